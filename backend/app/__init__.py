@@ -1,5 +1,6 @@
 # app/__init__.py - Clean production version
 import os
+import click
 from flask import Flask
 from flask_cors import CORS
 
@@ -23,21 +24,46 @@ def create_app(config_name='development'):
     # Initialize CORS
     CORS(app)
     
+    # Take the client address from the proxy's X-Forwarded-For, so per-IP limits see clients, not nginx
+    proxies = app.config.get('PROXY_FIX_X_FOR', 0)
+    if proxies:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+    
+    # Before any connection is opened: make psycopg2 yield to the eventlet hub.
+    # Outside the try below, so DB_GREEN_IO=require stops startup when it can't
+    from app.utils.green_db import init_green_db
+    init_green_db(app)
+    
     # Initialize extensions
     try:
-        from app.extensions import db, migrate, jwt, socketio
+        from app.extensions import db, jwt, socketio
+        from app.utils.db_routing import configure_engine_options, init_read_replicas
         
+        configure_engine_options(app)
         db.init_app(app)
-        migrate.init_app(app, db)
+        init_read_replicas(app)
         jwt.init_app(app)
-        socketio.init_app(app, cors_allowed_origins="*")
+        socketio.init_app(
+            app,
+            cors_allowed_origins="*",
+            message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'),
+            async_mode=app.config.get('SOCKETIO_ASYNC_MODE')
+        )
         
-        # Initialize Celery if available
-        try:
-            from app.extensions import init_celery
-            init_celery(app)
-        except ImportError:
-            pass  # Celery is optional
+        # Register Socket.IO connection handlers
+        from app.api import socket_events  # noqa: F401
+        
+        # Flask-Migrate (alembic) only matters to the `flask db` commands, so it is
+        # set up when the app is created by the flask CLI; web workers skip it
+        if click.get_current_context(silent=True) is not None or app.config.get('ENABLE_MIGRATE'):
+            from app.extensions import migrate
+            migrate.init_app(app, db)
+        
+        # Celery is configured when a task first touches it, not on every worker start
+        if app.config.get('CELERY_BROKER_URL'):
+            from app.extensions import defer_celery
+            defer_celery(app)
             
     except Exception as e:
         print(f"Warning: Extension initialization failed: {e}")
@@ -50,6 +76,8 @@ def create_app(config_name='development'):
         ('app.api.webhooks', 'webhooks_bp', '/api/webhooks'),
         ('app.api.clients', 'clients_bp', '/api/clients'),
         ('app.api.billing', 'billing_bp', '/api/billing'),
+        ('app.api.text_examples', 'text_examples_bp', '/api/text_examples'),
+        ('app.api.metrics', 'metrics_bp', '/metrics'),
     ]
     
     for module_name, blueprint_name, url_prefix in blueprints:
@@ -63,6 +91,27 @@ def create_app(config_name='development'):
         except Exception as e:
             print(f"Warning: Failed to register {blueprint_name}: {e}")
     
+    # Drop compiled reply rules when a profile's rules are edited
+    try:
+        from app.services.reply_rules import register_invalidation_hooks
+        register_invalidation_hooks()
+    except Exception as e:
+        print(f"Warning: Failed to register reply rule invalidation: {e}")
+    
+    # Bump response versions (ETags) of the scopes committed writes touch
+    try:
+        from app.services.response_versions import register_version_hooks
+        register_version_hooks()
+    except Exception as e:
+        print(f"Warning: Failed to register response version hooks: {e}")
+    
+    # Time SQL statements run while handling a message (the 'db' reply stage)
+    try:
+        from app.services.reply_trace import register_db_timing
+        register_db_timing()
+    except Exception as e:
+        print(f"Warning: Failed to register reply timing: {e}")
+    
     # JWT error handlers
     try:
         @jwt.expired_token_loader
@@ -76,6 +125,15 @@ def create_app(config_name='development'):
         @jwt.unauthorized_loader
         def missing_token_callback(error):
             return {'message': 'Authorization token is required'}, 401
+        
+        @jwt.token_in_blocklist_loader
+        def check_if_token_revoked(jwt_header, jwt_payload):
+            from app.services.token_revocation import is_token_revoked
+            return is_token_revoked(jwt_payload['jti'])
+        
+        @jwt.revoked_token_loader
+        def revoked_token_callback(jwt_header, jwt_payload):
+            return {'message': 'Token has been revoked'}, 401
     except Exception:
         pass  # JWT handlers are optional if JWT isn't available
     
@@ -85,7 +143,8 @@ def create_app(config_name='development'):
         return {
             "status": "healthy", 
             "message": "SMS AI Responder Backend is running",
-            "config": config_name
+            "config": config_name,
+            "db_io": "cooperative" if app.extensions.get('green_db') else "blocking"
         }
     
     return app
\ No newline at end of file
@@ -8,6 +8,7 @@ from flask_jwt_extended import (
 from app.models.user import User
 from app.extensions import db
 from app.utils.cors_middleware import cors_enabled
+from app.utils.security import rate_limited
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
@@ -72,6 +73,7 @@ def register():
 
 @auth_bp.route('/login', methods=['POST', 'OPTIONS'])
 @cors_enabled
+@rate_limited('RATE_LIMIT_LOGIN')
 def login():
     if request.method == 'OPTIONS':
         return make_response('', 200)
@@ -89,6 +91,10 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({"error": "Invalid credentials"}), 401
     
+    # Upgrade hashes made with older cost settings while we have the plain password
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+    
     # Update last login
     user.last_login = datetime.utcnow()
     db.session.commit()
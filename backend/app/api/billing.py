@@ -4,12 +4,18 @@ from app.models.user import User
 from app.models.billing import Subscription,SubscriptionPlan,Invoice
 
 from app.models.payment import PaymentMethod
-from app.services.billing_service import create_subscription, update_subscription, cancel_subscription
+from app.services.billing_service import (
+    create_subscription, update_subscription, cancel_subscription, start_subscription_job
+)
+from app.services.stripe_events import record_event, dispatch
+from app.services.response_versions import conditional
 from app.extensions import db
-import stripe
-from datetime import datetime, timezone
+from app.utils.lazy_import import lazy_import
+from datetime import timezone
 import pytz
 
+stripe = lazy_import('stripe')
+
 billing_bp = Blueprint('billing', __name__)
 
 @billing_bp.route('/plans', methods=['GET'])
@@ -35,6 +41,41 @@ def get_user_subscription():
     
     return jsonify(subscription.to_dict()), 200
 
+def queue_subscription_change(action, user_id, **kwargs):
+    """
+    Hand a subscription change to a queue worker when one is available.
+    
+    Returns a 202 response with a job to poll at /api/billing/jobs/<job_id>,
+    or None to make the change within the request.
+    """
+    from app.services.background_jobs import get_job_store
+    from app.services.queue_service import get_task_queue
+    
+    job_store = get_job_store()
+    task_queue = get_task_queue() if job_store is not None else None
+    if task_queue is None:
+        return None
+    
+    job_id = start_subscription_job(job_store, task_queue, action, user_id, **kwargs)
+    return jsonify({
+        "message": "Subscription change is being processed",
+        "job_id": job_id,
+        "status_url": f"/api/billing/jobs/{job_id}"
+    }), 202
+
+@billing_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_billing_job(job_id):
+    """Status of a background subscription change"""
+    from app.services.background_jobs import get_job_store, job_status
+    
+    job_store = get_job_store()
+    job = job_store.get(job_id) if job_store is not None else None
+    if job is None or job['user_id'] != get_jwt_identity():
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify(job_status(job)), 200
+
 @billing_bp.route('/subscription', methods=['POST'])
 @jwt_required()
 def create_user_subscription():
@@ -61,6 +102,11 @@ def create_user_subscription():
     if not plan:
         return jsonify({"error": "Subscription plan not found"}), 404
     
+    queued = queue_subscription_change('create', user_id, user_id=user_id, plan_id=data['plan_id'],
+                                       payment_method_id=data['payment_method_id'])
+    if queued is not None:
+        return queued
+    
     try:
         # Create subscription using billing service
         subscription = create_subscription(
@@ -98,6 +144,10 @@ def update_user_subscription():
     if not plan:
         return jsonify({"error": "Subscription plan not found"}), 404
     
+    queued = queue_subscription_change('update', user_id, subscription_id=subscription.id, plan_id=data['plan_id'])
+    if queued is not None:
+        return queued
+    
     try:
         # Update subscription using billing service
         updated_subscription = update_subscription(
@@ -124,6 +174,10 @@ def cancel_user_subscription():
     if not subscription:
         return jsonify({"error": "No active subscription found"}), 404
     
+    queued = queue_subscription_change('cancel', user_id, subscription_id=subscription.id)
+    if queued is not None:
+        return queued
+    
     try:
         # Cancel subscription using billing service
         cancel_subscription(subscription_id=subscription.id)
@@ -277,13 +331,18 @@ def get_invoices():
     """Get user's invoices"""
     user_id = get_jwt_identity()
     
-    invoices = Invoice.query.filter_by(user_id=user_id).order_by(Invoice.created_at.desc()).all()
+    invoices = Invoice.query.join(Subscription).filter(Subscription.user_id == user_id).order_by(
+        Invoice.created_at.desc()
+    ).all()
     
     return jsonify([invoice.to_dict() for invoice in invoices]), 200
 
 @billing_bp.route('/webhooks/stripe', methods=['POST'])
 def stripe_webhook():
-    """Handle Stripe webhook events"""
+    """Record a Stripe webhook event and acknowledge it; processing is queued"""
+    from app.services.queue_service import get_task_queue
+    from app.services.metrics import inc
+
     # Get Stripe webhook secret
     webhook_secret = current_app.config['STRIPE_WEBHOOK_SECRET']
     
@@ -305,86 +364,24 @@ def stripe_webhook():
         current_app.logger.error(f"Invalid Stripe signature: {e}")
         return 'Invalid signature', 400
     
-    # Handle the event based on its type
-    if event['type'] == 'invoice.payment_succeeded':
-        handle_invoice_payment_succeeded(event['data']['object'])
-    elif event['type'] == 'invoice.payment_failed':
-        handle_invoice_payment_failed(event['data']['object'])
-    elif event['type'] == 'customer.subscription.deleted':
-        handle_subscription_deleted(event['data']['object'])
-    # Add more event handlers as needed
-    
-    return '', 200
-
-def handle_invoice_payment_succeeded(invoice_data):
-    """Handle successful payment event"""
-    # Find subscription by Stripe ID
-    subscription = Subscription.query.filter_by(stripe_subscription_id=invoice_data['subscription']).first()
-    if not subscription:
-        current_app.logger.error(f"Subscription not found for Stripe ID: {invoice_data['subscription']}")
-        return
-    
-    # Create invoice record
-    invoice = Invoice(
-        user_id=subscription.user_id,
-        subscription_id=subscription.id,
-        stripe_invoice_id=invoice_data['id'],
-        amount=invoice_data['amount_paid'] / 100,  # Convert from cents to dollars
-        status='paid',
-        invoice_date=datetime.fromtimestamp(invoice_data['created']),
-        payment_method_id=subscription.payment_method_id
-    )
-    
-    db.session.add(invoice)
-    db.session.commit()
-    
-    current_app.logger.info(f"Invoice payment recorded: {invoice.id}")
-
-def handle_invoice_payment_failed(invoice_data):
-    """Handle failed payment event"""
-    # Find subscription by Stripe ID
-    subscription = Subscription.query.filter_by(stripe_subscription_id=invoice_data['subscription']).first()
-    if not subscription:
-        current_app.logger.error(f"Subscription not found for Stripe ID: {invoice_data['subscription']}")
-        return
-    
-    # Update subscription status to reflect payment failure
-    subscription.payment_status = 'failed'
-    
-    # Create invoice record
-    invoice = Invoice(
-        user_id=subscription.user_id,
-        subscription_id=subscription.id,
-        stripe_invoice_id=invoice_data['id'],
-        amount=invoice_data['amount_due'] / 100,  # Convert from cents to dollars
-        status='failed',
-        invoice_date=datetime.fromtimestamp(invoice_data['created']),
-        payment_method_id=subscription.payment_method_id
-    )
-    
-    db.session.add(invoice)
-    db.session.commit()
-    
-    current_app.logger.info(f"Invoice payment failed: {invoice.id}")
-
-def handle_subscription_deleted(subscription_data):
-    """Handle subscription cancellation event"""
-    # Find subscription by Stripe ID
-    subscription = Subscription.query.filter_by(stripe_subscription_id=subscription_data['id']).first()
-    if not subscription:
-        current_app.logger.error(f"Subscription not found for Stripe ID: {subscription_data['id']}")
-        return
-    
-    # Update subscription status
-    subscription.is_active = False
-    subscription.end_date = datetime.fromtimestamp(subscription_data['ended_at']) if subscription_data.get('ended_at') else datetime.utcnow()
+    # Store the event once per id; Stripe retries deliveries we fail to record
+    try:
+        stripe_event, is_new = record_event(event, payload)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to record Stripe event {event['id']}: {e}")
+        return 'Failed to record event', 500
+    inc('stripe_events_total', outcome='received' if is_new else 'duplicate')
     
-    db.session.commit()
+    # A redelivered event that is still pending nudges its key again
+    if stripe_event.status == 'pending':
+        dispatch(stripe_event.ordering_key, get_task_queue())
     
-    current_app.logger.info(f"Subscription cancelled: {subscription.id}")
+    return '', 200
 
 @billing_bp.route('/usage', methods=['GET'])
 @jwt_required()
+@conditional(lambda user_id: [f"billing:{user_id}", 'plans'])
 def get_usage():
     """Get user's current usage statistics"""
     user_id = get_jwt_identity()
@@ -1,19 +1,27 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
+from app.utils.db_routing import read_replica
+from app.api.serializers import select_messages, fetch_messages, count_rows, pagination, json_response
 from app.models.client import Client
 from app.models.profile import Profile
 from app.models.message import Message
 from app.models.user import User
 from app.utils.security import sanitize_input, validate_phone_number
+from app.utils.normalize_phone import normalize_phone_number
 from sqlalchemy import desc
 from datetime import datetime
 import json
 
 clients_bp = Blueprint('clients', __name__)
 
+CLIENT_MESSAGE_FIELDS = (
+    'id', 'content', 'is_incoming', 'timestamp', 'profile_id', 'ai_generated', 'is_read', 'twilio_sid', 'send_status'
+)
+
 @clients_bp.route('', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_clients():
     """Get all clients for a user's profiles"""
     user_id = get_jwt_identity()
@@ -109,6 +117,7 @@ def get_clients():
 
 @clients_bp.route('/<int:client_id>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_client(client_id):
     """Get details for a specific client"""
     user_id = get_jwt_identity()
@@ -220,6 +229,54 @@ def create_client():
     }), 201
 
 
+@clients_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_clients():
+    """
+    Bulk import clients from a CSV, JSON array or JSON lines upload.
+    
+    The file is sent as multipart field 'file' or as the raw request body.
+    Imported clients are linked to the profiles in 'profile_id' (comma-separated),
+    or to all of the user's profiles if none are given.
+    """
+    from app.services.client_import import import_clients as run_import
+    from app.utils.bulk_input import detect_format, FORMATS
+    
+    user_id = get_jwt_identity()
+    
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.values.get('format') or (
+        detect_format(upload.filename, upload.mimetype) if upload else detect_format(content_type=request.mimetype)
+    )
+    if fmt not in FORMATS:
+        return jsonify({"error": f"Unsupported format. Use one of: {', '.join(FORMATS)}"}), 400
+    
+    # Only the user's own profiles can be linked
+    owned_profile_ids = [row.id for row in db.session.query(Profile.id).filter_by(user_id=user_id).all()]
+    requested = request.values.get('profile_id')
+    if requested:
+        try:
+            profile_ids = [int(profile_id) for profile_id in requested.split(',') if profile_id.strip()]
+        except ValueError:
+            return jsonify({"error": "profile_id must be a comma-separated list of ids"}), 400
+        if not set(profile_ids) <= set(owned_profile_ids):
+            return jsonify({"error": "Unauthorized access to profile"}), 403
+    else:
+        profile_ids = owned_profile_ids
+    
+    summary = run_import(
+        stream,
+        profile_ids,
+        fmt=fmt,
+        chunk_size=current_app.config.get('CLIENT_IMPORT_CHUNK_SIZE', 1000),
+        max_rows=current_app.config.get('CLIENT_IMPORT_MAX_ROWS', 100000),
+        max_errors=current_app.config.get('CLIENT_IMPORT_MAX_ERRORS', 100)
+    )
+    
+    return jsonify(summary), 400 if 'error' in summary and not summary['total_rows'] else 200
+
+
 @clients_bp.route('/<int:client_id>', methods=['PUT'])
 @jwt_required()
 def update_client(client_id):
@@ -342,6 +399,7 @@ def unblock_client(client_id):
 
 @clients_bp.route('/<int:client_id>/messages', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_client_messages(client_id):
     """Get message history with a client"""
     user_id = get_jwt_identity()
@@ -356,54 +414,34 @@ def get_client_messages(client_id):
     # Filter by profile if specified
     profile_id = request.args.get('profile_id')
     
-    # Base query
-    query = Message.query.join(
+    # Base query: the message columns listed here plus the profile's name
+    statement = select_messages(
+        Profile.name.label('profile_name'),
+        fields=CLIENT_MESSAGE_FIELDS
+    ).join(
         Profile, Message.profile_id == Profile.id
-    ).filter(
+    ).where(
         Message.sender_number == client.phone_number,
         Profile.user_id == user_id
-    ).order_by(desc(Message.timestamp))
+    )
     
     # Apply profile filter
     if profile_id:
-        query = query.filter(Message.profile_id == profile_id)
+        statement = statement.where(Message.profile_id == profile_id)
     
     # Execute query with pagination
-    paginated_messages = query.paginate(page=page, per_page=per_page, error_out=False)
-    
-    # Format messages
-    messages_data = []
-    for message in paginated_messages.items:
-        # Get profile name
-        profile = Profile.query.get(message.profile_id)
-        
-        messages_data.append({
-            'id': message.id,
-            'content': message.content,
-            'is_incoming': message.is_incoming,
-            'timestamp': message.timestamp.isoformat(),
-            'profile_id': message.profile_id,
-            'profile_name': profile.name if profile else None,
-            'ai_generated': message.ai_generated,
-            'is_read': message.is_read,
-            'twilio_sid': message.twilio_sid,
-            'send_status': message.send_status
-        })
+    total = count_rows(statement)
+    messages_data = fetch_messages(
+        statement.order_by(desc(Message.timestamp)).limit(per_page).offset(max(page - 1, 0) * per_page)
+    )
     
-    return jsonify({
+    return json_response({
         'client_id': client.id,
         'phone_number': client.phone_number,
         'client_name': client.name,
         'messages': messages_data,
-        'pagination': {
-            'total': paginated_messages.total,
-            'pages': paginated_messages.pages,
-            'page': page,
-            'per_page': per_page,
-            'has_next': paginated_messages.has_next,
-            'has_prev': paginated_messages.has_prev
-        }
-    }), 200
+        'pagination': pagination(total, page, per_page)
+    })
 
 
 @clients_bp.route('/<int:client_id>/mark_messages_read', methods=['POST'])
@@ -451,6 +489,7 @@ def mark_messages_read(client_id):
 
 @clients_bp.route('/search', methods=['GET'])
 @jwt_required()
+@read_replica
 def search_clients():
     """Search for clients by phone number or name"""
     user_id = get_jwt_identity()
@@ -605,6 +644,7 @@ def set_client_regular_status(client_id):
 
 @clients_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_client_stats():
     """Get statistics about clients"""
     user_id = get_jwt_identity()
@@ -691,6 +731,7 @@ def get_client_stats():
 
 @clients_bp.route('/by_phone/<phone_number>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_client_by_phone(phone_number):
     """Get client by phone number"""
     user_id = get_jwt_identity()
@@ -5,13 +5,22 @@ from app.models.message import Message
 from app.models.profile import Profile
 from app.models.client import Client
 from app.services.message_handler import send_response
+from app.utils.security import rate_limited
 from app.extensions import db
+from app.utils.db_routing import read_replica
+from app.services.response_versions import conditional
+from app.api.serializers import (
+    MESSAGE_FIELDS, select_messages, message_dict, fetch_messages, count_rows, json_response
+)
+from sqlalchemy import select, func, case, and_
 from datetime import datetime, timedelta
 
 messages_bp = Blueprint('messages', __name__)
 
 @messages_bp.route('/profile/<int:profile_id>', methods=['GET'])
 @jwt_required()
+@conditional(lambda user_id, profile_id: [f"profile:{profile_id}"])
+@read_replica
 def get_profile_messages(profile_id):
     user_id = get_jwt_identity()
     
@@ -26,26 +35,28 @@ def get_profile_messages(profile_id):
     offset = int(request.args.get('offset', 0))
     
     # Query messages
-    query = Message.query.filter(Message.profile_id == profile_id)
+    statement = select_messages().where(Message.profile_id == profile_id)
     
     if client_number:
-        query = query.filter(Message.sender_number == client_number)
+        statement = statement.where(Message.sender_number == client_number)
     
     # Get total count (for pagination)
-    total = query.count()
+    total = count_rows(statement)
     
     # Get messages with pagination
-    messages = query.order_by(Message.timestamp.desc()) \
-                   .limit(limit).offset(offset).all()
+    messages = fetch_messages(
+        statement.order_by(Message.timestamp.desc()).limit(limit).offset(offset)
+    )
     
-    return jsonify({
+    return json_response({
         "total": total,
-        "messages": [msg.to_dict() for msg in messages]
-    }), 200
+        "messages": messages
+    })
 
 
 @messages_bp.route('/conversation/<int:profile_id>/<path:client_number>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_conversation(profile_id, client_number):
     user_id = get_jwt_identity()
     
@@ -59,33 +70,31 @@ def get_conversation(profile_id, client_number):
     before = request.args.get('before')  # Timestamp to get messages before
     
     # Query conversation
-    query = Message.query.filter(
+    statement = select_messages().where(
         Message.profile_id == profile_id,
         Message.sender_number == client_number
     )
     
     if before:
         before_time = datetime.fromisoformat(before)
-        query = query.filter(Message.timestamp < before_time)
+        statement = statement.where(Message.timestamp < before_time)
     
     # Get messages
-    messages = query.order_by(Message.timestamp.desc()) \
-                   .limit(limit).all()
-    
-    
+    messages = fetch_messages(statement.order_by(Message.timestamp.desc()).limit(limit))
     
     # Reverse to get chronological order
     messages.reverse()
     
-    return jsonify({
+    return json_response({
         "profile_id": profile_id,
         "client_number": client_number,
-        "messages": [msg.to_dict() for msg in messages]
-    }), 200
+        "messages": messages
+    })
 
 
 @messages_bp.route('/send', methods=['POST'])
 @jwt_required()
+@rate_limited('RATE_LIMIT_MESSAGE_SEND', key_func=get_jwt_identity)
 def send_message():
     user_id = get_jwt_identity()
     data = request.json
@@ -115,6 +124,8 @@ def send_message():
 
 @messages_bp.route('/conversations/<int:profile_id>', methods=['GET'])
 @jwt_required()
+@conditional(lambda user_id, profile_id: [f"profile:{profile_id}"])
+@read_replica
 def get_conversations(profile_id):
     user_id = get_jwt_identity()
     
@@ -123,43 +134,28 @@ def get_conversations(profile_id):
     if profile.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    # Get distinct client numbers for this profile
-    client_numbers = db.session.query(Message.sender_number) \
-                        .filter(Message.profile_id == profile_id) \
-                        .distinct().all()
-    client_numbers = [num[0] for num in client_numbers]
+    # Latest message and unread count per client number, with the client's name, in one query
+    by_number = dict(partition_by=Message.sender_number)
+    ranked = select_messages(
+        func.row_number().over(order_by=(Message.timestamp.desc(), Message.id.desc()), **by_number).label('rank'),
+        func.sum(case((and_(Message.is_incoming == True, Message.is_read == False), 1), else_=0))
+            .over(**by_number).label('unread_count')
+    ).where(Message.profile_id == profile_id).subquery()
+    
+    rows = db.session.execute(
+        select(ranked, Client.name.label('client_name'))
+        .outerjoin(Client, Client.phone_number == ranked.c.sender_number)
+        .where(ranked.c.rank == 1)
+        .order_by(ranked.c.timestamp.desc())
+    ).mappings()
     
     conversations = []
-    for number in client_numbers:
-        # Get the latest message for each client
-        latest_msg = Message.query.filter(
-            Message.profile_id == profile_id,
-            Message.sender_number == number
-        ).order_by(Message.timestamp.desc()).first()
-        
-        # Get unread count
-        unread_count = Message.query.filter(
-            Message.profile_id == profile_id,
-            Message.sender_number == number,
-            Message.is_incoming == True,
-            Message.is_read == False
-        ).count()
-        
-        # Get client info
-        client = Client.query.filter_by(phone_number=number).first()
-        client_name = client.name if client else None
-        
+    for row in rows:
         conversations.append({
-            "client_number": number,
-            "client_name": client_name,
-            "latest_message": latest_msg.to_dict() if latest_msg else None,
-            "unread_count": unread_count
+            "client_number": row['sender_number'],
+            "client_name": row['client_name'],
+            "latest_message": message_dict({field: row[field] for field in MESSAGE_FIELDS}),
+            "unread_count": int(row['unread_count'] or 0)
         })
     
-    # Sort by latest message timestamp (newest first)
-    conversations.sort(
-        key=lambda x: x["latest_message"]["timestamp"] if x["latest_message"] else "1970-01-01T00:00:00",
-        reverse=True
-    )
-    
-    return jsonify(conversations), 200
\ No newline at end of file
+    return json_response(conversations)
@@ -0,0 +1,18 @@
+# app/api/metrics.py
+import hmac
+from flask import Blueprint, request, current_app
+from app.services.metrics import collect, render
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('', methods=['GET'])
+def prometheus_metrics():
+    """Reply pipeline latency histograms and LLM stats in Prometheus text format"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+            return 'Unauthorized', 401
+
+    return render(collect()), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -6,12 +6,16 @@ from app.models.auto_reply import AutoReply
 from app.models.text_example import TextExample
 from app.services.twilio_service import TwilioService
 from app.extensions import db
+from app.utils.db_routing import read_replica
+from app.services.response_versions import conditional
 import json
 
 profiles_bp = Blueprint('profiles', __name__)
 
 @profiles_bp.route('', methods=['GET'])
 @jwt_required()
+@conditional(lambda user_id: [f"profiles:{user_id}"])
+@read_replica
 def get_profiles():
     user_id = get_jwt_identity()
     
@@ -23,6 +27,7 @@ def get_profiles():
 
 @profiles_bp.route('/<int:profile_id>', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_profile(profile_id):
     user_id = get_jwt_identity()
     
@@ -143,6 +148,7 @@ def toggle_ai(profile_id):
 # Auto-reply endpoints
 @profiles_bp.route('/<int:profile_id>/auto_replies', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_auto_replies(profile_id):
     user_id = get_jwt_identity()
     
@@ -161,6 +167,7 @@ def get_auto_replies(profile_id):
 # Text examples endpoints
 @profiles_bp.route('/<int:profile_id>/text_examples', methods=['GET'])
 @jwt_required()
+@read_replica
 def get_text_examples(profile_id):
     user_id = get_jwt_identity()
     
@@ -0,0 +1,87 @@
+# app/api/serializers.py
+"""
+Column projections for list endpoints.
+
+List endpoints select only the columns they return, get a message's flag
+status from a correlated EXISTS and names through joins, and build dicts
+straight from the rows, so a page of messages is one query however long it
+is and no ORM objects are hydrated. Message dicts have the same keys and
+values as Message.to_dict().
+
+json_response encodes with orjson when it is installed, else stdlib json.
+"""
+import json
+from datetime import datetime
+
+from flask import Response
+from sqlalchemy import select, exists, func
+from app.extensions import db
+from app.models.message import Message
+from app.models.flagged_message import FlaggedMessage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# Message.to_dict() keys, in order
+MESSAGE_FIELDS = (
+    'id', 'content', 'is_incoming', 'sender_number', 'profile_id', 'ai_generated', 'prompt_tokens', 'timings',
+    'is_read', 'twilio_sid', 'send_status', 'send_error', 'timestamp', 'created_at', 'is_flagged',
+)
+
+
+def is_flagged_column():
+    """True if the message has a FlaggedMessage (EXISTS, so messages flagged twice aren't repeated)"""
+    return exists().where(FlaggedMessage.message_id == Message.id).label('is_flagged')
+
+
+def select_messages(*extra_columns, fields=MESSAGE_FIELDS):
+    """SELECT of the given message fields (plus any extra labelled columns)"""
+    columns = [is_flagged_column() if field == 'is_flagged' else getattr(Message, field) for field in fields]
+    return select(*columns, *extra_columns)
+
+
+def message_dict(row):
+    """A message row (mapping) as to_dict() would render it"""
+    data = dict(row)
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            data[key] = value.isoformat()
+    if data.get('timings'):
+        data['timings'] = json.loads(data['timings'])
+    if 'is_flagged' in data:
+        data['is_flagged'] = bool(data['is_flagged'])
+    return data
+
+
+def fetch_messages(statement):
+    """Run a select_messages() statement and return its rows as dicts"""
+    return [message_dict(row) for row in db.session.execute(statement).mappings()]
+
+
+def count_rows(statement):
+    """Number of rows a (non-grouped) statement matches, ignoring its columns, ordering and paging"""
+    statement = statement.with_only_columns(func.count(), maintain_column_froms=True)
+    return db.session.execute(statement.order_by(None).limit(None).offset(None)).scalar()
+
+
+def pagination(total, page, per_page):
+    pages = (total + per_page - 1) // per_page if per_page else 0
+    return {
+        'total': total,
+        'pages': pages,
+        'page': page,
+        'per_page': per_page,
+        'has_next': page < pages,
+        'has_prev': page > 1,
+    }
+
+
+def json_response(payload, status=200):
+    """JSON response, encoded with orjson when available"""
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), default=str)
+    return Response(body, status=status, mimetype='application/json')
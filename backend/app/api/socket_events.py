@@ -0,0 +1,98 @@
+# app/api/socket_events.py
+"""
+Socket.IO connection handlers.
+
+Connections authenticate with the dashboard's access token (sent as
+auth.token) and are placed in their user room plus one room per profile they
+own. Unauthenticated connections, refresh tokens and revoked (logged out)
+tokens are refused.
+"""
+import logging
+
+from flask import request
+from flask_socketio import join_room, leave_room, ConnectionRefusedError
+from flask_jwt_extended import decode_token
+from app.extensions import socketio
+from app.services.realtime import user_room, profile_room, get_event_stream
+from app.services.token_revocation import is_token_revoked
+
+logger = logging.getLogger(__name__)
+
+# sid -> user id for connected sockets in this process
+_connected_users = {}
+
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    """Authenticate the socket and join the user's rooms"""
+    from app.models.profile import Profile
+
+    token = (auth or {}).get('token') or request.args.get('token')
+    if not token:
+        raise ConnectionRefusedError('Authorization token is required')
+
+    try:
+        claims = decode_token(token)
+    except Exception as e:
+        logger.info(f"Rejected socket connection: {str(e)}")
+        raise ConnectionRefusedError('Invalid token')
+
+    # decode_token checks the signature and expiry only; @jwt_required's other checks are made here
+    if claims.get('type') != 'access' or is_token_revoked(claims['jti']):
+        logger.info(f"Rejected socket connection: {claims.get('type')} token {claims['jti']} not usable")
+        raise ConnectionRefusedError('Invalid token')
+
+    user_id = claims['sub']
+
+    _connected_users[request.sid] = user_id
+    join_room(user_room(user_id))
+    for (profile_id,) in Profile.query.with_entities(Profile.id).filter_by(user_id=user_id):
+        join_room(profile_room(profile_id))
+
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    _connected_users.pop(request.sid, None)
+
+
+@socketio.on('resume')
+def handle_resume(data):
+    """
+    Replay events missed since the client's last sequence number.
+
+    Returns {'events': [...], 'seq': latest}, or {'reset': True, 'seq': latest}
+    when the missed events are no longer buffered and the client must reload.
+    A client without a position ('after' is null) just learns the latest seq.
+    """
+    user_id = _connected_users.get(request.sid)
+    event_stream = get_event_stream()
+    if user_id is None or event_stream is None:
+        return {'reset': True, 'seq': 0}
+
+    after = (data or {}).get('after')
+    if after is None:
+        return {'events': [], 'seq': event_stream.latest(user_id)}
+
+    events, latest = event_stream.replay(user_id, int(after))
+    if events is None:
+        return {'reset': True, 'seq': latest}
+    return {'events': events, 'seq': latest}
+
+
+@socketio.on('join_profile')
+def handle_join_profile(data):
+    """Join a profile's room, e.g. one created after the socket connected"""
+    from app.models.profile import Profile
+
+    user_id = _connected_users.get(request.sid)
+    profile_id = (data or {}).get('profile_id')
+    if user_id is None or not Profile.query.filter_by(id=profile_id, user_id=user_id).first():
+        return {'error': 'Profile not found'}
+
+    join_room(profile_room(profile_id))
+    return {'joined': profile_id}
+
+
+@socketio.on('leave_profile')
+def handle_leave_profile(data):
+    leave_room(profile_room((data or {}).get('profile_id')))
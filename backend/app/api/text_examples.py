@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify
+import csv
+from itertools import chain, islice
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from app.models.text_example import TextExample
 from app.models.profile import Profile
 from app.extensions import db
@@ -21,16 +24,27 @@ def create_text_example():
     if profile.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
+    from app.services.text_example_ingest import content_hash, examples_changed
+    
     # Create text example
     example = TextExample(
         profile_id=data['profile_id'],
-        content=data['content'],
+        content=data['content'].strip(),
+        content_hash=content_hash(data['content']),
         is_incoming=data.get('is_incoming', False)
     )
     
-    db.session.add(example)
-    db.session.commit()
+    try:
+        db.session.add(example)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = TextExample.query.filter_by(
+            profile_id=data['profile_id'], content_hash=content_hash(data['content'])
+        ).first()
+        return jsonify({"error": "Text example already exists", "example_id": existing.id if existing else None}), 409
     
+    examples_changed(example.profile_id)
     return jsonify(example.to_dict()), 201
 
 
@@ -47,9 +61,12 @@ def delete_text_example(example_id):
     if profile.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
+    from app.services.text_example_ingest import examples_changed
+    
     # Delete example
     db.session.delete(example)
     db.session.commit()
+    examples_changed(example.profile_id)
     
     return jsonify({"success": True, "message": "Text example deleted"}), 200
 
@@ -57,36 +74,96 @@ def delete_text_example(example_id):
 @text_examples_bp.route('/bulk', methods=['POST'])
 @jwt_required()
 def bulk_create_text_examples():
+    """
+    Add many text examples to a profile.
+    
+    Takes a JSON body {"profile_id", "examples": [{"content", "is_incoming"}, ...]},
+    or an uploaded file (multipart field 'file', or the raw body) in CSV, JSON
+    or JSON lines with profile_id as a query parameter. Duplicates are skipped,
+    and rows past TEXT_EXAMPLES_MAX_UPLOAD are counted as dropped. Large uploads are ingested in the background: the response is 202 with a
+    job to poll at /api/text_examples/jobs/<job_id>.
+    """
+    from app.services.text_example_ingest import ingest_text_examples, start_ingest_job
+    from app.services.background_jobs import get_job_store
+    from app.services.queue_service import get_task_queue
+    from app.utils.bulk_input import iter_rows, detect_format, FORMATS
+    
     user_id = get_jwt_identity()
-    data = request.json
+    
+    upload = request.files.get('file')
+    if request.is_json and not upload:
+        data = request.json
+        profile_id = data.get('profile_id')
+        rows = data.get('examples')
+        if not isinstance(rows, list):
+            rows = None
+    else:
+        profile_id = request.values.get('profile_id', type=int)
+        fmt = request.values.get('format') or (
+            detect_format(upload.filename, upload.mimetype) if upload else detect_format(content_type=request.mimetype)
+        )
+        if fmt not in FORMATS:
+            return jsonify({"error": f"Unsupported format. Use one of: {', '.join(FORMATS)}"}), 400
+        rows = iter_rows(upload.stream if upload else request.stream, fmt)
     
     # Validate required fields
-    if not all([data.get('profile_id'), data.get('examples')]):
+    if not profile_id or rows is None:
         return jsonify({"error": "Missing required fields"}), 400
     
     # Verify profile ownership
-    profile = Profile.query.get_or_404(data['profile_id'])
+    profile = Profile.query.get_or_404(profile_id)
     if profile.user_id != user_id:
         return jsonify({"error": "Unauthorized"}), 403
     
-    # Create text examples
-    examples = []
-    for ex in data['examples']:
-        if 'content' not in ex:
-            continue
-            
-        example = TextExample(
-            profile_id=data['profile_id'],
-            content=ex['content'],
-            is_incoming=ex.get('is_incoming', False)
-        )
-        db.session.add(example)
-        examples.append(example)
+    config = current_app.config
+    max_upload = config.get('TEXT_EXAMPLES_MAX_UPLOAD', 50000)
+    inline_limit = config.get('TEXT_EXAMPLES_INLINE_LIMIT', 2000)
     
-    db.session.commit()
+    try:
+        rows = iter(rows)
+        head = list(islice(rows, inline_limit + 1))
+        rows = chain(head, rows)
+        
+        # Too large to ingest within the request: stage it for a queue worker
+        job_store = get_job_store() if len(head) > inline_limit else None
+        task_queue = get_task_queue() if job_store is not None else None
+        if task_queue is not None:
+            job_id = start_ingest_job(job_store, task_queue, profile.id, user_id, islice(rows, max_upload))
+            dropped = sum(1 for _ in rows)
+            return jsonify({
+                "success": True,
+                "message": "Text examples are being added in the background" + _dropped_note(dropped, max_upload),
+                "dropped": dropped,
+                "job_id": job_id,
+                "status_url": f"/api/text_examples/jobs/{job_id}"
+            }), 202
+        
+        summary = ingest_text_examples(profile.id, islice(rows, max_upload), config)
+        dropped = sum(1 for _ in rows)
+    except (ValueError, csv.Error) as e:
+        return jsonify({"error": f"Could not read upload: {str(e)}"}), 400
+    
+    return jsonify(dict(
+        summary,
+        dropped=dropped,
+        success=True,
+        message=f"Added {summary['inserted']} text examples" + _dropped_note(dropped, max_upload)
+    )), 201
+
+
+def _dropped_note(dropped, max_upload):
+    return f"; {dropped} rows past the {max_upload} row limit were dropped" if dropped else ""
+
+
+@text_examples_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_ingest_job(job_id):
+    """Status of a background text example upload"""
+    from app.services.background_jobs import get_job_store, job_status
+    
+    job_store = get_job_store()
+    job = job_store.get(job_id) if job_store is not None else None
+    if job is None or job['user_id'] != get_jwt_identity():
+        return jsonify({"error": "Job not found"}), 404
     
-    return jsonify({
-        "success": True,
-        "message": f"Added {len(examples)} text examples",
-        "examples": [ex.to_dict() for ex in examples]
-    }), 201
\ No newline at end of file
+    return jsonify(job_status(job)), 200
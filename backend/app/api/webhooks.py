@@ -1,9 +1,15 @@
 # app/api/webhooks.py
+import time
 from flask import Blueprint, request, jsonify, current_app
 from app.models.user import User
 from app.models.profile import Profile
 from app.utils.twilio_helpers import validate_twilio_signature
+from app.utils.security import check_rate_limit
 from app.services.message_handler import handle_incoming_message
+from app.services.delivery_status import record_delivery_status
+from app.services.queue_service import get_task_queue
+from app.services.burst_coalescer import get_burst_tracker
+from app.services.reply_trace import stage
 from app.extensions import db
 from app.models.twilio_usage import TwilioUsage
 
@@ -12,6 +18,11 @@ webhooks_bp = Blueprint('webhooks', __name__)
 @webhooks_bp.route('/sms', methods=['POST'])
 def sms_webhook():
     """Webhook for incoming SMS messages from Twilio"""
+    with stage('webhook'):
+        return _receive_sms(time.time())
+
+
+def _receive_sms(received_at):
     # Extract message details
     message_text = request.form.get('Body', '').strip()
     sender_number = request.form.get('From', '')
@@ -49,13 +60,63 @@ def sms_webhook():
         user.twilio_usage_tracker.sms_count += 1
         db.session.commit()
     
-    # Process message asynchronously
-    task_queue.enqueue(
-        handle_incoming_message,
-        profile.id,
-        message_text,
-        sender_number
-    )
+    message_data = {'message_sid': request.form.get('MessageSid'), 'received_at': received_at}
+    
+    # Twilio doesn't redeliver a refused text, so one over the number's limit is still
+    # stored, just not auto-replied to. Counted only once validated, so forged
+    # requests can't use up a number's allowance.
+    allowed, _ = check_rate_limit('RATE_LIMIT_SMS_WEBHOOK', recipient_number)
+    if not allowed:
+        current_app.logger.warning(f"Auto replies for {recipient_number} are over the rate limit")
+        message_data['auto_reply'] = False
+    
+    # Process message asynchronously (inline when no task queue is configured).
+    # Messages in one conversation share a partition, so they're handled in arrival order.
+    task_queue = get_task_queue()
+    if task_queue is not None:
+        # Stamp the message so a burst of fragments is answered once
+        burst_tracker = get_burst_tracker()
+        if burst_tracker is not None:
+            message_data['burst_seq'] = burst_tracker.mark(profile.id, sender_number)
+        
+        message_data['enqueued_at'] = time.time()
+        task_queue.enqueue(
+            handle_incoming_message,
+            profile.id,
+            message_text,
+            sender_number,
+            message_data,
+            partition_key=f"{profile.id}:{sender_number}"
+        )
+    else:
+        handle_incoming_message(profile.id, message_text, sender_number, message_data)
     
     # Return empty response to Twilio
-    return '', 204
\ No newline at end of file
+    return '', 204
+
+
+@webhooks_bp.route('/sms/status', methods=['POST'])
+def sms_status_webhook():
+    """Delivery receipt (StatusCallback) for outbound messages; buffered and applied in batches"""
+    message_sid = request.form.get('MessageSid', '')
+    message_status = request.form.get('MessageStatus', '')
+    error_code = request.form.get('ErrorCode')
+    account_sid = request.form.get('AccountSid', '')
+    
+    # Receipts are signed with the sending account's credentials
+    user = None
+    if account_sid and account_sid != current_app.config.get('TWILIO_ACCOUNT_SID'):
+        user = User.query.filter_by(twilio_account_sid=account_sid).first()
+    
+    if user and not user.twilio_parent_account:
+        valid_account = validate_twilio_signature(request, user.twilio_api_key_secret)
+    else:
+        valid_account = validate_twilio_signature(request)
+    
+    if not valid_account:
+        current_app.logger.warning(f"Invalid Twilio signature on status callback for {message_sid}")
+        return 'Invalid request signature', 403
+    
+    record_delivery_status(message_sid, message_status, error_code)
+    
+    return '', 204
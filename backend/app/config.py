@@ -2,11 +2,10 @@ import os
 from datetime import timedelta
 from dotenv import load_dotenv
 
-from cryptography.fernet import Fernet
-
 load_dotenv()
 
 def generate_encryption_key():
+    from cryptography.fernet import Fernet
     return Fernet.generate_key().decode()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
@@ -19,6 +18,32 @@ class Config:
     DB_NAME = os.environ.get('DB_NAME')
     DB_USER = os.environ.get('DB_USER')
     DB_PASS = os.environ.get('DB_PASS')
+    
+    # Cooperative DB I/O under eventlet: 'auto', 'require' (fail startup if unavailable) or 'off'
+    DB_GREEN_IO = os.environ.get('DB_GREEN_IO', 'auto')
+    
+    # Connection pool per worker process. With eventlet each worker serves up to
+    # worker_connections requests at once, so size the pool for the queries you want
+    # in flight per worker; workers x (size + overflow) must stay under max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))  # Seconds a request waits for a connection
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True').lower() == 'true'  # Test connections on checkout
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))  # Seconds before a connection is replaced (-1: never)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '0'))  # PostgreSQL statement_timeout (0: none)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+
+    # Read replicas for dashboard and analytics reads (comma-separated URLs; empty: primary only)
+    DB_READ_REPLICA_URLS = [url for url in os.environ.get('DB_READ_REPLICA_URLS', '').split(',') if url]
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', '5'))  # Seconds behind before a replica is skipped
+    DB_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_LAG_CHECK_INTERVAL', '5'))  # Seconds a lag reading is reused
+    DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))  # Users read from the primary this long after writing
    
     
     # Twilio configuration
@@ -26,6 +51,7 @@ class Config:
     #Master Accounts
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
+    TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL')  # Override https://api.twilio.com (load tests)
     
     VERIFY_TWILIO_SIGNATURE = os.environ.get('VERIFY_TWILIO_SIGNATURE', 'True') == 'True'
     
@@ -33,7 +59,7 @@ class Config:
     
     TWILIO_SET_TRIAL_LIMITS = os.environ.get('TWILIO_SET_TRIAL_LIMITS', 'True') == 'True'
     
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://assitext.ca','https://assitext.ca').split(',')
+    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://assitext.ca,https://assitext.ca').split(',')
     
     BASE_URL = os.environ.get('BASE_URL', 'https://assitext.ca/')
     
@@ -43,11 +69,28 @@ class Config:
     MARKUP_PERCENTAGE = float(os.environ.get('MARKUP_PERCENTAGE', '20.0'))  # Markup percentage
     #Local LLM
     LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'http://10.0.0.6:11434/api')
+    LLM_ENDPOINT = os.environ.get('LLM_ENDPOINT', 'http://10.0.0.6:11434')  # Ollama server used by LLMService
     LLM_MODEL = os.environ.get('LLM_MODEL', 'dolphin3')
     LLM_TIMEOUT = int(os.environ.get('LLM_TIMEOUT', '30'))
     LLM_MAX_TOKENS = int(os.environ.get('LLM_MAX_TOKENS', '150'))
     LLM_TEMPERATURE = float(os.environ.get('LLM_TEMPERATURE', '0.7'))
     
+    # Reply pipeline timing (exposed on /metrics)
+    METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', '10'))  # Seconds between writes to the shared Redis totals
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required by /metrics when set
+    REPLY_SLOW_LOG_SECONDS = float(os.environ.get('REPLY_SLOW_LOG_SECONDS', '10'))  # Log stage timings of slower replies
+    REPLY_TIMINGS_PERSIST = os.environ.get('REPLY_TIMINGS_PERSIST', 'False').lower() == 'true'  # Store timings on reply messages
+    REPLY_TIMINGS_SLOW_SECONDS = float(os.environ.get('REPLY_TIMINGS_SLOW_SECONDS', '0'))  # Only for replies at least this slow
+    
+    # Prompt token budgets; keep budget + LLM_MAX_TOKENS within the model's context (Ollama num_ctx)
+    PROMPT_TOKENIZER = os.environ.get('PROMPT_TOKENIZER', 'approximate')  # approximate, tiktoken:<encoding> or tokenizers:<tokenizer.json>
+    PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '1800'))
+    # Per-model overrides ("model=tokens,..."; model names may contain colons)
+    PROMPT_TOKEN_BUDGETS = {
+        model: int(tokens) for model, tokens in
+        (item.rsplit('=', 1) for item in os.environ.get('PROMPT_TOKEN_BUDGETS', '').split(',') if item)
+    }
+    
     # Message Processing
     MAX_MESSAGE_LENGTH = int(os.environ.get('MAX_MESSAGE_LENGTH', '1600'))
     AUTO_REPLY_ENABLED = os.environ.get('AUTO_REPLY_ENABLED', 'True').lower() == 'true'
@@ -58,11 +101,97 @@ class Config:
     # Stripe configuration
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get('STRIPE_EVENT_MAX_ATTEMPTS', '5'))  # Before an event is marked failed and skipped
+    STRIPE_BACKFILL_CHUNK_SIZE = int(os.environ.get('STRIPE_BACKFILL_CHUNK_SIZE', '500'))  # Objects per upsert when backfilling or reconciling
+    STRIPE_RECONCILE_INTERVAL_MINUTES = int(os.environ.get('STRIPE_RECONCILE_INTERVAL_MINUTES', '60'))  # Full refresh of the Stripe mirror
     
     # Celery configuration
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND')
     
+    # Flask-Migrate is set up automatically under the flask CLI; force it for other tooling
+    ENABLE_MIGRATE = os.environ.get('ENABLE_MIGRATE', 'False').lower() == 'true'
+    
+    # Redis (task queue, throttling)
+    REDIS_URL = os.environ.get('REDIS_URL')
+    
+    # Password hashing cost; existing hashes are upgraded on the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')  # werkzeug method string
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+    
+    # API key authentication
+    API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', '30'))  # Seconds a key lookup is cached
+    API_KEY_LAST_USED_FLUSH_INTERVAL = int(os.environ.get('API_KEY_LAST_USED_FLUSH_INTERVAL', '30'))  # Seconds between bulk writes
+    
+    # Rate limits as "requests/seconds" (GCRA; empty disables)
+    RATE_LIMIT_SMS_WEBHOOK = os.environ.get('RATE_LIMIT_SMS_WEBHOOK', '60/60')  # Auto replies per receiving number; texts over it are still stored
+    RATE_LIMIT_LOGIN = os.environ.get('RATE_LIMIT_LOGIN', '10/60')  # Per client IP
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', '0'))  # Trusted proxies (e.g. nginx) in front; X-Forwarded-For is ignored at 0
+    RATE_LIMIT_MESSAGE_SEND = os.environ.get('RATE_LIMIT_MESSAGE_SEND', '30/60')  # Per user
+    
+    # Task queue workers
+    QUEUE_NAMES = os.environ.get('QUEUE_NAMES', 'default,outbound').split(',')
+    QUEUE_WORKER_CONCURRENCY = int(os.environ.get('QUEUE_WORKER_CONCURRENCY', '4'))
+    QUEUE_BATCH_SIZE = int(os.environ.get('QUEUE_BATCH_SIZE', '1'))
+    QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get('QUEUE_VISIBILITY_TIMEOUT', '300'))  # Seconds before an unacked task is retried
+    QUEUE_MAX_RETRIES = int(os.environ.get('QUEUE_MAX_RETRIES', '3'))
+    # Ordered partitions per queue ("name:count,..."); tasks for one conversation run in order
+    QUEUE_PARTITIONS = {
+        name: int(count) for name, count in
+        (item.split(':') for item in os.environ.get('QUEUE_PARTITIONS', 'default:64,outbound:64').split(',') if item)
+    }
+    
+    # Socket.IO fan-out: Redis message queue shared by web and queue workers, per-room emit batching
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', REDIS_URL)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE')  # e.g. 'eventlet' or 'threading'; unset auto-detects
+    SOCKETIO_BATCH_INTERVAL = float(os.environ.get('SOCKETIO_BATCH_INTERVAL', '0.02'))  # Seconds; 0 disables batching
+    SOCKETIO_BATCH_MAX = int(os.environ.get('SOCKETIO_BATCH_MAX', '100'))  # Events per room before an early flush
+    REALTIME_REPLAY_MAXLEN = int(os.environ.get('REALTIME_REPLAY_MAXLEN', '1000'))  # Events kept per user for resume; 0 disables
+    REALTIME_REPLAY_TTL = int(os.environ.get('REALTIME_REPLAY_TTL', '86400'))  # Seconds an idle user's stream is kept
+    
+    # Inbound burst coalescing: fragments arriving within this many seconds get one reply (0 disables)
+    INBOUND_COALESCE_WINDOW = float(os.environ.get('INBOUND_COALESCE_WINDOW', '3.0'))
+    
+    # Outbound SMS dispatch
+    OUTBOUND_NUMBER_RATE = float(os.environ.get('OUTBOUND_NUMBER_RATE', '1.0'))  # Messages/sec per sender number
+    OUTBOUND_NUMBER_BURST = int(os.environ.get('OUTBOUND_NUMBER_BURST', '3'))
+    OUTBOUND_ACCOUNT_RATE = float(os.environ.get('OUTBOUND_ACCOUNT_RATE', '30.0'))  # Messages/sec per Twilio account
+    OUTBOUND_ACCOUNT_BURST = int(os.environ.get('OUTBOUND_ACCOUNT_BURST', '30'))
+    OUTBOUND_MAX_IN_FLIGHT = int(os.environ.get('OUTBOUND_MAX_IN_FLIGHT', '20'))  # Concurrent Twilio sends across all processes
+    OUTBOUND_MAX_RETRIES = int(os.environ.get('OUTBOUND_MAX_RETRIES', '5'))
+    OUTBOUND_RETRY_BASE_DELAY = float(os.environ.get('OUTBOUND_RETRY_BASE_DELAY', '0.5'))  # Seconds
+    OUTBOUND_RETRY_MAX_DELAY = float(os.environ.get('OUTBOUND_RETRY_MAX_DELAY', '30.0'))  # Seconds
+    
+    # Compiled per-profile reply rules (keywords, business hours, out-of-office)
+    REPLY_RULES_CACHE_TTL = int(os.environ.get('REPLY_RULES_CACHE_TTL', '300'))  # Seconds; edits invalidate immediately
+    
+    # Bulk client import
+    CLIENT_IMPORT_CHUNK_SIZE = int(os.environ.get('CLIENT_IMPORT_CHUNK_SIZE', '1000'))  # Rows per INSERT ... ON CONFLICT
+    CLIENT_IMPORT_MAX_ROWS = int(os.environ.get('CLIENT_IMPORT_MAX_ROWS', '100000'))
+    CLIENT_IMPORT_MAX_ERRORS = int(os.environ.get('CLIENT_IMPORT_MAX_ERRORS', '100'))  # Row errors listed in the summary
+    
+    # Few-shot example selection
+    EXAMPLE_TOP_K = int(os.environ.get('EXAMPLE_TOP_K', '5'))  # Default when a profile has no AIModelSettings.example_count
+    EXAMPLE_INDEX_DIMS = int(os.environ.get('EXAMPLE_INDEX_DIMS', '512'))  # Hashed feature dimensions
+    EXAMPLE_INDEX_MAX_EXAMPLES = int(os.environ.get('EXAMPLE_INDEX_MAX_EXAMPLES', '5000'))  # Newest examples indexed per profile
+    EXAMPLE_INDEX_REFRESH_INTERVAL = int(os.environ.get('EXAMPLE_INDEX_REFRESH_INTERVAL', '30'))  # Seconds between checks for new examples
+    
+    # Text example uploads
+    TEXT_EXAMPLE_MAX_LENGTH = int(os.environ.get('TEXT_EXAMPLE_MAX_LENGTH', '1600'))  # Characters; longer examples are skipped
+    TEXT_EXAMPLES_MAX_PER_PROFILE = int(os.environ.get('TEXT_EXAMPLES_MAX_PER_PROFILE', '20000'))
+    TEXT_EXAMPLES_MAX_UPLOAD = int(os.environ.get('TEXT_EXAMPLES_MAX_UPLOAD', '50000'))  # Examples read from one upload; the rest are reported as dropped
+    TEXT_EXAMPLES_CHUNK_SIZE = int(os.environ.get('TEXT_EXAMPLES_CHUNK_SIZE', '1000'))  # Rows per INSERT
+    TEXT_EXAMPLES_INLINE_LIMIT = int(os.environ.get('TEXT_EXAMPLES_INLINE_LIMIT', '2000'))  # Larger uploads run as a background job
+    
+    # Uploads and background jobs
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', str(32 * 1024 * 1024)))  # Bytes per request
+    JOB_TTL = int(os.environ.get('JOB_TTL', '86400'))  # Seconds job status is kept
+    
+    # Delivery status callbacks
+    DELIVERY_STATUS_BATCH_SIZE = int(os.environ.get('DELIVERY_STATUS_BATCH_SIZE', '500'))
+    DELIVERY_STATUS_FLUSH_INTERVAL = float(os.environ.get('DELIVERY_STATUS_FLUSH_INTERVAL', '1.0'))  # Seconds
+    DELIVERY_STATUS_LEASE_SECONDS = int(os.environ.get('DELIVERY_STATUS_LEASE_SECONDS', '60'))  # Before a crashed flusher's batch is redelivered
+    
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or generate_encryption_key()
 class DevelopmentConfig(Config):
     DEBUG = True
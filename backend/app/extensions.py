@@ -1,20 +1,59 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
-from celery import Celery
+from app.utils.db_routing import RoutingSession
 
 # Initialize extensions without configuration
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 socketio = SocketIO()
 
-# Create Celery instance that will be configured later
-celery = Celery(__name__)
+# Flask-Migrate (alembic) and Celery are only needed by the `flask db` CLI and
+# Celery workers, so they are created on first access rather than at import
+_lazy_extensions = {}
+
+def __getattr__(name):
+    if name == 'migrate':
+        if name not in _lazy_extensions:
+            from flask_migrate import Migrate
+            _lazy_extensions[name] = Migrate()
+        return _lazy_extensions[name]
+    
+    if name == 'celery':
+        if name not in _lazy_extensions:
+            # Create Celery instance, configured for the app registered by defer_celery if any
+            from celery import Celery
+            _lazy_extensions[name] = Celery(__name__)
+            if 'celery_app' in _lazy_extensions:
+                init_celery(_lazy_extensions['celery_app'])
+        return _lazy_extensions[name]
+    
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_redis(app=None):
+    """Get the shared Redis connection for the app, or None if REDIS_URL is not set"""
+    app = app or current_app._get_current_object()
+    
+    if 'redis' not in app.extensions:
+        redis_url = app.config.get('REDIS_URL')
+        if redis_url:
+            import redis
+            app.extensions['redis'] = redis.from_url(redis_url)
+        else:
+            app.extensions['redis'] = None
+    
+    return app.extensions['redis']
+
+def defer_celery(app):
+    """Configure Celery for the app the first time `celery` is accessed"""
+    _lazy_extensions['celery_app'] = app
+    if 'celery' in _lazy_extensions:
+        init_celery(app)
 
 def init_celery(app):
     """Initialize Celery with Flask app context"""
+    celery = __getattr__('celery')
     celery.conf.update(
         broker_url=app.config['CELERY_BROKER_URL'],
         result_backend=app.config['CELERY_RESULT_BACKEND'],
@@ -11,6 +11,8 @@ def init_models():
     from app.models.billing import SubscriptionPlan, Subscription, Invoice, InvoiceItem
     from app.models.payment import PaymentMethod
     from app.models.subscription_payment_method import SubscriptionPaymentMethod
+    from app.models.stripe_event import StripeEvent
+    from app.models.stripe_mirror import StripeObject
     
     # Messaging models
     from app.models.message import Message
@@ -40,6 +42,8 @@ def init_models():
     globals()['InvoiceItem'] = InvoiceItem
     globals()['PaymentMethod'] = PaymentMethod
     globals()['SubscriptionPaymentMethod'] = SubscriptionPaymentMethod
+    globals()['StripeEvent'] = StripeEvent
+    globals()['StripeObject'] = StripeObject
     globals()['Message'] = Message
     globals()['FlaggedMessage'] = FlaggedMessage
     globals()['TextExample'] = TextExample
@@ -64,6 +68,8 @@ def init_models():
         'InvoiceItem': InvoiceItem,
         'PaymentMethod': PaymentMethod,
         'SubscriptionPaymentMethod': SubscriptionPaymentMethod,
+        'StripeEvent': StripeEvent,
+        'StripeObject': StripeObject,
         'Message': Message,
         'FlaggedMessage': FlaggedMessage,
         'TextExample': TextExample,
@@ -13,6 +13,7 @@ class AIModelSettings(db.Model):
     response_length = db.Column(db.Integer, default=150)
     custom_instructions = db.Column(db.Text)
     style_notes = db.Column(db.Text)
+    example_count = db.Column(db.Integer, default=5)  # Few-shot examples picked per reply
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -28,6 +29,7 @@ class AIModelSettings(db.Model):
             'response_length': self.response_length,
             'custom_instructions': self.custom_instructions,
             'style_notes': self.style_notes,
+            'example_count': self.example_count,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
\ No newline at end of file
@@ -8,13 +8,15 @@ class Message(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     profile_id = db.Column(db.Integer, db.ForeignKey('profiles.id', ondelete='CASCADE'), nullable=False)
-    sender_number = db.Column(db.String(20), nullable=False)
+    sender_number = db.Column(db.String(20), nullable=False, index=True)  # Conversations and client name changes look it up
     content = db.Column(db.Text, nullable=False)
     is_incoming = db.Column(db.Boolean, nullable=False)  # True if from client, False if from profile
     ai_generated = db.Column(db.Boolean, default=False)
+    prompt_tokens = db.Column(db.Integer)  # Prompt size an AI reply was generated from
+    timings = db.Column(db.Text)  # JSON reply pipeline stage timings (REPLY_TIMINGS_PERSIST)
     is_read = db.Column(db.Boolean, default=False)
-    twilio_sid = db.Column(db.String(50))
-    send_status = db.Column(db.String(20))  # 'sent', 'delivered', 'failed'
+    twilio_sid = db.Column(db.String(50), index=True)  # Delivery receipts are matched on it
+    send_status = db.Column(db.String(20))  # 'queued', 'sending', 'sent', 'delivered', 'undelivered', 'failed', 'read'
     send_error = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -40,6 +42,8 @@ class Message(db.Model):
             'sender_number': self.sender_number,
             'profile_id': self.profile_id,
             'ai_generated': self.ai_generated,
+            'prompt_tokens': self.prompt_tokens,
+            'timings': json.loads(self.timings) if self.timings else None,
             'is_read': self.is_read,
             'twilio_sid': self.twilio_sid,
             'send_status': self.send_status,
@@ -0,0 +1,40 @@
+# app/models/stripe_event.py
+from app.extensions import db
+from datetime import datetime
+import json
+
+class StripeEvent(db.Model):
+    """A received Stripe webhook event, stored once per event id and processed asynchronously"""
+    __tablename__ = 'stripe_events'
+    __table_args__ = (
+        db.Index('ix_stripe_events_pending', 'ordering_key', 'status', 'created'),
+        {'extend_existing': True},
+    )
+
+    id = db.Column(db.String(255), primary_key=True)  # Stripe event id (evt_...)
+    type = db.Column(db.String(100), nullable=False)
+    created = db.Column(db.DateTime, nullable=False)  # When Stripe created the event
+    ordering_key = db.Column(db.String(255), nullable=False)  # Subscription (or customer) the event applies to
+    payload = db.Column(db.Text, nullable=False)  # Event JSON as delivered
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processed, ignored, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+
+    def get_object(self):
+        """The event's data.object as a dict"""
+        return json.loads(self.payload)['data']['object']
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'created': self.created.isoformat(),
+            'ordering_key': self.ordering_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
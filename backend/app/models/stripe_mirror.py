@@ -0,0 +1,32 @@
+# app/models/stripe_mirror.py
+from app.extensions import db
+from datetime import datetime
+import json
+
+class StripeObject(db.Model):
+    """Local copy of a Stripe price, customer or subscription, kept current by webhooks and reconciliation"""
+    __tablename__ = 'stripe_objects'
+    __table_args__ = {'extend_existing': True}
+
+    id = db.Column(db.String(255), primary_key=True)  # Stripe id (price_..., cus_..., sub_...)
+    object = db.Column(db.String(30), nullable=False, index=True)  # price, customer, subscription
+    customer_id = db.Column(db.String(255), index=True)  # Owning customer, for subscriptions
+    data = db.Column(db.Text, nullable=False)  # Object JSON as Stripe returned it
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    as_of = db.Column(db.DateTime, nullable=False)  # Stripe time of this state; older states never overwrite it
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)  # When it was last written here
+
+    def get_data(self):
+        """The mirrored object as a dict"""
+        return json.loads(self.data)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'object': self.object,
+            'customer_id': self.customer_id,
+            'data': self.get_data(),
+            'deleted': self.deleted,
+            'as_of': self.as_of.isoformat(),
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
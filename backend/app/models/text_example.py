@@ -4,11 +4,16 @@ from datetime import datetime
 
 class TextExample(db.Model):
     __tablename__ = 'text_examples'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # One copy of each example per profile
+        db.UniqueConstraint('profile_id', 'content_hash', name='uix_text_example_content'),
+        {'extend_existing': True}
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     profile_id = db.Column(db.Integer, db.ForeignKey('profiles.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64))  # SHA-256 of the trimmed content
     is_incoming = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
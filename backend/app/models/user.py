@@ -40,10 +40,18 @@ class User(db.Model):
     twilio_usage_tracker = db.relationship('TwilioUsage', back_populates='user', uselist=False)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app.utils.security import run_off_hub
+        method = current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+        self.password_hash = run_off_hub(generate_password_hash, password, method=method)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from app.utils.security import run_off_hub
+        return run_off_hub(check_password_hash, self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check whether the stored hash predates the configured hashing cost"""
+        from app.utils.security import password_needs_rehash
+        return password_needs_rehash(self.password_hash)
     
     def encrypt_token(self, token):
         """Encrypt a sensitive token before storing it"""
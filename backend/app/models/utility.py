@@ -57,9 +57,9 @@ class APIKey(db.Model):
     user = db.relationship('User', back_populates='api_keys')
     
     def update_last_used(self):
-        """Update last used timestamp"""
-        self.last_used_at = datetime.utcnow()
-        db.session.commit()
+        """Record a use; last_used_at is written in bulk by the API key flusher"""
+        from app.services.api_key_cache import record_api_key_use
+        record_api_key_use(self.id)
     
     def is_valid(self):
         """Check if API key is valid and not expired"""
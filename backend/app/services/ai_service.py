@@ -3,8 +3,9 @@ import requests
 from flask import current_app
 from app.models.ai_model_settings import AIModelSettings
 from app.models.message import Message
-from app.models.text_example import TextExample
 from app.models.client import Client
+from app.services.example_index import select_examples
+from app.services import prompt_assembly
 
 def generate_ai_response(profile, incoming_message, sender_number):
     """Generate AI response using self-hosted LLM instead of OpenAI"""
@@ -25,31 +26,33 @@ def generate_ai_response(profile, incoming_message, sender_number):
     # Get client information (using your existing method)
     client = Client.query.filter_by(phone_number=sender_number).first()
     
-    # Get examples of profile's texting style (using your existing method)
-    examples = TextExample.query.filter_by(profile_id=profile.id).order_by(TextExample.timestamp).limit(20).all()
+    # Get the examples of profile's texting style most relevant to this message
+    examples = select_examples(profile, incoming_message, conversation)
     
-    # Create system prompt (using your existing method)
-    system_prompt = create_system_prompt(profile, client, examples)
+    # Create system prompt (using your existing method) and fit it, the history and the
+    # current message into the model's token budget
+    prompt = assemble_prompt(profile, client, examples, conversation, incoming_message)
+    current_app.logger.info(f"Prompt for profile {profile.id}: {prompt.stats()}")
     
     # Prepare conversation for LLM
     messages = [
-        {"role": "system", "content": system_prompt}
+        {"role": "system", "content": prompt.render(('system', 'notes', 'examples'))}
     ]
     
     # Add conversation history
-    for msg in conversation:
+    for msg in prompt.items('history'):
         role = "user" if msg.is_incoming else "assistant"
         messages.append({"role": role, "content": msg.content})
     
     # Add current message
-    messages.append({"role": "user", "content": incoming_message})
+    messages.append({"role": "user", "content": (prompt.items('message') or [incoming_message])[0]})
     
     # Call LLM API
     try:
         response = requests.post(
             f"{current_app.config['LLM_BASE_URL']}/chat",
             json={
-                "model": "dolphin3"
+                "model": "dolphin3",
                 "messages": messages,
                 "stream": False,
                 "options": {
@@ -85,8 +88,16 @@ def get_conversation_history(profile_id, client_phone, limit=10):
 
 def create_system_prompt(profile, client, examples):
     """Create system prompt for AI response generation"""
+    return assemble_prompt(profile, client, examples).render(('system', 'notes', 'examples'))
+
+
+def assemble_prompt(profile, client, examples, conversation=None, incoming_message=None):
+    """
+    Pack the system prompt, client notes and instructions, examples, history and
+    current message into the model's token budget (see prompt_assembly).
+    """
     # Basic information about the profile
-    prompt = f"""
+    system = f"""
     You are responding as {profile.name}, an escort. Mimic their texting style based on the examples provided.
     
     IMPORTANT GUIDELINES:
@@ -97,32 +108,34 @@ def create_system_prompt(profile, client, examples):
     5. If messages contain suspicious content, be vague or change the subject
     6. Be seductive, flirty, short and consise.
     7. Use one or two emojis.
-    
     """
     
     # Add client-specific information
-    if client:
-        prompt += f"\nClient information:"
+    if client and (client.name or client.is_regular):
+        system += f"\nClient information:"
         if client.name:
-            prompt += f"\n- Name: {client.name}"
-        if client.notes:
-            prompt += f"\n- Notes: {client.notes}"
+            system += f"\n- Name: {client.name}"
         if client.is_regular:
-            prompt += f"\n- This is a regular client. Be more familiar and friendly."
-    
-    # Add custom instructions from AI settings
-    if profile.ai_settings and profile.ai_settings.custom_instructions:
-        prompt += f"\n\nCustom instructions:\n{profile.ai_settings.custom_instructions}"
-    
-    # Add style notes
-    if profile.ai_settings and profile.ai_settings.style_notes:
-        prompt += f"\n\nWriting style notes:\n{profile.ai_settings.style_notes}"
-    
-    # Add examples of writing style
-    if examples:
-        prompt += "\n\nExamples of my texting style:"
-        for ex in examples:
-            sender = "Client" if ex.is_incoming else "Me"
-            prompt += f"\n{sender}: {ex.content}"
+            system += f"\n- This is a regular client. Be more familiar and friendly."
+    
+    # Client notes, custom instructions and style notes are dropped or cut first when over budget
+    settings = profile.ai_settings
+    notes = [
+        f"Client notes: {client.notes}" if client and client.notes else None,
+        f"Custom instructions:\n{settings.custom_instructions}" if settings and settings.custom_instructions else None,
+        f"Writing style notes:\n{settings.style_notes}" if settings and settings.style_notes else None,
+    ]
     
-    return prompt
+    def speaker(ex):
+        sender = "Client" if ex.is_incoming else "Me"
+        return f"{sender}: {ex.content}"
+    
+    assembler = prompt_assembly.new_assembler(current_app.config.get('LLM_MODEL', 'dolphin3'))
+    assembler.add('system', system, prompt_assembly.PRIORITY_SYSTEM, required=True, truncate=True)
+    assembler.add('notes', notes, prompt_assembly.PRIORITY_NOTES, truncate=True)
+    assembler.add('examples', examples, prompt_assembly.PRIORITY_EXAMPLES,
+                  header="Examples of my texting style:", render=speaker)
+    assembler.add('history', conversation or [], prompt_assembly.PRIORITY_HISTORY,
+                  render=lambda msg: msg.content, recent=True)
+    assembler.add('message', incoming_message, prompt_assembly.PRIORITY_MESSAGE, required=True, truncate=True)
+    return assembler.assemble()
@@ -0,0 +1,188 @@
+# app/services/api_key_cache.py
+"""
+API key lookup cache and write-behind last-used tracking.
+
+validate_api_key answers repeat lookups from a short-TTL cache of key hash
+-> key info (misses included, so a client retrying a bad key doesn't hit the
+database either). revoke_api_key evicts the key from this process's cache
+and publishes the key hash on a Redis channel every other process evicts it
+from; without Redis (or while a subscription is down) other processes stop
+accepting it within API_KEY_CACHE_TTL.
+
+Key usage is collected in memory as key id -> last use and written to
+api_keys.last_used_at in one executemany every API_KEY_LAST_USED_FLUSH_INTERVAL
+seconds, so API-key requests stay read-only.
+"""
+import time
+import threading
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+from app.extensions import db, socketio, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'api_keys_revoked'
+
+# Marks a cached "no such valid key" result
+_MISSING = object()
+
+
+class ApiKeyCache:
+    """TTL cache of API key hash -> key info dict (or a cached miss)"""
+
+    def __init__(self, ttl=30, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key_hash):
+        """
+        Returns:
+            tuple: (hit, info) - info is None for a cached miss
+        """
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            return False, None
+
+        info, cached_until = entry
+        now = time.monotonic()
+        if cached_until <= now:
+            return False, None
+
+        # The key may have expired while cached
+        if info is not _MISSING and info.get('expires_at') and info['expires_at'] < datetime.utcnow():
+            return True, None
+
+        return True, None if info is _MISSING else info
+
+    def set(self, key_hash, info):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                now = time.monotonic()
+                self._entries = {h: e for h, e in self._entries.items() if e[1] > now}
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+            self._entries[key_hash] = (_MISSING if info is None else info, time.monotonic() + self.ttl)
+
+    def invalidate(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+
+class LastUsedRecorder:
+    """Collects API key use times in memory for periodic bulk writes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, key_id, used_at=None):
+        with self._lock:
+            self._pending[key_id] = used_at or datetime.utcnow()
+
+    def flush(self):
+        """
+        Write all collected use times.
+
+        Returns:
+            int: Number of keys updated
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        try:
+            db.session.execute(
+                text("UPDATE api_keys SET last_used_at = :last_used_at WHERE id = :id"),
+                [{'id': key_id, 'last_used_at': used_at} for key_id, used_at in pending.items()]
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Failed to record last use of {len(pending)} API keys: {str(e)}")
+            # Keep the times for the next flush unless a newer use was recorded meanwhile
+            with self._lock:
+                for key_id, used_at in pending.items():
+                    self._pending.setdefault(key_id, used_at)
+            return 0
+
+        return len(pending)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def get_api_key_cache(app=None):
+    """Get the app's shared ApiKeyCache, subscribing to revocations on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'api_key_cache' not in app.extensions:
+        cache = ApiKeyCache(ttl=app.config.get('API_KEY_CACHE_TTL', 30))
+        app.extensions['api_key_cache'] = cache
+
+        redis_conn = get_redis(app)
+        if redis_conn is not None:
+            socketio.start_background_task(_listen, cache, redis_conn)
+
+    return app.extensions['api_key_cache']
+
+
+def invalidate_api_key(key_hash):
+    """Drop a cached key here and in every other process"""
+    get_api_key_cache().invalidate(key_hash)
+
+    redis_conn = get_redis()
+    if redis_conn is not None:
+        try:
+            redis_conn.publish(CHANNEL, key_hash)
+        except Exception as e:
+            logger.warning(f"Failed to publish API key revocation: {str(e)}")
+
+
+def _listen(cache, redis_conn):
+    while True:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CHANNEL)
+            for message in pubsub.listen():
+                cache.invalidate(message['data'].decode())
+        except Exception as e:
+            logger.warning(f"API key revocation channel lost: {str(e)}")
+        finally:
+            pubsub.close()
+
+        time.sleep(1)
+
+
+def get_last_used_recorder(app=None):
+    """Get the app's shared LastUsedRecorder, starting its flush loop on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'api_key_last_used' not in app.extensions:
+        app.extensions['api_key_last_used'] = LastUsedRecorder()
+        socketio.start_background_task(_flush_loop, app)
+
+    return app.extensions['api_key_last_used']
+
+
+def record_api_key_use(key_id):
+    """Note that an API key was used; written to the database on the next flush"""
+    get_last_used_recorder().record(key_id)
+
+
+def _flush_loop(app):
+    interval = app.config.get('API_KEY_LAST_USED_FLUSH_INTERVAL', 30)
+
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                get_last_used_recorder(app).flush()
+        except Exception as e:
+            logger.exception(f"API key last-used flush failed: {str(e)}")
@@ -0,0 +1,159 @@
+# app/services/background_jobs.py
+"""
+Status tracking for work handed to the task queue.
+
+A job is a Redis hash job:<id> holding its kind, owner, state (queued,
+running, completed or failed), result and error; clients poll it while a
+queue worker runs the job. Input too large for a task payload can be staged
+in the list job:<id>:input. Both expire JOB_TTL seconds after the last update.
+A job that must run at most once claims itself with start(), so a duplicate
+or reclaimed queue task finds it no longer queued and leaves it alone.
+"""
+import json
+import time
+import uuid
+import logging
+
+from flask import current_app
+from app.extensions import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATES = ('queued', 'running', 'completed', 'failed')
+
+# Moves a job from queued to running; 0 if it is in any other state (or gone)
+START_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') ~= 'queued' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', 'running', 'updated_at', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class JobStore:
+    """Job status hashes and staged input lists in Redis"""
+
+    def __init__(self, redis_conn, ttl=86400, key_prefix='job'):
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self._start_script = redis_conn.register_script(START_SCRIPT)
+
+    def create(self, kind, user_id=None):
+        """Record a new queued job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        key = self._key(job_id)
+        pipeline = self.redis_conn.pipeline(transaction=True)
+        pipeline.hset(key, mapping={
+            'id': job_id,
+            'kind': kind,
+            'user_id': '' if user_id is None else str(user_id),
+            'state': 'queued',
+            'created_at': now,
+            'updated_at': now,
+        })
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+        return job_id
+
+    def update(self, job_id, state=None, result=None, error=None):
+        fields = {'updated_at': time.time()}
+        if state is not None:
+            if state not in STATES:
+                raise ValueError(f"Unknown job state: {state}")
+            fields['state'] = state
+        if result is not None:
+            fields['result'] = json.dumps(result)
+        if error is not None:
+            fields['error'] = error
+
+        key = self._key(job_id)
+        pipeline = self.redis_conn.pipeline(transaction=True)
+        pipeline.hset(key, mapping=fields)
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def start(self, job_id):
+        """
+        Mark a queued job running.
+
+        Returns:
+            bool: False if the job was not queued (already started, finished or expired)
+        """
+        return bool(self._start_script(keys=[self._key(job_id)], args=[time.time(), self.ttl]))
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: Job status with result decoded, or None if unknown or expired
+        """
+        raw = self.redis_conn.hgetall(self._key(job_id))
+        if not raw:
+            return None
+
+        job = {key.decode(): value.decode() for key, value in raw.items()}
+        job['user_id'] = int(job['user_id']) if job.get('user_id') else None
+        job['created_at'] = float(job['created_at'])
+        job['updated_at'] = float(job['updated_at'])
+        if 'result' in job:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def push_input(self, job_id, items):
+        """Append JSON-serializable items to the job's staged input"""
+        key = self._key(job_id, 'input')
+        pipeline = self.redis_conn.pipeline(transaction=False)
+        pipeline.rpush(key, *[json.dumps(item) for item in items])
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def iter_input(self, job_id, batch_size=1000):
+        """Yield the job's staged input items in order"""
+        key = self._key(job_id, 'input')
+        start = 0
+        while True:
+            batch = self.redis_conn.lrange(key, start, start + batch_size - 1)
+            for raw in batch:
+                yield json.loads(raw)
+            if len(batch) < batch_size:
+                return
+            start += batch_size
+
+    def delete_input(self, job_id):
+        self.redis_conn.delete(self._key(job_id, 'input'))
+
+    def _key(self, job_id, suffix=None):
+        key = f"{self.key_prefix}:{job_id}"
+        return f"{key}:{suffix}" if suffix else key
+
+
+def get_job_store(app=None):
+    """Get the app's shared JobStore, or None when Redis is not configured"""
+    app = app or current_app._get_current_object()
+
+    if 'job_store' not in app.extensions:
+        redis_conn = get_redis(app)
+        app.extensions['job_store'] = JobStore(
+            redis_conn, ttl=app.config.get('JOB_TTL', 86400)
+        ) if redis_conn is not None else None
+
+    return app.extensions['job_store']
+
+
+def job_status(job):
+    """Public view of a job for status polling"""
+    status = {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'state': job['state'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
+    if 'result' in job:
+        status['result'] = job['result']
+    if job.get('error'):
+        status['error'] = job['error']
+    return status
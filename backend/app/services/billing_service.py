@@ -1,22 +1,32 @@
-import stripe
 from flask import current_app
+from app.utils.lazy_import import lazy_import
 from datetime import datetime, timedelta
 from app.extensions import db
+from app.services.queue_service import register_task
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+stripe = lazy_import('stripe')
+
 def initialize_stripe():
     """Configure Stripe with API key"""
     stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
 
 def create_subscription(user_id, plan_id, payment_method_id):
-    """Create a new subscription for a user"""
+    """
+    Create a new subscription for a user.
+    
+    Two Stripe calls at most: the customer (first subscription only) and the
+    subscription, which carries its default payment method itself. Both are
+    written to the Stripe mirror.
+    """
     from app.models.user import User
-    from app.models.billing import SubscriptionPlan, Subscription, Invoice
+    from app.models.billing import SubscriptionPlan, Subscription
     from app.models.payment import PaymentMethod
     from app.models.subscription_payment_method import SubscriptionPaymentMethod
+    from app.services.stripe_mirror import mirror
     
     initialize_stripe()
     
@@ -37,6 +47,10 @@ def create_subscription(user_id, plan_id, payment_method_id):
     if payment_method.user_id != user_id:
         raise ValueError("Payment method does not belong to user")
     
+    # Queued requests can race; only one may subscribe
+    if Subscription.query.filter_by(user_id=user_id, is_active=True).first():
+        raise ValueError("User already has an active subscription")
+    
     # Ensure user has a Stripe customer ID
     if not user.stripe_customer_id:
         customer = stripe.Customer.create(
@@ -45,22 +59,16 @@ def create_subscription(user_id, plan_id, payment_method_id):
             phone=user.phone_number
         )
         user.stripe_customer_id = customer.id
+        mirror(customer)
         db.session.commit()
     
-    # Set the payment method as default for the customer
-    stripe.Customer.modify(
-        user.stripe_customer_id,
-        invoice_settings={
-            'default_payment_method': payment_method.stripe_payment_method_id
-        }
-    )
-    
     # Create Stripe subscription
     stripe_subscription = stripe.Subscription.create(
         customer=user.stripe_customer_id,
         items=[
             {'price': plan.stripe_price_id},
         ],
+        default_payment_method=payment_method.stripe_payment_method_id,
         payment_behavior='default_incomplete',
         expand=['latest_invoice.payment_intent'],
         metadata={
@@ -95,7 +103,7 @@ def create_subscription(user_id, plan_id, payment_method_id):
     )
     
     db.session.add(subscription)
-    db.session.commit()
+    db.session.flush()
     
     # Create subscription-payment method relationship
     spm = SubscriptionPaymentMethod(
@@ -104,6 +112,7 @@ def create_subscription(user_id, plan_id, payment_method_id):
         is_primary=True
     )
     db.session.add(spm)
+    mirror(stripe_subscription)
     db.session.commit()
     
     return subscription
@@ -111,6 +120,7 @@ def create_subscription(user_id, plan_id, payment_method_id):
 def update_subscription(subscription_id, plan_id):
     """Update a subscription to a new plan"""
     from app.models.billing import Subscription, SubscriptionPlan
+    from app.services.stripe_mirror import mirror, subscription_item_id
     
     initialize_stripe()
     
@@ -126,11 +136,14 @@ def update_subscription(subscription_id, plan_id):
         return subscription  # No change needed
     
     try:
-        # Update Stripe subscription
-        stripe_subscription = stripe.Subscription.retrieve(subscription.stripe_subscription_id)
-        item_id = stripe_subscription['items']['data'][0].id
+        # The item to switch comes from the mirror; Stripe only if it isn't mirrored yet
+        item_id = subscription_item_id(subscription.stripe_subscription_id)
+        if item_id is None:
+            stripe_subscription = stripe.Subscription.retrieve(subscription.stripe_subscription_id)
+            item_id = stripe_subscription['items']['data'][0].id
         
-        stripe.Subscription.modify(
+        # Update Stripe subscription
+        stripe_subscription = stripe.Subscription.modify(
             subscription.stripe_subscription_id,
             items=[{
                 'id': item_id,
@@ -145,6 +158,7 @@ def update_subscription(subscription_id, plan_id):
         
         # Update local subscription
         subscription.plan_id = plan_id
+        mirror(stripe_subscription)
         db.session.commit()
         
         return subscription
@@ -156,6 +170,7 @@ def update_subscription(subscription_id, plan_id):
 def cancel_subscription(subscription_id):
     """Cancel a subscription"""
     from app.models.billing import Subscription
+    from app.services.stripe_mirror import mirror
     
     initialize_stripe()
     
@@ -164,13 +179,14 @@ def cancel_subscription(subscription_id):
         raise ValueError("Subscription not found")
     
     try:
-        stripe.Subscription.modify(
+        stripe_subscription = stripe.Subscription.modify(
             subscription.stripe_subscription_id,
             cancel_at_period_end=True
         )
         
         subscription.auto_renew = False
         subscription.end_date = subscription.get_current_period_end()
+        mirror(stripe_subscription)
         
         db.session.commit()
         
@@ -180,25 +196,30 @@ def cancel_subscription(subscription_id):
         logger.error(f"Stripe error canceling subscription: {str(e)}")
         raise ValueError(f"Error canceling subscription: {str(e)}")
 
-def check_subscription_status(subscription_id):
-    """Check current status of a subscription with Stripe"""
+def check_subscription_status(subscription_id, refresh=False):
+    """
+    Bring a subscription's status up to date.
+    
+    Served from the Stripe mirror, which webhooks and reconciliation keep
+    current; Stripe is only called when the subscription isn't mirrored yet
+    or refresh is set.
+    """
     from app.models.billing import Subscription
-    
-    initialize_stripe()
+    from app.services.stripe_mirror import mirror, get_mirrored, sync_subscriptions
     
     subscription = Subscription.query.get(subscription_id)
     if not subscription:
         raise ValueError("Subscription not found")
     
+    if not refresh and get_mirrored(subscription.stripe_subscription_id) is not None:
+        sync_subscriptions([subscription.stripe_subscription_id])
+        db.session.commit()
+        return subscription
+    
+    initialize_stripe()
+    
     try:
-        stripe_subscription = stripe.Subscription.retrieve(subscription.stripe_subscription_id)
-        
-        subscription.payment_status = stripe_subscription.status
-        
-        if stripe_subscription.status in ['canceled', 'unpaid']:
-            subscription.is_active = False
-            subscription.end_date = datetime.fromtimestamp(stripe_subscription.ended_at) if hasattr(stripe_subscription, 'ended_at') and stripe_subscription.ended_at else datetime.utcnow()
-        
+        mirror(stripe.Subscription.retrieve(subscription.stripe_subscription_id))
         db.session.commit()
         
         return subscription
@@ -253,4 +274,49 @@ def create_checkout_session(user_id, plan_id, success_url, cancel_url):
     
     except stripe.error.StripeError as e:
         logger.error(f"Stripe error creating checkout session: {str(e)}")
-        raise ValueError(f"Error creating checkout session: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Error creating checkout session: {str(e)}")
+
+
+JOB_KIND = 'subscription_change'
+
+# Job action -> billing function it runs
+SUBSCRIPTION_ACTIONS = {
+    'create': create_subscription,
+    'update': update_subscription,
+    'cancel': cancel_subscription,
+}
+
+
+def start_subscription_job(job_store, task_queue, action, user_id, **kwargs):
+    """
+    Queue a subscription change; a user's changes run one at a time, in order.
+    
+    Returns:
+        str: Job id
+    """
+    job_id = job_store.create(JOB_KIND, user_id=user_id)
+    task_queue.enqueue(subscription_job, job_id, action, kwargs, partition_key=f"billing:{user_id}")
+    return job_id
+
+
+@register_task
+def subscription_job(job_id, action, kwargs):
+    """Queue task: run a subscription change and record the outcome on the job"""
+    from app.services.background_jobs import get_job_store
+    
+    job_store = get_job_store()
+    # Runs at most once: a duplicate or reclaimed task must not redo (or overwrite) a change
+    if not job_store.start(job_id):
+        logger.warning(f"Subscription {action} job {job_id} is not queued, skipping")
+        return
+    try:
+        subscription = SUBSCRIPTION_ACTIONS[action](**kwargs)
+    except Exception as e:
+        # Not retried: most failures are card or validation errors the user has to fix and resubmit
+        db.session.rollback()
+        logger.exception(f"Subscription {action} job {job_id} failed: {str(e)}")
+        job_store.update(job_id, state='failed', error=str(e))
+        return
+    
+    job_store.update(job_id, state='completed', result=subscription.to_dict())
+    logger.info(f"Subscription {action} job {job_id} completed for subscription {subscription.id}")
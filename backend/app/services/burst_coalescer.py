@@ -0,0 +1,81 @@
+# app/services/burst_coalescer.py
+"""
+Coalescing of inbound message bursts.
+
+The SMS webhook stamps every inbound message with a per-conversation burst
+sequence number. The handler for a message stores it and queues the reply as
+a task delayed until the conversation has been quiet for
+INBOUND_COALESCE_WINDOW seconds, so no worker sits waiting. If a newer message
+arrived by then the reply is left to that message's task, which answers all
+unanswered fragments with one generation. A reply still being generated when
+a newer fragment arrives is cancelled the same way.
+"""
+import time
+import logging
+
+from flask import current_app
+from app.extensions import get_redis
+
+logger = logging.getLogger(__name__)
+
+class BurstTracker:
+    """Tracks the latest inbound message per conversation in Redis"""
+
+    def __init__(self, redis_conn, window=3.0, key_prefix='burst', ttl=3600):
+        self.redis_conn = redis_conn
+        self.window = window
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+
+    def mark(self, profile_id, sender_number):
+        """
+        Record a new inbound message for a conversation.
+
+        Returns:
+            int: The message's burst sequence number
+        """
+        key = self._key(profile_id, sender_number)
+        pipeline = self.redis_conn.pipeline(transaction=True)
+        pipeline.hincrby(key, 'seq', 1)
+        pipeline.hset(key, 'ts', time.time())
+        pipeline.expire(key, self.ttl)
+        seq, _, _ = pipeline.execute()
+        return seq
+
+    def latest(self, profile_id, sender_number):
+        """Latest (seq, arrival timestamp) for a conversation, or (0, 0.0)"""
+        seq, ts = self.redis_conn.hmget(self._key(profile_id, sender_number), 'seq', 'ts')
+        return int(seq or 0), float(ts or 0.0)
+
+    def is_superseded(self, profile_id, sender_number, seq):
+        """Check whether a newer message arrived after the one with this sequence number"""
+        return self.latest(profile_id, sender_number)[0] > seq
+
+    def quiet_in(self, profile_id, sender_number, seq):
+        """
+        Time left in the coalescing window after message seq.
+
+        Returns:
+            float: Seconds until the conversation has been quiet for the window
+                (0 if it already has), or None if a newer message arrived
+        """
+        latest_seq, latest_ts = self.latest(profile_id, sender_number)
+        if latest_seq > seq:
+            return None
+        return max(0.0, latest_ts + self.window - time.time())
+
+    def _key(self, profile_id, sender_number):
+        return f"{self.key_prefix}:{profile_id}:{sender_number}"
+
+
+def get_burst_tracker(app=None):
+    """Get the app's shared BurstTracker, or None when coalescing is disabled or Redis is not configured"""
+    app = app or current_app._get_current_object()
+
+    if 'burst_tracker' not in app.extensions:
+        window = app.config.get('INBOUND_COALESCE_WINDOW', 3.0)
+        redis_conn = get_redis(app)
+        app.extensions['burst_tracker'] = BurstTracker(redis_conn, window=window) \
+            if redis_conn is not None and window > 0 else None
+
+    return app.extensions['burst_tracker']
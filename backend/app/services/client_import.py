@@ -0,0 +1,211 @@
+# app/services/client_import.py
+"""
+Bulk client import.
+
+Rows (CSV, a JSON array or JSON lines) are read as a stream and processed in
+chunks of CLIENT_IMPORT_CHUNK_SIZE. Each chunk's phone numbers are normalized
+through an LRU of parse results (contact exports repeat the same numbers in
+the same formats a lot), deduplicated against everything seen so far in the
+import, and written with one INSERT ... ON CONFLICT for the clients and one
+for their profile_clients associations. Rows that can't be imported are
+reported by row number instead of failing the import.
+"""
+import csv
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import select
+from app.extensions import db
+from app.utils.normalize_phone import normalize_phone_number
+from app.utils.security import sanitize_input, validate_phone_number
+from app.utils.bulk_input import iter_rows, insert_on_conflict
+
+logger = logging.getLogger(__name__)
+
+# Column names accepted for the phone number, besides phone_number
+PHONE_COLUMNS = ('phone_number', 'phone', 'mobile', 'number', 'phone number')
+
+TRUE_VALUES = ('true', '1', 'yes', 'y', 't')
+
+
+@lru_cache(maxsize=65536)
+def normalize_phone_cached(phone_number):
+    """normalize_phone_number with parse results kept in an LRU"""
+    return normalize_phone_number(phone_number)
+
+
+def normalize_phone_batch(phone_numbers):
+    """
+    Normalize a batch of raw phone numbers, parsing each distinct value once.
+
+    Returns:
+        list: E.164 numbers (None where invalid), in input order
+    """
+    normalized = {}
+    for raw in set(phone_numbers):
+        phone = normalize_phone_cached(raw) if raw else None
+        normalized[raw] = phone if phone and validate_phone_number(phone) else None
+    return [normalized[raw] for raw in phone_numbers]
+
+
+def _phone_of(row):
+    for column in PHONE_COLUMNS:
+        value = row.get(column)
+        if value not in (None, ''):
+            return str(value).strip()
+    return None
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+class ClientImporter:
+    """Imports client rows in chunks and associates them with profiles"""
+
+    def __init__(self, profile_ids, chunk_size=1000, max_rows=100000, max_errors=100):
+        self.profile_ids = list(profile_ids)
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.max_errors = max_errors
+        self._seen = set()
+        self.summary = {
+            'total_rows': 0,
+            'created': 0,
+            'existing': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'associated': 0,
+            'errors': [],
+            'errors_truncated': False,
+        }
+
+    def run(self, rows):
+        """
+        Import every row.
+
+        Returns:
+            dict: Summary counts and per-row errors
+        """
+        chunk = []
+        for row_number, row in enumerate(rows, start=1):
+            if row_number > self.max_rows:
+                self._error(row_number, None, f"Import is limited to {self.max_rows} rows; the rest were skipped")
+                break
+
+            self.summary['total_rows'] += 1
+            chunk.append((row_number, row))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            self._import_chunk(chunk)
+        return self.summary
+
+    def _error(self, row_number, phone_number, message):
+        if len(self.summary['errors']) < self.max_errors:
+            self.summary['errors'].append({'row': row_number, 'phone_number': phone_number, 'error': message})
+        else:
+            self.summary['errors_truncated'] = True
+
+    def _import_chunk(self, chunk):
+        raw_phones = [_phone_of(row) if isinstance(row, dict) else None for _, row in chunk]
+        phones = normalize_phone_batch(raw_phones)
+
+        now = datetime.utcnow()
+        values = []
+        for (row_number, row), raw, phone in zip(chunk, raw_phones, phones):
+            if not isinstance(row, dict):
+                self.summary['invalid'] += 1
+                self._error(row_number, None, "Row is not an object")
+                continue
+            if phone is None:
+                self.summary['invalid'] += 1
+                self._error(row_number, raw, "Missing phone number" if not raw else "Invalid phone number")
+                continue
+            if phone in self._seen:
+                self.summary['duplicates'] += 1
+                continue
+            self._seen.add(phone)
+
+            values.append({
+                'phone_number': phone,
+                'name': sanitize_input(str(row.get('name') or ''))[:100] or None,
+                'email': sanitize_input(str(row.get('email') or ''))[:255] or None,
+                'notes': sanitize_input(str(row.get('notes') or '')) or None,
+                'is_regular': _flag(row.get('is_regular')),
+                'is_blocked': _flag(row.get('is_blocked')),
+                'created_at': now,
+                'updated_at': now,
+            })
+
+        if not values:
+            return
+
+        try:
+            client_ids, created = self._upsert_clients(values)
+            self.summary['created'] += created
+            self.summary['existing'] += len(values) - created
+            self.summary['associated'] += self._associate(client_ids, now)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Client import chunk failed: {str(e)}")
+            self._error(chunk[0][0], None, f"Database error; rows {chunk[0][0]}-{chunk[-1][0]} were not imported")
+            self.summary['invalid'] += len(values)
+
+    def _upsert_clients(self, values):
+        """
+        Insert new clients, leaving existing ones untouched.
+
+        Returns:
+            tuple: (ids of every client in values, number newly created)
+        """
+        from app.models.client import Client
+
+        table = Client.__table__
+        statement = insert_on_conflict(table).values(values).on_conflict_do_nothing(
+            index_elements=['phone_number']
+        ).returning(table.c.id, table.c.phone_number)
+        created = dict((phone, client_id) for client_id, phone in db.session.execute(statement))
+
+        missing = [value['phone_number'] for value in values if value['phone_number'] not in created]
+        existing = dict((phone, client_id) for client_id, phone in db.session.execute(
+            select(table.c.id, table.c.phone_number).where(table.c.phone_number.in_(missing))
+        )) if missing else {}
+
+        return list(created.values()) + list(existing.values()), len(created)
+
+    def _associate(self, client_ids, now):
+        """Link clients to the import's profiles. Returns the number of new links."""
+        from app.models.profile_client import ProfileClient
+
+        if not self.profile_ids or not client_ids:
+            return 0
+
+        table = ProfileClient.__table__
+        statement = insert_on_conflict(table).values([
+            {'profile_id': profile_id, 'client_id': client_id, 'created_at': now, 'updated_at': now}
+            for profile_id in self.profile_ids for client_id in client_ids
+        ]).on_conflict_do_nothing(index_elements=['profile_id', 'client_id'])
+        return db.session.execute(statement).rowcount or 0
+
+
+def import_clients(stream, profile_ids, fmt='csv', chunk_size=1000, max_rows=100000, max_errors=100):
+    """
+    Import clients from a CSV / JSON / JSON lines stream.
+
+    Returns:
+        dict: Summary counts and per-row errors
+    """
+    importer = ClientImporter(profile_ids, chunk_size=chunk_size, max_rows=max_rows, max_errors=max_errors)
+    try:
+        return importer.run(iter_rows(stream, fmt))
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # Malformed input part-way through; keep what was imported
+        importer.summary['error'] = f"Could not read {fmt} input: {str(e)}"
+        return importer.summary
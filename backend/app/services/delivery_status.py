@@ -0,0 +1,330 @@
+# app/services/delivery_status.py
+"""
+Batched ingestion of Twilio delivery receipts (message status callbacks).
+
+The status webhook only appends receipts to a buffer and returns. A background
+flusher drains the buffer, collapses receipts per message SID and applies them
+with a single UPDATE ... FROM (VALUES ...) per batch, then emits one aggregated
+Socket.IO event per profile.
+
+With Redis, a drained batch is moved to its own processing list and only
+deleted once its UPDATE has committed. Batches a crashed flusher left behind
+go back to the front of the buffer once their lease expires.
+"""
+import json
+import time
+import uuid
+import threading
+import logging
+
+from flask import current_app
+from sqlalchemy import text
+from app.extensions import db, socketio, get_redis
+from app.services.realtime import emit_to_profile
+from app.services.response_versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'delivery_status:pending'
+
+# Lua script: move up to ARGV[1] receipts from the buffer to a batch's
+# processing list and lease the batch for ARGV[2] seconds.
+DRAIN_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local moved = {}
+for i = 1, tonumber(ARGV[1]) do
+    local raw = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+    if not raw then
+        break
+    end
+    moved[i] = raw
+end
+if #moved > 0 then
+    redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), KEYS[2])
+end
+return moved
+"""
+
+# Lua script: put the receipts of batches whose lease expired back at the
+# front of the buffer, in order. Returns the number of receipts restored.
+RECLAIM_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local restored = 0
+for _, batch in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    while redis.call('LMOVE', batch, KEYS[1], 'RIGHT', 'LEFT') do
+        restored = restored + 1
+    end
+    redis.call('ZREM', KEYS[2], batch)
+end
+return restored
+"""
+
+# Twilio MessageStatus values we record; 'queued', 'accepted' and 'sending'
+# callbacks carry nothing the dispatcher hasn't already stored.
+TRACKED_STATUSES = {'sent', 'delivered', 'undelivered', 'failed', 'read'}
+
+# Later states win; receipts can arrive out of order
+STATUS_RANK = {
+    'queued': 0,
+    'sending': 1,
+    'sent': 2,
+    'delivered': 3,
+    'undelivered': 3,
+    'failed': 3,
+    'read': 4,
+}
+
+# Receipts whose SID isn't stored yet (the send is still committing) are retried this many times
+MAX_UNMATCHED_ATTEMPTS = 3
+
+
+class DeliveryStatusBuffer:
+    """
+    FIFO buffer of pending receipts.
+
+    Backed by a Redis list when Redis is configured, so any process can flush
+    receipts taken by any other; otherwise an in-process list. Drained batches
+    must be acked once applied; unacked Redis batches are redelivered after
+    lease_seconds.
+    """
+
+    def __init__(self, redis_conn=None, key=BUFFER_KEY, lease_seconds=60):
+        self.redis_conn = redis_conn
+        self.key = key
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._pending = []
+
+        if redis_conn is not None:
+            self._drain_script = redis_conn.register_script(DRAIN_SCRIPT)
+            self._reclaim_script = redis_conn.register_script(RECLAIM_SCRIPT)
+
+    def add(self, message_sid, status, error_code=None, attempts=0):
+        """Append a receipt and return the buffer length"""
+        receipt = json.dumps({
+            'sid': message_sid,
+            'status': status,
+            'error_code': error_code,
+            'attempts': attempts
+        })
+
+        if self.redis_conn is not None:
+            return self.redis_conn.rpush(self.key, receipt)
+
+        with self._lock:
+            self._pending.append(receipt)
+            return len(self._pending)
+
+    def drain(self, limit):
+        """
+        Take up to limit receipts, oldest first.
+
+        Returns:
+            tuple: (batch, receipts); pass batch to ack() once the receipts are applied
+        """
+        if self.redis_conn is None:
+            with self._lock:
+                raw, self._pending = self._pending[:limit], self._pending[limit:]
+            return None, [json.loads(item) for item in raw]
+
+        restored = self._reclaim_script(keys=[self.key, f"{self.key}:leases"])
+        if restored:
+            logger.warning(f"Restored {restored} delivery receipts from an abandoned batch")
+
+        batch = f"{self.key}:processing:{uuid.uuid4().hex}"
+        raw = self._drain_script(keys=[self.key, batch, f"{self.key}:leases"], args=[limit, self.lease_seconds])
+        return (batch if raw else None), [json.loads(item) for item in raw]
+
+    def ack(self, batch):
+        """Forget a drained batch whose receipts have been applied (or re-added)"""
+        if batch is None or self.redis_conn is None:
+            return
+        pipeline = self.redis_conn.pipeline(transaction=True)
+        pipeline.delete(batch)
+        pipeline.zrem(f"{self.key}:leases", batch)
+        pipeline.execute()
+
+    def __len__(self):
+        if self.redis_conn is not None:
+            return self.redis_conn.llen(self.key)
+        return len(self._pending)
+
+
+def collapse_receipts(receipts):
+    """Keep one receipt per message SID: the one with the most advanced status"""
+    latest = {}
+    for receipt in receipts:
+        current = latest.get(receipt['sid'])
+        if current is None or STATUS_RANK[receipt['status']] >= STATUS_RANK[current['status']]:
+            latest[receipt['sid']] = receipt
+    return list(latest.values())
+
+
+def _rank_case(column):
+    """SQL CASE expression mapping a send_status column to its rank"""
+    whens = ' '.join(f"WHEN '{status}' THEN {rank}" for status, rank in STATUS_RANK.items())
+    return f"(CASE {column} {whens} ELSE -1 END)"
+
+
+def apply_receipts(receipts):
+    """
+    Bulk-update Message.send_status for a batch of collapsed receipts.
+
+    Returns:
+        list: (message_id, profile_id, twilio_sid, send_status) for every matched message
+    """
+    if not receipts:
+        return []
+
+    params = {}
+    rows = []
+    for i, receipt in enumerate(receipts):
+        params[f'sid{i}'] = receipt['sid']
+        params[f'status{i}'] = receipt['status']
+        params[f'error{i}'] = f"Twilio error {receipt['error_code']}" if receipt.get('error_code') else None
+        params[f'rank{i}'] = STATUS_RANK[receipt['status']]
+        rows.append(f"(:sid{i}, :status{i}, :error{i}, CAST(:rank{i} AS INTEGER))")
+
+    if db.engine.dialect.name == 'postgresql':
+        # One statement for the whole batch; never move a message back to an earlier state
+        result = db.session.execute(text(f"""
+            UPDATE messages AS m
+            SET send_status = CASE WHEN {_rank_case('m.send_status')} < v.rank
+                                   THEN v.status ELSE m.send_status END,
+                send_error = COALESCE(v.error, m.send_error)
+            FROM (VALUES {', '.join(rows)}) AS v(sid, status, error, rank)
+            WHERE m.twilio_sid = v.sid
+            RETURNING m.id, m.profile_id, m.twilio_sid, m.send_status
+        """), params)
+        updated = [tuple(row) for row in result]
+    else:
+        # Portable fallback for SQLite-backed development and tests
+        for i in range(len(receipts)):
+            db.session.execute(text(f"""
+                UPDATE messages
+                SET send_status = :status{i},
+                    send_error = COALESCE(:error{i}, send_error)
+                WHERE twilio_sid = :sid{i}
+                  AND {_rank_case('send_status')} < :rank{i}
+            """), params)
+        result = db.session.execute(
+            text("SELECT id, profile_id, twilio_sid, send_status FROM messages WHERE twilio_sid IN ("
+                 + ', '.join(f':sid{i}' for i in range(len(receipts))) + ")"),
+            params
+        )
+        updated = [tuple(row) for row in result]
+
+    db.session.commit()
+    return updated
+
+
+def flush_delivery_statuses(app=None, limit=None):
+    """
+    Drain one batch of receipts, apply it and emit aggregated status events.
+
+    Returns:
+        int: Number of receipts drained
+    """
+    app = app or current_app._get_current_object()
+    limit = limit or app.config.get('DELIVERY_STATUS_BATCH_SIZE', 500)
+    buffer = get_status_buffer(app)
+
+    batch, receipts = buffer.drain(limit)
+    if not receipts:
+        return 0
+
+    collapsed = collapse_receipts(receipts)
+    try:
+        updated = apply_receipts(collapsed)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to apply {len(collapsed)} delivery receipts: {str(e)}")
+        for receipt in collapsed:
+            buffer.add(receipt['sid'], receipt['status'], receipt.get('error_code'), receipt['attempts'])
+        buffer.ack(batch)
+        return 0
+
+    # Retry receipts for messages whose SID isn't committed yet
+    matched_sids = {row[2] for row in updated}
+    for receipt in collapsed:
+        if receipt['sid'] not in matched_sids and receipt['attempts'] < MAX_UNMATCHED_ATTEMPTS:
+            buffer.add(receipt['sid'], receipt['status'], receipt.get('error_code'), receipt['attempts'] + 1)
+
+    # Applied and committed (re-adding first means a crash here repeats receipts rather than losing them)
+    buffer.ack(batch)
+
+    # One event per profile instead of one per receipt
+    by_profile = {}
+    for message_id, profile_id, _, send_status in updated:
+        by_profile.setdefault(profile_id, []).append({'id': message_id, 'send_status': send_status})
+
+    # The bulk UPDATE bypasses the ORM hooks that bump response versions
+    bump_versions((f"profile:{profile_id}" for profile_id in by_profile), app)
+
+    for profile_id, updates in by_profile.items():
+        emit_to_profile(profile_id, 'message_status_batch', {
+            'profile_id': profile_id,
+            'updates': updates
+        })
+
+    logger.debug(f"Applied {len(collapsed)} delivery receipts ({len(updated)} messages matched)")
+    return len(receipts)
+
+
+def get_status_buffer(app=None):
+    """Get the app's shared DeliveryStatusBuffer"""
+    app = app or current_app._get_current_object()
+
+    if 'delivery_status_buffer' not in app.extensions:
+        app.extensions['delivery_status_buffer'] = DeliveryStatusBuffer(
+            get_redis(app),
+            lease_seconds=app.config.get('DELIVERY_STATUS_LEASE_SECONDS', 60)
+        )
+
+    return app.extensions['delivery_status_buffer']
+
+
+def record_delivery_status(message_sid, status, error_code=None):
+    """
+    Buffer one delivery receipt from the status webhook.
+
+    Returns:
+        bool: True if the receipt was buffered, False if the status isn't tracked
+    """
+    if not message_sid or status not in TRACKED_STATUSES:
+        return False
+
+    app = current_app._get_current_object()
+    get_status_buffer(app).add(message_sid, status, error_code)
+    start_status_flusher(app)
+    return True
+
+
+def start_status_flusher(app):
+    """Start this process's background flush loop if it isn't running yet"""
+    if app.extensions.get('delivery_status_flusher'):
+        return
+
+    app.extensions['delivery_status_flusher'] = True
+    socketio.start_background_task(_flush_loop, app)
+
+
+def _flush_loop(app):
+    """Every DELIVERY_STATUS_FLUSH_INTERVAL seconds, flush what was buffered at the start of the tick"""
+    interval = app.config.get('DELIVERY_STATUS_FLUSH_INTERVAL', 1.0)
+
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                # Bounded by the backlog at tick start so retried receipts wait for the next tick
+                pending = len(get_status_buffer(app))
+                while pending > 0:
+                    drained = flush_delivery_statuses(app)
+                    if not drained:
+                        break
+                    pending -= drained
+        except Exception as e:
+            logger.exception(f"Delivery status flush failed: {str(e)}")
@@ -0,0 +1,237 @@
+# app/services/example_index.py
+"""
+Relevance-ranked few-shot example selection.
+
+Each profile's text examples are kept in an ExampleIndex: one row per
+example in a float32 NumPy matrix of hashed features (word unigrams and
+bigrams plus character trigrams, so "heyyy" still lands near "hey"), with
+document frequencies maintained as rows are added. The IDF weights and
+weighted row norms are computed once per version of the index (any add()
+starts a new one), so selecting examples for a prompt only weights the
+incoming message and recent history and scores every example with one
+matrix-vector product, returning the k most similar.
+
+Indexes are cached per process and grow incrementally: at most every
+EXAMPLE_INDEX_REFRESH_INTERVAL seconds a profile's index checks the
+examples table for new rows (one aggregate query) and appends them,
+rebuilding only when examples were deleted.
+"""
+import re
+import time
+import zlib
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+Example = namedtuple('Example', ['id', 'content', 'is_incoming'])
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Recent history counts for this much of the query next to the message itself
+HISTORY_WEIGHT = 0.5
+
+
+def _features(text):
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    features = list(tokens)
+    features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    for token in tokens:
+        padded = f"<{token}>"
+        features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def vectorize(texts, dims=512):
+    """
+    Hashed, sublinearly scaled term-frequency vectors.
+
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), dims)
+    """
+    matrix = np.zeros((len(texts), dims), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            matrix[row, zlib.crc32(feature.encode('utf-8')) % dims] += 1.0
+    np.log1p(matrix, out=matrix)
+    return matrix
+
+
+class ExampleIndex:
+    """Hashed feature matrix over one profile's examples"""
+
+    def __init__(self, dims=512):
+        self.dims = dims
+        self.examples = []
+        self._matrix = np.zeros((0, dims), dtype=np.float32)
+        self._df = np.zeros(dims, dtype=np.float32)
+        # (idf, row norms) for the current rows, computed on first use
+        self._weights = None
+        self.max_id = 0
+        self.checked_at = 0.0
+
+    def add(self, examples):
+        """Append Example rows (in id order)"""
+        if not examples:
+            return
+
+        vectors = vectorize([example.content for example in examples], self.dims)
+        self._matrix = np.concatenate([self._matrix, vectors]) if len(self.examples) else vectors
+        self._df += (vectors > 0).sum(axis=0)
+        self.examples.extend(examples)
+        self.max_id = max(self.max_id, examples[-1].id)
+        self._weights = None
+
+    def _idf_and_norms(self):
+        weights = self._weights
+        if weights is None:
+            idf = np.log((len(self.examples) + 1) / (self._df + 1)) + 1
+            norms = np.sqrt((self._matrix * self._matrix) @ (idf * idf))
+            weights = self._weights = (idf, np.maximum(norms, 1e-6))
+        return weights
+
+    def top_k(self, message, k=5, history=None):
+        """
+        The k examples most similar to the message (and, with less weight, the
+        recent history), in their original order.
+        """
+        if k <= 0 or not self.examples:
+            return []
+        if k >= len(self.examples):
+            return list(self.examples)
+
+        query = vectorize([message], self.dims)[0]
+        if history:
+            query += HISTORY_WEIGHT * vectorize([history], self.dims)[0]
+        if not query.any():
+            return self.examples[-k:]
+
+        idf, norms = self._idf_and_norms()
+        weighted_query = query * idf
+        weighted_query /= np.linalg.norm(weighted_query)
+
+        scores = self._matrix @ (weighted_query * idf)
+        scores /= norms
+
+        best = np.argpartition(-scores, k - 1)[:k]
+        return [self.examples[i] for i in np.sort(best)]
+
+    def __len__(self):
+        return len(self.examples)
+
+
+class ExampleIndexCache:
+    """Per-process LRU of profile id -> ExampleIndex, refreshed from the examples table"""
+
+    def __init__(self, dims=512, refresh_interval=30, max_examples=5000, max_profiles=256):
+        self.dims = dims
+        self.refresh_interval = refresh_interval
+        self.max_examples = max_examples
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    def get(self, profile_id):
+        with self._lock:
+            index = self._indexes.get(profile_id)
+            if index is not None:
+                self._indexes.move_to_end(profile_id)
+
+        if index is None or time.monotonic() - index.checked_at > self.refresh_interval:
+            index = self._refresh(profile_id, index)
+            with self._lock:
+                self._indexes[profile_id] = index
+                self._indexes.move_to_end(profile_id)
+                while len(self._indexes) > self.max_profiles:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, profile_id):
+        """Make the next lookup check the profile's examples for changes"""
+        with self._lock:
+            index = self._indexes.get(profile_id)
+            if index is not None:
+                index.checked_at = 0.0
+
+    def _refresh(self, profile_id, index):
+        from app.models.text_example import TextExample
+
+        count, max_id = db.session.query(
+            func.count(TextExample.id), func.max(TextExample.id)
+        ).filter_by(profile_id=profile_id).one()
+        count, max_id = count or 0, max_id or 0
+
+        if index is not None and max_id == index.max_id and min(count, self.max_examples) == len(index):
+            index.checked_at = time.monotonic()
+            return index
+
+        query = db.session.query(TextExample.id, TextExample.content, TextExample.is_incoming).filter(
+            TextExample.profile_id == profile_id
+        )
+        new_count = count - len(index) if index is not None else count
+        appendable = (
+            index is not None and max_id > index.max_id and new_count > 0
+            and len(index) + new_count <= self.max_examples
+        )
+        if appendable:
+            query = query.filter(TextExample.id > index.max_id)
+        else:
+            # First load, deletions, or past the size cap: keep the newest examples
+            index = ExampleIndex(self.dims)
+
+        rows = query.order_by(TextExample.id.desc()).limit(self.max_examples).all()
+        index.add([Example(row.id, row.content, bool(row.is_incoming)) for row in reversed(rows)])
+        index.checked_at = time.monotonic()
+        return index
+
+
+def get_example_index_cache(app=None):
+    """Get the app's shared ExampleIndexCache"""
+    app = app or current_app._get_current_object()
+
+    if 'example_index' not in app.extensions:
+        app.extensions['example_index'] = ExampleIndexCache(
+            dims=app.config.get('EXAMPLE_INDEX_DIMS', 512),
+            refresh_interval=app.config.get('EXAMPLE_INDEX_REFRESH_INTERVAL', 30),
+            max_examples=app.config.get('EXAMPLE_INDEX_MAX_EXAMPLES', 5000)
+        )
+
+    return app.extensions['example_index']
+
+
+def example_count_for(profile):
+    """Number of few-shot examples to use for a profile (AIModelSettings.example_count)"""
+    settings = profile.ai_settings
+    if settings is not None and settings.example_count is not None:
+        return settings.example_count
+    return current_app.config.get('EXAMPLE_TOP_K', 5)
+
+
+def select_examples(profile, message, history=None, k=None):
+    """
+    The profile's text examples most relevant to an incoming message.
+
+    Args:
+        profile: Profile replying
+        message: Incoming message text
+        history: Recent conversation (Message objects or strings), oldest first
+        k: Number of examples (default: the profile's example_count)
+
+    Returns:
+        list: Example(id, content, is_incoming) tuples in original order
+    """
+    k = example_count_for(profile) if k is None else k
+    if k <= 0:
+        return []
+
+    history_text = "\n".join(
+        item if isinstance(item, str) else item.content for item in (history or [])
+    ) or None
+
+    return get_example_index_cache().get(profile.id).top_k(message, k, history_text)
@@ -2,6 +2,8 @@ import requests
 import json
 from typing import Dict, List, Optional
 from flask import current_app
+from app.services import metrics
+from app.services.reply_trace import stage, record_llm_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,9 +18,10 @@ class LLMService:
         self.model_name = current_app.config.get('LLM_MODEL', 'dolphin3')
         self.timeout = current_app.config.get('LLM_TIMEOUT', 30)
         self.max_tokens = current_app.config.get('LLM_MAX_TOKENS', 150)
+        self.last_prompt = None  # AssembledPrompt of the latest request
         
     def generate_response(self, profile, message: str, sender_number: str,
-                         conversation_history: List = None) -> Optional[str]:
+                         conversation_history: List = None, should_cancel=None) -> Optional[str]:
         """
         Generate AI response for an incoming message.
         
@@ -27,32 +30,47 @@ class LLMService:
             message: Incoming message text
             sender_number: Phone number of sender
             conversation_history: Recent conversation history
+            should_cancel: Optional callable; when it returns True the generation is
+                aborted and None is returned
             
         Returns:
             Generated response text or None if failed
         """
         try:
             # Prepare the prompt
-            prompt = self._create_prompt(profile, message, sender_number, conversation_history)
+            with stage('prompt'):
+                prompt = self._create_prompt(profile, message, sender_number, conversation_history)
             
             # Format request for your LLM server
             request_data = self._format_llm_request(prompt)
             
             # Make request to LLM
             logger.info(f"Sending request to LLM: {self.llm_endpoint}")
-            response = requests.post(
-                f"{self.llm_endpoint}/api/generate",
-                json=request_data,
-                timeout=self.timeout
-            )
+            with stage('llm'):
+                if should_cancel is not None:
+                    generated_text, result = self._generate_cancellable(request_data, should_cancel)
+                    if generated_text is None:
+                        metrics.inc('llm_requests_total', model=self.model_name, outcome='cancelled' if result is None else 'error')
+                        return None
+                else:
+                    response = requests.post(
+                        f"{self.llm_endpoint}/api/generate",
+                        json=request_data,
+                        timeout=self.timeout
+                    )
+                    
+                    if response.status_code != 200:
+                        logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
+                        metrics.inc('llm_requests_total', model=self.model_name, outcome='error')
+                        return None
+                    
+                    # Parse response (adjust based on your LLM server format)
+                    result = response.json()
+                    generated_text = self._extract_response_text(result)
             
-            if response.status_code != 200:
-                logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
-                return None
-            
-            # Parse response (adjust based on your LLM server format)
-            result = response.json()
-            generated_text = self._extract_response_text(result)
+            # Token counts and prefill / generation durations reported by Ollama
+            metrics.inc('llm_requests_total', model=self.model_name, outcome='ok')
+            record_llm_stats(result, self.model_name)
             
             # Post-process the response
             formatted_response = self._post_process_response(generated_text, profile)
@@ -62,71 +80,116 @@ class LLMService:
             
         except requests.exceptions.Timeout:
             logger.error("LLM request timed out")
+            metrics.inc('llm_requests_total', model=self.model_name, outcome='timeout')
             return None
         except requests.exceptions.RequestException as e:
             logger.error(f"LLM request error: {str(e)}")
+            metrics.inc('llm_requests_total', model=self.model_name, outcome='error')
             return None
         except Exception as e:
             logger.error(f"Unexpected error in LLM generation: {str(e)}", exc_info=True)
             return None
     
+    def _generate_cancellable(self, request_data: Dict, should_cancel):
+        """
+        Stream a generation from Ollama, checking should_cancel between chunks.
+        Closing the stream early makes Ollama stop generating.
+        
+        Returns:
+            tuple: (text, final chunk with Ollama's stats); (None, None) if
+            cancelled and (None, {}) if the request failed
+        """
+        request_data = dict(request_data, stream=True)
+        
+        with requests.post(
+            f"{self.llm_endpoint}/api/generate",
+            json=request_data,
+            timeout=self.timeout,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
+                return None, {}
+            
+            chunks = []
+            chunk = {}
+            for line in response.iter_lines():
+                if should_cancel():
+                    logger.info("LLM generation cancelled")
+                    return None, None
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                chunks.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    break
+        
+        return "".join(chunks).strip(), chunk
+    
     def _create_prompt(self, profile, message: str, sender_number: str,
                       conversation_history: List = None) -> str:
-        """Create a properly formatted prompt for the LLM."""
+        """
+        Create a properly formatted prompt for the LLM, packed into the model's
+        token budget. The assembled prompt is kept as self.last_prompt.
+        """
         from app.models.client import Client
-        from app.models.text_example import TextExample
+        from app.services.example_index import select_examples
+        from app.services import prompt_assembly
         
         # Get client information
         client = Client.query.filter_by(phone_number=sender_number).first()
         client_name = client.name if client and client.name else "the client"
         
-        # Get examples of profile's texting style
-        examples = TextExample.query.filter_by(profile_id=profile.id).order_by(
-            TextExample.timestamp.desc()
-        ).limit(5).all()
+        history = (conversation_history or [])[-5:]  # Last 5 messages
         
-        # Build the prompt
+        # Get the examples of profile's texting style most relevant to this message
+        examples = select_examples(profile, message, history)
         
-        prompt = f"""You are {profile.name}, An escort.  Respond concisely, flirty and seductive.  Use 1 Emoji.  If the key word "rates?" is in the text use 
-                            IMPORTANT RULES:
-                            1. Keep responses brief (1-3 sentences max)
-                            2. Match the texting style shown in examples
-                            3. NEVER mention explicit services or prices
-                            4. Don't reveal you're an AI
-                            5. Be friendly but professional
-                            6. If asked about sensitive topics, be vague or redirect
-
-                            PROFILE INFO:
-                            - Name: {profile.name}
-                            - Description: {profile.description or 'Not provided'}
+        # Build the prompt
+        system = f"""You are {profile.name}, An escort.  Respond concisely, flirty and seductive.  Use 1 Emoji.  If the key word "rates?" is in the text use 
+IMPORTANT RULES:
+1. Keep responses brief (1-3 sentences max)
+2. Match the texting style shown in examples
+3. NEVER mention explicit services or prices
+4. Don't reveal you're an AI
+5. Be friendly but professional
+6. If asked about sensitive topics, be vague or redirect
 
-                            CLIENT INFO:
-                            - Phone: {sender_number}
-                            - Name: {client_name}
-                            """
+PROFILE INFO:
+- Name: {profile.name}
+- Description: {profile.description or 'Not provided'}
 
-        # Add client notes if available
-        if client and client.notes:
-            prompt += f"- Notes: {client.notes}\n"
-        
-        # Add texting style examples
-        if examples:
-            prompt += "\nEXAMPLES OF MY TEXTING STYLE:\n"
-            for example in examples:
-                sender = "Client" if example.is_incoming else "Me"
-                prompt += f"{sender}: {example.content}\n"
-        
-        # Add conversation history
-        if conversation_history:
-            prompt += "\nRECENT CONVERSATION:\n"
-            for msg in conversation_history[-5:]:  # Last 5 messages
-                sender = "Client" if msg.is_incoming else "Me"
-                prompt += f"{sender}: {msg.content}\n"
-        
-        # Add the current message
-        prompt += f"\nCURRENT MESSAGE FROM CLIENT:\n{message}\n\nYOUR RESPONSE:"
-        
-        return prompt
+CLIENT INFO:
+- Phone: {sender_number}
+- Name: {client_name}"""
+        
+        # Notes are the first thing to go when the prompt runs over budget
+        settings = profile.ai_settings
+        notes = [
+            f"- Notes: {client.notes}" if client and client.notes else None,
+            f"- Instructions: {settings.custom_instructions}" if settings and settings.custom_instructions else None,
+            f"- Style notes: {settings.style_notes}" if settings and settings.style_notes else None,
+        ]
+        
+        def speaker(item):
+            sender = "Client" if item.is_incoming else "Me"
+            return f"{sender}: {item.content}"
+        
+        assembler = prompt_assembly.new_assembler(self.model_name)
+        assembler.add('system', system, prompt_assembly.PRIORITY_SYSTEM, required=True, truncate=True)
+        assembler.add('notes', notes, prompt_assembly.PRIORITY_NOTES, truncate=True)
+        assembler.add('examples', examples, prompt_assembly.PRIORITY_EXAMPLES,
+                      header="EXAMPLES OF MY TEXTING STYLE:", render=speaker)
+        assembler.add('history', history, prompt_assembly.PRIORITY_HISTORY,
+                      header="RECENT CONVERSATION:", render=speaker, recent=True)
+        assembler.add('message', message, prompt_assembly.PRIORITY_MESSAGE,
+                      header="CURRENT MESSAGE FROM CLIENT:", required=True, truncate=True)
+        assembler.add('response', "YOUR RESPONSE:", prompt_assembly.PRIORITY_MESSAGE, required=True)
+        
+        self.last_prompt = assembler.assemble()
+        logger.info(f"Prompt for profile {profile.id}: {self.last_prompt.stats()}")
+        return self.last_prompt.text
     
     def _format_llm_request(self, prompt: str) -> Dict:
         """Format the request for your specific LLM server."""
@@ -214,17 +277,25 @@ class OpenAICompatibleLLMService(LLMService):
         }
     
     def generate_response(self, profile, message: str, sender_number: str,
-                         conversation_history: List = None) -> Optional[str]:
+                         conversation_history: List = None, should_cancel=None) -> Optional[str]:
         try:
-            prompt = self._create_prompt(profile, message, sender_number, conversation_history)
+            with stage('prompt'):
+                prompt = self._create_prompt(profile, message, sender_number, conversation_history)
             request_data = self._format_llm_request(prompt)
             
-            response = requests.post(
-                f"{self.llm_endpoint}/v1/chat/completions",
-                json=request_data,
-                timeout=self.timeout,
-                headers={"Content-Type": "application/json"}
-            )
+            with stage('llm'):
+                if should_cancel is not None:
+                    generated_text, result = self._generate_cancellable(request_data, should_cancel)
+                    if generated_text is None:
+                        return None
+                    return self._post_process_response(generated_text, profile)
+                
+                response = requests.post(
+                    f"{self.llm_endpoint}/v1/chat/completions",
+                    json=request_data,
+                    timeout=self.timeout,
+                    headers={"Content-Type": "application/json"}
+                )
             
             if response.status_code != 200:
                 logger.error(f"LLM request failed: {response.text}")
@@ -237,4 +308,41 @@ class OpenAICompatibleLLMService(LLMService):
             
         except Exception as e:
             logger.error(f"Error with OpenAI-compatible LLM: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+    
+    def _generate_cancellable(self, request_data: Dict, should_cancel):
+        """
+        Stream a chat completion (server-sent events), checking should_cancel
+        between chunks. Closing the stream early stops the generation.
+        
+        Returns:
+            tuple: (text, {}); (None, None) if cancelled and (None, {}) if the request failed
+        """
+        request_data = dict(request_data, stream=True)
+        
+        with requests.post(
+            f"{self.llm_endpoint}/v1/chat/completions",
+            json=request_data,
+            timeout=self.timeout,
+            headers={"Content-Type": "application/json"},
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f"LLM request failed: {response.text}")
+                return None, {}
+            
+            chunks = []
+            for line in response.iter_lines():
+                if should_cancel():
+                    logger.info("LLM generation cancelled")
+                    return None, None
+                if not line.startswith(b"data:"):
+                    continue
+                
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    chunks.append(choice.get("delta", {}).get("content") or "")
+        
+        return "".join(chunks).strip(), {}
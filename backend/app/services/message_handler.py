@@ -1,6 +1,10 @@
-from app.extensions import db, socketio
-from app.utils.twilio_helpers import send_sms
-from datetime import datetime, timedelta
+from app.extensions import db
+from sqlalchemy.exc import IntegrityError
+from app.services.burst_coalescer import get_burst_tracker
+from app.services.realtime import emit_to_profile
+from app.services.reply_rules import get_reply_rules
+from app.services.reply_trace import start_trace, finish_trace, stage
+from datetime import datetime
 import re
 import json
 import logging
@@ -14,11 +18,18 @@ FLAG_WORDS = [
 ]
 
 def handle_incoming_message(profile_id, message_text, sender_number, message_data=None):
-    """Process incoming message and determine appropriate response"""
+    """Process incoming message and determine appropriate response, timing each stage"""
+    message_data = message_data or {}
+    with start_trace(message_data.get('received_at'), message_data.get('enqueued_at')) as trace:
+        reply = _handle_incoming_message(trace, profile_id, message_text, sender_number, message_data)
+        finish_trace(trace, reply)
+    return reply
+
+
+def _handle_incoming_message(trace, profile_id, message_text, sender_number, message_data):
     from app.models.message import Message
     from app.models.profile import Profile
     from app.models.client import Client
-    from app.models.auto_reply import AutoReply
     from app.models.flagged_message import FlaggedMessage
     
     logger.info(f"Handling incoming message for profile {profile_id} from {sender_number}")
@@ -27,19 +38,25 @@ def handle_incoming_message(profile_id, message_text, sender_number, message_dat
     profile = Profile.query.get(profile_id)
     if not profile:
         logger.error(f"Profile {profile_id} not found")
+        trace.outcome = 'ignored'
         return None
     
-    # Get or create client record
+    # Get or create client record; workers on other partitions may create it concurrently
     client = Client.query.filter_by(phone_number=sender_number).first()
     if not client:
-        client = Client(phone_number=sender_number)
-        db.session.add(client)
-        db.session.commit()
-        logger.info(f"Created new client record for {sender_number}")
+        try:
+            client = Client(phone_number=sender_number)
+            db.session.add(client)
+            db.session.commit()
+            logger.info(f"Created new client record for {sender_number}")
+        except IntegrityError:
+            db.session.rollback()
+            client = Client.query.filter_by(phone_number=sender_number).first()
     
     # Check if client is blocked
     if client.is_blocked:
         logger.info(f"Client {sender_number} is blocked, ignoring message")
+        trace.outcome = 'ignored'
         return None
     
     # Save incoming message to database
@@ -61,7 +78,7 @@ def handle_incoming_message(profile_id, message_text, sender_number, message_dat
     logger.info(f"Saved incoming message with ID {message.id}")
     
     # Emit WebSocket event for real-time updates
-    socketio.emit('new_message', {
+    emit_to_profile(profile.id, 'new_message', {
         "id": message.id,
         "content": message.content,
         "is_incoming": message.is_incoming,
@@ -70,10 +87,11 @@ def handle_incoming_message(profile_id, message_text, sender_number, message_dat
         "timestamp": message.timestamp.isoformat(),
         "is_read": message.is_read,
         "profile_id": profile.id
-    })
+    }, user_id=profile.user_id)
     
     # Check if message contains flagged content
-    is_flagged, flag_reasons = check_flagged_content(message_text)
+    with stage('rules'):
+        is_flagged, flag_reasons = check_flagged_content(message_text)
     if is_flagged:
         flagged_message = FlaggedMessage(
             message_id=message.id,
@@ -83,27 +101,89 @@ def handle_incoming_message(profile_id, message_text, sender_number, message_dat
         db.session.add(flagged_message)
         db.session.commit()
     
+    # Over the receiving number's webhook rate limit: stored, but not answered
+    if message_data.get('auto_reply') is False:
+        logger.info(f"Not replying to message {message.id}; {profile.phone_number} is over its rate limit")
+        trace.outcome = 'rate_limited'
+        return None
+    
     # If AI responses are not enabled, just store the message and don't respond
     if not profile.ai_enabled:
         logger.info(f"AI disabled for profile {profile_id}, not generating response")
+        trace.outcome = 'ai_disabled'
+        return None
+    
+    # Coalesce bursts: only the latest fragment replies, covering every unanswered one
+    if message_data.get('burst_seq') and get_burst_tracker() is not None:
+        return _reply_to_burst(trace, profile, message_text, sender_number, message_data)
+    
+    return _reply(trace, profile, message_text, sender_number, get_conversation_history(profile.id, sender_number))
+
+
+def reply_to_burst(profile_id, message_text, sender_number, message_data):
+    """Queued by the latest message of a burst to reply once the coalescing window has passed"""
+    from app.models.profile import Profile
+    
+    with start_trace(message_data.get('received_at')) as trace:
+        profile = Profile.query.get(profile_id)
+        reply = _reply_to_burst(trace, profile, message_text, sender_number, message_data) if profile else None
+        finish_trace(trace, reply)
+    return reply
+
+
+def _reply_to_burst(trace, profile, message_text, sender_number, message_data):
+    """Answer a burst's unanswered messages if the window has passed, or queue the reply for when it will have"""
+    from app.services.queue_service import get_task_queue
+    
+    burst_tracker = get_burst_tracker()
+    burst_seq = message_data['burst_seq']
+    remaining = burst_tracker.quiet_in(profile.id, sender_number, burst_seq)
+    if remaining is None:
+        logger.info(f"Message from {sender_number} (burst {burst_seq}) coalesced into a later one")
+        trace.outcome = 'coalesced'
+        return None
+    
+    if remaining > 0:
+        # The worker moves on; the reply task joins this conversation's partition when the window ends
+        get_task_queue().enqueue(
+            reply_to_burst,
+            profile.id,
+            message_text,
+            sender_number,
+            message_data,
+            delay=remaining,
+            partition_key=f"{profile.id}:{sender_number}"
+        )
+        trace.outcome = 'deferred'
         return None
     
-    # Check for automatic responses based on keywords
-    for auto_reply in AutoReply.query.filter_by(profile_id=profile.id, is_active=True).all():
-        if auto_reply.keyword.lower() in message_text.lower():
-            logger.info(f"Auto-reply triggered for keyword: {auto_reply.keyword}")
-            return send_response(profile, auto_reply.response, sender_number, is_ai_generated=False)
-    
-    # Check if within business hours
-    if not is_within_business_hours(profile):
-        from app.models.auto_reply import OutOfOfficeReply
-        out_of_office_reply = OutOfOfficeReply.query.filter_by(
-            profile_id=profile.id, 
-            is_active=True
-        ).first()
-        if out_of_office_reply:
-            logger.info(f"Outside business hours, sending out-of-office reply")
-            return send_response(profile, out_of_office_reply.message, sender_number, is_ai_generated=False)
+    def superseded():
+        return burst_tracker.is_superseded(profile.id, sender_number, burst_seq)
+    
+    # The joined fragments are the current message, so history stops at the last reply
+    message_text = get_unanswered_text(profile.id, sender_number) or message_text
+    history = get_conversation_history(profile.id, sender_number, answered_only=True)
+    return _reply(trace, profile, message_text, sender_number, history, superseded)
+
+
+def _reply(trace, profile, message_text, sender_number, history, superseded=None):
+    """Send the rule-based or generated reply to a message"""
+    # Keyword auto replies and out-of-office, from the profile's compiled rules
+    with stage('rules'):
+        reply_rules = get_reply_rules(profile)
+        auto_reply = reply_rules.match_keyword(message_text)
+        out_of_office_reply = None if auto_reply else reply_rules.out_of_office_reply()
+    
+    if auto_reply:
+        keyword, response = auto_reply
+        logger.info(f"Auto-reply triggered for keyword: {keyword}")
+        trace.outcome = 'auto_reply'
+        return send_response(profile, response, sender_number, is_ai_generated=False)
+    
+    if out_of_office_reply:
+        logger.info(f"Outside business hours, sending out-of-office reply")
+        trace.outcome = 'out_of_office'
+        return send_response(profile, out_of_office_reply, sender_number, is_ai_generated=False)
     
     # Generate AI response using your local LLM
     try:
@@ -113,28 +193,38 @@ def handle_incoming_message(profile_id, message_text, sender_number, message_dat
             profile=profile,
             message=message_text,
             sender_number=sender_number,
-            conversation_history=get_conversation_history(profile.id, sender_number)
+            conversation_history=history,
+            should_cancel=superseded
         )
         
+        # A newer fragment arrived while generating; its task replies to the whole burst
+        if superseded is not None and superseded():
+            logger.info(f"Cancelled reply to {sender_number}; a newer message arrived")
+            trace.outcome = 'cancelled'
+            return None
+        
         if ai_response:
             logger.info(f"Generated AI response: {ai_response}")
-            return send_response(profile, ai_response, sender_number, is_ai_generated=True)
+            trace.outcome = 'ai'
+            prompt_tokens = llm_service.last_prompt.tokens if llm_service.last_prompt else None
+            return send_response(profile, ai_response, sender_number, is_ai_generated=True, prompt_tokens=prompt_tokens)
     except Exception as e:
         logger.error(f"Error generating AI response: {str(e)}", exc_info=True)
     
     # Fallback response if AI generation fails
     fallback_response = "I'll get back to you soon!"
     logger.info(f"Using fallback response")
+    trace.outcome = 'fallback'
     return send_response(profile, fallback_response, sender_number, is_ai_generated=False)
 
 
-def send_response(profile, response_text, recipient_number, is_ai_generated=True):
-    """Send response via Twilio and save to database"""
+def send_response(profile, response_text, recipient_number, is_ai_generated=True, prompt_tokens=None):
+    """
+    Save response as a queued message and hand it to the outbound dispatcher.
+    prompt_tokens is the size of the prompt an AI response was generated from.
+    """
     from app.models.message import Message
-    from app.models.user import User
-    
-    # Get the user who owns this profile
-    user = User.query.get(profile.user_id)
+    from app.services.outbound_dispatcher import queue_outbound_message
     
     # Save outgoing message to database
     message = Message(
@@ -143,51 +233,30 @@ def send_response(profile, response_text, recipient_number, is_ai_generated=True
         sender_number=recipient_number,
         profile_id=profile.id,
         ai_generated=is_ai_generated,
-        timestamp=datetime.utcnow()
+        prompt_tokens=prompt_tokens,
+        timestamp=datetime.utcnow(),
+        send_status='queued'
     )
     db.session.add(message)
     db.session.commit()
     
-    # Send via Twilio using the appropriate account
-    try:
-        twilio_message = send_sms(
-            from_number=profile.phone_number,
-            to_number=recipient_number,
-            body=response_text,
-            user=user  # Pass the user to determine which Twilio account to use
-        )
-        
-        # Update message with Twilio SID
-        message.twilio_sid = twilio_message.sid
-        message.send_status = 'sent'
-        
-        # Update usage tracking
-        if user.twilio_usage_tracker:
-            user.twilio_usage_tracker.sms_count += 1
-        
-        db.session.commit()
-        
-        # Emit WebSocket event
-        socketio.emit('new_message', {
-            "id": message.id,
-            "content": message.content,
-            "is_incoming": message.is_incoming,
-            "sender_number": message.sender_number,
-            "ai_generated": message.ai_generated,
-            "timestamp": message.timestamp.isoformat(),
-            "is_read": message.is_read,
-            "profile_id": profile.id
-        })
-        
-        return message
+    # Emit WebSocket event; delivery progress follows as 'message_status' events
+    emit_to_profile(profile.id, 'new_message', {
+        "id": message.id,
+        "content": message.content,
+        "is_incoming": message.is_incoming,
+        "sender_number": message.sender_number,
+        "ai_generated": message.ai_generated,
+        "timestamp": message.timestamp.isoformat(),
+        "is_read": message.is_read,
+        "profile_id": profile.id,
+        "send_status": message.send_status
+    }, user_id=profile.user_id)
     
-    except Exception as e:
-        logger.error(f"Error sending SMS: {str(e)}", exc_info=True)
-        # Update message status to reflect sending failure
-        message.send_status = 'failed'
-        message.send_error = str(e)
-        db.session.commit()
-        return None
+    # Delivery happens on the outbound queue (or a background task when no queue is configured)
+    queue_outbound_message(message)
+    
+    return message
 
 
 def format_outgoing_message(message_text, profile):
@@ -205,14 +274,53 @@ def format_outgoing_message(message_text, profile):
     return formatted_text
 
 
-def get_conversation_history(profile_id, client_phone, limit=10):
-    """Get recent conversation history between profile and client"""
+def get_last_reply(profile_id, client_phone):
+    """The latest message sent to the client, or None"""
+    from app.models.message import Message
+    
+    return Message.query.filter(
+        Message.profile_id == profile_id,
+        Message.sender_number == client_phone,
+        Message.is_incoming == False
+    ).order_by(Message.timestamp.desc()).first()
+
+
+def get_unanswered_text(profile_id, client_phone, limit=10):
+    """Join the client's messages received since the last reply, oldest first"""
+    from app.models.message import Message
+    
+    last_reply = get_last_reply(profile_id, client_phone)
+    
+    query = Message.query.filter(
+        Message.profile_id == profile_id,
+        Message.sender_number == client_phone,
+        Message.is_incoming == True
+    )
+    if last_reply:
+        query = query.filter(Message.timestamp > last_reply.timestamp)
+    
+    messages = query.order_by(Message.timestamp.desc()).limit(limit).all()
+    return "\n".join(msg.content for msg in reversed(messages))
+
+
+def get_conversation_history(profile_id, client_phone, limit=10, answered_only=False):
+    """
+    Get recent conversation history between profile and client.
+    answered_only stops at the last reply, leaving out the messages received since.
+    """
     from app.models.message import Message
     
-    messages = Message.query.filter(
+    query = Message.query.filter(
         Message.profile_id == profile_id,
         Message.sender_number == client_phone
-    ).order_by(Message.timestamp.desc()).limit(limit).all()
+    )
+    if answered_only:
+        last_reply = get_last_reply(profile_id, client_phone)
+        if last_reply is None:
+            return []
+        query = query.filter(Message.timestamp <= last_reply.timestamp)
+    
+    messages = query.order_by(Message.timestamp.desc()).limit(limit).all()
     
     # Reverse to get chronological order
     return messages[::-1]
@@ -243,43 +351,4 @@ def check_flagged_content(message_text):
 
 def is_within_business_hours(profile):
     """Check if current time is within business hours for profile"""
-    import pytz
-    
-    timezone = pytz.timezone(profile.timezone or 'UTC')
-    current_time = datetime.now(timezone)
-    
-    # Get day of week as lowercase string
-    day_of_week = current_time.strftime('%A').lower()
-    
-    # Get business hours for profile
-    business_hours = profile.get_business_hours()
-    
-    # If no business hours are set, return True (always available)
-    if not business_hours:
-        return True
-    
-    # Check if day exists in business hours
-    if day_of_week not in business_hours:
-        return False
-    
-    # Parse start and end times
-    day_hours = business_hours[day_of_week]
-    start_time_str = day_hours.get("start", "00:00")
-    end_time_str = day_hours.get("end", "23:59")
-    
-    try:
-        start_hour, start_minute = map(int, start_time_str.split(':'))
-        end_hour, end_minute = map(int, end_time_str.split(':'))
-        
-        start_time = current_time.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)
-        
-        # Handle cases where end time is on the next day
-        if end_hour < start_hour:
-            end_time = current_time.replace(hour=end_hour, minute=end_minute, second=0, microsecond=0) + timedelta(days=1)
-        else:
-            end_time = current_time.replace(hour=end_hour, minute=end_minute, second=0, microsecond=0)
-        
-        return start_time <= current_time <= end_time
-    except (ValueError, IndexError):
-        # If parsing fails, assume always available
-        return True
\ No newline at end of file
+    return get_reply_rules(profile).is_open()
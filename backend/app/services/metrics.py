@@ -0,0 +1,229 @@
+# app/services/metrics.py
+"""
+Prometheus-style metrics.
+
+Counters and histograms are defined once in METRICS and recorded in memory.
+Each process adds what it recorded to the Redis hash `metrics` every
+METRICS_FLUSH_INTERVAL seconds (one pipeline of HINCRBYFLOATs), so the
+/metrics endpoint of any web process reports totals for every web and queue
+worker. Without Redis, /metrics reports this process's own totals.
+
+Hash fields are the exposition sample names themselves, e.g.
+reply_stage_seconds_bucket{stage="llm",le="2.5"}, so rendering is a sort
+and a join.
+"""
+import time
+import threading
+import logging
+
+from flask import current_app
+from app.extensions import socketio, get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'metrics'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+UTILIZATION_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'reply_stage_seconds': (
+        'histogram',
+        'Time a message spent in each reply pipeline stage (db overlaps the stages that query)',
+        LATENCY_BUCKETS,
+    ),
+    'reply_total_seconds': (
+        'histogram',
+        'Time from webhook receipt to the reply being queued for sending',
+        LATENCY_BUCKETS,
+    ),
+    'llm_prompt_tokens': ('histogram', 'Prompt tokens evaluated per LLM request', TOKEN_BUCKETS),
+    'llm_completion_tokens': ('histogram', 'Tokens generated per LLM request', TOKEN_BUCKETS),
+    'llm_prompt_eval_seconds': ('histogram', 'LLM prompt evaluation (prefill) time', LATENCY_BUCKETS),
+    'llm_eval_seconds': ('histogram', 'LLM generation time', LATENCY_BUCKETS),
+    'llm_load_seconds': ('histogram', 'LLM model load time per request', LATENCY_BUCKETS),
+    'llm_requests_total': ('counter', 'LLM requests by outcome', None),
+    'replies_total': ('counter', 'Inbound messages handled, by how they were answered', None),
+    'db_pool_checkout_seconds': ('histogram', 'Time waiting for a pooled database connection', POOL_WAIT_BUCKETS),
+    'db_pool_utilization': (
+        'histogram',
+        'Share of the pool (size + overflow) checked out, sampled at each checkout',
+        UTILIZATION_BUCKETS,
+    ),
+    'db_pool_timeouts_total': ('counter', 'Connection checkouts that gave up after DB_POOL_TIMEOUT', None),
+    'conditional_get_total': ('counter', 'Conditional dashboard GETs, by whether the response had changed', None),
+    'db_read_routing_total': (
+        'counter',
+        'read_replica requests by where their reads went (replica, or the primary after a recent write or lag)',
+        None,
+    ),
+    'stripe_events_total': (
+        'counter',
+        'Stripe webhook events by outcome (received, duplicate, processed, ignored, retried, failed)',
+        None,
+    ),
+}
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+
+
+def _sample(name, labels):
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def _bucket_label(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, with deltas kept for flushing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._pending = {}
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        self._add([(_sample(name, _labels(labels)), amount)])
+
+    def observe(self, name, value, **labels):
+        """Record a histogram observation"""
+        _, _, buckets = METRICS[name]
+        label_text = _labels(labels)
+        prefix = f'{label_text},' if label_text else ''
+
+        # Every bucket is written (0 when above the value) so each series has the full set
+        updates = [
+            (f'{name}_bucket{{{prefix}le="{_bucket_label(bound)}"}}', 1 if value <= bound else 0)
+            for bound in buckets
+        ]
+        updates.append((f'{name}_bucket{{{prefix}le="+Inf"}}', 1))
+        updates.append((_sample(f'{name}_sum', label_text), value))
+        updates.append((_sample(f'{name}_count', label_text), 1))
+        self._add(updates)
+
+    def _add(self, updates):
+        with self._lock:
+            for sample, amount in updates:
+                self._totals[sample] = self._totals.get(sample, 0) + amount
+                self._pending[sample] = self._pending.get(sample, 0) + amount
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)
+
+    def flush(self, redis_conn):
+        """
+        Add everything recorded since the last flush to the shared Redis hash.
+
+        Returns:
+            int: Number of samples written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        try:
+            pipeline = redis_conn.pipeline(transaction=False)
+            for sample, amount in pending.items():
+                pipeline.hincrbyfloat(REDIS_KEY, sample, amount)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to flush {len(pending)} metric samples: {str(e)}")
+            with self._lock:
+                for sample, amount in pending.items():
+                    self._pending[sample] = self._pending.get(sample, 0) + amount
+            return 0
+
+        return len(pending)
+
+
+def render(samples):
+    """Prometheus text exposition of sample name -> value"""
+    families = {}
+    for sample, value in samples.items():
+        base = sample.split('{', 1)[0]
+        for suffix in ('_bucket', '_sum', '_count'):
+            if base.endswith(suffix) and base[:-len(suffix)] in METRICS:
+                base = base[:-len(suffix)]
+                break
+        families.setdefault(base, []).append((sample, value))
+
+    lines = []
+    for name in sorted(families):
+        if name in METRICS:
+            kind, help_text, _ = METRICS[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+        for sample, value in sorted(families[name], key=_sample_order):
+            lines.append(f'{sample} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sample_order(item):
+    # Buckets in ascending le order, then _count and _sum
+    sample = item[0]
+    if '_bucket{' in sample:
+        labels, _, bound = sample.rpartition('le="')
+        bound = bound.rstrip('"}')
+        return (labels, 0, float('inf') if bound == '+Inf' else float(bound))
+    return (sample, 1, 0.0)
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def get_metrics(app=None):
+    """Get the app's MetricsRegistry, starting its Redis flush loop on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'metrics' not in app.extensions:
+        app.extensions['metrics'] = MetricsRegistry()
+        if get_redis(app) is not None:
+            socketio.start_background_task(_flush_loop, app)
+
+    return app.extensions['metrics']
+
+
+def inc(name, amount=1, **labels):
+    get_metrics().inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    get_metrics().observe(name, value, **labels)
+
+
+def collect(app=None):
+    """
+    Current totals for /metrics: every process's flushed samples when Redis
+    is configured (plus this process's unflushed ones), else this process's.
+    """
+    app = app or current_app._get_current_object()
+    registry = get_metrics(app)
+    redis_conn = get_redis(app)
+    if redis_conn is None:
+        return registry.totals()
+
+    registry.flush(redis_conn)
+    return {sample.decode(): float(value) for sample, value in redis_conn.hgetall(REDIS_KEY).items()}
+
+
+def _flush_loop(app):
+    interval = app.config.get('METRICS_FLUSH_INTERVAL', 10)
+
+    while True:
+        time.sleep(interval)
+        try:
+            get_metrics(app).flush(get_redis(app))
+        except Exception as e:
+            logger.exception(f"Metrics flush failed: {str(e)}")
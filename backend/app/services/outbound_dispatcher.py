@@ -0,0 +1,385 @@
+# app/services/outbound_dispatcher.py
+"""
+Outbound SMS dispatcher.
+
+Replies are saved as 'queued' messages and handed to this stage for delivery,
+so reply generation never waits on Twilio. Delivery is shaped by token buckets
+per sender number and per Twilio account, capped by a cross-process in-flight
+limit, and retried with jittered backoff on retryable Twilio errors.
+
+Without a task queue, delivery runs on a background task in this process,
+one conversation at a time in order, so throttle waits and retry backoff
+never hold up the webhook request that produced the reply.
+
+Message.send_status moves through queued -> sending -> sent | failed.
+"""
+import random
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+
+from flask import current_app
+from app.extensions import db, get_redis, socketio
+from app.services.realtime import emit_to_profile
+from app.services.reply_trace import stage, add_stored_timing
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses and Twilio error codes worth retrying
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_TWILIO_CODES = {20429, 20500, 20503}
+
+# Lua script: take one token from every bucket in KEYS, or none at all.
+# ARGV holds (rate, burst) pairs per key. Returns the seconds to wait as a
+# string (Lua numbers are truncated to integers on the way out), '0' on success.
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return '0'
+"""
+
+# Lua script: lease-based counting semaphore. Expired leases (crashed
+# workers) are dropped before counting. ARGV: limit, lease id, lease seconds.
+SEMAPHORE_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Conversation -> message ids waiting for this process's background delivery (no task queue)
+_local_pending = {}
+_local_pending_lock = threading.Lock()
+
+
+class LocalTokenBucket:
+    """In-process token bucket, used when Redis is not configured"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class SendThrottle:
+    """
+    Shapes outbound throughput: one token bucket per sender number, one per
+    Twilio account and a global cap on concurrent Twilio requests.
+
+    With a Redis connection the limits are shared by every process; without
+    one they apply per process.
+    """
+
+    def __init__(self, redis_conn=None, number_rate=1.0, number_burst=3,
+                 account_rate=30.0, account_burst=30, max_in_flight=20,
+                 lease_seconds=30, key_prefix='outbound'):
+        self.redis_conn = redis_conn
+        self.number_rate = number_rate
+        self.number_burst = number_burst
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+        self.key_prefix = key_prefix
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._local_slots = threading.BoundedSemaphore(max_in_flight)
+
+        if redis_conn is not None:
+            self._bucket_script = redis_conn.register_script(TOKEN_BUCKET_SCRIPT)
+            self._semaphore_script = redis_conn.register_script(SEMAPHORE_ACQUIRE_SCRIPT)
+
+    def reserve(self, from_number, account_key):
+        """
+        Try to take a send token for both the sender number and the account.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds to wait before retrying
+        """
+        number_key = f"{self.key_prefix}:bucket:number:{from_number}"
+        account_bucket_key = f"{self.key_prefix}:bucket:account:{account_key}"
+
+        if self.redis_conn is not None:
+            wait = self._bucket_script(
+                keys=[number_key, account_bucket_key],
+                args=[self.number_rate, self.number_burst, self.account_rate, self.account_burst]
+            )
+            return float(wait)
+
+        with self._lock:
+            buckets = [
+                self._local_bucket(number_key, self.number_rate, self.number_burst),
+                self._local_bucket(account_bucket_key, self.account_rate, self.account_burst),
+            ]
+            now = time.monotonic()
+            for bucket in buckets:
+                bucket.refill(now)
+
+            wait = max(bucket.wait_time() for bucket in buckets)
+            if wait > 0:
+                return wait
+
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0.0
+
+    def acquire_slot(self, timeout=None):
+        """
+        Acquire one in-flight slot, blocking until one frees up.
+
+        Returns:
+            str: Lease id to pass to release_slot, or None on timeout
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        if self.redis_conn is None:
+            acquired = self._local_slots.acquire(timeout=timeout) if timeout is not None \
+                else self._local_slots.acquire()
+            return 'local' if acquired else None
+
+        lease_id = uuid.uuid4().hex
+        key = f"{self.key_prefix}:in_flight"
+        while True:
+            if self._semaphore_script(keys=[key], args=[self.max_in_flight, lease_id, self.lease_seconds]):
+                return lease_id
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05 + random.random() * 0.05)
+
+    def release_slot(self, lease_id):
+        """Release an in-flight slot taken with acquire_slot"""
+        if lease_id is None:
+            return
+        if self.redis_conn is None:
+            self._local_slots.release()
+        else:
+            self.redis_conn.zrem(f"{self.key_prefix}:in_flight", lease_id)
+
+    def _local_bucket(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = LocalTokenBucket(rate, burst)
+        return bucket
+
+
+def is_retryable_error(error):
+    """Check whether a send error is transient and worth retrying"""
+    from twilio.base.exceptions import TwilioRestException
+    import requests
+
+    if isinstance(error, TwilioRestException):
+        return error.status in RETRYABLE_HTTP_STATUSES or error.code in RETRYABLE_TWILIO_CODES
+
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """Full-jitter exponential backoff for the given (0-based) retry attempt"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def get_send_throttle(app=None):
+    """Get the app's shared SendThrottle, building it from config on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'send_throttle' not in app.extensions:
+        app.extensions['send_throttle'] = SendThrottle(
+            redis_conn=get_redis(app),
+            number_rate=app.config.get('OUTBOUND_NUMBER_RATE', 1.0),
+            number_burst=app.config.get('OUTBOUND_NUMBER_BURST', 3),
+            account_rate=app.config.get('OUTBOUND_ACCOUNT_RATE', 30.0),
+            account_burst=app.config.get('OUTBOUND_ACCOUNT_BURST', 30),
+            max_in_flight=app.config.get('OUTBOUND_MAX_IN_FLIGHT', 20)
+        )
+
+    return app.extensions['send_throttle']
+
+
+def queue_outbound_message(message):
+    """
+    Hand a saved 'queued' message to the dispatcher.
+
+    The message is enqueued on the 'outbound' queue when a task queue is
+    configured, partitioned by conversation so replies go out in order;
+    otherwise it is delivered by a background task in this process.
+    """
+    from app.services.queue_service import get_task_queue
+
+    partition_key = f"{message.profile_id}:{message.sender_number}"
+    task_queue = get_task_queue()
+    if task_queue is not None:
+        task_queue.enqueue(
+            'app.services.outbound_dispatcher.deliver_message',
+            message.id,
+            queue='outbound',
+            partition_key=partition_key
+        )
+        return
+
+    with _local_pending_lock:
+        pending = _local_pending.get(partition_key)
+        if pending is not None:
+            # This conversation's delivery task is running; it sends this next
+            pending.append(message.id)
+            return
+        _local_pending[partition_key] = deque([message.id])
+
+    socketio.start_background_task(_deliver_pending, current_app._get_current_object(), partition_key)
+
+
+def _deliver_pending(app, partition_key):
+    """Deliver a conversation's locally queued messages in order, then exit"""
+    while True:
+        with _local_pending_lock:
+            pending = _local_pending[partition_key]
+            if not pending:
+                del _local_pending[partition_key]
+                return
+            message_id = pending.popleft()
+
+        with app.app_context():
+            try:
+                deliver_message(message_id)
+            except Exception as e:
+                logger.error(f"Background delivery of message {message_id} failed: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+
+
+def deliver_message(message_id):
+    """
+    Deliver a queued outbound message through Twilio.
+
+    Runs as an 'outbound' queue task or a background task. Waits for send
+    tokens, retries retryable errors with jittered backoff and records the
+    final send_status.
+
+    Returns:
+        str: Final send status of the message
+    """
+    from app.models.message import Message
+    from app.models.profile import Profile
+    from app.models.user import User
+    from app.utils.twilio_helpers import send_sms
+
+    message = Message.query.get(message_id)
+    if not message:
+        logger.error(f"Outbound message {message_id} not found")
+        return None
+
+    # Duplicate task for a message that's already been handled
+    if message.send_status not in ('queued', 'sending'):
+        return message.send_status
+
+    profile = Profile.query.get(message.profile_id)
+    user = User.query.get(profile.user_id)
+    account_key = user.twilio_account_sid or current_app.config.get('TWILIO_ACCOUNT_SID')
+
+    throttle = get_send_throttle()
+    max_retries = current_app.config.get('OUTBOUND_MAX_RETRIES', 5)
+    base_delay = current_app.config.get('OUTBOUND_RETRY_BASE_DELAY', 0.5)
+    max_delay = current_app.config.get('OUTBOUND_RETRY_MAX_DELAY', 30.0)
+
+    _set_send_status(message, 'sending')
+
+    attempt = 0
+    while True:
+        # Wait for a token on both the sender number and the account
+        wait = throttle.reserve(profile.phone_number, account_key)
+        while wait > 0:
+            time.sleep(wait)
+            wait = throttle.reserve(profile.phone_number, account_key)
+
+        lease_id = throttle.acquire_slot()
+        try:
+            with stage('twilio_send') as span:
+                twilio_message = send_sms(
+                    from_number=profile.phone_number,
+                    to_number=message.sender_number,
+                    body=message.content,
+                    user=user
+                )
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        finally:
+            throttle.release_slot(lease_id)
+
+        if error is None:
+            message.twilio_sid = twilio_message.sid
+            message.send_error = None
+            add_stored_timing(message, 'twilio_send', span.seconds)
+
+            # Update usage tracking
+            if user.twilio_usage_tracker:
+                user.twilio_usage_tracker.sms_count += 1
+
+            _set_send_status(message, 'sent')
+            return 'sent'
+
+        if attempt >= max_retries or not is_retryable_error(error):
+            logger.error(f"Error sending SMS for message {message.id}: {str(error)}", exc_info=error)
+            message.send_error = str(error)
+            _set_send_status(message, 'failed')
+            return 'failed'
+
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        attempt += 1
+        logger.warning(
+            f"Retryable error sending message {message.id} "
+            f"(attempt {attempt}/{max_retries}), retrying in {delay:.2f}s: {str(error)}"
+        )
+        time.sleep(delay)
+
+
+def _set_send_status(message, status):
+    """Persist a send_status change and push it to the dashboard"""
+    message.send_status = status
+    db.session.commit()
+
+    emit_to_profile(message.profile_id, 'message_status', {
+        "id": message.id,
+        "profile_id": message.profile_id,
+        "send_status": message.send_status,
+        "twilio_sid": message.twilio_sid
+    })
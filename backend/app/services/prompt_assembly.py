@@ -0,0 +1,275 @@
+# app/services/prompt_assembly.py
+"""
+Token-budgeted prompt assembly.
+
+A prompt is built from sections (system instructions, the current message,
+recent history, few-shot examples, notes), each with a priority. Sections
+are packed highest priority first into the model's token budget: required
+sections always go in (truncated if they alone overflow it), history keeps
+its most recent messages that fit, examples keep as many as fit in the order
+given, and notes are cut down to whatever room is left. Sections are then
+rendered in the order they were added, so priority decides what survives and
+not where it appears.
+
+Tokens are counted with PROMPT_TOKENIZER: "approximate" (a fast estimate
+that errs high), "tiktoken:<encoding>" or "tokenizers:<tokenizer.json path
+or hub name>". An unavailable tokenizer falls back to the approximation.
+The budget is PROMPT_TOKEN_BUDGET, or the model's entry in
+PROMPT_TOKEN_BUDGETS.
+"""
+import re
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Section priorities, packed lowest number first
+PRIORITY_SYSTEM = 0
+PRIORITY_MESSAGE = 1
+PRIORITY_HISTORY = 2
+PRIORITY_EXAMPLES = 3
+PRIORITY_NOTES = 4
+
+# Truncated text ends with this marker
+ELLIPSIS = '...'
+
+# Items are not truncated to fewer tokens than this; they are dropped instead
+MIN_TRUNCATED_TOKENS = 8
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class ApproximateTokenizer:
+    """
+    Token estimate without a vocabulary: about four characters per token for
+    words, one per ASCII punctuation mark and two per other symbol (emoji
+    usually take two or more BPE tokens). Errs on the high side for English.
+    """
+
+    name = 'approximate'
+
+    def count(self, text):
+        tokens = 0
+        for piece in WORD_PATTERN.findall(text):
+            if piece[0].isalnum() or piece[0] == '_':
+                tokens += (len(piece) + 3) // 4 if piece.isascii() else len(piece.encode('utf-8')) // 3 + 1
+            else:
+                tokens += 1 if piece.isascii() else 2
+        return tokens
+
+
+class TiktokenTokenizer:
+    """Exact counts for a tiktoken encoding (e.g. cl100k_base)"""
+
+    def __init__(self, encoding):
+        import tiktoken
+
+        self.name = f"tiktoken:{encoding}"
+        self._encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text):
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer:
+    """Exact counts for a Hugging Face tokenizer.json (a file path or hub name)"""
+
+    def __init__(self, source):
+        import os
+        from tokenizers import Tokenizer
+
+        self.name = f"tokenizers:{source}"
+        self._tokenizer = Tokenizer.from_file(source) if os.path.exists(source) else Tokenizer.from_pretrained(source)
+
+    def count(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+TOKENIZERS = {
+    'approximate': lambda argument: ApproximateTokenizer(),
+    'tiktoken': TiktokenTokenizer,
+    'tokenizers': HuggingFaceTokenizer,
+}
+
+
+def register_tokenizer(kind, factory):
+    """Make PROMPT_TOKENIZER "<kind>:<argument>" build factory(argument)"""
+    TOKENIZERS[kind] = factory
+    get_tokenizer.cache_clear()
+
+
+@lru_cache(maxsize=16)
+def get_tokenizer(spec='approximate'):
+    """
+    Tokenizer for a PROMPT_TOKENIZER spec, falling back to the approximation
+    when it can't be loaded.
+    """
+    kind, _, argument = (spec or 'approximate').partition(':')
+    factory = TOKENIZERS.get(kind)
+    if factory is None:
+        logger.warning(f"Unknown tokenizer {spec!r}, using approximate token counts")
+        return ApproximateTokenizer()
+
+    try:
+        return factory(argument)
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer {spec!r}, using approximate token counts: {str(e)}")
+        return ApproximateTokenizer()
+
+
+def token_budget_for(model, config=None):
+    """Prompt token budget for a model"""
+    config = config if config is not None else current_app.config
+    return config.get('PROMPT_TOKEN_BUDGETS', {}).get(model, config.get('PROMPT_TOKEN_BUDGET', 1800))
+
+
+def truncate_to_tokens(text, max_tokens, count):
+    """
+    The longest prefix of text (plus ELLIPSIS) that fits in max_tokens, or ''
+    if not even the marker fits. Text that already fits is returned as is.
+    """
+    if count(text) <= max_tokens:
+        return text
+    if count(ELLIPSIS) > max_tokens:
+        return ''
+
+    # Longest prefix that fits; counts grow with the prefix so bisect on length
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count(text[:middle].rstrip() + ELLIPSIS) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + ELLIPSIS
+
+
+Section = namedtuple('Section', ['name', 'items', 'priority', 'header', 'render', 'required', 'truncate', 'recent'])
+
+
+class AssembledPrompt:
+    """The packed sections of a prompt and what didn't fit"""
+
+    def __init__(self, sections, included, tokens, budget, dropped, truncated):
+        self._sections = sections
+        self.included = included
+        self.tokens = tokens
+        self.budget = budget
+        self.dropped = dropped
+        self.truncated = truncated
+
+    def items(self, name):
+        """Included items of a section, in their original order (truncated text items are replaced)"""
+        return self.included.get(name, [])
+
+    def render(self, names=None, separator='\n\n'):
+        """Text of the included sections (or just those named) in the order they were added"""
+        parts = []
+        for section in self._sections:
+            if names is not None and section.name not in names:
+                continue
+            items = self.included.get(section.name)
+            if not items:
+                continue
+            lines = [section.render(item) for item in items]
+            if section.header:
+                lines.insert(0, section.header)
+            parts.append('\n'.join(lines))
+        return separator.join(parts)
+
+    @property
+    def text(self):
+        return self.render()
+
+    def stats(self):
+        """Token counts and dropped / truncated items per section, for logging"""
+        return {
+            'tokens': self.tokens,
+            'budget': self.budget,
+            'dropped': {name: count for name, count in self.dropped.items() if count},
+            'truncated': sorted(self.truncated),
+        }
+
+
+class PromptAssembler:
+    """Packs prompt sections by priority into a token budget"""
+
+    def __init__(self, budget, tokenizer=None):
+        self.budget = budget
+        self.tokenizer = tokenizer or ApproximateTokenizer()
+        self._sections = []
+
+    def count(self, text):
+        return self.tokenizer.count(text)
+
+    def add(self, name, items, priority, header=None, render=None, required=False, truncate=False, recent=False):
+        """
+        Add a section.
+
+        Args:
+            name: Section name, used to look its items up afterwards
+            items: Strings, or any objects with a render function
+            priority: Packing order, lower first (see PRIORITY_*)
+            header: Line rendered above the section's items
+            render: item -> text (default: the item itself)
+            required: Always include every item, truncating text items to fit
+            truncate: Cut a string item down to the room left instead of dropping it
+            recent: Items are chronological; keep the latest ones without gaps
+        """
+        if isinstance(items, str):
+            items = [items]
+        items = [item for item in items if item is not None and item != '']
+        self._sections.append(Section(name, items, priority, header, render or str, required, truncate, recent))
+        return self
+
+    def assemble(self):
+        remaining = self.budget
+        included, dropped, truncated = {}, {}, set()
+
+        for section in sorted(self._sections, key=lambda section: section.priority):
+            if not section.items:
+                continue
+
+            # Each item takes a line; the header line and the blank line before the section
+            # are paid for with the first item included
+            header_cost = (self.count(section.header) + 1 if section.header else 0) + 1
+            order = range(len(section.items) - 1, -1, -1) if section.recent else range(len(section.items))
+            kept = {}
+            for index in order:
+                item = section.items[index]
+                overhead = 1 + (0 if kept else header_cost)
+                cost = self.count(section.render(item)) + overhead
+
+                if cost > remaining and (section.required or section.truncate) and isinstance(item, str):
+                    room = remaining - overhead
+                    if room >= MIN_TRUNCATED_TOKENS or section.required:
+                        item = truncate_to_tokens(item, max(room, 0), self.count)
+                        truncated.add(section.name)
+                        cost = self.count(section.render(item)) + overhead
+
+                if item and (cost <= remaining or section.required):
+                    kept[index] = item
+                    remaining -= cost
+                elif section.recent:
+                    # Older history with a gap before the latest messages would mislead
+                    break
+
+            dropped[section.name] = len(section.items) - len(kept)
+            if kept:
+                included[section.name] = [kept[index] for index in sorted(kept)]
+
+        prompt = AssembledPrompt(self._sections, included, 0, self.budget, dropped, truncated)
+        prompt.tokens = self.count(prompt.render())
+        return prompt
+
+
+def new_assembler(model, config=None):
+    """PromptAssembler with the configured tokenizer and the model's budget"""
+    config = config if config is not None else current_app.config
+    return PromptAssembler(
+        token_budget_for(model, config),
+        get_tokenizer(config.get('PROMPT_TOKENIZER', 'approximate'))
+    )
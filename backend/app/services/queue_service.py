@@ -1,93 +1,652 @@
 # app/services/queue_service.py
-import redis
 import json
 import uuid
+import time
+import random
+import signal
+import zlib
+import importlib
+import threading
 from flask import current_app
+from app.utils.lazy_import import lazy_import
 import logging
 
+redis = lazy_import('redis')
+
 logger = logging.getLogger(__name__)
 
+# Default module for tasks enqueued by bare function name
+DEFAULT_TASK_MODULE = 'app.services.message_handler'
+
+# Lua script: atomically take a task out of the processing list and, if it was
+# still there, push its replacement (retry or dead letter). For partitioned
+# tasks KEYS[4]/KEYS[5] are the partition lock and active-partition set: the
+# lock is released and a retried partition is marked active again. If the
+# partition (KEYS[6]) still has tasks, the signal list (KEYS[7]) wakes a worker.
+# Returns 1 if the task was owned, 0 if someone else already acked or reclaimed it.
+SETTLE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+if ARGV[2] ~= '' then
+    if ARGV[3] == 'retry' then
+        redis.call('RPUSH', KEYS[3], ARGV[2])
+        if KEYS[5] then
+            redis.call('SADD', KEYS[5], ARGV[4])
+        end
+    else
+        redis.call('LPUSH', KEYS[3], ARGV[2])
+    end
+end
+if KEYS[4] then
+    redis.call('DEL', KEYS[4])
+    if redis.call('LLEN', KEYS[6]) > 0 then
+        redis.call('LPUSH', KEYS[7], 1)
+        redis.call('LTRIM', KEYS[7], 0, 999)
+    end
+end
+return 1
+"""
+
+# Lua script: lease the next task from one of up to ARGV[3] random active
+# partitions whose lock is free, falling back to every active partition when
+# all of those are locked. The partition stays locked until the task is
+# settled, so each partition runs strictly one task at a time, in order.
+# Partitions found empty are dropped from the active set.
+PARTITION_DEQUEUE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local lease = tonumber(ARGV[2])
+local function take(candidates)
+    for _, pid in ipairs(candidates) do
+        local partition = ARGV[1] .. ':p' .. pid
+        local lock = partition .. ':lock'
+        if redis.call('SET', lock, '1', 'NX', 'PX', math.ceil(lease * 2000)) then
+            local raw = redis.call('LMOVE', partition, KEYS[2], 'RIGHT', 'LEFT')
+            if raw then
+                redis.call('ZADD', KEYS[3], now + lease, raw)
+                return raw
+            end
+            redis.call('SREM', KEYS[1], pid)
+            redis.call('DEL', lock)
+        end
+    end
+    return false
+end
+local candidates = redis.call('SRANDMEMBER', KEYS[1], tonumber(ARGV[3]))
+local raw = take(candidates)
+if not raw and redis.call('SCARD', KEYS[1]) > #candidates then
+    raw = take(redis.call('SMEMBERS', KEYS[1]))
+end
+return raw
+"""
+
+# Lua script: move up to ARGV[3] delayed tasks that are due (score <= ARGV[2])
+# to their queue. Members are '<partition>|<task>', with an empty partition on
+# unpartitioned queues.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[2], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    local sep = string.find(member, '|', 1, true)
+    local pid = string.sub(member, 1, sep - 1)
+    local raw = string.sub(member, sep + 1)
+    if pid == '' then
+        redis.call('LPUSH', KEYS[2], raw)
+    else
+        redis.call('LPUSH', ARGV[1] .. ':p' .. pid, raw)
+        redis.call('SADD', KEYS[3], pid)
+        redis.call('LPUSH', KEYS[4], 1)
+    end
+end
+if #due > 0 then
+    redis.call('LTRIM', KEYS[4], 0, 999)
+end
+return #due
+"""
+
+# Partitions probed per partitioned dequeue attempt
+PARTITION_CANDIDATES = 8
+
+# Seconds between a worker pool's checks for delayed tasks that are due
+DELAYED_POLL_INTERVAL = 0.1
+
+# Registry of task functions by dotted path, filled by register_task and on first resolve
+_task_registry = {}
+_registry_lock = threading.Lock()
+
+
+def register_task(func=None, name=None):
+    """
+    Register a function as a queue task.
+
+    Can be used as @register_task or @register_task(name='alias'). Tasks are
+    always registered under their dotted path, plus the alias if given.
+    """
+    def decorator(f):
+        with _registry_lock:
+            _task_registry[f"{f.__module__}.{f.__name__}"] = f
+            if name:
+                _task_registry[name] = f
+        return f
+
+    return decorator(func) if func is not None else decorator
+
+
+def resolve_task(func_name):
+    """Resolve a task name to its function, importing it only the first time"""
+    func = _task_registry.get(func_name)
+    if func is not None:
+        return func
+
+    module_name, attr = func_name.rsplit('.', 1) if '.' in func_name else (DEFAULT_TASK_MODULE, func_name)
+    func = getattr(importlib.import_module(module_name), attr)
+
+    with _registry_lock:
+        _task_registry[func_name] = func
+    return func
+
+
+class Task:
+    """A task taken from a queue; holds the raw payload needed to ack it"""
+
+    __slots__ = ('queue', 'raw', 'data', 'dequeued_at')
+
+    def __init__(self, queue, raw):
+        self.queue = queue
+        self.raw = raw
+        self.data = json.loads(raw)
+        self.dequeued_at = time.time()
+
+    @property
+    def id(self):
+        return self.data['id']
+
+    @property
+    def attempts(self):
+        return self.data.get('attempts', 0)
+
+    @property
+    def wait_time(self):
+        """Seconds the task spent queued before being picked up"""
+        enqueued_at = self.data.get('enqueued_at')
+        return max(0.0, self.dequeued_at - enqueued_at) if enqueued_at else 0.0
+
+
 class RedisQueue:
     """
-    Redis-based queue service for handling asynchronous tasks
+    Redis-based reliable queue for asynchronous tasks.
+
+    Layout per queue name:
+        queue:<name>             pending tasks (LPUSH in, consumed from the right)
+        queue:<name>:processing  tasks currently leased by a worker
+        queue:<name>:leases      sorted set of leased tasks scored by lease expiry
+        queue:<name>:failed      dead-lettered tasks
+        queue:<name>:delayed     sorted set of tasks enqueued with a delay, scored by due time
+        queue:<name>:stats       counters for sizing workers
+
+    Dequeue moves a task into the processing list (BLMOVE) and leases it for
+    visibility_timeout seconds. A task that isn't acked before its lease
+    expires (e.g. the worker died) is reclaimed and retried, and a task that
+    fails more than max_retries times is dead-lettered.
+
+    Queues listed in `partitions` are split into that many ordered partitions
+    (queue:<name>:p<i>) chosen by a hash of each task's partition_key. A
+    partition is locked while one of its tasks is leased, so tasks sharing a
+    key run one at a time in enqueue order while different keys run in
+    parallel. queue:<name>:active tracks non-empty partitions and
+    queue:<name>:signal wakes idle workers.
     """
-    
-    def __init__(self, redis_url, default_queue='default'):
-        """Initialize the queue with Redis connection and default queue name"""
-        self.redis_conn = redis.from_url(redis_url)
+
+    def __init__(self, redis_url=None, default_queue='default', visibility_timeout=300, max_retries=3,
+                 connection=None, partitions=None):
+        """Initialize the queue with Redis connection (or an existing one) and default queue name"""
+        if connection is None:
+            connection = redis.from_url(redis_url)
+        self.redis_conn = connection
         self.default_queue = default_queue
-    
-    def enqueue(self, func, *args, queue=None, **kwargs):
+        self.visibility_timeout = visibility_timeout
+        self.max_retries = max_retries
+        self.partitions = dict(partitions or {})
+        self._settle = self.redis_conn.register_script(SETTLE_SCRIPT)
+        self._partition_dequeue = self.redis_conn.register_script(PARTITION_DEQUEUE_SCRIPT)
+        self._promote = self.redis_conn.register_script(PROMOTE_SCRIPT)
+
+    def enqueue(self, func, *args, queue=None, partition_key=None, delay=None, **kwargs):
         """
         Add a task to the queue
         func: function to execute (or function name as string)
         args, kwargs: arguments to pass to the function
         queue: optional queue name, defaults to self.default_queue
+        partition_key: on partitioned queues, tasks with the same key run in order
+        delay: optional seconds to hold the task back; it joins the queue once due
         """
         # Determine which queue to use
         queue_name = queue or self.default_queue
-        
+
         # Create a unique task ID
         task_id = str(uuid.uuid4())
-        
+
         # Prepare the task data
         task_data = {
             'id': task_id,
-            'function': func.__name__ if callable(func) else func,
+            'function': f"{func.__module__}.{func.__name__}" if callable(func) else func,
             'args': args,
-            'kwargs': kwargs
+            'kwargs': kwargs,
+            'enqueued_at': time.time() + (delay or 0),
+            'attempts': 0
         }
-        
+
+        if queue_name in self.partitions:
+            task_data['partition'] = self.partition_for(queue_name, partition_key or task_id)
+
         # Serialize task data
         serialized_task = json.dumps(task_data)
-        
+
         # Add to queue
-        self.redis_conn.lpush(f'queue:{queue_name}', serialized_task)
+        if delay:
+            member = f"{task_data.get('partition', '')}|{serialized_task}"
+            self.redis_conn.zadd(self._key(queue_name, 'delayed'), {member: task_data['enqueued_at']})
+        elif 'partition' in task_data:
+            pipeline = self.redis_conn.pipeline(transaction=True)
+            pipeline.lpush(self._partition_key(queue_name, task_data['partition']), serialized_task)
+            pipeline.sadd(self._key(queue_name, 'active'), task_data['partition'])
+            pipeline.lpush(self._key(queue_name, 'signal'), 1)
+            pipeline.ltrim(self._key(queue_name, 'signal'), 0, 999)
+            pipeline.execute()
+        else:
+            self.redis_conn.lpush(self._key(queue_name), serialized_task)
         logger.debug(f"Enqueued task {task_id} to queue '{queue_name}'")
-        
+
         return task_id
-    
+
+    def promote_delayed(self, queue=None, limit=100):
+        """
+        Move delayed tasks that are due onto their queue.
+
+        Returns:
+            int: Number of tasks moved
+        """
+        queue_name = queue or self.default_queue
+        keys = [self._key(queue_name, 'delayed'), self._key(queue_name), self._key(queue_name, 'active'),
+                self._key(queue_name, 'signal')]
+        return self._promote(keys=keys, args=[self._key(queue_name), time.time(), limit])
+
+    def partition_for(self, queue_name, partition_key):
+        """Stable partition index for a key (the same in every process)"""
+        return zlib.crc32(str(partition_key).encode('utf-8')) % self.partitions[queue_name]
+
+    def dequeue(self, queue=None, timeout=5):
+        """
+        Take one task from the queue and lease it.
+        timeout: seconds to block waiting for a task; None to return immediately
+        """
+        queue_name = queue or self.default_queue
+
+        if queue_name in self.partitions:
+            return self._dequeue_partitioned(queue_name, timeout)
+
+        if timeout is None:
+            raw = self.redis_conn.lmove(self._key(queue_name), self._key(queue_name, 'processing'), 'RIGHT', 'LEFT')
+        else:
+            raw = self.redis_conn.blmove(
+                self._key(queue_name), self._key(queue_name, 'processing'), timeout, 'RIGHT', 'LEFT'
+            )
+
+        if raw is None:
+            return None
+
+        self.redis_conn.zadd(self._key(queue_name, 'leases'), {raw: time.time() + self.visibility_timeout})
+        return Task(queue_name, raw)
+
+    def dequeue_batch(self, queue=None, count=10, timeout=5):
+        """
+        Take up to count tasks, blocking only for the first one.
+        timeout: seconds to block waiting for the first task; None to return immediately
+        """
+        queue_name = queue or self.default_queue
+
+        first = self.dequeue(queue_name, timeout=timeout)
+        if first is None:
+            return []
+
+        tasks = [first]
+        if queue_name in self.partitions:
+            # Each task holds its partition's lock, so a batch spans distinct partitions
+            while len(tasks) < count:
+                task = self._dequeue_partitioned(queue_name, None)
+                if task is None:
+                    break
+                tasks.append(task)
+        elif count > 1:
+            pipeline = self.redis_conn.pipeline(transaction=False)
+            for _ in range(count - 1):
+                pipeline.lmove(self._key(queue_name), self._key(queue_name, 'processing'), 'RIGHT', 'LEFT')
+            raws = [raw for raw in pipeline.execute() if raw is not None]
+
+            if raws:
+                expiry = time.time() + self.visibility_timeout
+                self.redis_conn.zadd(self._key(queue_name, 'leases'), {raw: expiry for raw in raws})
+                tasks.extend(Task(queue_name, raw) for raw in raws)
+
+        return tasks
+
+    def ack(self, task):
+        """Mark a task as done and drop it from the processing list"""
+        keys, args = self._settle_params(task.queue, task.data, self._key(task.queue))
+        return bool(self._settle(keys=keys, args=[task.raw, '', ''] + args))
+
+    def fail(self, task, error=None):
+        """
+        Record a failed attempt: retry the task, or dead-letter it once max_retries is exceeded.
+
+        Returns:
+            str: 'retry', 'dead' or None if the task was no longer owned
+        """
+        return self._requeue(task.queue, task.raw, error)
+
+    def extend_lease(self, task, seconds=None):
+        """Push back a long-running task's lease expiry"""
+        seconds = seconds or self.visibility_timeout
+        self.redis_conn.zadd(self._key(task.queue, 'leases'), {task.raw: time.time() + seconds}, xx=True)
+
+        if 'partition' in task.data:
+            lock_key = self._partition_key(task.queue, task.data['partition'], 'lock')
+            self.redis_conn.pexpire(lock_key, int(seconds * 2000))
+
+    def reclaim_expired(self, queue=None, limit=100):
+        """
+        Return tasks whose lease expired (crashed or stuck workers) to the queue.
+
+        Returns:
+            int: Number of tasks reclaimed
+        """
+        queue_name = queue or self.default_queue
+        leases_key = self._key(queue_name, 'leases')
+        now = time.time()
+
+        # Lease tasks that were moved to processing by a worker that died before leasing them
+        processing = self.redis_conn.lrange(self._key(queue_name, 'processing'), 0, -1)
+        if processing:
+            self.redis_conn.zadd(leases_key, {raw: now + self.visibility_timeout for raw in processing}, nx=True)
+
+        reclaimed = 0
+        for raw in self.redis_conn.zrangebyscore(leases_key, '-inf', now, start=0, num=limit):
+            if self._requeue(queue_name, raw, 'Lease expired'):
+                reclaimed += 1
+
+        if reclaimed:
+            logger.warning(f"Reclaimed {reclaimed} expired tasks on queue '{queue_name}'")
+        return reclaimed
+
+    def run_task(self, task):
+        """Execute a leased task, then ack or fail it and record stats"""
+        started = time.time()
+        try:
+            func = resolve_task(task.data['function'])
+            func(*task.data['args'], **task.data['kwargs'])
+        except Exception as e:
+            logger.exception(f"Error processing task {task.id} from queue '{task.queue}': {str(e)}")
+            outcome = self.fail(task, str(e))
+            self._record(task, started, outcome or 'lost')
+            return False
+
+        self.ack(task)
+        self._record(task, started, 'completed')
+        logger.debug(f"Processed task {task.id} from queue '{task.queue}'")
+        return True
+
     def process_queue(self, queue=None, limit=None):
         """
-        Process tasks in the queue
+        Process tasks in the queue until it is empty
         queue: optional queue name, defaults to self.default_queue
         limit: optional maximum number of tasks to process
         """
         queue_name = queue or self.default_queue
         count = 0
-        
-        while True:
-            # Stop if we've reached the limit
-            if limit is not None and count >= limit:
-                break
-            
-            # Try to get a task from the queue
-            serialized_task = self.redis_conn.rpop(f'queue:{queue_name}')
-            if not serialized_task:
+
+        while limit is None or count < limit:
+            self.promote_delayed(queue_name)
+            task = self.dequeue(queue_name, timeout=None)
+            if task is None:
                 break
-            
-            try:
-                # Deserialize task data
-                task_data = json.loads(serialized_task)
-                
-                # Get function to execute
-                func_name = task_data['function']
-                
-                # Import and execute the function
-                module_name, func_name = func_name.rsplit('.', 1) if '.' in func_name else ('app.services.message_handler', func_name)
-                module = __import__(module_name, fromlist=[func_name])
-                func = getattr(module, func_name)
-                
-                # Execute function with arguments
-                result = func(*task_data['args'], **task_data['kwargs'])
-                
-                logger.debug(f"Processed task {task_data['id']} from queue '{queue_name}'")
+
+            if self.run_task(task):
                 count += 1
-                
-            except Exception as e:
-                logger.exception(f"Error processing task from queue '{queue_name}': {str(e)}")
-                
-                # Add task to failure queue for later inspection
-                self.redis_conn.lpush(f'queue:{queue_name}:failed', serialized_task)
+
+        return count
+
+    def stats(self, queue=None):
+        """
+        Queue depth, latency and throughput figures for sizing workers.
+
+        Returns:
+            dict: depth, in_flight, dead, oldest_wait_seconds, totals, average
+                  wait/run seconds and tasks completed in the last full minute
+        """
+        queue_name = queue or self.default_queue
+        last_minute = int(time.time() // 60) - 1
+
+        if queue_name in self.partitions:
+            pending_lists = [self._partition_key(queue_name, int(pid))
+                             for pid in self.redis_conn.smembers(self._key(queue_name, 'active'))]
+        else:
+            pending_lists = [self._key(queue_name)]
+
+        pipeline = self.redis_conn.pipeline(transaction=False)
+        pipeline.llen(self._key(queue_name, 'processing'))
+        pipeline.llen(self._key(queue_name, 'failed'))
+        pipeline.hgetall(self._key(queue_name, 'stats'))
+        pipeline.get(self._key(queue_name, f'completed:{last_minute}'))
+        pipeline.zcard(self._key(queue_name, 'delayed'))
+        for pending in pending_lists:
+            pipeline.llen(pending)
+            pipeline.lindex(pending, -1)
+        in_flight, dead, totals, per_minute, delayed, *pending_stats = pipeline.execute()
+
+        depth = sum(pending_stats[0::2])
+        oldest = [json.loads(raw)['enqueued_at'] for raw in pending_stats[1::2] if raw]
+        totals = {k.decode(): float(v) for k, v in totals.items()}
+        completed = int(totals.get('completed', 0))
+        oldest_wait = time.time() - min(oldest) if oldest else 0.0
+
+        return {
+            'queue': queue_name,
+            'partitions': self.partitions.get(queue_name, 1),
+            'depth': depth,
+            'delayed': delayed,
+            'in_flight': in_flight,
+            'dead': dead,
+            'oldest_wait_seconds': round(max(0.0, oldest_wait), 3),
+            'completed': completed,
+            'retried': int(totals.get('retried', 0)),
+            'dead_lettered': int(totals.get('dead_lettered', 0)),
+            'avg_wait_seconds': round(totals.get('wait_seconds', 0) / completed, 4) if completed else 0.0,
+            'avg_run_seconds': round(totals.get('run_seconds', 0) / completed, 4) if completed else 0.0,
+            'completed_last_minute': int(per_minute or 0)
+        }
+
+    def _requeue(self, queue_name, raw, error):
+        """Settle a leased task as retry or dead letter; None if it was no longer owned"""
+        task_data = json.loads(raw)
+        task_data['attempts'] = task_data.get('attempts', 0) + 1
+        task_data['last_error'] = error
+
+        if task_data['attempts'] > self.max_retries:
+            outcome, target = 'dead', self._key(queue_name, 'failed')
+        elif 'partition' in task_data:
+            # Retries go to the consuming end so they run next, ahead of later tasks in the partition
+            outcome, target = 'retry', self._partition_key(queue_name, task_data['partition'])
+        else:
+            outcome, target = 'retry', self._key(queue_name)
+
+        keys, args = self._settle_params(queue_name, task_data, target)
+        owned = self._settle(keys=keys, args=[raw, json.dumps(task_data), outcome] + args)
+        return outcome if owned else None
+
+    def _settle_params(self, queue_name, task_data, target):
+        """Keys and extra args for SETTLE_SCRIPT, including the partition lock if any"""
+        keys = [self._key(queue_name, 'processing'), self._key(queue_name, 'leases'), target]
+        if 'partition' not in task_data:
+            return keys, []
+
+        partition = task_data['partition']
+        keys += [self._partition_key(queue_name, partition, 'lock'), self._key(queue_name, 'active'),
+                 self._partition_key(queue_name, partition), self._key(queue_name, 'signal')]
+        return keys, [partition]
+
+    def _dequeue_partitioned(self, queue_name, timeout):
+        """Lease the next task from any unlocked partition, waiting on the signal list if none is ready"""
+        args = [self._key(queue_name), self.visibility_timeout, PARTITION_CANDIDATES]
+        keys = [self._key(queue_name, 'active'), self._key(queue_name, 'processing'), self._key(queue_name, 'leases')]
+
+        raw = self._partition_dequeue(keys=keys, args=args)
+        if raw is None and timeout is not None:
+            self.redis_conn.blpop([self._key(queue_name, 'signal')], timeout=timeout)
+            raw = self._partition_dequeue(keys=keys, args=args)
+
+        return Task(queue_name, raw) if raw is not None else None
+
+    def _record(self, task, started, outcome):
+        """Update the queue's stats counters for one finished attempt"""
+        stats_key = self._key(task.queue, 'stats')
+        pipeline = self.redis_conn.pipeline(transaction=False)
+
+        if outcome == 'completed':
+            minute_key = self._key(task.queue, f'completed:{int(time.time() // 60)}')
+            pipeline.hincrby(stats_key, 'completed', 1)
+            pipeline.hincrbyfloat(stats_key, 'wait_seconds', task.wait_time)
+            pipeline.hincrbyfloat(stats_key, 'run_seconds', time.time() - started)
+            pipeline.incr(minute_key)
+            pipeline.expire(minute_key, 7200)
+        elif outcome == 'retry':
+            pipeline.hincrby(stats_key, 'retried', 1)
+        elif outcome == 'dead':
+            pipeline.hincrby(stats_key, 'dead_lettered', 1)
+
+        pipeline.execute()
+
+    @staticmethod
+    def _key(queue_name, suffix=None):
+        return f'queue:{queue_name}:{suffix}' if suffix else f'queue:{queue_name}'
+
+    @staticmethod
+    def _partition_key(queue_name, partition, suffix=None):
+        key = f'queue:{queue_name}:p{partition}'
+        return f'{key}:{suffix}' if suffix else key
+
+
+class QueueWorker:
+    """
+    Long-running worker pool for a RedisQueue.
+
+    Runs `concurrency` worker threads (green threads under eventlet) that pull
+    batches from the given queues and run each task inside an app context, plus
+    one reaper thread that reclaims expired leases and one that moves delayed
+    tasks onto their queues when they are due.
+    """
+
+    def __init__(self, app, task_queue, queues=None, concurrency=4, batch_size=1, block_timeout=1):
+        self.app = app
+        self.task_queue = task_queue
+        self.queues = list(queues or [task_queue.default_queue])
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start worker and reaper threads"""
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._work, args=(index,), name=f'queue-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        reaper = threading.Thread(target=self._reap, name='queue-reaper', daemon=True)
+        reaper.start()
+        self._threads.append(reaper)
+
+        scheduler = threading.Thread(target=self._promote_delayed, name='queue-scheduler', daemon=True)
+        scheduler.start()
+        self._threads.append(scheduler)
+
+        logger.info(f"Started {self.concurrency} workers on queues {self.queues}")
+
+    def stop(self, timeout=None):
+        """Stop taking new tasks and wait for running ones to finish"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run(self):
+        """Run until SIGINT/SIGTERM, then shut down gracefully"""
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self._stopping.set())
+
+        self.start()
+        while not self._stopping.wait(1):
+            pass
+
+        logger.info("Shutting down queue workers")
+        self.stop()
+
+    def _work(self, index):
+        # Stagger which queue each worker blocks on so every queue has listeners
+        primary = self.queues[index % len(self.queues)]
+
+        while not self._stopping.is_set():
+            try:
+                tasks = []
+                for queue_name in self.queues:
+                    tasks = self.task_queue.dequeue_batch(queue_name, self.batch_size, timeout=None)
+                    if tasks:
+                        break
+
+                if not tasks:
+                    tasks = self.task_queue.dequeue_batch(primary, self.batch_size, timeout=self.block_timeout)
+
+                for task in tasks:
+                    with self.app.app_context():
+                        self.task_queue.run_task(task)
+            except redis.RedisError as e:
+                logger.error(f"Queue worker {index} lost Redis connection: {str(e)}")
+                self._stopping.wait(1 + random.random())
+
+    def _reap(self):
+        interval = max(1, self.task_queue.visibility_timeout / 2)
+
+        while not self._stopping.wait(interval):
+            for queue_name in self.queues:
+                try:
+                    self.task_queue.reclaim_expired(queue_name)
+                except redis.RedisError as e:
+                    logger.error(f"Failed to reclaim tasks on queue '{queue_name}': {str(e)}")
+
+    def _promote_delayed(self):
+        while not self._stopping.wait(DELAYED_POLL_INTERVAL):
+            for queue_name in self.queues:
+                try:
+                    self.task_queue.promote_delayed(queue_name)
+                except redis.RedisError as e:
+                    logger.error(f"Failed to promote delayed tasks on queue '{queue_name}': {str(e)}")
+
+
+def get_task_queue(app=None):
+    """Get the app's task queue, or None if REDIS_URL is not configured"""
+    app = app or current_app._get_current_object()
+
+    if 'task_queue' not in app.extensions:
+        from app.extensions import get_redis
         
-        return count
\ No newline at end of file
+        redis_conn = get_redis(app)
+        app.extensions['task_queue'] = RedisQueue(
+            connection=redis_conn,
+            visibility_timeout=app.config.get('QUEUE_VISIBILITY_TIMEOUT', 300),
+            max_retries=app.config.get('QUEUE_MAX_RETRIES', 3),
+            partitions=app.config.get('QUEUE_PARTITIONS')
+        ) if redis_conn is not None else None
+
+    return app.extensions['task_queue']
@@ -0,0 +1,228 @@
+# app/services/realtime.py
+"""
+Room-scoped, micro-batched Socket.IO emits.
+
+Dashboards join a 'user:<id>' room and one 'profile:<id>' room per owned
+profile when they connect, so events only reach the tenant they belong to.
+Events are buffered per room and flushed every SOCKETIO_BATCH_INTERVAL
+seconds: a room with one pending event gets it as-is, a room with several
+gets a single 'event_batch' carrying all of them in order.
+
+With SOCKETIO_MESSAGE_QUEUE set, emits from any process (web or queue
+worker) are published through Redis and reach sockets on every web worker.
+
+Every event also gets the next sequence number of the tenant (user) it
+belongs to, carried as data['seq'], and is appended to that user's bounded
+replay stream. A reconnecting dashboard sends 'resume' with the last
+sequence number it saw and receives only the events it missed, or a reset
+if the stream has been trimmed past that point.
+"""
+import json
+import time
+import threading
+import logging
+
+from flask import current_app
+from app.extensions import db, socketio, get_redis
+from app.services.reply_trace import stage
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'event_batch'
+
+# Lua script: assign the user's next sequence number and append the event to
+# their replay stream with that number as its id, trimming the stream to about
+# ARGV[1] entries. KEYS: stream, sequence counter. ARGV: maxlen, event, data, ttl.
+APPEND_EVENT_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], seq .. '-0', 'event', ARGV[2], 'data', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return seq
+"""
+
+# profile id -> owning user id; ownership never changes
+_profile_owners = {}
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def profile_room(profile_id):
+    return f"profile:{profile_id}"
+
+
+class EmitBatcher:
+    """Buffers emits per room and flushes them on a short interval"""
+
+    def __init__(self, server, interval=0.02, max_batch=100):
+        self.server = server
+        self.interval = interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._started = False
+
+    def emit(self, event, data, room):
+        """Queue an event for a room; sent immediately when batching is disabled"""
+        if self.interval <= 0:
+            self.server.emit(event, data, to=room)
+            return
+
+        with self._lock:
+            events = self._pending.setdefault(room, [])
+            events.append({'event': event, 'data': data})
+            full = len(events) >= self.max_batch
+            if not self._started:
+                self._started = True
+                self.server.start_background_task(self._flush_loop)
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Send everything buffered so far. Returns the number of emits made."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for room, events in pending.items():
+            if len(events) == 1:
+                self.server.emit(events[0]['event'], events[0]['data'], to=room)
+            else:
+                self.server.emit(BATCH_EVENT, {'events': events}, to=room)
+        return len(pending)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Socket.IO batch flush failed: {str(e)}")
+
+
+class EventStream:
+    """Per-user event sequence numbers and bounded replay buffers (Redis streams)"""
+
+    def __init__(self, redis_conn, maxlen=1000, ttl=86400, key_prefix='events'):
+        self.redis_conn = redis_conn
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self._append = redis_conn.register_script(APPEND_EVENT_SCRIPT)
+
+    def append(self, user_id, event, data):
+        """Record an event for a user and return its sequence number"""
+        stream_key, seq_key = self._keys(user_id)
+        return self._append(keys=[stream_key, seq_key], args=[self.maxlen, event, json.dumps(data), self.ttl])
+
+    def replay(self, user_id, after):
+        """
+        Events recorded for a user after sequence number `after`.
+
+        Returns:
+            tuple: (list of {'event', 'data'} with data['seq'] set, or None if
+                events after `after` are no longer buffered; latest sequence number)
+        """
+        stream_key, seq_key = self._keys(user_id)
+        pipeline = self.redis_conn.pipeline(transaction=True)
+        pipeline.get(seq_key)
+        pipeline.xrange(stream_key, '-', '+', count=1)
+        pipeline.xrange(stream_key, f'{after + 1}-0', '+', count=self.maxlen)
+        latest, first, entries = pipeline.execute()
+        latest = int(latest or 0)
+
+        # The counter was reset (expired) since the client last saw it
+        if after > latest:
+            return None, latest
+        if after == latest:
+            return [], latest
+
+        # Trimmed past the client's position
+        if not first or self._seq(first[0][0]) > after + 1:
+            return None, latest
+
+        events = []
+        for entry_id, fields in entries:
+            data = json.loads(fields[b'data'])
+            data['seq'] = self._seq(entry_id)
+            events.append({'event': fields[b'event'].decode(), 'data': data})
+        return events, latest
+
+    def latest(self, user_id):
+        """The user's latest sequence number"""
+        return int(self.redis_conn.get(self._keys(user_id)[1]) or 0)
+
+    def _keys(self, user_id):
+        return f"{self.key_prefix}:user:{user_id}", f"{self.key_prefix}:user:{user_id}:seq"
+
+    @staticmethod
+    def _seq(entry_id):
+        return int(entry_id.split(b'-')[0])
+
+
+def get_event_stream(app=None):
+    """Get the app's shared EventStream, or None when Redis is not configured or replay is disabled"""
+    app = app or current_app._get_current_object()
+
+    if 'event_stream' not in app.extensions:
+        maxlen = app.config.get('REALTIME_REPLAY_MAXLEN', 1000)
+        redis_conn = get_redis(app)
+        app.extensions['event_stream'] = EventStream(
+            redis_conn,
+            maxlen=maxlen,
+            ttl=app.config.get('REALTIME_REPLAY_TTL', 86400)
+        ) if redis_conn is not None and maxlen > 0 else None
+
+    return app.extensions['event_stream']
+
+
+def profile_owner(profile_id):
+    """User id owning a profile (cached)"""
+    if profile_id not in _profile_owners:
+        from app.models.profile import Profile
+        _profile_owners[profile_id] = db.session.query(Profile.user_id).filter_by(id=profile_id).scalar()
+    return _profile_owners[profile_id]
+
+
+def get_emit_batcher(app=None):
+    """Get the app's shared EmitBatcher"""
+    app = app or current_app._get_current_object()
+
+    if 'emit_batcher' not in app.extensions:
+        app.extensions['emit_batcher'] = EmitBatcher(
+            socketio,
+            interval=app.config.get('SOCKETIO_BATCH_INTERVAL', 0.02),
+            max_batch=app.config.get('SOCKETIO_BATCH_MAX', 100)
+        )
+
+    return app.extensions['emit_batcher']
+
+
+def emit_to_profile(profile_id, event, data, user_id=None):
+    """Send an event to every dashboard watching a profile"""
+    with stage('emit'):
+        data = _sequenced(user_id or profile_owner(profile_id), event, data)
+        get_emit_batcher().emit(event, data, room=profile_room(profile_id))
+
+
+def emit_to_user(user_id, event, data):
+    """Send an event to every dashboard session of a user"""
+    with stage('emit'):
+        data = _sequenced(user_id, event, data)
+        get_emit_batcher().emit(event, data, room=user_room(user_id))
+
+
+def _sequenced(user_id, event, data):
+    """Record the event in the user's replay stream and stamp it with its sequence number"""
+    event_stream = get_event_stream()
+    if event_stream is None or user_id is None:
+        return data
+
+    try:
+        return dict(data, seq=event_stream.append(user_id, event, data))
+    except Exception as e:
+        # Live delivery matters more than replay; the client resyncs on the gap
+        logger.warning(f"Failed to record {event} event for user {user_id}: {str(e)}")
+        return data
@@ -0,0 +1,357 @@
+# app/services/reply_rules.py
+"""
+Compiled per-profile reply rules.
+
+A profile's active AutoReply keywords, business hours and out-of-office text
+are compiled once into a ReplyRules object: one Aho-Corasick automaton over
+all keywords (matched case-insensitively on word boundaries, the highest
+priority match wins), a table of the week's open intervals in the profile's
+timezone, and the resolved out-of-office message. Deciding which rule fires
+for an inbound message is then a single pass over the text with no queries.
+
+Compiled rules are cached per process. Committing a change to a profile's
+auto replies, out-of-office replies, business hours or timezone drops the
+entry in this process and, through a Redis pub/sub channel, in every other
+one; REPLY_RULES_CACHE_TTL bounds staleness if a notification is missed.
+"""
+import time
+import threading
+import logging
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from app.extensions import db, socketio, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'reply_rules_invalidated'
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+_hooks_registered = False
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over lowercased keywords.
+
+    A keyword only matches as a whole word: it can't be preceded or followed
+    by a letter, digit or underscore unless the keyword itself starts or ends
+    with punctuation there.
+    """
+
+    def __init__(self, keywords):
+        # Node 0 is the root; each node has goto transitions, a failure link and outputs
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._lengths = []
+        self._boundaries = []
+
+        for index, keyword in enumerate(keywords):
+            keyword = keyword.lower()
+            self._lengths.append(len(keyword))
+            if not keyword:
+                self._boundaries.append((False, False))
+                continue
+            self._boundaries.append((_is_word_char(keyword[0]), _is_word_char(keyword[-1])))
+
+            node = 0
+            for char in keyword:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node].append(index)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """
+        Yield (keyword index, start, end) for every whole-word occurrence in text.
+        """
+        text = text.lower()
+        length = len(text)
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            for index in self._output[node]:
+                end = position + 1
+                start = end - self._lengths[index]
+                check_start, check_end = self._boundaries[index]
+                if check_start and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if check_end and end < length and _is_word_char(text[end]):
+                    continue
+                yield index, start, end
+
+
+class WeeklySchedule:
+    """
+    Open intervals over the week in a timezone, as seconds since Monday 00:00.
+
+    Built from Profile.business_hours ({"monday": {"start": "10:00", "end":
+    "22:00"}, ...}). No hours at all means always open; a missing day is
+    closed; an end before the start runs into the next day; a day whose hours
+    can't be parsed is open all day.
+    """
+
+    def __init__(self, business_hours, timezone='UTC'):
+        import pytz
+
+        try:
+            self.timezone = pytz.timezone(timezone or 'UTC')
+        except pytz.UnknownTimeZoneError:
+            logger.warning(f"Unknown timezone {timezone!r}, using UTC for business hours")
+            self.timezone = pytz.utc
+
+        self.always_open = not business_hours
+        self.intervals = [] if self.always_open else self._compile(business_hours)
+
+    @staticmethod
+    def _compile(business_hours):
+        intervals = []
+        for day_index, day in enumerate(DAYS):
+            day_hours = business_hours.get(day)
+            if not isinstance(day_hours, dict):
+                continue
+
+            day_start = day_index * DAY_SECONDS
+            try:
+                start_hour, start_minute = map(int, day_hours.get('start', '00:00').split(':'))
+                end_hour, end_minute = map(int, day_hours.get('end', '23:59').split(':'))
+            except (ValueError, AttributeError):
+                intervals.append((day_start, day_start + DAY_SECONDS))
+                continue
+
+            start = day_start + start_hour * 3600 + start_minute * 60
+            end = day_start + end_hour * 3600 + end_minute * 60
+            if end_hour < start_hour:
+                end += DAY_SECONDS
+
+            # Sunday night hours run into Monday morning
+            if end > WEEK_SECONDS:
+                intervals.append((start, WEEK_SECONDS))
+                intervals.append((0, end - WEEK_SECONDS))
+            else:
+                intervals.append((start, end))
+        return sorted(intervals)
+
+    def is_open(self, now=None):
+        """Check whether `now` (an aware datetime, default the current time) falls in an open interval"""
+        if self.always_open:
+            return True
+
+        local = (now or datetime.now(self.timezone)).astimezone(self.timezone)
+        second = local.weekday() * DAY_SECONDS + local.hour * 3600 + local.minute * 60 + local.second
+        for start, end in self.intervals:
+            if start > second:
+                break
+            if second <= end:
+                return True
+        return False
+
+
+class ReplyRules:
+    """A profile's compiled keyword replies, business hours and out-of-office message"""
+
+    def __init__(self, auto_replies, business_hours=None, timezone='UTC', out_of_office=None):
+        """
+        Args:
+            auto_replies: Active (keyword, response, priority) tuples, in creation order
+            business_hours: Profile.get_business_hours() dict
+            timezone: Profile timezone name
+            out_of_office: Out-of-office message, or None
+        """
+        self.auto_replies = [(keyword, response, priority or 0) for keyword, response, priority in auto_replies]
+        self.automaton = KeywordAutomaton([keyword for keyword, _, _ in self.auto_replies])
+        self.schedule = WeeklySchedule(business_hours, timezone)
+        self.out_of_office = out_of_office
+        self.compiled_at = time.monotonic()
+
+    def match_keyword(self, text):
+        """
+        The auto reply whose keyword occurs in text, highest priority first and
+        earliest created among equals.
+
+        Returns:
+            tuple: (keyword, response) or None
+        """
+        best = None
+        for index, _, _ in self.automaton.find(text):
+            if best is None or (-self.auto_replies[index][2], index) < (-self.auto_replies[best][2], best):
+                best = index
+        if best is None:
+            return None
+        keyword, response, _ = self.auto_replies[best]
+        return keyword, response
+
+    def is_open(self, now=None):
+        return self.schedule.is_open(now)
+
+    def out_of_office_reply(self, now=None):
+        """The out-of-office message if it applies at `now`, else None"""
+        if self.out_of_office and not self.schedule.is_open(now):
+            return self.out_of_office
+        return None
+
+
+def compile_reply_rules(profile):
+    """Load and compile a profile's active reply rules"""
+    from app.models.auto_reply import AutoReply, OutOfOfficeReply
+
+    auto_replies = db.session.query(AutoReply.keyword, AutoReply.response, AutoReply.priority).filter_by(
+        profile_id=profile.id, is_active=True
+    ).order_by(AutoReply.id).all()
+
+    out_of_office = db.session.query(OutOfOfficeReply.message).filter_by(
+        profile_id=profile.id, is_active=True
+    ).order_by(OutOfOfficeReply.id).limit(1).scalar()
+
+    try:
+        business_hours = profile.get_business_hours()
+    except ValueError:
+        logger.warning(f"Profile {profile.id} has malformed business hours, treating it as always open")
+        business_hours = {}
+
+    return ReplyRules(auto_replies, business_hours, profile.timezone, out_of_office)
+
+
+class ReplyRulesCache:
+    """Per-process cache of compiled ReplyRules by profile id"""
+
+    def __init__(self, compile_rules=compile_reply_rules, ttl=300):
+        self.compile_rules = compile_rules
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, profile):
+        rules = self._entries.get(profile.id)
+        if rules is None or time.monotonic() - rules.compiled_at > self.ttl:
+            rules = self.compile_rules(profile)
+            with self._lock:
+                self._entries[profile.id] = rules
+        return rules
+
+    def invalidate(self, profile_id):
+        with self._lock:
+            self._entries.pop(profile_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_reply_rules_cache(app=None):
+    """Get this process's ReplyRulesCache, subscribing to invalidations on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'reply_rules' not in app.extensions:
+        cache = ReplyRulesCache(ttl=app.config.get('REPLY_RULES_CACHE_TTL', 300))
+        app.extensions['reply_rules'] = cache
+
+        redis_conn = get_redis(app)
+        if redis_conn is not None:
+            socketio.start_background_task(_listen, cache, redis_conn)
+
+    return app.extensions['reply_rules']
+
+
+def get_reply_rules(profile):
+    """Compiled reply rules for a profile (cached)"""
+    return get_reply_rules_cache().get(profile)
+
+
+def invalidate_reply_rules(profile_ids):
+    """Drop compiled rules for these profiles here and in every other process"""
+    cache = get_reply_rules_cache()
+    for profile_id in profile_ids:
+        cache.invalidate(profile_id)
+
+    redis_conn = get_redis()
+    if redis_conn is not None:
+        try:
+            for profile_id in profile_ids:
+                redis_conn.publish(CHANNEL, profile_id)
+        except Exception as e:
+            logger.warning(f"Failed to publish reply rule invalidation for profiles {profile_ids}: {str(e)}")
+
+
+def _listen(cache, redis_conn):
+    while True:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CHANNEL)
+            for message in pubsub.listen():
+                cache.invalidate(int(message['data']))
+        except Exception as e:
+            logger.warning(f"Reply rule invalidation channel lost: {str(e)}")
+        finally:
+            pubsub.close()
+
+        time.sleep(1)
+
+
+def register_invalidation_hooks():
+    """Invalidate a profile's compiled rules whenever a commit changes them"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session
+    from app.models.auto_reply import AutoReply, OutOfOfficeReply
+    from app.models.profile import Profile
+
+    def mark(session, profile_id):
+        if profile_id is not None:
+            session.info.setdefault('reply_rules_changed', set()).add(profile_id)
+
+    def rule_changed(mapper, connection, target):
+        mark(inspect(target).session, target.profile_id)
+
+    def profile_changed(mapper, connection, target):
+        state = inspect(target)
+        if state.attrs.business_hours.history.has_changes() or state.attrs.timezone.history.has_changes():
+            mark(state.session, target.id)
+
+    for model in (AutoReply, OutOfOfficeReply):
+        for event_name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, event_name, rule_changed)
+    event.listen(Profile, 'after_update', profile_changed)
+
+    @event.listens_for(Session, 'after_commit')
+    def after_commit(session):
+        changed = session.info.pop('reply_rules_changed', None)
+        if changed and has_app_context():
+            invalidate_reply_rules(changed)
+
+    @event.listens_for(Session, 'after_rollback')
+    def after_rollback(session):
+        session.info.pop('reply_rules_changed', None)
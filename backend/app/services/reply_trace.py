@@ -0,0 +1,195 @@
+# app/services/reply_trace.py
+"""
+Per-stage timing of the reply pipeline.
+
+handle_incoming_message runs inside a ReplyTrace. Code along the way wraps
+its work in stage('<name>') spans (rules, prompt, llm, twilio_send, emit),
+every SQL statement executed meanwhile is added to the 'db' stage, and the
+webhook's enqueue timestamp gives 'queue_wait'. When the message is done each
+stage's total goes into the reply_stage_seconds histogram, alongside the
+end-to-end reply_total_seconds and Ollama's token counts and durations.
+
+A stage() outside any trace (the webhook itself, outbound sends on the
+'outbound' queue, dashboard emits) is observed on its own.
+
+With REPLY_TIMINGS_PERSIST, a reply's timings are also stored as JSON on the
+reply message (only for replies slower than REPLY_TIMINGS_SLOW_SECONDS when
+that is set) for looking into slow replies after the fact.
+"""
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+from flask import current_app
+from app.extensions import db
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Ollama reports durations in nanoseconds
+NANOSECONDS = 1e9
+
+_local = threading.local()
+_db_timing_registered = False
+
+
+class Span:
+    """Elapsed time of one stage() block, set when the block exits"""
+
+    __slots__ = ('stage', 'seconds')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.seconds = None
+
+
+class ReplyTrace:
+    """Stage timings for one inbound message"""
+
+    def __init__(self, received_at=None, enqueued_at=None):
+        self.received_at = received_at
+        self.started_at = time.time()
+        self.stages = {}
+        self.llm = {}
+        self.outcome = None
+        if enqueued_at:
+            self.add('queue_wait', max(0.0, self.started_at - enqueued_at))
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def total(self):
+        """Seconds since webhook receipt (or since the trace started)"""
+        return time.time() - (self.received_at or self.started_at)
+
+    def as_dict(self):
+        return {
+            'outcome': self.outcome,
+            'total': round(self.total, 4),
+            'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+            'llm': self.llm,
+        }
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def start_trace(received_at=None, enqueued_at=None):
+    """Make a new ReplyTrace current for the block"""
+    previous = current_trace()
+    trace = _local.trace = ReplyTrace(received_at, enqueued_at)
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a pipeline stage of the current trace (or on its own)"""
+    span = Span(name)
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.seconds = time.perf_counter() - started
+        trace = current_trace()
+        if trace is not None:
+            trace.add(name, span.seconds)
+        else:
+            metrics.observe('reply_stage_seconds', span.seconds, stage=name)
+
+
+def record_llm_stats(result, model):
+    """
+    Record Ollama's token counts and durations from a /api/generate or
+    /api/chat response (the final chunk when streaming).
+    """
+    stats = {}
+    for field, metric, scale in (
+        ('prompt_eval_count', 'llm_prompt_tokens', 1),
+        ('eval_count', 'llm_completion_tokens', 1),
+        ('prompt_eval_duration', 'llm_prompt_eval_seconds', NANOSECONDS),
+        ('eval_duration', 'llm_eval_seconds', NANOSECONDS),
+        ('load_duration', 'llm_load_seconds', NANOSECONDS),
+    ):
+        value = (result or {}).get(field)
+        if isinstance(value, (int, float)):
+            value = value / scale
+            stats[field] = value if scale == 1 else round(value, 4)
+            metrics.observe(metric, value, model=model)
+
+    trace = current_trace()
+    if trace is not None:
+        trace.llm.update(stats)
+    return stats
+
+
+def finish_trace(trace, reply=None):
+    """Observe a finished trace's stage totals and, if configured, store them on the reply"""
+    outcome = trace.outcome or 'none'
+    for stage_name, seconds in trace.stages.items():
+        metrics.observe('reply_stage_seconds', seconds, stage=stage_name)
+    metrics.observe('reply_total_seconds', trace.total, outcome=outcome)
+    metrics.inc('replies_total', outcome=outcome)
+
+    timings = trace.as_dict()
+    if trace.total >= current_app.config.get('REPLY_SLOW_LOG_SECONDS', 10.0):
+        logger.warning(f"Slow reply: {timings}")
+
+    if reply is None or not current_app.config.get('REPLY_TIMINGS_PERSIST', False):
+        return
+    if trace.total < current_app.config.get('REPLY_TIMINGS_SLOW_SECONDS', 0.0):
+        return
+
+    try:
+        reply.timings = json.dumps(timings)
+        db.session.commit()
+    except Exception as e:
+        logger.warning(f"Failed to store timings for message {reply.id}: {str(e)}")
+
+
+def add_stored_timing(message, stage_name, seconds):
+    """Add a later stage (e.g. the Twilio send) to a reply's stored timings, if it has any"""
+    if not message.timings:
+        return
+    try:
+        timings = json.loads(message.timings)
+    except ValueError:
+        return
+    timings.setdefault('stages', {})[stage_name] = round(seconds, 4)
+    message.timings = json.dumps(timings)
+
+
+def register_db_timing():
+    """Add the time of every SQL statement run inside a trace to its 'db' stage"""
+    global _db_timing_registered
+    if _db_timing_registered:
+        return
+    _db_timing_registered = True
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_trace() is not None:
+            conn.info.setdefault('trace_query_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace()
+        started = conn.info.get('trace_query_started')
+        if trace is not None and started:
+            trace.add('db', time.perf_counter() - started.pop())
+
+    @event.listens_for(Engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('trace_query_started') if context.connection is not None else None
+        if started:
+            started.pop()
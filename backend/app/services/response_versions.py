@@ -0,0 +1,250 @@
+# app/services/response_versions.py
+"""
+Version counters and ETags for polled dashboard endpoints.
+
+A cacheable response depends on a few scopes:
+
+    profiles:<user_id>    the user's profile list
+    billing:<user_id>     the user's subscription and usage
+    plans                 subscription plans
+    profile:<profile_id>  a profile's messages and conversations (including
+                          the client names shown in them)
+
+Each scope has a counter in Redis. Writes to the models in a scope are
+collected when the session flushes and the counters are INCRed once the
+transaction commits, so a version never runs ahead of the data it stands
+for. Bulk SQL updates call bump_versions() themselves.
+
+@conditional derives a response's ETag from its scopes' counters (one MGET),
+the user and the URL. A request whose If-None-Match matches gets a 304
+without the view running; otherwise the view runs and its 200 carries the
+ETag. Without Redis other processes' writes can't be seen, so responses are
+sent as usual with no ETag.
+
+With read replicas, a bump also marks its scopes as recently changed for as
+long as a replica within the lag limit might not have the write yet. A 200
+for a recently changed scope reads from the primary, so its ETag is never
+attached to a body older than the versions it was made from.
+"""
+import hashlib
+import logging
+import secrets
+from functools import wraps
+
+from flask import current_app, g, request, make_response, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.extensions import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'version:'
+
+# Changes whenever Redis loses the counters, so restarted counts can't repeat old ETags
+EPOCH_KEY = 'version:epoch'
+
+# Suffix of the short-lived key set while a scope's last write may be missing on a replica
+CHANGED_SUFFIX = ':changed'
+
+# Model class name -> scopes a write to an instance changes
+MODEL_SCOPES = {
+    'Message': lambda message: [f"profile:{message.profile_id}"],
+    'FlaggedMessage': lambda flag: [f"profile:{flag.message.profile_id}"] if flag.message is not None else [],
+    'Profile': lambda profile: [f"profile:{profile.id}", f"profiles:{profile.user_id}"],
+    'Client': lambda client: _client_scopes(client),
+    'Subscription': lambda subscription: [f"billing:{subscription.user_id}"],
+    'UsageRecord': lambda record: [f"billing:{record.user_id}"],
+    'SubscriptionPlan': lambda plan: ['plans'],
+}
+
+_events_registered = False
+
+
+def get_versions(scopes, app=None):
+    """
+    Current versions of the scopes, prefixed by the counters' epoch.
+
+    Returns:
+        list: Version strings, or None when there is no shared store
+    """
+    app = app or current_app._get_current_object()
+    redis_conn = get_redis(app)
+    if redis_conn is None:
+        return None
+
+    try:
+        epoch, *versions = redis_conn.mget([EPOCH_KEY] + [f"{KEY_PREFIX}{scope}" for scope in scopes])
+        if epoch is None:
+            redis_conn.set(EPOCH_KEY, secrets.token_hex(8), nx=True)
+            epoch = redis_conn.get(EPOCH_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to read response versions: {str(e)}")
+        return None
+
+    return [_text(epoch)] + [_text(version) if version is not None else '0' for version in versions]
+
+
+def bump_versions(scopes, app=None):
+    """Mark responses that depend on any of the scopes as changed"""
+    scopes = set(scopes)
+    if not scopes:
+        return
+
+    app = app or current_app._get_current_object()
+    redis_conn = get_redis(app)
+    if redis_conn is None:
+        return
+
+    window = _replica_window(app)
+    try:
+        pipeline = redis_conn.pipeline(transaction=False)
+        for scope in sorted(scopes):
+            pipeline.incr(f"{KEY_PREFIX}{scope}")
+            if window > 0:
+                pipeline.set(f"{KEY_PREFIX}{scope}{CHANGED_SUFFIX}", 1, px=int(window * 1000))
+        pipeline.execute()
+    except Exception as e:
+        logger.warning(f"Failed to bump response versions {sorted(scopes)}: {str(e)}")
+
+
+def recently_changed(scopes, app=None):
+    """True if any of the scopes was bumped recently enough that a replica may not have the write"""
+    app = app or current_app._get_current_object()
+    redis_conn = get_redis(app)
+    if redis_conn is None or _replica_window(app) <= 0:
+        return False
+
+    try:
+        return bool(redis_conn.exists(*[f"{KEY_PREFIX}{scope}{CHANGED_SUFFIX}" for scope in scopes]))
+    except Exception as e:
+        logger.warning(f"Failed to check recent changes to {sorted(scopes)}: {str(e)}")
+        return True
+
+
+def _replica_window(app):
+    # A replica that was within the lag limit at its last check has every write older than this
+    from app.utils.db_routing import get_replica_router
+
+    router = get_replica_router(app)
+    if router is None or not router.replicas:
+        return 0
+    return router.max_lag + router.check_interval
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def make_etag(user_id, versions):
+    """ETag for this request's URL as seen by user_id at the given versions"""
+    source = '|'.join([str(user_id), request.full_path] + versions)
+    return hashlib.sha1(source.encode()).hexdigest()[:32]
+
+
+def conditional(scopes):
+    """
+    Answer a GET with a 304 when nothing it depends on has changed.
+
+    Apply below @jwt_required and above @read_replica. scopes is called with
+    the user id and the view's arguments and returns the scope names the
+    response depends on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask_jwt_extended import get_jwt_identity
+            from app.services.metrics import inc
+
+            user_id = get_jwt_identity()
+            names = scopes(user_id, **kwargs)
+            versions = get_versions(names)
+            if versions is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(user_id, versions)
+            if etag in request.if_none_match:
+                inc('conditional_get_total', result='not_modified')
+                response = make_response('', 304)
+            else:
+                inc('conditional_get_total', result='modified')
+                if recently_changed(names):
+                    # A replica may not have the write these versions include yet
+                    g.db_read_primary = True
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _client_scopes(client):
+    """
+    A client's name shows in the conversations of every profile it has texted,
+    so a name change (or a named client appearing or going) changes those.
+    Clients created unnamed, e.g. on a first inbound text, change nothing.
+    """
+    from sqlalchemy import inspect, select
+    from sqlalchemy.orm import object_session
+    from app.models.message import Message
+
+    session = object_session(client)
+    state = inspect(client)
+    name = state.attrs.name.history
+    number = state.attrs.phone_number.history
+    if client in session.deleted:
+        changed = client.name is not None
+    else:
+        changed = (any(value is not None for value in list(name.added) + list(name.deleted))
+                   or (bool(number.deleted) and client.name is not None))
+    if not changed:
+        return []
+
+    numbers = {client.phone_number, *[value for value in number.deleted if value]}
+    # On the flush's own connection: querying through the session would autoflush mid-flush
+    profile_ids = session.connection().execute(
+        select(Message.profile_id).where(Message.sender_number.in_(numbers)).distinct()
+    ).scalars()
+    return [f"profile:{profile_id}" for profile_id in profile_ids]
+
+
+def _scopes_for(obj):
+    scopes_of = MODEL_SCOPES.get(type(obj).__name__)
+    if scopes_of is None:
+        return []
+    try:
+        return scopes_of(obj)
+    except Exception as e:
+        logger.debug(f"No response scopes for {type(obj).__name__}: {str(e)}")
+        return []
+
+
+def _after_flush(session, flush_context):
+    changed = session.info.setdefault('changed_scopes', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        changed.update(_scopes_for(obj))
+
+
+def _after_commit(session):
+    changed = session.info.pop('changed_scopes', None)
+    if changed and has_app_context():
+        bump_versions(changed)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop('changed_scopes', None)
+
+
+def register_version_hooks():
+    """Bump the versions of the scopes every committed ORM write touches"""
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
@@ -0,0 +1,369 @@
+# app/services/stripe_events.py
+"""
+Stripe event store and processing.
+
+The webhook only verifies an event and records it: one INSERT ... ON
+CONFLICT DO NOTHING keyed on the event id, so a redelivered event is stored
+once, then a 200. Processing happens in a queue task partitioned by the
+event's ordering key (the subscription, customer or price it is about),
+which applies that key's pending events oldest first, one transaction per
+event, so the handler's writes and the event's status commit together and a
+retry never applies an event twice.
+
+A failing event stays pending and blocks the events after it for the same
+key until it succeeds, the queue retries are spent or STRIPE_EVENT_MAX_ATTEMPTS
+is reached, when it is marked failed and skipped. Without a task queue the
+events are processed inline after the webhook records them.
+
+Subscription, customer and price events update the local Stripe mirror
+(see stripe_mirror). Invoices are upserted on stripe_invoice_id in chunks of
+STRIPE_BACKFILL_CHUNK_SIZE. An invoice event for a subscription that isn't
+known here yet fails and is retried like any other error, while a backfill
+counts such invoices as skipped. An update never moves an invoice back to an
+earlier status (a late invoice.finalized after invoice.paid is a no-op),
+which also makes replays and backfills safe to repeat.
+"""
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import case, func
+from app.extensions import db
+from app.services.queue_service import register_task
+from app.services.stripe_mirror import mirror
+from app.utils.bulk_input import insert_on_conflict
+
+logger = logging.getLogger(__name__)
+
+# Later statuses win over earlier ones when an invoice is upserted
+INVOICE_STATUS_RANK = {'draft': 0, 'open': 1, 'uncollectible': 2, 'paid': 3, 'void': 3}
+
+# Invoice columns an upsert refreshes on an existing row
+INVOICE_UPDATE_COLUMNS = (
+    'subscription_id', 'invoice_number', 'amount_due', 'amount_paid', 'currency', 'tax_amount', 'status',
+    'billing_reason', 'period_start', 'period_end', 'due_date', 'paid_at', 'voided_at', 'description',
+    'invoice_pdf_url', 'hosted_invoice_url',
+)
+
+
+def ordering_key(event):
+    """Events with the same key are applied in the order Stripe created them"""
+    obj = event['data']['object']
+    if obj.get('object') in ('subscription', 'customer', 'price'):
+        return obj['id']
+    return obj.get('subscription') or obj.get('customer') or event['id']
+
+
+def record_event(event, payload=None):
+    """
+    Store a verified Stripe event unless it was already received.
+
+    Args:
+        event: Event as returned by stripe.Webhook.construct_event (or a dict)
+        payload: Raw JSON body; serialized from event if not given
+
+    Returns:
+        tuple: (StripeEvent, is_new)
+    """
+    from app.models.stripe_event import StripeEvent
+
+    if payload is None:
+        payload = json.dumps(event)
+    elif isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+
+    statement = insert_on_conflict(StripeEvent.__table__).values(
+        id=event['id'],
+        type=event['type'],
+        created=datetime.utcfromtimestamp(event['created']),
+        ordering_key=ordering_key(event),
+        payload=payload,
+        status='pending',
+        attempts=0,
+        received_at=datetime.utcnow(),
+    ).on_conflict_do_nothing(index_elements=['id'])
+    is_new = db.session.execute(statement).rowcount == 1
+    db.session.commit()
+
+    return db.session.get(StripeEvent, event['id']), is_new
+
+
+def dispatch(key, task_queue=None):
+    """Queue processing of an ordering key's pending events, or process them now without a queue"""
+    if task_queue is None:
+        try:
+            process_stripe_events(key)
+        except Exception as e:
+            # Left pending for the next event on the key or process_pending()
+            logger.warning(f"Stripe events for {key} left pending: {str(e)}")
+    else:
+        task_queue.enqueue(process_stripe_events, key, partition_key=f"stripe:{key}")
+
+
+@register_task
+def process_stripe_events(key):
+    """
+    Queue task: apply the key's pending events, oldest first.
+
+    Raises if an event failed but can still be retried, so the queue retries
+    the task and the events after it wait.
+    """
+    from flask import current_app
+    from app.models.stripe_event import StripeEvent
+
+    max_attempts = current_app.config.get('STRIPE_EVENT_MAX_ATTEMPTS', 5)
+    processed = 0
+
+    while True:
+        stripe_event = StripeEvent.query.filter_by(ordering_key=key, status='pending').order_by(
+            StripeEvent.created, StripeEvent.received_at, StripeEvent.id
+        ).with_for_update().first()
+        if stripe_event is None:
+            break
+
+        error = apply_event(stripe_event, max_attempts)
+        if error is not None:
+            raise RuntimeError(f"Stripe event {stripe_event.id} ({stripe_event.type}) failed: {error}")
+        processed += 1
+
+    return processed
+
+
+def apply_event(stripe_event, max_attempts=5):
+    """
+    Run the event's handler and record its outcome in the same transaction.
+
+    Returns:
+        str: Error if the event is still pending and should be retried, else None
+    """
+    from app.models.stripe_event import StripeEvent
+    from app.services.metrics import inc
+
+    event_id = stripe_event.id
+    handler = HANDLERS.get(stripe_event.type)
+    try:
+        if handler is not None:
+            handler(stripe_event.get_object(), stripe_event.created)
+        stripe_event.status = 'processed' if handler is not None else 'ignored'
+        stripe_event.processed_at = datetime.utcnow()
+        db.session.commit()
+        inc('stripe_events_total', outcome=stripe_event.status)
+        return None
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Error processing Stripe event {event_id}: {str(e)}")
+        error = str(e)
+
+    stripe_event = db.session.get(StripeEvent, event_id)
+    stripe_event.attempts += 1
+    stripe_event.last_error = error
+    if stripe_event.attempts >= max_attempts:
+        stripe_event.status = 'failed'
+        logger.error(f"Giving up on Stripe event {event_id} after {stripe_event.attempts} attempts")
+    db.session.commit()
+    inc('stripe_events_total', outcome='failed' if stripe_event.status == 'failed' else 'retried')
+
+    return None if stripe_event.status == 'failed' else error
+
+
+def replay_events(events, task_queue=None):
+    """
+    Record events (e.g. from stripe.Event.list) and process every key they touch.
+
+    Returns:
+        dict: Counts of recorded and already known events and keys processed
+    """
+    summary = {'recorded': 0, 'duplicates': 0, 'keys': 0}
+    keys = {}
+    for event in events:
+        stripe_event, is_new = record_event(event)
+        summary['recorded' if is_new else 'duplicates'] += 1
+        keys[stripe_event.ordering_key] = True
+
+    for key in keys:
+        dispatch(key, task_queue)
+    summary['keys'] = len(keys)
+    return summary
+
+
+def process_pending(task_queue=None):
+    """Dispatch every key with pending events, e.g. after a worker outage"""
+    from app.models.stripe_event import StripeEvent
+
+    keys = [key for key, in db.session.query(StripeEvent.ordering_key).filter_by(status='pending').distinct()]
+    for key in keys:
+        dispatch(key, task_queue)
+    return len(keys)
+
+
+def backfill_invoices(invoices, config):
+    """
+    Upsert Stripe invoice objects in chunks.
+
+    Returns:
+        dict: Counts of invoices written and skipped (no matching subscription)
+    """
+    chunk_size = config.get('STRIPE_BACKFILL_CHUNK_SIZE', 500)
+    summary = {'upserted': 0, 'skipped': 0}
+
+    chunk = []
+    for invoice in invoices:
+        chunk.append(invoice)
+        if len(chunk) >= chunk_size:
+            _add_counts(summary, upsert_invoices(chunk))
+            db.session.commit()
+            chunk = []
+    if chunk:
+        _add_counts(summary, upsert_invoices(chunk))
+        db.session.commit()
+
+    return summary
+
+
+def _add_counts(summary, counts):
+    for key, value in counts.items():
+        summary[key] += value
+
+
+def upsert_invoices(invoices):
+    """
+    Insert or refresh Invoice rows from Stripe invoice objects (one statement, not committed).
+
+    Invoices whose subscription isn't known here are skipped.
+
+    Returns:
+        dict: Counts of invoices written and skipped
+    """
+    from app.models.billing import Invoice, Subscription
+
+    stripe_ids = {invoice.get('subscription') for invoice in invoices if invoice.get('subscription')}
+    subscription_ids = dict(
+        db.session.query(Subscription.stripe_subscription_id, Subscription.id).filter(
+            Subscription.stripe_subscription_id.in_(stripe_ids)
+        ).all()
+    ) if stripe_ids else {}
+
+    rows = {}
+    skipped = 0
+    for invoice in invoices:
+        subscription_id = subscription_ids.get(invoice.get('subscription'))
+        if subscription_id is None:
+            logger.warning(f"No subscription for Stripe invoice {invoice['id']} "
+                           f"(subscription {invoice.get('subscription')})")
+            skipped += 1
+            continue
+        # The last copy of an invoice in a chunk wins, as it would one statement at a time
+        rows[invoice['id']] = invoice_row(invoice, subscription_id)
+
+    if rows:
+        table = Invoice.__table__
+        statement = insert_on_conflict(table).values(list(rows.values()))
+        newer = _status_rank(statement.excluded.status) >= _status_rank(table.c.status)
+        updates = {
+            column: case((newer, statement.excluded[column]), else_=table.c[column])
+            for column in INVOICE_UPDATE_COLUMNS
+        }
+        updates['paid_at'] = func.coalesce(table.c.paid_at, statement.excluded.paid_at)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['stripe_invoice_id'], set_=updates))
+
+    return {'upserted': len(rows), 'skipped': skipped}
+
+
+def _status_rank(column):
+    return case(INVOICE_STATUS_RANK, value=column, else_=0)
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+
+def _amount(cents):
+    return Decimal(cents or 0) / 100
+
+
+def invoice_row(invoice, subscription_id):
+    """Invoice column values for a Stripe invoice object"""
+    transitions = invoice.get('status_transitions') or {}
+    return {
+        'subscription_id': subscription_id,
+        'stripe_invoice_id': invoice['id'],
+        'invoice_number': invoice.get('number') or invoice['id'],
+        'amount_due': _amount(invoice.get('amount_due')),
+        'amount_paid': _amount(invoice.get('amount_paid')),
+        'currency': (invoice.get('currency') or 'usd').upper(),
+        'tax_amount': _amount(invoice.get('tax')),
+        'status': invoice.get('status') or 'draft',
+        'billing_reason': invoice.get('billing_reason'),
+        'created_at': _timestamp(invoice.get('created')) or datetime.utcnow(),
+        'period_start': _timestamp(invoice.get('period_start')),
+        'period_end': _timestamp(invoice.get('period_end')),
+        'due_date': _timestamp(invoice.get('due_date')),
+        'paid_at': _timestamp(transitions.get('paid_at')),
+        'voided_at': _timestamp(transitions.get('voided_at')),
+        'description': invoice.get('description'),
+        'invoice_pdf_url': invoice.get('invoice_pdf'),
+        'hosted_invoice_url': invoice.get('hosted_invoice_url'),
+    }
+
+
+def _subscription_for(stripe_subscription_id):
+    from app.models.billing import Subscription
+
+    if not stripe_subscription_id:
+        return None
+    return Subscription.query.filter_by(stripe_subscription_id=stripe_subscription_id).first()
+
+
+def _upsert_event_invoice(invoice):
+    """Upsert one event's invoice, failing the event if its subscription isn't known here yet"""
+    if upsert_invoices([invoice])['skipped'] and invoice.get('subscription'):
+        raise RuntimeError(f"Subscription {invoice['subscription']} of invoice {invoice['id']} is not known yet")
+
+
+def handle_invoice(invoice, as_of):
+    _upsert_event_invoice(invoice)
+
+
+def handle_invoice_payment_succeeded(invoice, as_of):
+    _upsert_event_invoice(invoice)
+    subscription = _subscription_for(invoice.get('subscription'))
+    if subscription is not None:
+        subscription.payment_status = 'active'
+
+
+def handle_invoice_payment_failed(invoice, as_of):
+    _upsert_event_invoice(invoice)
+    subscription = _subscription_for(invoice.get('subscription'))
+    if subscription is not None:
+        subscription.payment_status = 'failed'
+
+
+def handle_mirrored(obj, as_of):
+    mirror(obj, as_of)
+
+
+def handle_mirrored_deleted(obj, as_of):
+    mirror(obj, as_of, deleted=True)
+
+
+# Event type -> handler of its data.object and the event's time; handlers write but don't commit
+HANDLERS = {
+    'invoice.created': handle_invoice,
+    'invoice.finalized': handle_invoice,
+    'invoice.updated': handle_invoice,
+    'invoice.paid': handle_invoice_payment_succeeded,
+    'invoice.payment_succeeded': handle_invoice_payment_succeeded,
+    'invoice.payment_failed': handle_invoice_payment_failed,
+    'invoice.voided': handle_invoice,
+    'invoice.marked_uncollectible': handle_invoice,
+    'customer.subscription.created': handle_mirrored,
+    'customer.subscription.updated': handle_mirrored,
+    'customer.subscription.deleted': handle_mirrored,
+    'customer.created': handle_mirrored,
+    'customer.updated': handle_mirrored,
+    'customer.deleted': handle_mirrored_deleted,
+    'price.created': handle_mirrored,
+    'price.updated': handle_mirrored,
+    'price.deleted': handle_mirrored_deleted,
+}
@@ -0,0 +1,223 @@
+# app/services/stripe_mirror.py
+"""
+Local mirror of Stripe prices, customers and subscriptions.
+
+Each object is stored whole in stripe_objects with the Stripe time of the
+state it holds (as_of): the event's created time for webhook updates, the
+fetch time for API reads. Upserts only replace a row with a state at least as
+new, so a late or replayed event can't roll the mirror back.
+
+Writing a subscription to the mirror also brings the local Subscription row
+up to date (status, plan, renewal and end dates), so billing read paths and
+the subscription item id needed for plan changes come from the database
+instead of a Stripe call per request.
+
+reconcile() lists every mirrored object type from the API in chunks of
+STRIPE_BACKFILL_CHUNK_SIZE, upserts them and marks objects Stripe no longer
+returns as deleted. It catches anything the webhooks missed and runs
+periodically from the scheduler or on demand from backfill_stripe.py.
+"""
+import json
+import logging
+from datetime import datetime
+
+from app.extensions import db
+from app.utils.bulk_input import insert_on_conflict
+from app.utils.lazy_import import lazy_import
+
+logger = logging.getLogger(__name__)
+
+stripe = lazy_import('stripe')
+
+MIRRORED_OBJECTS = ('price', 'customer', 'subscription')
+
+# Subscription statuses that end access
+INACTIVE_STATUSES = ('canceled', 'unpaid', 'incomplete_expired')
+
+
+def as_dict(obj):
+    """A Stripe API object (or a webhook payload dict) as plain dicts and lists"""
+    if hasattr(obj, 'to_dict_recursive'):
+        return obj.to_dict_recursive()
+    return obj
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+
+def upsert_objects(objects, as_of, deleted=False):
+    """
+    Write Stripe objects to the mirror unless it already holds a newer state (not committed).
+
+    Returns:
+        int: Number of objects given
+    """
+    from app.models.stripe_mirror import StripeObject
+
+    rows = {}
+    for obj in objects:
+        obj = as_dict(obj)
+        rows[obj['id']] = {
+            'id': obj['id'],
+            'object': obj['object'],
+            'customer_id': obj['id'] if obj['object'] == 'customer' else obj.get('customer'),
+            'data': json.dumps(obj),
+            'deleted': deleted,
+            'as_of': as_of,
+            'synced_at': datetime.utcnow(),
+        }
+    if not rows:
+        return 0
+
+    table = StripeObject.__table__
+    statement = insert_on_conflict(table).values(list(rows.values()))
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['id'],
+        set_={column: statement.excluded[column]
+              for column in ('customer_id', 'data', 'deleted', 'as_of', 'synced_at')},
+        where=statement.excluded.as_of >= table.c.as_of,
+    ))
+    return len(rows)
+
+
+def mirror(obj, as_of=None, deleted=False):
+    """Write one object to the mirror and sync what depends on it (not committed)"""
+    obj = as_dict(obj)
+    upsert_objects([obj], as_of or datetime.utcnow(), deleted=deleted)
+    if obj['object'] == 'subscription':
+        sync_subscriptions([obj['id']])
+    elif obj['object'] == 'customer' and deleted:
+        from app.models.user import User
+        User.query.filter_by(stripe_customer_id=obj['id']).update({'stripe_customer_id': None},
+                                                                   synchronize_session=False)
+    return obj
+
+
+def get_mirrored(stripe_id):
+    """
+    Returns:
+        dict: The mirrored object, or None if it isn't mirrored or was deleted
+    """
+    from app.models.stripe_mirror import StripeObject
+
+    row = db.session.get(StripeObject, stripe_id) if stripe_id else None
+    if row is None or row.deleted:
+        return None
+    return row.get_data()
+
+
+def subscription_items(subscription):
+    items = subscription.get('items') or {}
+    return items.get('data') or []
+
+
+def subscription_item_id(stripe_subscription_id):
+    """Id of a mirrored subscription's (first) item, or None if it isn't mirrored"""
+    subscription = get_mirrored(stripe_subscription_id)
+    items = subscription_items(subscription) if subscription else []
+    return items[0]['id'] if items else None
+
+
+def sync_subscriptions(stripe_ids):
+    """Bring local Subscription rows in line with their mirrored Stripe subscriptions (not committed)"""
+    from app.models.billing import Subscription, SubscriptionPlan
+    from app.models.stripe_mirror import StripeObject
+
+    mirrored = {row.id: row.get_data() for row in StripeObject.query.filter(StripeObject.id.in_(stripe_ids))}
+    if not mirrored:
+        return 0
+
+    price_ids = {items[0]['price']['id'] for items in map(subscription_items, mirrored.values()) if items}
+    plans = dict(
+        db.session.query(SubscriptionPlan.stripe_price_id, SubscriptionPlan.id).filter(
+            SubscriptionPlan.stripe_price_id.in_(price_ids)
+        ).all()
+    ) if price_ids else {}
+
+    synced = 0
+    for subscription in Subscription.query.filter(Subscription.stripe_subscription_id.in_(mirrored)):
+        apply_subscription(subscription, mirrored[subscription.stripe_subscription_id], plans)
+        synced += 1
+    return synced
+
+
+def apply_subscription(subscription, data, plans):
+    """Copy a Stripe subscription's state onto a local Subscription"""
+    items = subscription_items(data)
+    subscription.payment_status = data['status']
+    subscription.is_active = data['status'] not in INACTIVE_STATUSES
+    subscription.auto_renew = not data.get('cancel_at_period_end')
+
+    period_end = data.get('current_period_end') or (items[0].get('current_period_end') if items else None)
+    if period_end:
+        subscription.renewal_date = _timestamp(period_end)
+
+    if not subscription.is_active:
+        subscription.end_date = _timestamp(data.get('ended_at')) or subscription.end_date or datetime.utcnow()
+    elif data.get('cancel_at_period_end'):
+        subscription.end_date = _timestamp(data.get('cancel_at')) or subscription.renewal_date
+    else:
+        subscription.end_date = None
+
+    plan_id = plans.get(items[0]['price']['id']) if items else None
+    if plan_id is not None:
+        subscription.plan_id = plan_id
+
+
+def _list(object_type):
+    if object_type == 'price':
+        return stripe.Price.list(limit=100)
+    if object_type == 'customer':
+        return stripe.Customer.list(limit=100)
+    return stripe.Subscription.list(status='all', limit=100)
+
+
+def reconcile(config, object_types=MIRRORED_OBJECTS):
+    """
+    Refresh the mirror from the Stripe API.
+
+    Returns:
+        dict: Per object type, how many were listed and how many marked deleted
+    """
+    from app.models.stripe_mirror import StripeObject
+    from app.services.billing_service import initialize_stripe
+
+    initialize_stripe()
+    chunk_size = config.get('STRIPE_BACKFILL_CHUNK_SIZE', 500)
+    summary = {}
+
+    for object_type in object_types:
+        started = datetime.utcnow()
+        listed = 0
+        chunk = []
+        for obj in _list(object_type).auto_paging_iter():
+            chunk.append(as_dict(obj))
+            if len(chunk) >= chunk_size:
+                listed += _write_chunk(chunk, started)
+                chunk = []
+        if chunk:
+            listed += _write_chunk(chunk, started)
+
+        # Not listed and not updated by a webhook since the listing started
+        gone = StripeObject.query.filter(
+            StripeObject.object == object_type,
+            StripeObject.deleted.is_(False),
+            StripeObject.synced_at < started
+        ).update({'deleted': True}, synchronize_session=False)
+        db.session.commit()
+
+        summary[object_type] = {'listed': listed, 'deleted': gone}
+        logger.info(f"Reconciled Stripe {object_type} mirror: {listed} listed, {gone} marked deleted")
+
+    return summary
+
+
+def _write_chunk(objects, as_of):
+    count = upsert_objects(objects, as_of)
+    subscription_ids = [obj['id'] for obj in objects if obj['object'] == 'subscription']
+    if subscription_ids:
+        sync_subscriptions(subscription_ids)
+    db.session.commit()
+    return count
+
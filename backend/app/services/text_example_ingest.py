@@ -0,0 +1,212 @@
+# app/services/text_example_ingest.py
+"""
+Bulk text example ingestion.
+
+Examples are streamed in chunks of TEXT_EXAMPLES_CHUNK_SIZE and written with
+one multi-row INSERT ... ON CONFLICT DO NOTHING per chunk, keyed on the
+SHA-256 of the trimmed content, so an example a profile already has (or
+that appears twice in one upload) is stored once. Examples over
+TEXT_EXAMPLE_MAX_LENGTH characters and anything past the profile's
+TEXT_EXAMPLES_MAX_PER_PROFILE are skipped and counted. Nothing is loaded
+back through the ORM; the result is counts plus the first new ids.
+
+Uploads with more than TEXT_EXAMPLES_INLINE_LIMIT examples are staged in
+Redis and ingested by a queue worker, with progress available as a job.
+"""
+import hashlib
+import logging
+from datetime import datetime
+
+from sqlalchemy import func
+from app.extensions import db
+from app.services.queue_service import register_task
+from app.utils.bulk_input import insert_on_conflict
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = 'text_example_ingest'
+
+TRUE_VALUES = ('true', '1', 'yes', 'y', 't')
+
+
+def content_hash(content):
+    """Deduplication key of an example's content"""
+    return hashlib.sha256(content.strip().encode('utf-8')).hexdigest()
+
+
+def examples_changed(profile_id):
+    """Have this process's example index (if built) pick up a profile's changes on next use"""
+    from flask import current_app
+
+    example_index = current_app.extensions.get('example_index')
+    if example_index is not None:
+        example_index.invalidate(profile_id)
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+class TextExampleIngester:
+    """Writes a profile's text examples in deduplicated chunks"""
+
+    def __init__(self, profile_id, chunk_size=1000, max_length=1600, max_per_profile=20000, max_ids=1000):
+        self.profile_id = profile_id
+        self.chunk_size = chunk_size
+        self.max_length = max_length
+        self.max_ids = max_ids
+        self._seen = set()
+        self._remaining = max_per_profile - self._existing_count()
+        self.summary = {
+            'received': 0,
+            'inserted': 0,
+            'duplicates': 0,
+            'too_long': 0,
+            'invalid': 0,
+            'over_limit': 0,
+            'ids': [],
+            'ids_truncated': False,
+        }
+
+    def _existing_count(self):
+        from app.models.text_example import TextExample
+        return db.session.query(func.count(TextExample.id)).filter_by(profile_id=self.profile_id).scalar() or 0
+
+    def run(self, rows):
+        """
+        Ingest every row ({'content', 'is_incoming'} dicts or plain strings).
+
+        Returns:
+            dict: Counts and the first new ids
+        """
+        chunk = []
+        for row in rows:
+            self.summary['received'] += 1
+            value = self._prepare(row)
+            if value is None:
+                continue
+
+            chunk.append(value)
+            if len(chunk) >= self.chunk_size:
+                self._insert(chunk)
+                chunk = []
+
+        if chunk:
+            self._insert(chunk)
+
+        if self.summary['inserted']:
+            examples_changed(self.profile_id)
+        return self.summary
+
+    def _prepare(self, row):
+        if isinstance(row, str):
+            row = {'content': row}
+        content = row.get('content') if isinstance(row, dict) else None
+        if not isinstance(content, str) or not content.strip():
+            self.summary['invalid'] += 1
+            return None
+
+        content = content.strip()
+        if len(content) > self.max_length:
+            self.summary['too_long'] += 1
+            return None
+
+        digest = content_hash(content)
+        if digest in self._seen:
+            self.summary['duplicates'] += 1
+            return None
+        self._seen.add(digest)
+
+        return {
+            'profile_id': self.profile_id,
+            'content': content,
+            'content_hash': digest,
+            'is_incoming': _flag(row.get('is_incoming')),
+            'timestamp': datetime.utcnow(),
+        }
+
+    def _insert(self, values):
+        from app.models.text_example import TextExample
+
+        if self._remaining <= 0:
+            self.summary['over_limit'] += len(values)
+            return
+        if len(values) > self._remaining:
+            self.summary['over_limit'] += len(values) - self._remaining
+            values = values[:self._remaining]
+
+        table = TextExample.__table__
+        statement = insert_on_conflict(table).values(values).on_conflict_do_nothing(
+            index_elements=['profile_id', 'content_hash']
+        ).returning(table.c.id)
+
+        try:
+            ids = [row[0] for row in db.session.execute(statement)]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._remaining -= len(ids)
+        self.summary['inserted'] += len(ids)
+        self.summary['duplicates'] += len(values) - len(ids)
+
+        room = self.max_ids - len(self.summary['ids'])
+        self.summary['ids'].extend(ids[:room])
+        if len(ids) > room:
+            self.summary['ids_truncated'] = True
+
+
+def ingest_text_examples(profile_id, rows, config):
+    """Ingest rows for a profile with the limits from `config` (an app config mapping)"""
+    ingester = TextExampleIngester(
+        profile_id,
+        chunk_size=config.get('TEXT_EXAMPLES_CHUNK_SIZE', 1000),
+        max_length=config.get('TEXT_EXAMPLE_MAX_LENGTH', 1600),
+        max_per_profile=config.get('TEXT_EXAMPLES_MAX_PER_PROFILE', 20000),
+    )
+    return ingester.run(rows)
+
+
+def start_ingest_job(job_store, task_queue, profile_id, user_id, rows):
+    """
+    Stage rows in Redis and queue their ingestion.
+
+    Returns:
+        str: Job id
+    """
+    job_id = job_store.create(JOB_KIND, user_id=user_id)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= 1000:
+            job_store.push_input(job_id, batch)
+            batch = []
+    if batch:
+        job_store.push_input(job_id, batch)
+
+    task_queue.enqueue(ingest_text_examples_job, job_id, profile_id, partition_key=f"text_examples:{profile_id}")
+    return job_id
+
+
+@register_task
+def ingest_text_examples_job(job_id, profile_id):
+    """Queue task: ingest a staged upload and record the outcome on the job"""
+    from flask import current_app
+    from app.services.background_jobs import get_job_store
+
+    job_store = get_job_store()
+    job_store.update(job_id, state='running')
+    try:
+        summary = ingest_text_examples(profile_id, job_store.iter_input(job_id), current_app.config)
+    except Exception as e:
+        logger.exception(f"Text example ingestion job {job_id} failed: {str(e)}")
+        job_store.update(job_id, state='failed', error=str(e))
+        raise
+
+    job_store.update(job_id, state='completed', result=summary)
+    job_store.delete_input(job_id)
+    logger.info(f"Ingested {summary['inserted']} text examples for profile {profile_id} (job {job_id})")
@@ -0,0 +1,177 @@
+# app/services/token_revocation.py
+"""
+Per-process JWT revocation filter.
+
+Each process keeps the revoked JTIs that haven't expired yet in memory,
+bootstrapped from the revoked_tokens table and kept current through a Redis
+pub/sub channel that every revocation is published on. While the
+subscription is live, token checks are answered from memory with no network
+round trip; if it drops (or Redis isn't configured) checks fall back to the
+authoritative stores until it is re-established. Entries are dropped as
+their tokens expire.
+"""
+import time
+import calendar
+import threading
+import logging
+from datetime import datetime
+
+from flask import current_app
+from app.extensions import db, socketio, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'revoked_tokens'
+REDIS_KEY = 'revoked_token:{}'
+
+# Seconds between sweeps of expired entries
+PRUNE_INTERVAL = 60
+
+
+class RevocationFilter:
+    """
+    In-memory set of revoked JTIs with expiries.
+
+    lookup is the authoritative check (jti -> bool), used whenever the filter
+    can't vouch for being current (healthy is False).
+    """
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.healthy = False
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pruned_at = time.time()
+
+    def add(self, jti, expires_at):
+        """Record a revoked JTI until expires_at (epoch seconds)"""
+        with self._lock:
+            self._entries[jti] = max(expires_at, self._entries.get(jti, 0))
+
+    def load(self, entries):
+        """Bulk-add (jti, expires_at) pairs"""
+        with self._lock:
+            for jti, expires_at in entries:
+                self._entries[jti] = max(expires_at, self._entries.get(jti, 0))
+
+    def is_revoked(self, jti):
+        now = time.time()
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self.prune(now)
+
+        expires_at = self._entries.get(jti)
+        if expires_at is not None and expires_at > now:
+            return True
+        if self.healthy:
+            return False
+        return self.lookup(jti)
+
+    def prune(self, now=None):
+        """Drop entries whose tokens have expired"""
+        now = now or time.time()
+        with self._lock:
+            self._entries = {jti: exp for jti, exp in self._entries.items() if exp > now}
+            self._pruned_at = now
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _epoch(expires_at):
+    """Naive UTC datetime (or epoch number) to epoch seconds"""
+    if isinstance(expires_at, datetime):
+        return calendar.timegm(expires_at.utctimetuple())
+    return float(expires_at)
+
+
+def _authoritative_lookup(app):
+    def lookup(jti):
+        redis_conn = get_redis(app)
+        if redis_conn is not None and redis_conn.exists(REDIS_KEY.format(jti)):
+            return True
+
+        from app.models.revoked_token import RevokedToken
+        return RevokedToken.is_token_revoked(jti)
+    return lookup
+
+
+def _bootstrap(app, revocation_filter):
+    """Load every unexpired revocation from the database"""
+    from app.models.revoked_token import RevokedToken
+
+    with app.app_context():
+        rows = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.expires_at > datetime.utcnow()
+        ).all()
+        db.session.remove()
+
+    revocation_filter.load((jti, _epoch(expires_at)) for jti, expires_at in rows)
+    logger.info(f"Loaded {len(rows)} revoked tokens into the revocation filter")
+
+
+def _listen(app, revocation_filter, redis_conn):
+    """Follow the revocation channel, re-bootstrapping after every (re)subscribe"""
+    while True:
+        pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CHANNEL)
+            # Subscribed first so nothing published during the bootstrap is missed
+            _bootstrap(app, revocation_filter)
+            revocation_filter.healthy = True
+
+            for message in pubsub.listen():
+                jti, expires_at = message['data'].decode().split(' ')
+                revocation_filter.add(jti, float(expires_at))
+        except Exception as e:
+            logger.warning(f"Revocation channel lost, checking revocations remotely: {str(e)}")
+        finally:
+            revocation_filter.healthy = False
+            pubsub.close()
+
+        time.sleep(1)
+
+
+def get_revocation_filter(app=None):
+    """Get this process's RevocationFilter, starting its subscription on first use"""
+    app = app or current_app._get_current_object()
+
+    if 'revocation_filter' not in app.extensions:
+        revocation_filter = RevocationFilter(_authoritative_lookup(app))
+        app.extensions['revocation_filter'] = revocation_filter
+
+        redis_conn = get_redis(app)
+        if redis_conn is not None:
+            socketio.start_background_task(_listen, app, revocation_filter, redis_conn)
+
+    return app.extensions['revocation_filter']
+
+
+def is_token_revoked(jti):
+    """Check a JTI against the local filter (remote stores only when it isn't current)"""
+    return get_revocation_filter().is_revoked(jti)
+
+
+def revoke_jti(jti, expires_at):
+    """
+    Revoke a token everywhere: the revoked_tokens table, the Redis key and
+    every process's filter.
+
+    Args:
+        jti: Token id
+        expires_at: Token expiry, as a naive UTC datetime or epoch seconds
+    """
+    from app.models.revoked_token import RevokedToken
+
+    expires_epoch = _epoch(expires_at)
+    get_revocation_filter().add(jti, expires_epoch)
+
+    if not RevokedToken.query.filter_by(jti=jti).first():
+        RevokedToken.revoke_token(jti, datetime.utcfromtimestamp(expires_epoch))
+
+    redis_conn = get_redis()
+    if redis_conn is not None:
+        ttl = max(1, int(expires_epoch - time.time()))
+        pipeline = redis_conn.pipeline(transaction=False)
+        pipeline.setex(REDIS_KEY.format(jti), ttl, 1)
+        pipeline.publish(CHANNEL, f"{jti} {expires_epoch}")
+        pipeline.execute()
@@ -1,27 +1,29 @@
 # app/services/twilio_service.py
 from flask import current_app
-from twilio.rest import Client
 from app.exceptions import TwilioAccountError, TwilioNumberError, TwilioBillingError
 from app.models.twilio_usage import TwilioUsage
 from app.extensions import db
+from app.utils.lazy_import import lazy_import
 import secrets
 import string
 
+twilio_rest = lazy_import('twilio.rest')
+
 class TwilioService:
     def __init__(self, user=None):
         """Initialize with master Twilio credentials or user credentials"""
         self.master_account_sid = current_app.config['TWILIO_ACCOUNT_SID']
         self.master_auth_token = current_app.config['TWILIO_AUTH_TOKEN']
-        self.master_client = Client(self.master_account_sid, self.master_auth_token)
+        self.master_client = twilio_rest.Client(self.master_account_sid, self.master_auth_token)
         
         self.user = user
         if user and user.twilio_account_sid:
             if user.twilio_account_type == 'subaccount' and user.twilio_auth_token:
                 # For subaccounts, we have the auth token
-                self.client = Client(user.twilio_account_sid, user.twilio_auth_token)
+                self.client = twilio_rest.Client(user.twilio_account_sid, user.twilio_auth_token)
             elif user.twilio_account_type == 'external' and user.twilio_api_key_sid and user.twilio_api_key_secret:
                 # For external accounts, we use API key
-                self.client = Client(user.twilio_api_key_sid, user.twilio_api_key_secret, 
+                self.client = twilio_rest.Client(user.twilio_api_key_sid, user.twilio_api_key_secret, 
                                     account_sid=user.twilio_account_sid)
             else:
                 # Fallback to master account if incomplete credentials
@@ -45,7 +47,7 @@ class TwilioService:
             user.twilio_parent_account = True
             
             # Create API Key for better security
-            subaccount_client = Client(subaccount.sid, subaccount.auth_token)
+            subaccount_client = twilio_rest.Client(subaccount.sid, subaccount.auth_token)
             api_key = subaccount_client.new_keys.create(friendly_name=f"API Key for {user.username}")
             
             # Store the API key credentials
@@ -71,7 +73,7 @@ class TwilioService:
         """Verify external Twilio account credentials and permissions"""
         try:
             # Try to connect with the provided credentials
-            test_client = Client(account_sid, auth_token)
+            test_client = twilio_rest.Client(account_sid, auth_token)
             
             # Test if we can access account information
             account = test_client.api.accounts(account_sid).fetch()
@@ -93,7 +95,7 @@ class TwilioService:
         
         try:
             # Create an API key in the external account
-            external_client = Client(account_sid, auth_token)
+            external_client = twilio_rest.Client(account_sid, auth_token)
             api_key = external_client.new_keys.create(
                 friendly_name=f"SMS-AI-Responder Integration Key"
             )
@@ -81,4 +81,15 @@ def process_monthly_billing():
         except Exception as e:
             logger.exception(f"Error processing billing for user {user.id}: {str(e)}")
     
-    logger.info("Completed monthly billing process")
\ No newline at end of file
+    logger.info("Completed monthly billing process")
+
+def reconcile_stripe_mirror(app):
+    """Refresh the local Stripe mirror from the API, catching anything webhooks missed"""
+    from app.services.stripe_mirror import reconcile
+    
+    with app.app_context():
+        try:
+            summary = reconcile(app.config)
+            logger.info(f"Reconciled Stripe mirror: {summary}")
+        except Exception as e:
+            logger.exception(f"Error reconciling Stripe mirror: {str(e)}")
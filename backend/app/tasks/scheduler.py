@@ -1,9 +1,10 @@
 # app/tasks/scheduler.py
 from flask import current_app
-from app.tasks.billing import update_all_usage_tracking, process_monthly_billing
+from app.tasks.billing import update_all_usage_tracking, process_monthly_billing, reconcile_stripe_mirror
 import atexit
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 def init_scheduler(app):
     """Initialize the task scheduler"""
@@ -29,6 +30,17 @@ def init_scheduler(app):
         replace_existing=True
     )
     
+    # Keep the Stripe mirror in step with Stripe
+    scheduler.add_job(
+        reconcile_stripe_mirror,
+        args=[app],
+        trigger=IntervalTrigger(minutes=app.config.get('STRIPE_RECONCILE_INTERVAL_MINUTES', 60)),
+        id='reconcile_stripe_mirror',
+        name='Reconcile the local Stripe mirror',
+        max_instances=1,
+        replace_existing=True
+    )
+    
     scheduler.start()
     
     # Shut down the scheduler when exiting the app
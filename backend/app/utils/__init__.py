@@ -12,62 +12,65 @@ Usage examples:
     from utils.openai_helpers import generate_ai_response
 """
 
-# Import commonly used security functions for easy access
-# These are the functions most likely to be used throughout the application
-from .security import (
+# Commonly used functions are re-exported here for easy access, but resolved
+# on first use so importing any app.utils submodule doesn't also pull in
+# bcrypt, PyJWT and the Twilio SDK. Maps exported name -> submodule.
+_LAZY_EXPORTS = {
     # Token and authentication functions
-    generate_token,
-    verify_token,
-    revoke_token,
+    'generate_token': '.security',
+    'verify_token': '.security',
+    'revoke_token': '.security',
     
     # Password handling
-    hash_password,
-    verify_password,
+    'hash_password': '.security',
+    'verify_password': '.security',
+    'password_needs_rehash': '.security',
     
     # API key management
-    generate_api_key,
-    validate_api_key,
-    revoke_api_key,
-    get_api_key_info,
+    'generate_api_key': '.security',
+    'validate_api_key': '.security',
+    'revoke_api_key': '.security',
+    'get_api_key_info': '.security',
     
     # Security validation functions
-    validate_password_strength,
-    validate_email_address,
-    validate_phone_number,
+    'validate_password_strength': '.security',
+    'validate_email_address': '.security',
+    'validate_phone_number': '.security',
     
     # Input sanitization
-    sanitize_input,
-    mask_sensitive_data,
+    'sanitize_input': '.security',
+    'mask_sensitive_data': '.security',
     
     # Security utilities
-    generate_secure_key,
-    generate_verification_code,
-    secure_compare,
+    'generate_secure_key': '.security',
+    'generate_verification_code': '.security',
+    'secure_compare': '.security',
     
-    # Rate limiting decorator
-    rate_limit,
+    # Rate limiting
+    'rate_limit': '.security',
+    'rate_limited': '.security',
     
     # API key decorator
-    require_api_key,
+    'require_api_key': '.security',
     
     # Security logging
-    log_security_event
-)
+    'log_security_event': '.security',
+    
+    # Twilio utilities
+    'get_twilio_client': '.twilio_helpers',
+    'send_sms': '.twilio_helpers',
+    'validate_twilio_request': '.twilio_helpers',
+}
 
-# Import Twilio utilities
-# We import all functions from twilio_helpers since they're commonly used together
-try:
-    from .twilio_helpers import (
-        get_twilio_client,
-        send_sms,
-        validate_twilio_request
-    )
-except ImportError:
-    # Handle case where twilio_helpers.py doesn't exist yet
-    pass
 
-# Import OpenAI utilities
-# These might be used less frequently, so we import selectively
+def __getattr__(name):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    import importlib
+    value = getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
 
 
 # Package-level constants
@@ -79,6 +82,7 @@ __all__ = [
     'revoke_token',
     'hash_password',
     'verify_password',
+    'password_needs_rehash',
     'generate_api_key',
     'validate_api_key',
     'revoke_api_key',
@@ -92,6 +96,7 @@ __all__ = [
     'generate_verification_code',
     'secure_compare',
     'rate_limit',
+    'rate_limited',
     'require_api_key',
     'log_security_event',
     
@@ -143,6 +148,8 @@ def create_user_session(user_id, remember_me=False):
     Returns:
         dict: Dictionary containing both tokens
     """
+    from .security import generate_token
+    
     access_hours = 1
     refresh_days = 1 if not remember_me else 30
     
@@ -181,6 +188,8 @@ def validate_user_input(data, required_fields=None, sanitize=True):
     Returns:
         tuple: (is_valid, cleaned_data, errors)
     """
+    from .security import sanitize_input, validate_email_address, validate_phone_number
+    
     errors = []
     cleaned_data = {}
     
@@ -254,7 +263,7 @@ def debug_package_imports():
     print("Available functions in utils package:")
     for item in __all__:
         try:
-            func = globals()[item]
+            func = __getattr__(item) if item in _LAZY_EXPORTS else globals()[item]
             print(f"  - {item}: {func.__doc__.split('.')[0] if func.__doc__ else 'No description'}")
-        except KeyError:
+        except (KeyError, ImportError, AttributeError):
             print(f"  - {item}: Not found (may be imported conditionally)")
\ No newline at end of file
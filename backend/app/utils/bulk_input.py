@@ -0,0 +1,57 @@
+# app/utils/bulk_input.py
+"""
+Streaming readers for bulk uploads (CSV, JSON arrays and JSON lines) and
+the INSERT ... ON CONFLICT construct bulk writers share.
+"""
+import io
+import csv
+import json
+
+from app.extensions import db
+
+FORMATS = ('csv', 'json', 'ndjson')
+
+
+def iter_rows(stream, fmt='csv'):
+    """
+    Yield row dicts from a binary stream.
+
+    CSV and JSON lines are read incrementally; a JSON array is parsed whole
+    (uploads are bounded by MAX_CONTENT_LENGTH).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported input format: {fmt}")
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for row in csv.DictReader(text):
+            yield {(key or '').strip().lower(): value for key, value in row.items()}
+    elif fmt == 'ndjson':
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        rows = json.load(text)
+        if not isinstance(rows, list):
+            raise ValueError("JSON input must be an array of objects")
+        yield from rows
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the import format from a file name or content type (default csv)"""
+    filename = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if filename.endswith(('.jsonl', '.ndjson')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    if filename.endswith('.json') or 'json' in content_type:
+        return 'json'
+    return 'csv'
+
+
+def insert_on_conflict(table):
+    """INSERT construct for the app's database dialect, supporting on_conflict_do_nothing/update"""
+    if db.engine.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(table)
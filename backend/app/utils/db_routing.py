@@ -0,0 +1,333 @@
+# app/utils/db_routing.py
+"""
+Connection pool configuration and read-replica routing.
+
+Engines are created with the DB_POOL_* settings (size, overflow, checkout
+timeout, pre-ping, recycle) and, on PostgreSQL, DB_STATEMENT_TIMEOUT_MS.
+Replicas listed in DB_READ_REPLICA_URLS get engines with the same settings.
+
+Views decorated with @read_replica (dashboard and analytics GETs) run their
+SELECTs on one replica per request, picked round-robin among those no more
+than DB_REPLICA_MAX_LAG seconds behind. Writes, SELECT ... FOR UPDATE and
+anything after the request's first flush go to the primary, and a user who
+committed a write in the last DB_READ_YOUR_WRITES_SECONDS reads from the
+primary so they see their own changes, as does a @conditional response for
+data changed within the replica lag window (see response_versions). The
+webhook and queue workers never read from a replica.
+
+Every pool records how long checkouts wait, how full it is at each checkout
+and checkout timeouts as db_pool_* metrics, labelled by bind.
+"""
+import time
+import logging
+import threading
+from functools import wraps
+
+import sqlalchemy as sa
+from sqlalchemy.pool import QueuePool
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'primary'
+
+# Options that only apply to a sized pool (in-memory SQLite shares one connection)
+POOL_SIZING_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')
+
+# Seconds of replay lag; 0 on a primary or on a replica that has replayed all it received
+LAG_QUERY = sa.text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+WRITE_KEY_PREFIX = 'db:wrote:'
+
+_local_writes = {}
+_local_writes_lock = threading.Lock()
+_events_registered = False
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records checkout wait, utilization and timeouts"""
+
+    app = None
+    bind = PRIMARY
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa.exc.TimeoutError:
+            self._record('inc', 'db_pool_timeouts_total', 1)
+            raise
+
+        self._record('observe', 'db_pool_checkout_seconds', time.perf_counter() - started)
+        capacity = self.size() + max(self._max_overflow, 0)
+        if capacity:
+            self._record('observe', 'db_pool_utilization', self.checkedout() / capacity)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.app, pool.bind = self.app, self.bind
+        return pool
+
+    def _record(self, method, name, value):
+        if self.app is None:
+            return
+        try:
+            from app.services.metrics import get_metrics
+            getattr(get_metrics(self.app), method)(name, value, bind=self.bind)
+        except Exception as e:
+            logger.debug(f"Failed to record {name}: {str(e)}")
+
+
+def engine_options(config, url):
+    """SQLALCHEMY_ENGINE_OPTIONS adjusted for the database at url"""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = sa.engine.make_url(url)
+
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        for option in POOL_SIZING_OPTIONS:
+            options.pop(option, None)
+        return options
+
+    options.setdefault('poolclass', InstrumentedQueuePool)
+
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+    if timeout and url.get_backend_name() == 'postgresql':
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args['options'] = f"{connect_args.get('options', '')} -c statement_timeout={int(timeout)}".strip()
+        options['connect_args'] = connect_args
+
+    return options
+
+
+def configure_engine_options(app):
+    """Before db.init_app: build the primary engine's options from config"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config, uri)
+
+
+def init_read_replicas(app):
+    """After db.init_app: label the primary pool for metrics and create the replica engines"""
+    from app.extensions import db
+
+    with app.app_context():
+        _instrument(db.engine.pool, app, PRIMARY)
+
+    replicas = []
+    for index, url in enumerate(app.config.get('DB_READ_REPLICA_URLS') or []):
+        name = f"replica_{index}"
+        engine = sa.create_engine(url, **engine_options(app.config, url))
+        _instrument(engine.pool, app, name)
+        replicas.append((name, engine))
+
+    app.extensions['db_replicas'] = ReplicaRouter(
+        replicas,
+        max_lag=app.config.get('DB_REPLICA_MAX_LAG', 5.0),
+        check_interval=app.config.get('DB_REPLICA_LAG_CHECK_INTERVAL', 5.0),
+    )
+    register_session_events()
+    return app.extensions['db_replicas']
+
+
+def _instrument(pool, app, bind):
+    if isinstance(pool, InstrumentedQueuePool):
+        pool.app, pool.bind = app, bind
+
+
+class ReplicaRouter:
+    """Round-robin over the replicas that are within the lag limit"""
+
+    def __init__(self, replicas, max_lag=5.0, check_interval=5.0):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._lags = {}
+        self._next = 0
+
+    def lag(self, name, engine):
+        """Seconds the replica is behind (cached for check_interval; inf if it can't be checked)"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lags.get(name)
+        if cached and now - cached[1] < self.check_interval:
+            return cached[0]
+
+        try:
+            lag = self._measure(engine)
+        except Exception as e:
+            logger.warning(f"Lag check failed for {name}: {str(e)}")
+            lag = float('inf')
+
+        with self._lock:
+            self._lags[name] = (lag, now)
+        return lag
+
+    @staticmethod
+    def _measure(engine):
+        if engine.dialect.name != 'postgresql':
+            return 0.0
+        with engine.connect() as conn:
+            return float(conn.execute(LAG_QUERY).scalar() or 0.0)
+
+    def pick(self):
+        """
+        Next replica within the lag limit.
+
+        Returns:
+            tuple: (name, engine), or None if every replica is lagging
+        """
+        if not self.replicas:
+            return None
+
+        with self._lock:
+            start = self._next
+            self._next = (start + 1) % len(self.replicas)
+
+        for offset in range(len(self.replicas)):
+            name, engine = self.replicas[(start + offset) % len(self.replicas)]
+            if self.lag(name, engine) <= self.max_lag:
+                return name, engine
+        return None
+
+
+def get_replica_router(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions.get('db_replicas')
+
+
+class RoutingSession(Session):
+    """Session that runs a read_replica request's plain SELECTs on its replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None and self._read_only(clause):
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _read_only(self, clause):
+        # Autoflush runs before the bind is chosen, so pending changes have set 'wrote'
+        if self._flushing or self.info.get('wrote'):
+            return False
+        return isinstance(clause, sa.sql.Select) and clause._for_update_arg is None
+
+
+def read_replica(view):
+    """
+    Let a view's SELECTs run on a read replica (apply below @jwt_required so
+    the user's recent writes are known).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = _choose_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _choose_replica():
+    router = get_replica_router()
+    if router is None or not router.replicas:
+        return None
+
+    from app.services.metrics import inc
+
+    if g.get('db_read_primary'):
+        inc('db_read_routing_total', route='recent_change')
+        return None
+
+    user_id = _current_user_id()
+    if user_id is not None and recently_wrote(user_id):
+        inc('db_read_routing_total', route='recent_write')
+        return None
+
+    picked = router.pick()
+    inc('db_read_routing_total', route='replica' if picked else 'lagging')
+    return picked[1] if picked else None
+
+
+def _current_user_id():
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return get_jwt_identity()
+    except Exception:
+        # No verified JWT in this request
+        return None
+
+
+def mark_write(user_id, app=None):
+    """Send the user's reads to the primary for DB_READ_YOUR_WRITES_SECONDS"""
+    from app.extensions import get_redis
+
+    app = app or current_app._get_current_object()
+    window = app.config.get('DB_READ_YOUR_WRITES_SECONDS', 10.0)
+    if window <= 0:
+        return
+
+    redis_conn = get_redis(app)
+    if redis_conn is not None:
+        try:
+            redis_conn.set(f"{WRITE_KEY_PREFIX}{user_id}", 1, px=int(window * 1000))
+            return
+        except Exception as e:
+            logger.warning(f"Failed to record write by user {user_id}: {str(e)}")
+
+    now = time.monotonic()
+    with _local_writes_lock:
+        _local_writes[user_id] = now + window
+        if len(_local_writes) > 10000:
+            for key in [key for key, until in _local_writes.items() if until <= now]:
+                del _local_writes[key]
+
+
+def recently_wrote(user_id, app=None):
+    """True if the user committed a write within DB_READ_YOUR_WRITES_SECONDS"""
+    from app.extensions import get_redis
+
+    app = app or current_app._get_current_object()
+    redis_conn = get_redis(app)
+    if redis_conn is not None:
+        try:
+            return bool(redis_conn.exists(f"{WRITE_KEY_PREFIX}{user_id}"))
+        except Exception as e:
+            logger.warning(f"Failed to check writes by user {user_id}: {str(e)}")
+            return True
+
+    with _local_writes_lock:
+        return _local_writes.get(user_id, 0) > time.monotonic()
+
+
+def _after_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+def _after_commit(session):
+    if not session.info.pop('wrote', False) or not has_request_context():
+        return
+
+    # The rest of this request, and the user's next few, read their own writes
+    g.db_replica = None
+    user_id = _current_user_id()
+    if user_id is not None:
+        mark_write(user_id)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop('wrote', None)
+
+
+def register_session_events():
+    """Track flushed writes per session for routing and read-your-writes"""
+    global _events_registered
+    if _events_registered:
+        return
+    _events_registered = True
+
+    sa.event.listen(RoutingSession, 'after_flush', _after_flush)
+    sa.event.listen(RoutingSession, 'after_commit', _after_commit)
+    sa.event.listen(RoutingSession, 'after_soft_rollback', _after_soft_rollback)
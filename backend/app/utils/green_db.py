@@ -0,0 +1,86 @@
+# app/utils/green_db.py
+"""
+Cooperative PostgreSQL I/O for eventlet workers.
+
+psycopg2 blocks in C while a query runs, which under eventlet freezes every
+green thread on the worker. Installing a psycopg2 wait callback makes each
+connection yield to the eventlet hub while it waits on the socket, so one
+worker runs as many queries concurrently as its pool allows.
+"""
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def eventlet_active():
+    """True when running under a monkey-patched eventlet worker"""
+    if 'eventlet' not in sys.modules:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched('socket')
+
+
+def _eventlet_wait_callback(conn, timeout=-1):
+    """psycopg2 wait callback that waits on the connection's socket through the eventlet hub"""
+    from psycopg2 import extensions, OperationalError
+    from eventlet.hubs import trampoline
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Bad result from poll: {state}")
+
+
+def make_psycopg2_green():
+    """Install the eventlet wait callback for every psycopg2 connection in this process"""
+    from psycopg2 import extensions
+    extensions.set_wait_callback(_eventlet_wait_callback)
+
+
+def green_db_active():
+    """True if psycopg2 connections in this process yield to the eventlet hub"""
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    return extensions.get_wait_callback() is _eventlet_wait_callback
+
+
+def init_green_db(app):
+    """
+    Make database I/O cooperative when the app runs under eventlet.
+
+    Must run before the first connection is opened. DB_GREEN_IO controls it:
+    'auto' (default) enables it under eventlet, 'require' additionally refuses
+    to start if it can't be enabled, 'off' disables it.
+
+    Returns:
+        bool: True if database I/O is cooperative
+    """
+    mode = app.config.get('DB_GREEN_IO', 'auto')
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    under_eventlet = eventlet_active()
+
+    if mode != 'off' and under_eventlet and uri.startswith('postgres'):
+        make_psycopg2_green()
+
+    active = green_db_active()
+    app.extensions['green_db'] = active
+
+    # Startup check: under eventlet a blocking driver serializes every query on the worker
+    if under_eventlet and not active:
+        message = f"Database I/O is blocking under eventlet (DB_GREEN_IO={mode}, driver={uri.split(':', 1)[0]})"
+        if mode == 'require':
+            raise RuntimeError(message)
+        logger.warning(message)
+    elif active:
+        logger.info("Database I/O is cooperative (psycopg2 eventlet wait callback installed)")
+
+    return active
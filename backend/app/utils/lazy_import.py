@@ -0,0 +1,42 @@
+# app/utils/lazy_import.py
+"""
+Deferred imports for heavy third-party SDKs.
+
+    stripe = lazy_import('stripe')
+
+binds a stand-in that imports the real module on first attribute access, so
+modules that only use an SDK in a few request handlers don't pay for it at
+startup.
+"""
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the named module on first attribute access"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self.__dict__['_module'] is None:
+            self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return self.__dict__['_module']
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        # e.g. stripe.api_key = ...
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name):
+    """Return a LazyModule for `name` (the module itself if it's already imported)"""
+    import sys
+    return sys.modules.get(name) or LazyModule(name)
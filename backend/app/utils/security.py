@@ -11,13 +11,15 @@ import os
 import re
 import secrets
 import string
+import sys
+import threading
 import time
 from datetime import datetime, timedelta
 from functools import wraps
 
 import bcrypt
 import jwt
-from flask import current_app, request, g, jsonify
+from flask import current_app, request, g, jsonify, make_response
 from werkzeug.local import LocalProxy
 
 # Initialize Redis client for token blacklist and rate limiting
@@ -110,8 +112,9 @@ def verify_token(token):
             algorithms=['HS256']
         )
         
-        # Check if token has been revoked
-        if redis_client and redis_client.get(f"revoked_token:{payload['jti']}"):
+        # Check if token has been revoked (answered from the local filter when it's current)
+        from app.services.token_revocation import is_token_revoked
+        if is_token_revoked(payload['jti']):
             return None
         
         return payload
@@ -144,27 +147,39 @@ def revoke_token(token):
         if not token_jti:
             return False
         
-        # Calculate time until token expiration
-        expiration = datetime.fromtimestamp(payload.get('exp')) - datetime.utcnow()
-        ttl = max(1, int(expiration.total_seconds()))
-        
-        # Add to blacklist with expiration
-        if redis_client:
-            redis_client.setex(f"revoked_token:{token_jti}", ttl, 1)
-            return True
-        else:
-            # Fallback if Redis isn't available
-            # This is less optimal as the revocation won't persist across app restarts
-            if not hasattr(g, 'revoked_tokens'):
-                g.revoked_tokens = set()
-            g.revoked_tokens.add(token_jti)
-            return True
+        # Record in revoked_tokens and Redis, and publish to every process's revocation filter
+        from app.services.token_revocation import revoke_jti
+        revoke_jti(token_jti, payload.get('exp'))
+        return True
     except Exception:
         return False
 
 
 # Password Management Functions
 
+def run_off_hub(func, *args, **kwargs):
+    """
+    Run a CPU-heavy call (password hashing) without stalling the event loop.
+    
+    Under eventlet (the production gunicorn worker) the call runs on eventlet's
+    native thread pool while other green threads keep running; otherwise it
+    runs inline.
+    
+    Args:
+        func: Function to call
+        args, kwargs: Arguments to pass to it
+        
+    Returns:
+        The function's return value
+    """
+    if 'eventlet' in sys.modules:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'):
+            return tpool.execute(func, *args, **kwargs)
+    
+    return func(*args, **kwargs)
+
+
 def hash_password(password):
     """
     Hash a password securely using bcrypt.
@@ -175,8 +190,8 @@ def hash_password(password):
     Returns:
         str: Hashed password
     """
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+    salt = bcrypt.gensalt(rounds=current_app.config.get('BCRYPT_ROUNDS', 12))
+    hashed = run_off_hub(bcrypt.hashpw, password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 
@@ -191,7 +206,28 @@ def verify_password(password, password_hash):
     Returns:
         bool: True if password matches, False otherwise
     """
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    return run_off_hub(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def password_needs_rehash(password_hash):
+    """
+    Check whether a stored hash was made with weaker settings than configured.
+    
+    Handles bcrypt hashes (compared against BCRYPT_ROUNDS) and werkzeug hashes
+    (compared against PASSWORD_HASH_METHOD).
+    
+    Args:
+        password_hash: Stored password hash
+        
+    Returns:
+        bool: True if the password should be rehashed on next successful login
+    """
+    if password_hash.startswith('$2'):
+        rounds = int(password_hash.split('$')[2])
+        return rounds != current_app.config.get('BCRYPT_ROUNDS', 12)
+    
+    method = password_hash.split('$', 1)[0]
+    return method != current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
 
 
 def validate_password_strength(password):
@@ -255,32 +291,42 @@ def validate_api_key(api_key):
         dict: API key information if valid, None otherwise
     """
     from app.models.api_key import APIKey
+    from app.services.api_key_cache import get_api_key_cache, record_api_key_use
     
     if not api_key:
         return None
     
-    # Check against database
-    key_record = APIKey.query.filter_by(key_hash=_hash_api_key(api_key)).first()
-    
-    if not key_record:
-        return None
+    key_hash = _hash_api_key(api_key)
+    cache = get_api_key_cache()
     
-    # Check if key is active
-    if not key_record.is_active:
-        return None
+    # Serve repeat lookups (valid or not) from the short-TTL cache
+    hit, key_info = cache.get(key_hash)
+    if not hit:
+        key_info = None
+        
+        # Check against database
+        key_record = APIKey.query.filter_by(key_hash=key_hash).first()
+        
+        # Check if key is active and hasn't expired
+        if key_record and key_record.is_active and not (
+            key_record.expires_at and key_record.expires_at < datetime.utcnow()
+        ):
+            key_info = {
+                "id": key_record.id,
+                "user_id": key_record.user_id,
+                "name": key_record.name,
+                "permissions": key_record.permissions,
+                "created_at": key_record.created_at,
+                "expires_at": key_record.expires_at
+            }
+        
+        cache.set(key_hash, key_info)
     
-    # Check if key has expired
-    if key_record.expires_at and key_record.expires_at < datetime.utcnow():
-        return None
+    # last_used_at is written behind, in bulk
+    if key_info:
+        record_api_key_use(key_info["id"])
     
-    # Return key info
-    return {
-        "id": key_record.id,
-        "user_id": key_record.user_id,
-        "name": key_record.name,
-        "permissions": key_record.permissions,
-        "created_at": key_record.created_at
-    }
+    return key_info
 
 
 def revoke_api_key(api_key):
@@ -295,9 +341,11 @@ def revoke_api_key(api_key):
     """
     from app.models.api_key import APIKey
     from app.extensions import db
+    from app.services.api_key_cache import invalidate_api_key
     
     # Find key record
-    key_record = APIKey.query.filter_by(key_hash=_hash_api_key(api_key)).first()
+    key_hash = _hash_api_key(api_key)
+    key_record = APIKey.query.filter_by(key_hash=key_hash).first()
     
     if not key_record:
         return False
@@ -308,6 +356,7 @@ def revoke_api_key(api_key):
     
     try:
         db.session.commit()
+        invalidate_api_key(key_hash)
         return True
     except Exception:
         db.session.rollback()
@@ -507,10 +556,42 @@ def secure_compare(a, b):
     return hmac.compare_digest(a.encode('utf-8'), b.encode('utf-8'))
 
 
+# Lua script: GCRA (generic cell rate algorithm) check-and-update in one round
+# trip. KEYS[1] holds the key's theoretical arrival time (TAT). ARGV: emission
+# interval (period / limit) and tolerance (period), both in seconds.
+# Returns {allowed, seconds until retry, seconds until the key fully resets}
+# as strings, since Lua numbers are truncated to integers on the way out.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1])) or now, now)
+local new_tat = tat + interval
+if new_tat - tolerance > now then
+    return {0, tostring(new_tat - tolerance - now), tostring(tat - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, '0', tostring(new_tat - now)}
+"""
+
+# Per-process state: known-blocked keys (the local pre-check) and the
+# fallback limiter used when Redis is not configured
+_rate_limit_lock = threading.Lock()
+_blocked_until = {}
+_local_tats = {}
+_gcra_scripts = {}
+
+
 def rate_limit(key, limit, period):
     """
     Implement rate limiting.
     
+    Uses GCRA: each key may make `limit` requests per `period` seconds,
+    spread out or in one burst, with no double burst at window edges. The
+    check and update are a single atomic Redis call. A key this process has
+    just seen denied is refused locally until its retry time.
+    
     Args:
         key: Rate limit key (e.g., user_id or IP)
         limit: Maximum number of requests
@@ -519,40 +600,119 @@ def rate_limit(key, limit, period):
     Returns:
         tuple: (bool, dict) - (is_allowed, rate_limit_info)
     """
-    if not redis_client:
-        # No rate limiting if Redis is not available
-        return True, {"limit": limit, "remaining": limit, "reset": int(time.time()) + period}
+    now = time.time()
+    interval = period / float(limit)
     
-    current = int(time.time())
-    reset_time = current - (current % period) + period
-    window_key = f"ratelimit:{key}:{reset_time}"
-    
-    # Get current count
-    count = redis_client.get(window_key)
-    count = int(count) if count else 0
-    
-    # Check if limit exceeded
-    if count >= limit:
+    # Local pre-check: no round trip for a key we already know is blocked
+    blocked_until = _blocked_until.get(key)
+    if blocked_until and blocked_until > now:
         return False, {
             "limit": limit,
-            "remaining": 0, 
-            "reset": reset_time,
-            "retry_after": reset_time - current
+            "remaining": 0,
+            "reset": int(blocked_until),
+            "retry_after": max(1, int(blocked_until - now + 0.999))
         }
     
-    # Increment count and set expiration
-    pipeline = redis_client.pipeline()
-    pipeline.incr(window_key)
-    pipeline.expire(window_key, period)
-    pipeline.execute()
+    from app.extensions import get_redis
+    conn = redis_client or get_redis()
+    if conn is not None:
+        script = _gcra_scripts.get(id(conn))
+        if script is None:
+            script = _gcra_scripts[id(conn)] = conn.register_script(GCRA_SCRIPT)
+        allowed, retry_after, reset_after = script(keys=[f"ratelimit:{key}"], args=[interval, period])
+        allowed, retry_after, reset_after = int(allowed), float(retry_after), float(reset_after)
+    else:
+        # Per-process fallback with the same algorithm
+        with _rate_limit_lock:
+            tat = max(_local_tats.get(key, now), now)
+            new_tat = tat + interval
+            allowed = new_tat - period <= now
+            if allowed:
+                _local_tats[key] = new_tat
+            retry_after = 0 if allowed else new_tat - period - now
+            reset_after = (new_tat if allowed else tat) - now
+    
+    if not allowed:
+        with _rate_limit_lock:
+            _blocked_until[key] = now + retry_after
+            if len(_blocked_until) > 10000:
+                for stale in [k for k, until in _blocked_until.items() if until <= now]:
+                    del _blocked_until[stale]
+        return False, {
+            "limit": limit,
+            "remaining": 0,
+            "reset": int(now + reset_after),
+            "retry_after": max(1, int(retry_after + 0.999))
+        }
     
     return True, {
         "limit": limit,
-        "remaining": limit - (count + 1),
-        "reset": reset_time
+        "remaining": max(0, int((period - reset_after) / interval)),
+        "reset": int(now + reset_after)
     }
 
 
+def check_rate_limit(config_key, client_key):
+    """
+    Count a request by client_key against the limit configured in config_key.
+    
+    Args:
+        config_key: Config setting holding the limit as "requests/seconds", e.g. "10/60"
+        client_key: Who the request is counted against
+        
+    Returns:
+        tuple: (allowed, info), with info None when the limit is not configured
+    """
+    setting = current_app.config.get(config_key)
+    if not setting:
+        return True, None
+    
+    limit, period = (int(part) for part in setting.split('/'))
+    return rate_limit(f"{request.endpoint}:{client_key}", limit, period)
+
+
+def rate_limit_exceeded(info):
+    """429 response for a request check_rate_limit refused"""
+    response = make_response(jsonify({"error": "Rate limit exceeded"}), 429)
+    response.headers['Retry-After'] = str(info['retry_after'])
+    return response
+
+
+def rate_limited(config_key, key_func=None):
+    """
+    Decorator applying rate_limit to a route.
+    
+    Args:
+        config_key: Config setting holding the limit as "requests/seconds", e.g. "10/60"
+        key_func: Returns the client key for the request; defaults to the remote address
+        
+    Sets X-RateLimit-Limit, X-RateLimit-Remaining and X-RateLimit-Reset on
+    every response, and answers 429 with Retry-After once the limit is hit.
+    Behind a proxy the remote address is only the client's when the app is
+    wrapped in ProxyFix (PROXY_FIX_X_FOR).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return f(*args, **kwargs)
+            
+            client_key = key_func() if key_func else request.remote_addr
+            allowed, info = check_rate_limit(config_key, client_key)
+            if info is None:
+                return f(*args, **kwargs)
+            
+            response = make_response(f(*args, **kwargs)) if allowed else rate_limit_exceeded(info)
+            response.headers['X-RateLimit-Limit'] = str(info['limit'])
+            response.headers['X-RateLimit-Remaining'] = str(info['remaining'])
+            response.headers['X-RateLimit-Reset'] = str(info['reset'])
+            return response
+        
+        return decorated
+    
+    return decorator
+
+
 def log_security_event(event_type, details, user_id=None, ip_address=None):
     """
     Log a security-related event.
@@ -1,10 +1,12 @@
-from twilio.rest import Client
 from flask import current_app
 from app.extensions import db
+from app.utils.lazy_import import lazy_import
+
+twilio_rest = lazy_import('twilio.rest')
 
 def get_twilio_client():
     """Get configured Twilio client"""
-    return Client(
+    return twilio_rest.Client(
         current_app.config['TWILIO_ACCOUNT_SID'],
         current_app.config['TWILIO_AUTH_TOKEN']
     )
@@ -85,20 +87,32 @@ def get_twilio_client(user=None):
     If user is provided, use their credentials
     Otherwise use the master account credentials
     """
+    client = None
     if user and user.twilio_account_sid:
         if user.twilio_account_type == 'subaccount' and user.twilio_auth_token:
             # For subaccounts, we have the auth token
-            return Client(user.twilio_account_sid, user.twilio_auth_token)
+            client = twilio_rest.Client(user.twilio_account_sid, user.twilio_auth_token)
         elif user.twilio_account_type == 'external' and user.twilio_api_key_sid and user.twilio_api_key_secret:
             # For external accounts, we use API key
-            return Client(user.twilio_api_key_sid, user.twilio_api_key_secret, 
+            client = twilio_rest.Client(user.twilio_api_key_sid, user.twilio_api_key_secret, 
                          account_sid=user.twilio_account_sid)
     
     # Fallback to master account
-    return Client(
-        current_app.config['TWILIO_ACCOUNT_SID'],
-        current_app.config['TWILIO_AUTH_TOKEN']
-    )
+    if client is None:
+        client = twilio_rest.Client(
+            current_app.config['TWILIO_ACCOUNT_SID'],
+            current_app.config['TWILIO_AUTH_TOKEN']
+        )
+    
+    # Point the REST API at a stand-in server (see benchmarks/webhook_load.py)
+    if current_app.config.get('TWILIO_API_BASE_URL'):
+        client.api.base_url = current_app.config['TWILIO_API_BASE_URL'].rstrip('/')
+    
+    return client
+
+def get_status_callback_url():
+    """URL Twilio posts delivery receipts to for outbound messages"""
+    return f"{current_app.config['BASE_URL'].rstrip('/')}/api/webhooks/sms/status"
 
 def send_sms(from_number, to_number, body, user=None):
     """
@@ -111,7 +125,8 @@ def send_sms(from_number, to_number, body, user=None):
     message = client.messages.create(
         body=body,
         from_=from_number,
-        to=to_number
+        to=to_number,
+        status_callback=get_status_callback_url()
     )
     # If using the master account but sending on behalf of a user with a subaccount,
     # update their usage tracker
@@ -0,0 +1,95 @@
+# backfill_stripe.py
+"""
+Rebuild Stripe event, invoice and mirror data from the command line.
+
+    python backfill_stripe.py events --since 2024-01-01
+    python backfill_stripe.py events --file events.jsonl
+    python backfill_stripe.py invoices --since 2024-01-01 --customer cus_123
+    python backfill_stripe.py invoices --file invoices.jsonl
+    python backfill_stripe.py pending
+    python backfill_stripe.py mirror
+
+events records Stripe events (from the API or a JSON lines file) in the
+event store, skipping ones already received, and processes them in order per
+subscription. invoices upserts invoice objects straight into Invoice.
+pending reprocesses events left pending, e.g. after a worker outage. mirror
+refreshes the local copy of Stripe prices, customers and subscriptions. All
+of them are safe to run again.
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from datetime import datetime
+from app import create_app
+from app.services.stripe_events import replay_events, backfill_invoices, process_pending, HANDLERS
+from app.services.stripe_mirror import reconcile
+
+
+def read_lines(path):
+    """Objects from a JSON lines file, or stdin for -"""
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        stream.close()
+
+
+def list_params(args):
+    params = {'limit': 100}
+    if args.since:
+        params['created'] = {'gte': int(datetime.strptime(args.since, '%Y-%m-%d').timestamp())}
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay Stripe events, backfill invoices or refresh the Stripe mirror')
+    parser.add_argument('mode', choices=('events', 'invoices', 'pending', 'mirror'))
+    parser.add_argument('--file', help='JSON lines file of events or invoices (- for stdin) instead of the Stripe API')
+    parser.add_argument('--since', help='Only objects created on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--customer', help='Only this customer\'s invoices')
+    parser.add_argument('--queue', action='store_true', help='Queue event processing instead of running it here')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+
+    app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+
+    with app.app_context():
+        task_queue = None
+        if args.queue:
+            from app.services.queue_service import get_task_queue
+            task_queue = get_task_queue()
+
+        if args.mode == 'pending':
+            summary = {'keys': process_pending(task_queue)}
+        elif args.mode == 'mirror':
+            summary = reconcile(app.config)
+        elif args.file:
+            objects = read_lines(args.file)
+            if args.mode == 'events':
+                summary = replay_events(objects, task_queue)
+            else:
+                summary = backfill_invoices(objects, app.config)
+        else:
+            import stripe
+            stripe.api_key = app.config['STRIPE_SECRET_KEY']
+            params = list_params(args)
+            if args.mode == 'events':
+                # Stripe lists newest first; recording order doesn't matter, processing sorts by created
+                events = stripe.Event.list(types=list(HANDLERS), **params).auto_paging_iter()
+                summary = replay_events(events, task_queue)
+            else:
+                if args.customer:
+                    params['customer'] = args.customer
+                summary = backfill_invoices(stripe.Invoice.list(**params).auto_paging_iter(), app.config)
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
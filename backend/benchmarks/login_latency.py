@@ -0,0 +1,87 @@
+# benchmarks/login_latency.py
+"""
+Event-loop latency during a burst of logins under eventlet.
+
+A ticker green thread sleeps TICK seconds in a loop and records how late it
+wakes up, while a burst of concurrent password checks runs: once calling the
+hash inline (the old behaviour) and once through run_off_hub (eventlet's
+native thread pool). Lateness is what every websocket and webhook on the
+worker would see.
+
+    python benchmarks/login_latency.py --logins 20 --method pbkdf2:sha256:600000
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.security import run_off_hub
+
+TICK = 0.005
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(check, logins, password_hash):
+    lags = []
+    running = [True]
+
+    def ticker():
+        while running[0]:
+            started = time.perf_counter()
+            eventlet.sleep(TICK)
+            lags.append(time.perf_counter() - started - TICK)
+
+    ticker_thread = eventlet.spawn(ticker)
+    eventlet.sleep(TICK * 4)
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(logins)
+    for _ in range(logins):
+        pool.spawn(check, password_hash, 'correct horse battery staple')
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+
+    running[0] = False
+    ticker_thread.wait()
+
+    return {
+        'burst_seconds': round(elapsed, 3),
+        'loop_lag_p50_ms': round(percentile(lags, 50) * 1000, 2),
+        'loop_lag_p99_ms': round(percentile(lags, 99) * 1000, 2),
+        'loop_lag_max_ms': round(max(lags) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--logins', type=int, default=20, help='Concurrent logins in the burst')
+    parser.add_argument('--method', default='pbkdf2:sha256:600000', help='werkzeug hash method')
+    args = parser.parse_args(argv)
+
+    password_hash = generate_password_hash('correct horse battery staple', method=args.method)
+
+    results = {
+        'logins': args.logins,
+        'method': args.method,
+        'inline': measure(check_password_hash, args.logins, password_hash),
+        'thread_pool': measure(
+            lambda *a: run_off_hub(check_password_hash, *a), args.logins, password_hash
+        ),
+    }
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
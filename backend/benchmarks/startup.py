@@ -0,0 +1,140 @@
+# benchmarks/startup.py
+"""
+Cold-start cost of a web worker.
+
+Starts a fresh interpreter with -X importtime, creates the app, serves the
+first request ('/') through the test client and reports the time to each
+step, the total import time, the slowest top-level imports and which heavy
+SDKs were loaded along the way. With --budget the exit status is 1 when the
+median time to first request exceeds it, so it can gate CI.
+
+    python benchmarks/startup.py --runs 5 --top 15
+    python benchmarks/startup.py --budget 3.0
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SDKs a web worker should only load when a request actually needs them
+HEAVY_MODULES = ['stripe', 'celery', 'alembic', 'flask_migrate', 'twilio.rest', 'openai', 'numpy']
+
+# Runs in the child interpreter; prints one JSON line on stdout
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+response = app.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_app_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'first_request_seconds': served - created,
+    'loaded_modules': sorted(m for m in json.loads(sys.argv[2]) if m in sys.modules),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        tuple: (total self time in seconds, list of (module, cumulative seconds) for top-level imports)
+    """
+    total_us = 0
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        total_us += int(self_us)
+        # Nested imports are indented under the module that triggered them
+        if not name[1:].startswith(' '):
+            top_level.append((name.strip(), int(cumulative_us) / 1e6))
+    return total_us / 1e6, top_level
+
+
+def measure(config_name, env=None):
+    """Start one interpreter, create the app and serve the first request"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, config_name, json.dumps(HEAVY_MODULES)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-4000:]}")
+
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    import_total, top_level = parse_importtime(result.stderr)
+    child['time_to_first_request_seconds'] = (
+        child['import_app_seconds'] + child['create_app_seconds'] + child['first_request_seconds']
+    )
+    child['process_wall_seconds'] = wall
+    child['import_total_seconds'] = import_total
+    child['top_imports'] = top_level
+    return child
+
+
+def run(config_name='development', runs=3, top=10, env=None):
+    """
+    Measure startup `runs` times.
+
+    Returns:
+        dict: Medians over the runs, plus the slowest top-level imports and
+            heavy modules loaded in the last run
+    """
+    samples = [measure(config_name, env=env) for _ in range(runs)]
+    last = samples[-1]
+
+    def median(key):
+        return round(statistics.median(sample[key] for sample in samples), 4)
+
+    return {
+        'runs': runs,
+        'config': config_name,
+        'status': last['status'],
+        'time_to_first_request_seconds': median('time_to_first_request_seconds'),
+        'import_app_seconds': median('import_app_seconds'),
+        'create_app_seconds': median('create_app_seconds'),
+        'first_request_seconds': median('first_request_seconds'),
+        'process_wall_seconds': median('process_wall_seconds'),
+        'import_total_seconds': median('import_total_seconds'),
+        'top_imports': [
+            {'module': name, 'cumulative_ms': round(seconds * 1000, 1)}
+            for name, seconds in sorted(last['top_imports'], key=lambda item: -item[1])[:top]
+        ],
+        'heavy_modules_loaded': last['loaded_modules'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--config', default=os.environ.get('FLASK_CONFIG', 'development'), help='Config name')
+    parser.add_argument('--runs', type=int, default=3, help='Interpreter starts to take the median of')
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list')
+    parser.add_argument('--budget', type=float, help='Fail if the median time to first request exceeds this many seconds')
+    args = parser.parse_args(argv)
+
+    results = run(args.config, runs=args.runs, top=args.top)
+    print(json.dumps(results, indent=2))
+
+    if args.budget is not None and results['time_to_first_request_seconds'] > args.budget:
+        print(f"Time to first request {results['time_to_first_request_seconds']}s exceeds budget {args.budget}s",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
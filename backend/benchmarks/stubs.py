@@ -0,0 +1,247 @@
+# benchmarks/stubs.py
+"""
+Local stand-ins for the Twilio REST API and an Ollama server.
+
+TwilioStub accepts Messages.json creates like api.twilio.com after a
+configurable latency and records when each reply arrived and for whom.
+OllamaStub answers /api/generate and /api/chat, optionally streamed, taking
+prompt_tokens / prefill_rate + response tokens / token_rate seconds and
+reporting the same eval counts and durations Ollama does.
+
+Both run on a ThreadingHTTPServer in a background thread:
+
+    with TwilioStub(latency=0.05) as twilio, OllamaStub(token_rate=40) as ollama:
+        ... point TWILIO_API_BASE_URL / LLM_ENDPOINT at twilio.url / ollama.url
+
+or standalone, for a separately started app:
+
+    python benchmarks/stubs.py ollama --port 11434 --token-rate 30
+    python benchmarks/stubs.py twilio --port 8081 --latency 0.1
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Rough tokens per character of prompt text, for reporting prompt_eval_count
+CHARS_PER_TOKEN = 4
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.stub.handle(self)
+
+
+class _StubServer:
+    """Runs a handler on an ephemeral (or given) port in a daemon thread"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def _delay(mean, jitter):
+        return max(0.0, random.uniform(mean - jitter, mean + jitter)) if jitter else mean
+
+
+class TwilioStub(_StubServer):
+    """Accepts outbound messages like the Twilio REST API and records their arrival"""
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.sent = []
+
+    def handle(self, request):
+        if not request.path.endswith('/Messages.json'):
+            return request._send_json(404, {'code': 20404, 'message': 'Not found', 'status': 404})
+
+        form = {key: values[0] for key, values in parse_qs(request._body().decode()).items()}
+        time.sleep(self._delay(self.latency, self.jitter))
+
+        if self.error_rate and random.random() < self.error_rate:
+            return request._send_json(503, {'code': 20503, 'message': 'Service unavailable', 'status': 503})
+
+        with self._lock:
+            self.sent.append({'to': form.get('To'), 'from': form.get('From'), 'body': form.get('Body'), 'at': time.time()})
+
+        account_sid = request.path.split('/Accounts/', 1)[-1].split('/', 1)[0]
+        request._send_json(201, {
+            'sid': f"SM{uuid.uuid4().hex}",
+            'account_sid': account_sid,
+            'to': form.get('To'),
+            'from': form.get('From'),
+            'body': form.get('Body'),
+            'status': 'queued',
+            'num_segments': '1',
+            'direction': 'outbound-api',
+            'api_version': '2010-04-01',
+        })
+
+    def take_sent(self):
+        """Messages received since the last call"""
+        with self._lock:
+            sent, self.sent = self.sent, []
+        return sent
+
+
+class OllamaStub(_StubServer):
+    """Generates canned replies at configurable prefill and token rates"""
+
+    def __init__(self, latency=0.0, jitter=0.0, prefill_rate=2000.0, token_rate=40.0, response_tokens=20,
+                 error_rate=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.prefill_rate = prefill_rate
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def handle(self, request):
+        if request.path not in ('/api/generate', '/api/chat'):
+            return request._send_json(404, {'error': 'not found'})
+
+        payload = json.loads(request._body() or b'{}')
+        with self._lock:
+            self.requests += 1
+
+        if self.error_rate and random.random() < self.error_rate:
+            return request._send_json(500, {'error': 'model failed to load'})
+
+        if request.path == '/api/chat':
+            prompt = ''.join(message.get('content', '') for message in payload.get('messages', []))
+        else:
+            prompt = payload.get('prompt', '')
+        prompt_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+        prefill = self._delay(self.latency, self.jitter) + prompt_tokens / self.prefill_rate
+        time.sleep(prefill)
+
+        words = ['hey', 'babe', 'sounds', 'fun', '😘'] * (self.response_tokens // 5 + 1)
+        tokens = [f"{word} " for word in words[:self.response_tokens]]
+        stats = {
+            'done': True,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(prefill * 1e9),
+            'eval_count': len(tokens),
+            'eval_duration': int(len(tokens) / self.token_rate * 1e9),
+            'load_duration': 0,
+        }
+
+        if payload.get('stream', True):
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/x-ndjson')
+            request.send_header('Transfer-Encoding', 'chunked')
+            request.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(1 / self.token_rate)
+                    self._write_chunk(request, self._chunk(request.path, payload, token, {'done': False}))
+                self._write_chunk(request, self._chunk(request.path, payload, '', stats))
+                request.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                # Client cancelled the generation
+                pass
+            return
+
+        time.sleep(len(tokens) / self.token_rate)
+        request._send_json(200, self._chunk(request.path, payload, ''.join(tokens).strip(), stats))
+
+    @staticmethod
+    def _chunk(path, payload, text, extra):
+        chunk = {'model': payload.get('model'), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        if path == '/api/chat':
+            chunk['message'] = {'role': 'assistant', 'content': text}
+        else:
+            chunk['response'] = text
+        chunk.update(extra)
+        return chunk
+
+    @staticmethod
+    def _write_chunk(request, payload):
+        data = json.dumps(payload).encode() + b'\n'
+        request.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+        request.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a Twilio or Ollama stand-in server')
+    parser.add_argument('service', choices=['twilio', 'ollama'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds before each response starts')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency is uniform in latency +/- jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--token-rate', type=float, default=40.0, help='Ollama: generated tokens per second')
+    parser.add_argument('--prefill-rate', type=float, default=2000.0, help='Ollama: prompt tokens evaluated per second')
+    parser.add_argument('--response-tokens', type=int, default=20, help='Ollama: tokens per reply')
+    args = parser.parse_args(argv)
+
+    if args.service == 'twilio':
+        stub = TwilioStub(args.latency, args.jitter, args.error_rate, host=args.host, port=args.port)
+    else:
+        stub = OllamaStub(args.latency, args.jitter, args.prefill_rate, args.token_rate, args.response_tokens,
+                          args.error_rate, host=args.host, port=args.port)
+
+    print(f"{args.service} stub listening on {stub.url}", file=sys.stderr)
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
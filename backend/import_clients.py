@@ -0,0 +1,53 @@
+# import_clients.py
+"""
+Bulk client import from the command line.
+
+    python import_clients.py contacts.csv --profile-id 3
+    python import_clients.py contacts.jsonl --profile-id 3,4 --format ndjson
+    cat contacts.csv | python import_clients.py - --profile-id 3
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from app import create_app
+from app.services.client_import import import_clients
+from app.utils.bulk_input import detect_format, FORMATS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import clients from CSV, JSON or JSON lines')
+    parser.add_argument('path', help="File to import, or - for stdin")
+    parser.add_argument('--profile-id', default='', help='Comma-separated profile ids to link imported clients to')
+    parser.add_argument('--format', choices=FORMATS, help='Input format (default: from the file extension, else csv)')
+    parser.add_argument('--chunk-size', type=int, help='Rows per insert (default: CLIENT_IMPORT_CHUNK_SIZE)')
+    parser.add_argument('--max-rows', type=int, help='Row limit (default: CLIENT_IMPORT_MAX_ROWS)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+
+    app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+    profile_ids = [int(profile_id) for profile_id in args.profile_id.split(',') if profile_id.strip()]
+    fmt = args.format or detect_format(args.path)
+
+    with app.app_context():
+        stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        try:
+            summary = import_clients(
+                stream,
+                profile_ids,
+                fmt=fmt,
+                chunk_size=args.chunk_size or app.config.get('CLIENT_IMPORT_CHUNK_SIZE', 1000),
+                max_rows=args.max_rows or app.config.get('CLIENT_IMPORT_MAX_ROWS', 100000),
+                max_errors=app.config.get('CLIENT_IMPORT_MAX_ERRORS', 100)
+            )
+        finally:
+            stream.close()
+
+    print(json.dumps(summary, indent=2))
+    return 1 if 'error' in summary else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# tests/test_api_key_cache.py
+import time
+import threading
+from datetime import datetime, timedelta
+import fakeredis
+from flask import Flask
+from app.services import api_key_cache
+from app.services.api_key_cache import ApiKeyCache, LastUsedRecorder, get_api_key_cache, invalidate_api_key
+
+
+def test_cache_hits_misses_and_invalidation():
+    cache = ApiKeyCache(ttl=30)
+    cache.set('valid', {'id': 1, 'expires_at': None})
+    cache.set('unknown', None)
+
+    assert cache.get('valid') == (True, {'id': 1, 'expires_at': None})
+    assert cache.get('unknown') == (True, None)
+    assert cache.get('never-seen') == (False, None)
+
+    cache.invalidate('valid')
+    assert cache.get('valid') == (False, None)
+
+
+def test_cached_key_stops_working_when_it_expires():
+    cache = ApiKeyCache(ttl=30)
+    cache.set('old', {'id': 1, 'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+
+    assert cache.get('old') == (True, None)
+
+
+def test_entries_expire_after_ttl():
+    cache = ApiKeyCache(ttl=0)
+    cache.set('valid', {'id': 1, 'expires_at': None})
+
+    assert cache.get('valid') == (False, None)
+
+
+def test_recorder_keeps_latest_use_per_key():
+    recorder = LastUsedRecorder()
+    first, later = datetime(2024, 1, 1), datetime(2024, 1, 2)
+    recorder.record(1, first)
+    recorder.record(1, later)
+    recorder.record(2, first)
+
+    assert len(recorder) == 2
+    assert recorder._pending[1] == later
+
+
+def test_revocation_reaches_other_processes(monkeypatch):
+    monkeypatch.setattr(api_key_cache.socketio, 'start_background_task',
+                        lambda target, *args: threading.Thread(target=target, args=args, daemon=True).start())
+    server = fakeredis.FakeServer()
+    apps = []
+    for _ in range(2):
+        app = Flask(__name__)
+        app.extensions['redis'] = fakeredis.FakeStrictRedis(server=server)
+        get_api_key_cache(app).set('key-hash', {'id': 1, 'expires_at': None})
+        apps.append(app)
+    revoking, other = apps
+
+    redis_conn = revoking.extensions['redis']
+    deadline = time.time() + 5
+    while redis_conn.pubsub_numsub(api_key_cache.CHANNEL)[0][1] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+
+    with revoking.app_context():
+        invalidate_api_key('key-hash')
+
+    assert get_api_key_cache(revoking).get('key-hash') == (False, None)
+    while get_api_key_cache(other).get('key-hash')[0] and time.time() < deadline:
+        time.sleep(0.01)
+    assert get_api_key_cache(other).get('key-hash') == (False, None)
@@ -0,0 +1,95 @@
+# tests/test_burst_coalescer.py
+import time
+import pytest
+from app.services.burst_coalescer import BurstTracker
+
+fakeredis = pytest.importorskip('fakeredis')
+
+
+@pytest.fixture
+def tracker():
+    return BurstTracker(fakeredis.FakeRedis(), window=0.3)
+
+
+def test_latest_message_replies_after_quiet_window(tracker):
+    seq = tracker.mark(1, '+15550000001')
+
+    assert 0.25 < tracker.quiet_in(1, '+15550000001', seq) <= 0.3
+    time.sleep(0.3)
+    assert tracker.quiet_in(1, '+15550000001', seq) == 0
+
+
+def test_earlier_fragment_is_superseded(tracker):
+    first = tracker.mark(1, '+15550000001')
+    tracker.mark(1, '+15550000001')
+
+    assert tracker.quiet_in(1, '+15550000001', first) is None
+    assert tracker.is_superseded(1, '+15550000001', first)
+    # Other conversations are tracked separately
+    assert tracker.mark(1, '+15550000002') == 1
+
+
+def test_burst_is_answered_once_without_holding_a_worker(tmp_path, monkeypatch):
+    from datetime import datetime, timedelta
+    from flask import Flask
+    from app.extensions import db
+    from app.models import init_models
+    from app.services import message_handler
+    from app.services.llm_service import LLMService
+    from app.services.metrics import MetricsRegistry
+    from app.services.queue_service import get_task_queue
+
+    models = init_models()
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        INBOUND_COALESCE_WINDOW=0.3,
+        QUEUE_PARTITIONS={'default': 4, 'outbound': 4},
+    )
+    app.extensions['redis'] = fakeredis.FakeRedis()
+    app.extensions['metrics'] = MetricsRegistry()
+    db.init_app(app)
+    monkeypatch.setattr(message_handler, 'emit_to_profile', lambda *args, **kwargs: None)
+
+    prompts = []
+
+    def generate_response(self, profile, message, sender_number, conversation_history=None, should_cancel=None):
+        prompts.append((message, [item.content for item in conversation_history]))
+        return 'Hey you'
+
+    monkeypatch.setattr(LLMService, 'generate_response', generate_response)
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        profile = models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000', ai_enabled=True)
+        db.session.add(profile)
+        db.session.flush()
+        earlier = datetime.utcnow() - timedelta(minutes=5)
+        db.session.add_all([
+            models['Message'](profile_id=profile.id, sender_number='+15551000001', content='hello',
+                              is_incoming=True, timestamp=earlier),
+            models['Message'](profile_id=profile.id, sender_number='+15551000001', content='hi there',
+                              is_incoming=False, timestamp=earlier + timedelta(seconds=1)),
+        ])
+        db.session.commit()
+
+        tracker = message_handler.get_burst_tracker()
+        seqs = [tracker.mark(profile.id, '+15551000001') for _ in range(2)]
+        started = time.time()
+        for seq, text in zip(seqs, ['are you', 'free tonight']):
+            assert message_handler.handle_incoming_message(profile.id, text, '+15551000001',
+                                                           {'burst_seq': seq}) is None
+        assert time.time() - started < 0.25
+        assert prompts == []
+
+        time.sleep(0.3)
+        assert get_task_queue().process_queue() == 1
+
+    assert prompts == [('are you\nfree tonight', ['hello', 'hi there'])]
+    totals = app.extensions['metrics'].totals()
+    assert totals['replies_total{outcome="coalesced"}'] == 1
+    assert totals['replies_total{outcome="deferred"}'] == 1
+    assert totals['replies_total{outcome="ai"}'] == 1
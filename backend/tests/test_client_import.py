@@ -0,0 +1,84 @@
+# tests/test_client_import.py
+import io
+import json
+import pytest
+from flask import Flask
+from app.extensions import db
+from app.services import client_import
+
+
+@pytest.fixture
+def app_context():
+    from app.models import init_models
+    models = init_models()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[models['Client'].__table__, models['ProfileClient'].__table__])
+        yield models
+        db.session.remove()
+
+
+def csv_stream(*lines):
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def test_normalize_batch_parses_each_distinct_number_once(monkeypatch):
+    calls = []
+    client_import.normalize_phone_cached.cache_clear()
+    monkeypatch.setattr(client_import, 'normalize_phone_number', lambda raw: calls.append(raw) or '+12125551234')
+
+    result = client_import.normalize_phone_batch(['212-555-1234'] * 3 + [None])
+    client_import.normalize_phone_batch(['212-555-1234'])
+    client_import.normalize_phone_cached.cache_clear()
+
+    assert result == ['+12125551234'] * 3 + [None]
+    assert calls == ['212-555-1234']
+
+
+def test_import_dedupes_reports_errors_and_links_profiles(app_context):
+    Client, ProfileClient = app_context['Client'], app_context['ProfileClient']
+    db.session.add(Client(phone_number='+12125550000', name='Existing'))
+    db.session.commit()
+
+    summary = client_import.import_clients(csv_stream(
+        "Phone,Name,is_regular",
+        "(212) 555-1234,Alice,yes",
+        "+1 212 555 1234,Alice again,",
+        "+12125550000,Renamed,",
+        "not a number,Bob,",
+        ",Nobody,",
+    ), profile_ids=[1, 2], chunk_size=2)
+
+    assert summary['total_rows'] == 5
+    assert summary['created'] == 1
+    assert summary['existing'] == 1
+    assert summary['duplicates'] == 1
+    assert summary['invalid'] == 2
+    assert [error['row'] for error in summary['errors']] == [4, 5]
+    assert summary['associated'] == 4
+
+    alice = Client.query.filter_by(phone_number='+12125551234').one()
+    assert alice.name == 'Alice' and alice.is_regular
+    assert Client.query.filter_by(phone_number='+12125550000').one().name == 'Existing'
+    assert ProfileClient.query.count() == 4
+
+    # Re-importing adds nothing
+    summary = client_import.import_clients(csv_stream("phone", "2125551234"), profile_ids=[1])
+    assert (summary['created'], summary['existing'], summary['associated']) == (0, 1, 0)
+
+
+def test_json_formats_and_row_limit(app_context):
+    rows = [{'phone_number': f'+1212555{i:04d}'} for i in range(3)]
+
+    ndjson = io.BytesIO("\n".join(json.dumps(row) for row in rows).encode())
+    assert client_import.import_clients(ndjson, [], fmt='ndjson')['created'] == 3
+
+    summary = client_import.import_clients(io.BytesIO(json.dumps(rows).encode()), [], fmt='json', max_rows=2)
+    assert summary['total_rows'] == 2
+    assert summary['errors'][0]['row'] == 3
+
+    summary = client_import.import_clients(io.BytesIO(b'{"phone": 1}'), [], fmt='json')
+    assert 'error' in summary
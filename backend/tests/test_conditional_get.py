@@ -0,0 +1,141 @@
+# tests/test_conditional_get.py
+import pytest
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app.extensions import db, jwt
+from app.models import init_models
+from app.services.metrics import MetricsRegistry
+from app.services.response_versions import register_version_hooks, bump_versions
+
+
+@pytest.fixture
+def dashboard(tmp_path):
+    fakeredis = pytest.importorskip('fakeredis')
+    models = init_models()
+    from app.api.messages import messages_bp
+    from app.api.profiles import profiles_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        JWT_SECRET_KEY='test-secret-key-with-enough-length',
+    )
+    app.extensions['redis'] = fakeredis.FakeRedis()
+    app.extensions['metrics'] = MetricsRegistry()
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(messages_bp, url_prefix='/api/messages')
+    app.register_blueprint(profiles_bp, url_prefix='/api/profiles')
+    register_version_hooks()
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        profile = models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000')
+        db.session.add(profile)
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=user.id)}"}
+        profile_id = profile.id
+
+    yield app, headers, profile_id, models
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def get(app, path, headers, etag=None):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = app.test_client().get(path, headers={**headers, **({'If-None-Match': etag} if etag else {})})
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return response, len(statements)
+
+
+def test_unchanged_responses_are_304_without_queries(dashboard):
+    app, headers, profile_id, models = dashboard
+    path = f"/api/messages/conversations/{profile_id}"
+
+    first, _ = get(app, path, headers)
+    assert first.status_code == 200 and first.headers['ETag']
+
+    again, queries = get(app, path, headers, first.headers['ETag'])
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert queries == 0
+    assert app.extensions['metrics'].totals()['conditional_get_total{result="not_modified"}'] == 1
+
+
+def test_committed_writes_change_the_etag(dashboard):
+    app, headers, profile_id, models = dashboard
+    path = f"/api/messages/profile/{profile_id}"
+    etag = get(app, path, headers)[0].headers['ETag']
+
+    with app.app_context():
+        db.session.add(models['Message'](profile_id=profile_id, sender_number='+15551000001', content='hi',
+                                         is_incoming=True))
+        db.session.flush()
+        db.session.rollback()
+    assert get(app, path, headers, etag)[0].status_code == 304
+
+    with app.app_context():
+        db.session.add(models['Message'](profile_id=profile_id, sender_number='+15551000001', content='hi',
+                                         is_incoming=True))
+        db.session.commit()
+    changed, _ = get(app, path, headers, etag)
+    assert changed.status_code == 200
+    assert changed.get_json()['total'] == 1
+    assert changed.headers['ETag'] != etag
+
+    # Other scopes are untouched; bulk updates bump explicitly
+    profiles_etag = get(app, '/api/profiles', headers)[0].headers['ETag']
+    assert get(app, '/api/profiles', headers, profiles_etag)[0].status_code == 304
+    with app.app_context():
+        user_id = db.session.get(models['Profile'], profile_id).user_id
+        bump_versions([f"profiles:{user_id}"])
+    assert get(app, '/api/profiles', headers, profiles_etag)[0].status_code == 200
+
+
+def test_no_etag_without_redis(dashboard):
+    app, headers, profile_id, models = dashboard
+    app.extensions['redis'] = None
+
+    response, _ = get(app, '/api/profiles', headers)
+
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+
+def test_client_names_change_only_their_profiles_conversations(dashboard):
+    app, headers, profile_id, models = dashboard
+    path = f"/api/messages/conversations/{profile_id}"
+    with app.app_context():
+        db.session.add(models['Message'](profile_id=profile_id, sender_number='+15551000001', content='hi',
+                                         is_incoming=True))
+        db.session.commit()
+    etag = get(app, path, headers)[0].headers['ETag']
+
+    # A client created on a first text, and a named client of another tenant
+    with app.app_context():
+        db.session.add(models['Client'](phone_number='+15551000001'))
+        db.session.add(models['Client'](phone_number='+15559000009', name='Elsewhere'))
+        db.session.commit()
+    assert get(app, path, headers, etag)[0].status_code == 304
+
+    with app.app_context():
+        models['Client'].query.filter_by(phone_number='+15551000001').one().name = 'Sam'
+        db.session.commit()
+    renamed, _ = get(app, path, headers, etag)
+    assert renamed.status_code == 200
+    assert renamed.headers['ETag'] != etag
@@ -0,0 +1,137 @@
+# tests/test_db_routing.py
+import pytest
+import sqlalchemy as sa
+from flask import Flask, g
+from app.extensions import db
+from app.models import init_models
+from app.services.metrics import get_metrics
+from app.utils import db_routing
+from app.utils.db_routing import (
+    InstrumentedQueuePool, ReplicaRouter, configure_engine_options, engine_options, init_read_replicas, read_replica,
+)
+
+
+@pytest.fixture
+def routed_app(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_routing, '_local_writes', {})
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 1},
+        DB_READ_REPLICA_URLS=[f"sqlite:///{tmp_path / 'replica.db'}"],
+    )
+    User = init_models()['User']
+    configure_engine_options(app)
+    db.init_app(app)
+    init_read_replicas(app)
+
+    # The same table on both, with a different row on each so reads show where they went
+    with app.app_context():
+        for engine, username in ((db.engine, 'primary'), (app.extensions['db_replicas'].replicas[0][1], 'replica')):
+            db.metadata.create_all(engine, tables=[User.__table__])
+            with engine.begin() as conn:
+                conn.execute(User.__table__.insert().values(username=username, email=f'{username}@example.com',
+                                                            password_hash='-'))
+    return app, User
+
+
+def first_username(User):
+    return db.session.execute(sa.select(User.username)).scalar()
+
+
+def test_engine_options_per_database():
+    config = {'SQLALCHEMY_ENGINE_OPTIONS': {'pool_size': 5, 'pool_recycle': 60}, 'DB_STATEMENT_TIMEOUT_MS': 2000}
+
+    memory = engine_options(config, 'sqlite://')
+    assert 'pool_size' not in memory and 'poolclass' not in memory
+
+    postgres = engine_options(config, 'postgresql://localhost/app')
+    assert postgres['poolclass'] is InstrumentedQueuePool and postgres['pool_size'] == 5
+    assert postgres['connect_args'] == {'options': '-c statement_timeout=2000'}
+
+
+def test_read_replica_views_read_from_replica_until_they_write(routed_app, monkeypatch):
+    app, User = routed_app
+    monkeypatch.setattr(db_routing, '_current_user_id', lambda: 7)
+
+    @read_replica
+    def view():
+        before = first_username(User)
+        db.session.get(User, 1).first_name = 'Ann'
+        db.session.commit()
+        return before, first_username(User)
+
+    with app.test_request_context():
+        assert first_username(User) == 'primary'
+        assert view() == ('replica', 'primary')
+        db.session.remove()
+
+    # The user just wrote, so their next request reads from the primary too
+    with app.test_request_context():
+        assert view() == ('primary', 'primary')
+        assert g.db_replica is None
+        db.session.remove()
+
+    totals = get_metrics(app).totals()
+    assert totals['db_read_routing_total{route="replica"}'] == 1
+    assert totals['db_read_routing_total{route="recent_write"}'] == 1
+
+
+def test_new_etags_for_recent_changes_are_read_from_the_primary(routed_app, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    import flask_jwt_extended
+    from app.services.response_versions import bump_versions, conditional
+
+    app, User = routed_app
+    app.extensions['redis'] = fakeredis.FakeRedis()
+    monkeypatch.setattr(flask_jwt_extended, 'get_jwt_identity', lambda: 7)
+
+    @app.route('/me')
+    @conditional(lambda user_id: [f"profiles:{user_id}"])
+    @read_replica
+    def me():
+        return first_username(User)
+
+    # The replica is behind: it hasn't replayed the write the new version stands for
+    with app.app_context():
+        bump_versions(['profiles:7'])
+    client = app.test_client()
+    fresh = client.get('/me')
+    assert fresh.get_data(as_text=True) == 'primary'
+    assert client.get('/me', headers={'If-None-Match': fresh.headers['ETag']}).status_code == 304
+
+    # Once every replica within the lag limit must have it, the replica serves it again
+    app.extensions['redis'].delete('version:profiles:7:changed')
+    assert client.get('/me').get_data(as_text=True) == 'replica'
+
+    totals = get_metrics(app).totals()
+    assert totals['db_read_routing_total{route="recent_change"}'] == 1
+    assert totals['db_read_routing_total{route="replica"}'] == 1
+
+
+def test_lagging_replicas_are_skipped(monkeypatch):
+    lags = {'replica_0': 30.0, 'replica_1': 0.5}
+    router = ReplicaRouter([('replica_0', 'a'), ('replica_1', 'b')], max_lag=5.0)
+    monkeypatch.setattr(router, '_measure', lambda engine: lags['replica_0' if engine == 'a' else 'replica_1'])
+
+    assert [router.pick() for _ in range(3)] == [('replica_1', 'b')] * 3
+
+    lags['replica_1'] = 60.0
+    router._lags.clear()
+    assert router.pick() is None
+
+
+def test_pool_records_checkout_wait_and_timeouts(routed_app):
+    app, User = routed_app
+    with app.app_context():
+        engine = db.engine
+        held = [engine.connect(), engine.connect()]
+        with pytest.raises(sa.exc.TimeoutError):
+            engine.connect()
+        for conn in held:
+            conn.close()
+
+    totals = get_metrics(app).totals()
+    assert totals['db_pool_checkout_seconds_count{bind="primary"}'] >= 2
+    assert totals['db_pool_utilization_bucket{bind="primary",le="1.0"}'] >= 2
+    assert totals['db_pool_timeouts_total{bind="primary"}'] == 1
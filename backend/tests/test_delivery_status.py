@@ -0,0 +1,53 @@
+# tests/test_delivery_status.py
+import pytest
+from app.services.delivery_status import DeliveryStatusBuffer, collapse_receipts
+
+
+def test_buffer_drains_in_order_and_in_batches():
+    buffer = DeliveryStatusBuffer()
+    for i in range(5):
+        buffer.add(f'SM{i}', 'delivered')
+
+    _, first = buffer.drain(3)
+    assert [r['sid'] for r in first] == ['SM0', 'SM1', 'SM2']
+    assert len(buffer) == 2
+
+    _, rest = buffer.drain(10)
+    assert [r['sid'] for r in rest] == ['SM3', 'SM4']
+    assert buffer.drain(10) == (None, [])
+
+
+def test_unacked_batches_return_to_the_buffer():
+    fakeredis = pytest.importorskip('fakeredis')
+    redis_conn = fakeredis.FakeRedis()
+    for i in range(4):
+        DeliveryStatusBuffer(redis_conn).add(f'SM{i}', 'delivered')
+
+    # A flusher takes a batch and dies before applying it
+    crashed = DeliveryStatusBuffer(redis_conn, lease_seconds=0)
+    batch, receipts = crashed.drain(2)
+    assert [r['sid'] for r in receipts] == ['SM0', 'SM1']
+    assert len(crashed) == 2
+
+    buffer = DeliveryStatusBuffer(redis_conn)
+    batch, receipts = buffer.drain(10)
+    assert [r['sid'] for r in receipts] == ['SM0', 'SM1', 'SM2', 'SM3']
+
+    buffer.ack(batch)
+    assert buffer.drain(10) == (None, [])
+    assert redis_conn.keys('delivery_status:*') == []
+
+
+def test_collapse_keeps_most_advanced_status():
+    receipts = [
+        {'sid': 'SM1', 'status': 'delivered', 'error_code': None, 'attempts': 0},
+        {'sid': 'SM1', 'status': 'sent', 'error_code': None, 'attempts': 0},  # late, out of order
+        {'sid': 'SM2', 'status': 'sent', 'error_code': None, 'attempts': 0},
+        {'sid': 'SM2', 'status': 'undelivered', 'error_code': '30003', 'attempts': 0},
+    ]
+
+    collapsed = {r['sid']: r for r in collapse_receipts(receipts)}
+
+    assert collapsed['SM1']['status'] == 'delivered'
+    assert collapsed['SM2']['status'] == 'undelivered'
+    assert collapsed['SM2']['error_code'] == '30003'
@@ -0,0 +1,90 @@
+# tests/test_example_index.py
+import time
+import pytest
+from flask import Flask
+from app.extensions import db
+
+np = pytest.importorskip('numpy')
+
+from app.services.example_index import Example, ExampleIndex, ExampleIndexCache  # noqa: E402
+
+EXAMPLES = [
+    "hey babe how's your night going",
+    "i'm free tonight after 9 if you want to chat",
+    "sorry hun, busy all weekend",
+    "my rates are on my website",
+    "heyyy you 😘",
+    "thanks for the lovely evening",
+]
+
+
+def build(texts=EXAMPLES, dims=512):
+    index = ExampleIndex(dims)
+    index.add([Example(i + 1, text, False) for i, text in enumerate(texts)])
+    return index
+
+
+def test_top_k_prefers_similar_examples():
+    index = build()
+
+    assert [e.content for e in index.top_k("are you free tonight?", k=1)] == [EXAMPLES[1]]
+    assert [e.content for e in index.top_k("what are your rates", k=1)] == [EXAMPLES[3]]
+    # Character trigrams match stretched spellings
+    assert EXAMPLES[4] in [e.content for e in index.top_k("heyyyy", k=2)]
+
+
+def test_top_k_keeps_original_order_and_falls_back_to_newest():
+    index = build()
+
+    picked = index.top_k("busy tonight weekend", k=3)
+    assert [e.id for e in picked] == sorted(e.id for e in picked)
+    assert index.top_k("   ", k=2) == index.examples[-2:]
+    assert len(index.top_k("anything", k=10)) == len(EXAMPLES)
+
+
+def test_adding_examples_refreshes_the_weights():
+    index = build(EXAMPLES[:3])
+    index.top_k("warm up", k=1)
+    index.add([Example(len(EXAMPLES) + i, text, False) for i, text in enumerate(EXAMPLES[3:])])
+
+    fresh = build()
+    for message in ("what are your rates", "heyyyy", "lovely evening"):
+        assert [e.content for e in index.top_k(message, k=2)] == [e.content for e in fresh.top_k(message, k=2)]
+
+
+def test_selection_is_fast_on_large_index():
+    index = build([f"{EXAMPLES[i % len(EXAMPLES)]} number {i}" for i in range(5000)])
+    index.top_k("warm up", k=5)
+
+    started = time.perf_counter()
+    for _ in range(20):
+        index.top_k("are you free tonight after work?", k=5, history="hey\nhow are you")
+    assert (time.perf_counter() - started) / 20 < 0.01
+
+
+def test_cache_appends_new_examples_and_rebuilds_after_deletes():
+    from app.models import init_models
+    TextExample = init_models()['TextExample']
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[TextExample.__table__])
+        cache = ExampleIndexCache(refresh_interval=0)
+
+        db.session.add_all([TextExample(profile_id=1, content=text) for text in EXAMPLES[:3]])
+        db.session.commit()
+        first = cache.get(1)
+        assert len(first) == 3
+
+        db.session.add(TextExample(profile_id=1, content=EXAMPLES[3]))
+        db.session.commit()
+        assert cache.get(1) is first and len(first) == 4
+
+        TextExample.query.filter_by(content=EXAMPLES[0]).delete()
+        db.session.commit()
+        rebuilt = cache.get(1)
+        assert rebuilt is not first
+        assert [e.content for e in rebuilt.examples] == EXAMPLES[1:4]
+        db.session.remove()
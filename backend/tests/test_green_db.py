@@ -0,0 +1,48 @@
+# tests/test_green_db.py
+import pytest
+from flask import Flask
+from app.utils import green_db
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://localhost/test'
+    return app
+
+
+def test_not_enabled_outside_eventlet(app, monkeypatch):
+    monkeypatch.setattr(green_db, 'eventlet_active', lambda: False)
+
+    assert green_db.init_green_db(app) is False
+    assert app.extensions['green_db'] is False
+
+
+def test_enabled_under_eventlet(app, monkeypatch):
+    extensions = pytest.importorskip('psycopg2.extensions')
+    monkeypatch.setattr(green_db, 'eventlet_active', lambda: True)
+    try:
+        assert green_db.init_green_db(app) is True
+        assert extensions.get_wait_callback() is green_db._eventlet_wait_callback
+    finally:
+        extensions.set_wait_callback(None)
+
+
+def test_require_refuses_blocking_io(app, monkeypatch):
+    app.config['DB_GREEN_IO'] = 'require'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
+    monkeypatch.setattr(green_db, 'eventlet_active', lambda: True)
+
+    with pytest.raises(RuntimeError):
+        green_db.init_green_db(app)
+
+
+def test_require_stops_create_app(monkeypatch):
+    from app import create_app
+    from app.config import config
+    monkeypatch.setattr(config['development'], 'DB_GREEN_IO', 'require', raising=False)
+    monkeypatch.setattr(config['development'], 'SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    monkeypatch.setattr(green_db, 'eventlet_active', lambda: True)
+
+    with pytest.raises(RuntimeError):
+        create_app('development')
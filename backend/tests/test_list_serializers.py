@@ -0,0 +1,118 @@
+# tests/test_list_serializers.py
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app.extensions import db, jwt
+from app.models import init_models
+
+MESSAGES_PER_CLIENT = 20
+
+
+@pytest.fixture
+def client_app(tmp_path):
+    models = init_models()
+    from app.api.messages import messages_bp
+    from app.api.clients import clients_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        JWT_SECRET_KEY='test-secret-key-with-enough-length',
+    )
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(messages_bp, url_prefix='/api/messages')
+    app.register_blueprint(clients_bp, url_prefix='/api/clients')
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        profile = models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000')
+        db.session.add(profile)
+        db.session.flush()
+
+        started = datetime(2024, 1, 1)
+        # The second client's conversation is the more recent one
+        for hour, number in enumerate(('+15551000001', '+15551000002')):
+            db.session.add(models['Client'](phone_number=number, name=f"Client {number[-1]}"))
+            for index in range(MESSAGES_PER_CLIENT):
+                db.session.add(models['Message'](
+                    profile_id=profile.id, sender_number=number, content=f"message {index}",
+                    is_incoming=index % 2 == 0, is_read=index < 10,
+                    timestamp=started + timedelta(hours=hour, minutes=index),
+                ))
+        db.session.flush()
+        first = models['Message'].query.order_by(models['Message'].id).first()
+        db.session.add_all([models['FlaggedMessage'](message_id=first.id) for _ in range(2)])
+        db.session.commit()
+
+        token = create_access_token(identity=user.id)
+        ids = {'profile': profile.id, 'client': models['Client'].query.first().id, 'flagged': first.id}
+
+    yield app, {'Authorization': f"Bearer {token}"}, ids
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def count_queries(app, path, headers):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = app.test_client().get(path, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements), response.get_json()
+
+
+@pytest.mark.parametrize('path, queries', [
+    ('/api/messages/profile/{profile}?limit=40', 3),
+    ('/api/messages/conversation/{profile}/+15551000001', 2),
+    ('/api/messages/conversations/{profile}', 2),
+    ('/api/clients/{client}/messages?per_page=40', 3),
+])
+def test_list_endpoints_use_a_fixed_number_of_queries(client_app, path, queries):
+    app, headers, ids = client_app
+
+    count, _ = count_queries(app, path.format(**ids), headers)
+
+    assert count == queries
+
+
+def test_projected_messages_match_to_dict(client_app):
+    app, headers, ids = client_app
+
+    _, body = count_queries(app, f"/api/messages/profile/{ids['profile']}?limit=40", headers)
+
+    assert body['total'] == 2 * MESSAGES_PER_CLIENT
+    by_id = {message['id']: message for message in body['messages']}
+    with app.app_context():
+        from app.models.message import Message
+        for message in Message.query.all():
+            assert by_id[message.id] == message.to_dict()
+    assert by_id[ids['flagged']]['is_flagged'] is True
+
+
+def test_conversations_summarize_each_client(client_app):
+    app, headers, ids = client_app
+
+    _, conversations = count_queries(app, f"/api/messages/conversations/{ids['profile']}", headers)
+
+    assert [conversation['client_number'] for conversation in conversations] == ['+15551000002', '+15551000001']
+    assert conversations[0]['client_name'] == 'Client 2'
+    assert conversations[0]['latest_message']['content'] == f"message {MESSAGES_PER_CLIENT - 1}"
+    # Unread incoming messages: even indexes from 10 up
+    assert conversations[0]['unread_count'] == 5
@@ -0,0 +1,66 @@
+# tests/test_load_harness.py
+import os
+import json
+import importlib.util
+import requests
+from twilio.request_validator import RequestValidator
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'webhook_load.py')
+
+spec = importlib.util.spec_from_file_location('webhook_load_benchmark', BENCHMARK)
+webhook_load = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(webhook_load)
+
+from benchmarks.stubs import TwilioStub, OllamaStub  # noqa: E402
+
+
+def test_signature_matches_twilio_validator():
+    url = 'http://127.0.0.1:5000/api/webhooks/sms'
+    params = {'From': '+15551000001', 'To': '+15550000000', 'Body': 'hey 😘', 'AccountSid': webhook_load.ACCOUNT_SID}
+
+    signature = webhook_load.sign(url, params, 'secret')
+
+    assert RequestValidator('secret').validate(url, params, signature)
+    assert not RequestValidator('other').validate(url, params, signature)
+
+
+def test_twilio_stub_records_sent_messages():
+    with TwilioStub(latency=0) as twilio:
+        response = requests.post(
+            f"{twilio.url}/2010-04-01/Accounts/AC123/Messages.json",
+            data={'To': '+15551000001', 'From': '+15550000000', 'Body': 'hi'},
+        )
+
+        assert response.status_code == 201
+        assert response.json()['account_sid'] == 'AC123'
+        sent = twilio.take_sent()
+        assert [(message['to'], message['body']) for message in sent] == [('+15551000001', 'hi')]
+        assert twilio.take_sent() == []
+
+
+def test_ollama_stub_streams_tokens_and_reports_stats():
+    with OllamaStub(token_rate=1000, response_tokens=5) as ollama:
+        response = requests.post(f"{ollama.url}/api/generate",
+                                 json={'model': 'test', 'prompt': 'x' * 400}, stream=True)
+        chunks = [json.loads(line) for line in response.iter_lines() if line]
+
+        assert len(chunks) == 6
+        assert ''.join(chunk['response'] for chunk in chunks).split() == ['hey', 'babe', 'sounds', 'fun', '😘']
+        assert chunks[-1]['done'] and chunks[-1]['prompt_eval_count'] == 100 and chunks[-1]['eval_count'] == 5
+
+        response = requests.post(f"{ollama.url}/api/chat", json={
+            'model': 'test', 'stream': False, 'messages': [{'role': 'user', 'content': 'hello'}],
+        })
+        assert response.json()['message']['content'] == 'hey babe sounds fun 😘'
+        assert ollama.requests == 2
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {'webhook_ms': {'p50': 10.0, 'p99': 100.0}, 'reply_ms': {'p99': 1000.0},
+                'error_rate': 0.0, 'replies_per_second': 20.0}
+    results = {'webhook_ms': {'p50': 11.0, 'p99': 150.0}, 'reply_ms': {'p99': 900.0},
+               'error_rate': 0.0, 'replies_per_second': 12.0}
+
+    regressions = webhook_load.compare(results, baseline, tolerance=0.2)
+
+    assert regressions == ['webhook_ms.p99: 150.0 > 100.0', 'replies_per_second: 12.0 < 20.0']
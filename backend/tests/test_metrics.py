@@ -0,0 +1,109 @@
+# tests/test_metrics.py
+import json
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from app.extensions import db
+from app.services.metrics import MetricsRegistry, render, get_metrics
+from app.services.reply_trace import start_trace, stage, finish_trace, record_llm_stats, register_db_timing
+
+
+def test_histogram_buckets_are_cumulative_and_rendered():
+    registry = MetricsRegistry()
+    registry.observe('reply_stage_seconds', 0.2, stage='llm')
+    registry.observe('reply_stage_seconds', 3.0, stage='llm')
+    registry.inc('replies_total', outcome='ai')
+
+    totals = registry.totals()
+    assert totals['reply_stage_seconds_bucket{stage="llm",le="0.1"}'] == 0
+    assert totals['reply_stage_seconds_bucket{stage="llm",le="0.25"}'] == 1
+    assert totals['reply_stage_seconds_bucket{stage="llm",le="5.0"}'] == 2
+    assert totals['reply_stage_seconds_bucket{stage="llm",le="+Inf"}'] == 2
+    assert totals['reply_stage_seconds_count{stage="llm"}'] == 2
+
+    output = render(totals)
+    assert '# TYPE reply_stage_seconds histogram' in output
+    assert 'reply_stage_seconds_sum{stage="llm"} 3.2' in output
+    assert 'replies_total{outcome="ai"} 1' in output
+    lines = [line for line in output.splitlines() if line.startswith('reply_stage_seconds_bucket')]
+    assert lines[-1].endswith('le="+Inf"} 2')
+
+
+def test_flushes_from_several_processes_add_up():
+    fakeredis = pytest.importorskip('fakeredis')
+    redis_conn = fakeredis.FakeRedis()
+
+    web, worker = MetricsRegistry(), MetricsRegistry()
+    web.observe('reply_stage_seconds', 0.01, stage='webhook')
+    worker.observe('reply_stage_seconds', 0.5, stage='llm')
+    worker.observe('reply_stage_seconds', 0.7, stage='llm')
+    assert web.flush(redis_conn) and worker.flush(redis_conn)
+    assert worker.flush(redis_conn) == 0
+
+    shared = {k.decode(): float(v) for k, v in redis_conn.hgetall('metrics').items()}
+    assert shared['reply_stage_seconds_count{stage="llm"}'] == 2
+    assert shared['reply_stage_seconds_count{stage="webhook"}'] == 1
+
+
+@pytest.fixture
+def traced_app():
+    from app.models import init_models
+    Message = init_models()['Message']
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['REPLY_TIMINGS_PERSIST'] = True
+    db.init_app(app)
+    register_db_timing()
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[Message.__table__])
+        yield app, Message
+        db.session.remove()
+
+
+def test_trace_collects_stages_and_stores_them_on_the_reply(traced_app):
+    app, Message = traced_app
+    reply = Message(profile_id=1, sender_number='+15550001111', content='hi', is_incoming=False)
+    db.session.add(reply)
+    db.session.commit()
+
+    with start_trace() as trace:
+        with stage('rules'):
+            pass
+        db.session.execute(text('SELECT 1'))
+        record_llm_stats({'prompt_eval_count': 312, 'eval_count': 24, 'eval_duration': 480000000}, 'dolphin3')
+        trace.outcome = 'ai'
+        finish_trace(trace, reply)
+
+    assert set(trace.stages) == {'rules', 'db'}
+    timings = json.loads(db.session.get(Message, reply.id).timings)
+    assert timings['outcome'] == 'ai'
+    assert timings['llm'] == {'prompt_eval_count': 312, 'eval_count': 24, 'eval_duration': 0.48}
+
+    totals = get_metrics(app).totals()
+    assert totals['reply_stage_seconds_count{stage="rules"}'] == 1
+    assert totals['llm_prompt_tokens_sum{model="dolphin3"}'] == 312
+    assert totals['replies_total{outcome="ai"}'] == 1
+
+    # Outside a trace a stage is observed on its own, and queries aren't timed
+    with stage('twilio_send'):
+        db.session.execute(text('SELECT 1'))
+    totals = get_metrics(app).totals()
+    assert totals['reply_stage_seconds_count{stage="twilio_send"}'] == 1
+    assert totals['reply_stage_seconds_count{stage="db"}'] == 1
+
+
+def test_metrics_endpoint_requires_token_when_set():
+    from app.api.metrics import metrics_bp
+
+    app = Flask(__name__)
+    app.config['METRICS_TOKEN'] = 'secret'
+    app.register_blueprint(metrics_bp, url_prefix='/metrics')
+    with app.app_context():
+        get_metrics(app).inc('replies_total', outcome='fallback')
+
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'replies_total{outcome="fallback"} 1' in response.get_data(as_text=True)
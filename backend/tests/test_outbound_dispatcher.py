@@ -0,0 +1,190 @@
+# tests/test_outbound_dispatcher.py
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from twilio.base.exceptions import TwilioRestException
+from app.extensions import db
+from app.models import init_models
+from app.services import outbound_dispatcher
+from app.services.metrics import MetricsRegistry
+from app.services.outbound_dispatcher import (
+    SendThrottle, is_retryable_error, backoff_delay, deliver_message, queue_outbound_message,
+)
+from app.utils import twilio_helpers
+
+
+@pytest.fixture
+def outbound_app(tmp_path, monkeypatch):
+    models = init_models()
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        OUTBOUND_MAX_RETRIES=2,
+    )
+    app.extensions['redis'] = None
+    app.extensions['metrics'] = MetricsRegistry()
+    db.init_app(app)
+
+    statuses = []
+    monkeypatch.setattr(outbound_dispatcher, 'emit_to_profile',
+                        lambda profile_id, event, data, **kwargs: statuses.append(data['send_status']))
+    monkeypatch.setattr(outbound_dispatcher.time, 'sleep', lambda seconds: None)
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        profile = models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000')
+        db.session.add(profile)
+        db.session.flush()
+        message = models['Message'](profile_id=profile.id, sender_number='+15551000001', content='hi',
+                                    is_incoming=False, send_status='queued')
+        db.session.add(message)
+        db.session.commit()
+        message_id = message.id
+
+    yield app, models, message_id, statuses
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def twilio_sender(monkeypatch, *outcomes):
+    """Make send_sms raise or return each outcome in turn, recording the calls"""
+    calls = []
+
+    def send_sms(**kwargs):
+        outcome = outcomes[len(calls)]
+        calls.append(kwargs)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(sid=outcome)
+
+    monkeypatch.setattr(twilio_helpers, 'send_sms', send_sms)
+    return calls
+
+
+def test_number_bucket_allows_burst_then_waits():
+    throttle = SendThrottle(number_rate=1.0, number_burst=2, account_rate=100.0, account_burst=100)
+
+    assert throttle.reserve('+15550000001', 'AC1') == 0
+    assert throttle.reserve('+15550000001', 'AC1') == 0
+
+    wait = throttle.reserve('+15550000001', 'AC1')
+    assert 0 < wait <= 1.0
+
+
+def test_buckets_are_per_sender_number():
+    throttle = SendThrottle(number_rate=1.0, number_burst=1, account_rate=100.0, account_burst=100)
+
+    assert throttle.reserve('+15550000001', 'AC1') == 0
+    assert throttle.reserve('+15550000002', 'AC1') == 0
+    assert throttle.reserve('+15550000001', 'AC1') > 0
+
+
+def test_account_bucket_limits_all_numbers():
+    throttle = SendThrottle(number_rate=10.0, number_burst=10, account_rate=1.0, account_burst=2)
+
+    assert throttle.reserve('+15550000001', 'AC1') == 0
+    assert throttle.reserve('+15550000002', 'AC1') == 0
+    assert throttle.reserve('+15550000003', 'AC1') > 0
+    # A different account has its own bucket
+    assert throttle.reserve('+15550000003', 'AC2') == 0
+
+
+def test_in_flight_slots_are_bounded():
+    throttle = SendThrottle(max_in_flight=1)
+
+    lease = throttle.acquire_slot()
+    assert lease is not None
+    assert throttle.acquire_slot(timeout=0.01) is None
+
+    throttle.release_slot(lease)
+    assert throttle.acquire_slot(timeout=0.01) is not None
+
+
+@pytest.mark.parametrize('status, code, expected', [
+    (429, 20429, True),
+    (503, 20503, True),
+    (400, 21211, False),  # Invalid 'To' number
+    (401, 20003, False),  # Authentication error
+])
+def test_retryable_twilio_errors(status, code, expected):
+    error = TwilioRestException(status, '/Messages.json', code=code)
+    assert is_retryable_error(error) is expected
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base_delay=0.5, max_delay=4.0)
+        assert 0 <= delay <= 4.0
+
+
+def test_retryable_errors_are_retried_until_sent(outbound_app, monkeypatch):
+    app, models, message_id, statuses = outbound_app
+    calls = twilio_sender(monkeypatch, TwilioRestException(503, '/Messages.json', code=20503), 'SM1')
+
+    with app.app_context():
+        assert deliver_message(message_id) == 'sent'
+        message = db.session.get(models['Message'], message_id)
+        assert (message.send_status, message.twilio_sid, message.send_error) == ('sent', 'SM1', None)
+
+    assert len(calls) == 2
+    assert statuses == ['sending', 'sent']
+
+
+def test_non_retryable_errors_fail_without_retrying(outbound_app, monkeypatch):
+    app, models, message_id, statuses = outbound_app
+    calls = twilio_sender(monkeypatch, TwilioRestException(400, '/Messages.json', msg='Invalid To', code=21211))
+
+    with app.app_context():
+        assert deliver_message(message_id) == 'failed'
+        message = db.session.get(models['Message'], message_id)
+        assert message.send_status == 'failed' and 'Invalid To' in message.send_error
+
+    assert len(calls) == 1
+    assert statuses == ['sending', 'failed']
+
+
+def test_duplicate_tasks_do_not_send_again(outbound_app, monkeypatch):
+    app, models, message_id, statuses = outbound_app
+    calls = twilio_sender(monkeypatch, 'SM1', 'SM2')
+
+    with app.app_context():
+        assert deliver_message(message_id) == 'sent'
+        assert deliver_message(message_id) == 'sent'
+        assert db.session.get(models['Message'], message_id).twilio_sid == 'SM1'
+
+    assert len(calls) == 1
+
+
+def test_without_a_queue_delivery_runs_after_the_request(outbound_app, monkeypatch):
+    app, models, message_id, statuses = outbound_app
+    calls = twilio_sender(monkeypatch, 'SM1', 'SM2')
+    tasks = []
+    monkeypatch.setattr(outbound_dispatcher.socketio, 'start_background_task',
+                        lambda target, *args: tasks.append((target, args)))
+
+    with app.app_context():
+        first = db.session.get(models['Message'], message_id)
+        second = models['Message'](profile_id=first.profile_id, sender_number=first.sender_number,
+                                   content='again', is_incoming=False, send_status='queued')
+        db.session.add(second)
+        db.session.commit()
+
+        queue_outbound_message(first)
+        queue_outbound_message(second)
+        # Nothing is sent in the request; one task delivers the conversation in order
+        assert calls == [] and len(tasks) == 1
+        second_id = second.id
+
+    target, args = tasks[0]
+    target(*args)
+
+    assert [call['body'] for call in calls] == ['hi', 'again']
+    assert outbound_dispatcher._local_pending == {}
+    with app.app_context():
+        assert db.session.get(models['Message'], second_id).twilio_sid == 'SM2'
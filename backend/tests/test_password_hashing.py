@@ -0,0 +1,34 @@
+# tests/test_password_hashing.py
+import bcrypt
+import pytest
+from flask import Flask
+from werkzeug.security import generate_password_hash
+from app.utils.security import hash_password, verify_password, password_needs_rehash, run_off_hub
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    app.config['BCRYPT_ROUNDS'] = 4
+    with app.app_context():
+        yield
+
+
+def test_bcrypt_round_trip_uses_configured_rounds(app_context):
+    password_hash = hash_password('s3cret')
+
+    assert password_hash.startswith('$2b$04$')
+    assert verify_password('s3cret', password_hash)
+    assert not verify_password('wrong', password_hash)
+    assert not password_needs_rehash(password_hash)
+
+
+def test_weaker_hashes_need_rehash(app_context):
+    assert password_needs_rehash(bcrypt.hashpw(b's3cret', bcrypt.gensalt(rounds=5)).decode())
+    assert password_needs_rehash(generate_password_hash('s3cret', method='pbkdf2:sha256:500'))
+    assert not password_needs_rehash(generate_password_hash('s3cret', method='pbkdf2:sha256:1000'))
+
+
+def test_run_off_hub_runs_inline_without_eventlet():
+    assert run_off_hub(sum, [1, 2, 3]) == 6
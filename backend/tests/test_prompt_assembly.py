@@ -0,0 +1,82 @@
+# tests/test_prompt_assembly.py
+from collections import namedtuple
+
+from app.services.prompt_assembly import (
+    ApproximateTokenizer, PromptAssembler, get_tokenizer, token_budget_for, truncate_to_tokens,
+    PRIORITY_SYSTEM, PRIORITY_MESSAGE, PRIORITY_HISTORY, PRIORITY_EXAMPLES, PRIORITY_NOTES,
+)
+
+Msg = namedtuple('Msg', ['content', 'is_incoming'])
+
+count = ApproximateTokenizer().count
+
+
+def build(budget, history, examples, notes, message="are you free tonight?"):
+    speaker = lambda item: f"{'Client' if item.is_incoming else 'Me'}: {item.content}"
+    assembler = PromptAssembler(budget)
+    assembler.add('system', "You are Amy. Keep replies short.", PRIORITY_SYSTEM, required=True, truncate=True)
+    assembler.add('notes', notes, PRIORITY_NOTES, truncate=True)
+    assembler.add('examples', examples, PRIORITY_EXAMPLES, header="EXAMPLES:", render=speaker)
+    assembler.add('history', history, PRIORITY_HISTORY, header="RECENT CONVERSATION:", render=speaker, recent=True)
+    assembler.add('message', message, PRIORITY_MESSAGE, header="CURRENT MESSAGE:", required=True, truncate=True)
+    return assembler.assemble()
+
+
+def test_approximate_counts_and_truncation():
+    assert count("") == 0
+    assert count("hello there, friend") == 2 + 2 + 1 + 2
+    assert count("😘") == 2
+
+    text = "word " * 100
+    cut = truncate_to_tokens(text, 20, count)
+    assert cut.endswith('...') and count(cut) <= 20 and count(cut) >= 18
+    assert truncate_to_tokens("short", 20, count) == "short"
+
+
+def test_everything_fits_in_a_large_budget():
+    history = [Msg(f"message {i}", i % 2 == 0) for i in range(5)]
+    examples = [Msg("heyyy babe", False), Msg("you up?", True)]
+    prompt = build(1000, history, examples, ["- Notes: likes dogs"])
+
+    assert prompt.stats()['dropped'] == {} and not prompt.truncated
+    assert prompt.tokens <= 1000
+    text = prompt.text
+    # Rendered in the order added, regardless of priority
+    assert text.index("You are Amy") < text.index("likes dogs") < text.index("EXAMPLES:") \
+        < text.index("RECENT CONVERSATION:") < text.index("CURRENT MESSAGE:")
+
+
+def test_low_priority_sections_give_way_first():
+    history = [Msg(f"history message number {i}", True) for i in range(10)]
+    examples = [Msg(f"example reply number {i}", False) for i in range(10)]
+    notes = ["- Notes: " + "very long client notes " * 50]
+    budget = 120
+    prompt = build(budget, history, examples, notes)
+
+    assert prompt.tokens <= budget
+    # The current message and system prompt survive whole
+    assert prompt.items('message') == ["are you free tonight?"]
+    assert prompt.items('system') == ["You are Amy. Keep replies short."]
+    # History keeps the newest messages, contiguous
+    kept = prompt.items('history')
+    assert kept and kept == history[-len(kept):]
+    assert prompt.dropped['notes'] == 1 or 'notes' in prompt.truncated
+    assert prompt.dropped['examples'] > 0
+
+
+def test_oversized_message_is_truncated_to_the_budget():
+    prompt = build(40, [], [], [], message="please " * 200)
+
+    assert 'message' in prompt.truncated
+    assert prompt.items('message')[0].endswith('...')
+    assert prompt.tokens <= 40
+
+
+def test_tokenizer_fallback_and_model_budgets():
+    assert isinstance(get_tokenizer('no-such-kind:x'), ApproximateTokenizer)
+    # A tokenizer whose library or vocabulary is unavailable falls back too
+    assert isinstance(get_tokenizer('tokenizers:/nonexistent/tokenizer.json'), ApproximateTokenizer)
+
+    config = {'PROMPT_TOKEN_BUDGET': 1800, 'PROMPT_TOKEN_BUDGETS': {'llama3:8b': 6000}}
+    assert token_budget_for('llama3:8b', config) == 6000
+    assert token_budget_for('dolphin3', config) == 1800
@@ -0,0 +1,156 @@
+# tests/test_queue_service.py
+import time
+import pytest
+from app.services.queue_service import RedisQueue, register_task, resolve_task
+
+fakeredis = pytest.importorskip('fakeredis')
+
+calls = []
+
+
+@register_task
+def record_call(value):
+    calls.append(value)
+
+
+@register_task
+def always_fail():
+    raise RuntimeError('boom')
+
+
+@pytest.fixture
+def task_queue():
+    calls.clear()
+    return RedisQueue(connection=fakeredis.FakeRedis(), visibility_timeout=30, max_retries=2)
+
+
+def test_task_runs_and_is_acked(task_queue):
+    task_queue.enqueue(record_call, 'hello')
+
+    assert task_queue.process_queue() == 1
+    assert calls == ['hello']
+
+    stats = task_queue.stats()
+    assert stats['depth'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['completed'] == 1
+
+
+def test_failing_task_is_retried_then_dead_lettered(task_queue):
+    task_queue.enqueue(always_fail)
+
+    task_queue.process_queue()
+
+    stats = task_queue.stats()
+    assert stats['depth'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['dead'] == 1
+    assert stats['retried'] == 2
+
+
+def test_expired_lease_is_reclaimed(task_queue):
+    task_queue.enqueue(record_call, 'crashed')
+    task = task_queue.dequeue(timeout=None)
+    assert task is not None
+
+    # Simulate a worker that died holding the task
+    task_queue.redis_conn.zadd('queue:default:leases', {task.raw: time.time() - 1})
+    assert task_queue.reclaim_expired() == 1
+
+    # The stale worker can no longer ack it, and it runs again
+    assert task_queue.ack(task) is False
+    assert task_queue.process_queue() == 1
+    assert calls == ['crashed']
+
+
+def test_batch_dequeue(task_queue):
+    for i in range(5):
+        task_queue.enqueue(record_call, i)
+
+    tasks = task_queue.dequeue_batch(count=3, timeout=None)
+
+    assert [t.data['args'] for t in tasks] == [[0], [1], [2]]
+    assert task_queue.stats()['in_flight'] == 3
+
+
+def test_resolve_task_uses_registry():
+    assert resolve_task(f'{__name__}.record_call') is record_call
+
+
+@pytest.fixture
+def partitioned_queue():
+    calls.clear()
+    return RedisQueue(connection=fakeredis.FakeRedis(), visibility_timeout=30, max_retries=2,
+                      partitions={'default': 8})
+
+
+def test_partition_runs_one_task_at_a_time_in_order(partitioned_queue):
+    for i in range(3):
+        partitioned_queue.enqueue(record_call, i, partition_key='1:+15550000001')
+
+    first = partitioned_queue.dequeue(timeout=None)
+    # The partition is locked until the first task settles
+    assert partitioned_queue.dequeue(timeout=None) is None
+
+    partitioned_queue.fail(first)
+    assert partitioned_queue.process_queue() == 3
+    assert calls == [0, 1, 2]
+
+
+def test_different_partitions_run_in_parallel(partitioned_queue):
+    keys = ['1:+15550000001', '1:+15550000002']
+    assert len({partitioned_queue.partition_for('default', key) for key in keys}) == 2
+
+    for key in keys:
+        partitioned_queue.enqueue(record_call, key, partition_key=key)
+
+    batch = partitioned_queue.dequeue_batch(count=5, timeout=None)
+    assert sorted(task.data['args'][0] for task in batch) == keys
+    assert partitioned_queue.stats()['in_flight'] == 2
+
+    for task in batch:
+        partitioned_queue.ack(task)
+    assert partitioned_queue.stats()['in_flight'] == 0
+    assert partitioned_queue.stats()['depth'] == 0
+
+
+def test_settling_a_busy_partition_wakes_a_worker(partitioned_queue):
+    for i in range(2):
+        partitioned_queue.enqueue(record_call, i, partition_key='1:+15550000001')
+    partitioned_queue.redis_conn.delete('queue:default:signal')
+
+    first = partitioned_queue.dequeue(timeout=None)
+    partitioned_queue.ack(first)
+
+    # The next task in the conversation doesn't wait for an idle worker's poll
+    assert partitioned_queue.redis_conn.llen('queue:default:signal') == 1
+    assert partitioned_queue.dequeue(timeout=1).data['args'] == [1]
+
+
+def test_free_partitions_are_found_when_sampled_ones_are_locked(partitioned_queue, monkeypatch):
+    from app.services import queue_service
+    monkeypatch.setattr(queue_service, 'PARTITION_CANDIDATES', 1)
+    partitioned_queue.enqueue(record_call, 'held', partition_key='1:+15550000001')
+    partitioned_queue.enqueue(record_call, 'next', partition_key='1:+15550000001')
+    assert partitioned_queue.dequeue(timeout=None).data['args'] == ['held']
+    for i in range(10):
+        partitioned_queue.enqueue(record_call, i, partition_key='1:+15550000002')
+
+    for i in range(10):
+        task = partitioned_queue.dequeue(timeout=None)
+        assert task.data['args'] == [i]
+        partitioned_queue.ack(task)
+
+
+def test_delayed_tasks_join_their_partition_when_due(partitioned_queue):
+    partitioned_queue.enqueue(record_call, 'later', partition_key='1:+15550000001', delay=0.2)
+    partitioned_queue.enqueue(record_call, 'now', partition_key='1:+15550000001')
+
+    assert partitioned_queue.stats()['delayed'] == 1
+    assert partitioned_queue.process_queue() == 1
+    assert calls == ['now']
+
+    time.sleep(0.2)
+    assert partitioned_queue.process_queue() == 1
+    assert calls == ['now', 'later']
+    assert partitioned_queue.stats()['delayed'] == 0
@@ -0,0 +1,150 @@
+# tests/test_rate_limit.py
+import pytest
+from flask import Flask
+from app.utils import security
+from app.utils.security import rate_limit, rate_limited
+
+
+@pytest.fixture(autouse=True)
+def reset_local_state():
+    security._blocked_until.clear()
+    security._local_tats.clear()
+    yield
+    security._blocked_until.clear()
+    security._local_tats.clear()
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['RATE_LIMIT_TEST'] = '3/60'
+
+    @app.route('/limited', methods=['POST'])
+    @rate_limited('RATE_LIMIT_TEST')
+    def limited():
+        return 'ok'
+
+    return app
+
+
+def test_gcra_allows_burst_then_denies_in_redis(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    monkeypatch.setattr(security, 'redis_client', fakeredis.FakeRedis())
+
+    results = [rate_limit('user:1', 3, 60) for _ in range(4)]
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert [info['remaining'] for _, info in results] == [2, 1, 0, 0]
+    # Tokens come back one emission interval (60s / 3) at a time
+    assert 1 <= results[3][1]['retry_after'] <= 20
+    # Other keys are unaffected
+    assert rate_limit('user:2', 3, 60)[0] is True
+
+
+def test_denied_key_is_refused_locally(monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    conn = fakeredis.FakeRedis()
+    monkeypatch.setattr(security, 'redis_client', conn)
+
+    for _ in range(2):
+        rate_limit('user:1', 1, 60)
+    conn.flushall()
+
+    assert rate_limit('user:1', 1, 60)[0] is False
+
+
+def test_decorator_sets_headers_and_429(app):
+    client = app.test_client()
+
+    responses = [client.post('/limited') for _ in range(4)]
+
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert responses[0].headers['X-RateLimit-Limit'] == '3'
+    assert responses[0].headers['X-RateLimit-Remaining'] == '2'
+    assert 'Retry-After' in responses[3].headers
+
+
+@pytest.fixture
+def create_app():
+    """create_app, with the loaders it registers on the shared JWTManager undone afterwards"""
+    from app import create_app
+    from app.extensions import jwt
+    loaders = dict(vars(jwt))
+    yield create_app
+    vars(jwt).clear()
+    vars(jwt).update(loaders)
+
+
+def test_forwarded_clients_get_their_own_login_bucket(monkeypatch, create_app):
+    from app.config import config
+    monkeypatch.setattr(config['development'], 'RATE_LIMIT_LOGIN', '1/60')
+    monkeypatch.setattr(config['development'], 'PROXY_FIX_X_FOR', 1)
+    monkeypatch.setattr(config['development'], 'SQLALCHEMY_DATABASE_URI', 'sqlite://')
+    monkeypatch.setattr(config['development'], 'REDIS_URL', None, raising=False)
+    client = create_app('development').test_client()
+
+    def login(address):
+        return client.post('/api/auth/login', json={}, headers={'X-Forwarded-For': address}).status_code
+
+    assert login('203.0.113.1') != 429
+    assert login('203.0.113.2') != 429
+    assert login('203.0.113.1') == 429
+
+
+def test_forged_sms_webhooks_do_not_use_up_the_number_limit(monkeypatch, tmp_path, create_app):
+    from app.config import config
+    from app.extensions import db
+    from app.models import init_models
+    monkeypatch.setattr(config['development'], 'RATE_LIMIT_SMS_WEBHOOK', '1/60')
+    monkeypatch.setattr(config['development'], 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(config['development'], 'REDIS_URL', None, raising=False)
+    app = create_app('development')
+    models = init_models()
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-',
+                              twilio_parent_account=True)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000'))
+        db.session.commit()
+    client = app.test_client()
+
+    forged = [client.post('/api/webhooks/sms', data={'To': '+15550000000', 'From': '+15551000001', 'Body': 'hi'})
+              for _ in range(3)]
+
+    assert [response.status_code for response in forged] == [403, 403, 403]
+    assert security._local_tats == {}
+
+
+def test_sms_over_the_number_limit_is_stored_without_a_reply(monkeypatch, tmp_path, create_app):
+    from app.config import config
+    from app.extensions import db
+    from app.models import init_models
+    from app.services.metrics import get_metrics
+    monkeypatch.setattr(config['development'], 'RATE_LIMIT_SMS_WEBHOOK', '1/60')
+    monkeypatch.setattr(config['development'], 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setattr(config['development'], 'REDIS_URL', None, raising=False)
+    app = create_app('development')
+    models = init_models()
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-',
+                              twilio_account_sid='AC1')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(models['Profile'](user_id=user.id, name='Main', phone_number='+15550000000',
+                                         ai_enabled=False))
+        db.session.commit()
+    client = app.test_client()
+
+    responses = [client.post('/api/webhooks/sms', data={'To': '+15550000000', 'From': '+15551000001',
+                                                        'Body': body, 'AccountSid': 'AC1'})
+                 for body in ('first', 'second')]
+
+    assert [response.status_code for response in responses] == [204, 204]
+    with app.app_context():
+        assert [m.content for m in models['Message'].query.order_by('id')] == ['first', 'second']
+        totals = get_metrics().totals()
+    assert totals['replies_total{outcome="ai_disabled"}'] == 1
+    assert totals['replies_total{outcome="rate_limited"}'] == 1
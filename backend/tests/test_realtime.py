@@ -0,0 +1,117 @@
+# tests/test_realtime.py
+import pytest
+from app.services.realtime import EmitBatcher, EventStream, BATCH_EVENT, profile_room
+
+
+class RecordingServer:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def start_background_task(self, target, *args):
+        pass
+
+
+def test_events_are_grouped_per_room():
+    server = RecordingServer()
+    batcher = EmitBatcher(server, interval=1.0)
+
+    batcher.emit('new_message', {'id': 1}, room=profile_room(1))
+    batcher.emit('message_status', {'id': 1}, room=profile_room(1))
+    batcher.emit('new_message', {'id': 2}, room=profile_room(2))
+
+    assert batcher.flush() == 2
+    by_room = {to: (event, data) for event, data, to in server.emitted}
+    assert by_room['profile:1'] == (BATCH_EVENT, {'events': [
+        {'event': 'new_message', 'data': {'id': 1}},
+        {'event': 'message_status', 'data': {'id': 1}},
+    ]})
+    # A lone event is sent as itself
+    assert by_room['profile:2'] == ('new_message', {'id': 2})
+
+
+def test_batching_can_be_disabled():
+    server = RecordingServer()
+    EmitBatcher(server, interval=0).emit('new_message', {'id': 1}, room='user:1')
+
+    assert server.emitted == [('new_message', {'id': 1}, 'user:1')]
+
+
+@pytest.fixture
+def event_stream():
+    fakeredis = pytest.importorskip('fakeredis')
+    return EventStream(fakeredis.FakeRedis(), maxlen=3)
+
+
+def test_replay_returns_only_missed_events(event_stream):
+    for i in range(1, 4):
+        assert event_stream.append(7, 'new_message', {'id': i}) == i
+
+    events, latest = event_stream.replay(7, after=1)
+    assert latest == 3
+    assert [(e['event'], e['data']) for e in events] == [
+        ('new_message', {'id': 2, 'seq': 2}),
+        ('new_message', {'id': 3, 'seq': 3}),
+    ]
+    assert event_stream.replay(7, after=3) == ([], 3)
+
+
+def test_replay_requires_reset_once_trimmed(event_stream):
+    for i in range(5):
+        event_stream.append(7, 'new_message', {'id': i})
+
+    # Events 1 and 2 were trimmed; a client at seq 1 must reload, one at seq 2 need not
+    assert event_stream.replay(7, after=1) == (None, 5)
+    assert len(event_stream.replay(7, after=2)[0]) == 3
+    # Sequence numbers are per user
+    assert event_stream.append(8, 'new_message', {}) == 1
+
+
+
+def test_socket_connections_need_a_live_access_token(tmp_path, monkeypatch):
+    import time
+    from flask import Flask, request
+    from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, decode_token
+    from flask_socketio import ConnectionRefusedError
+    from app.api import socket_events
+    from app.extensions import db
+    from app.models import init_models
+    from app.services.token_revocation import RevocationFilter
+
+    models = init_models()
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        JWT_SECRET_KEY='test-secret-key-with-enough-length',
+    )
+    db.init_app(app)
+    JWTManager(app)
+    revocation_filter = RevocationFilter(lambda jti: False)
+    revocation_filter.healthy = True
+    app.extensions['revocation_filter'] = revocation_filter
+
+    joined = []
+    monkeypatch.setattr(socket_events, 'join_room', joined.append)
+    monkeypatch.setattr(socket_events, '_connected_users', {})
+
+    with app.test_request_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        request.sid = 'sid-1'
+
+        revoked = create_access_token(identity=user.id)
+        revocation_filter.add(decode_token(revoked)['jti'], time.time() + 3600)
+        for token in (create_refresh_token(identity=user.id), revoked):
+            with pytest.raises(ConnectionRefusedError):
+                socket_events.handle_connect({'token': token})
+        assert joined == []
+
+        socket_events.handle_connect({'token': create_access_token(identity=user.id)})
+        assert joined == [f"user:{user.id}"]
+
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,97 @@
+# tests/test_reply_rules.py
+from datetime import datetime
+from types import SimpleNamespace
+import pytz
+from app.services.reply_rules import KeywordAutomaton, WeeklySchedule, ReplyRules, ReplyRulesCache
+
+HOURS = {
+    'monday': {'start': '10:00', 'end': '22:00'},
+    'friday': {'start': '20:00', 'end': '02:00'},
+    'sunday': {'start': '22:00', 'end': '01:00'},
+}
+
+
+def at(timezone, *args):
+    return pytz.timezone(timezone).localize(datetime(*args))
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = KeywordAutomaton(['new york', 'york city', 'city', 'he', 'she', 'hers'])
+
+    assert sorted(automaton.find('New York City')) == [(0, 0, 8), (1, 4, 13), (2, 9, 13)]
+    assert sorted(automaton.find('she hers he')) == [(3, 9, 11), (4, 0, 3), (5, 4, 8)]
+
+
+def test_keywords_match_whole_words_only():
+    rules = ReplyRules([('rate', 'Rates are on my site', 0), ('$$', 'Ask me', 0)])
+
+    assert rules.match_keyword('What is your RATE?') == ('rate', 'Rates are on my site')
+    assert rules.match_keyword('I was separated') is None
+    assert rules.match_keyword('how many$$') == ('$$', 'Ask me')
+
+
+def test_highest_priority_then_earliest_rule_wins():
+    rules = ReplyRules([
+        ('hello', 'Hi!', 0),
+        ('available', 'Yes', 5),
+        ('hi', 'Hey', 0),
+    ])
+
+    assert rules.match_keyword('hello, are you available?') == ('available', 'Yes')
+    assert rules.match_keyword('hi hello') == ('hello', 'Hi!')
+
+
+def test_schedule_in_profile_timezone():
+    schedule = WeeklySchedule(HOURS, 'America/Toronto')
+
+    # Monday 2024-01-01
+    assert schedule.is_open(at('America/Toronto', 2024, 1, 1, 12, 0))
+    assert not schedule.is_open(at('America/Toronto', 2024, 1, 1, 9, 59))
+    # 12:00 in Toronto is 17:00 UTC
+    assert schedule.is_open(at('UTC', 2024, 1, 1, 17, 0))
+    assert not schedule.is_open(at('UTC', 2024, 1, 1, 12, 0))
+    # Missing day is closed
+    assert not schedule.is_open(at('America/Toronto', 2024, 1, 2, 12, 0))
+
+
+def test_overnight_hours_run_into_next_day_and_week():
+    schedule = WeeklySchedule(HOURS, 'UTC')
+
+    # Friday 2024-01-05 20:00 - Saturday 02:00
+    assert schedule.is_open(at('UTC', 2024, 1, 6, 1, 30))
+    assert not schedule.is_open(at('UTC', 2024, 1, 6, 2, 30))
+    # Sunday 2024-01-07 22:00 - Monday 01:00
+    assert schedule.is_open(at('UTC', 2024, 1, 8, 0, 30))
+
+
+def test_no_business_hours_means_always_open():
+    rules = ReplyRules([], {}, 'UTC', out_of_office='Back soon')
+
+    assert rules.is_open(at('UTC', 2024, 1, 2, 3, 0))
+    assert rules.out_of_office_reply(at('UTC', 2024, 1, 2, 3, 0)) is None
+
+
+def test_out_of_office_only_when_closed():
+    rules = ReplyRules([], HOURS, 'UTC', out_of_office='Back soon')
+
+    assert rules.out_of_office_reply(at('UTC', 2024, 1, 1, 12, 0)) is None
+    assert rules.out_of_office_reply(at('UTC', 2024, 1, 2, 12, 0)) == 'Back soon'
+
+
+def test_cache_compiles_once_until_invalidated():
+    compiled = []
+
+    def compile_rules(profile):
+        compiled.append(profile.id)
+        return ReplyRules([])
+
+    cache = ReplyRulesCache(compile_rules, ttl=300)
+    profile = SimpleNamespace(id=7)
+
+    first = cache.get(profile)
+    assert cache.get(profile) is first
+    assert compiled == [7]
+
+    cache.invalidate(7)
+    assert cache.get(profile) is not first
+    assert compiled == [7, 7]
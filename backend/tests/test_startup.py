@@ -0,0 +1,43 @@
+# tests/test_startup.py
+import os
+import sys
+import importlib.util
+from app.utils.lazy_import import lazy_import
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'startup.py')
+
+spec = importlib.util.spec_from_file_location('startup_benchmark', BENCHMARK)
+startup = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(startup)
+
+
+def test_parse_importtime():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   child",
+        "import time:       200 |        300 | parent",
+        "some other output",
+    ])
+
+    total, top_level = startup.parse_importtime(stderr)
+
+    assert total == 0.0003
+    assert top_level == [('parent', 0.0003)]
+
+
+def test_lazy_import_defers_until_attribute_access():
+    module = lazy_import('xml.dom.minidom')
+    sys.modules.pop('xml.dom.minidom', None)
+
+    assert 'xml.dom.minidom' not in sys.modules
+    assert module.parseString('<a/>').documentElement.tagName == 'a'
+    assert 'xml.dom.minidom' in sys.modules
+
+
+def test_worker_starts_without_heavy_sdks_within_budget():
+    env = dict(os.environ, CELERY_BROKER_URL='redis://localhost:6379/0')
+    results = startup.run('development', runs=1, env=env)
+
+    assert results['status'] == 200
+    assert results['heavy_modules_loaded'] == []
+    assert results['time_to_first_request_seconds'] < float(os.environ.get('STARTUP_BUDGET_SECONDS', '5'))
@@ -0,0 +1,185 @@
+# tests/test_stripe_events.py
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from flask import Flask
+from app.extensions import db
+from app.models import init_models
+from app.services.metrics import MetricsRegistry
+from app.services import stripe_events
+
+WEBHOOK_SECRET = 'whsec_test'
+CREATED = 1704067200  # 2024-01-01
+
+
+@pytest.fixture
+def billing_app(tmp_path):
+    models = init_models()
+    from app.api.billing import billing_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        STRIPE_EVENT_MAX_ATTEMPTS=3,
+        STRIPE_BACKFILL_CHUNK_SIZE=2,
+    )
+    app.extensions['redis'] = None
+    app.extensions['metrics'] = MetricsRegistry()
+    db.init_app(app)
+    app.register_blueprint(billing_bp, url_prefix='/api/billing')
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-')
+        plan = models['SubscriptionPlan'](name='Basic', price=10)
+        db.session.add_all([user, plan])
+        db.session.flush()
+        db.session.add(models['Subscription'](user_id=user.id, plan_id=plan.id, stripe_subscription_id='sub_1',
+                                              payment_status='past_due'))
+        db.session.commit()
+
+    yield app, models
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def invoice_event(event_id, event_type, status, created, invoice_id='in_1'):
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'created': created,
+        'data': {'object': {
+            'id': invoice_id, 'object': 'invoice', 'subscription': 'sub_1', 'customer': 'cus_1',
+            'number': f"INV-{invoice_id}", 'status': status, 'amount_due': 1000,
+            'amount_paid': 1000 if status == 'paid' else 0, 'currency': 'usd', 'created': CREATED,
+            'status_transitions': {'paid_at': created if status == 'paid' else None},
+        }},
+    }
+
+
+def deliver(app, event):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return app.test_client().post('/api/billing/webhooks/stripe', data=payload,
+                                  headers={'Stripe-Signature': f"t={timestamp},v1={signature}",
+                                           'Content-Type': 'application/json'})
+
+
+def test_redelivered_events_are_applied_once(billing_app):
+    app, models = billing_app
+    event = invoice_event('evt_1', 'invoice.payment_succeeded', 'paid', CREATED)
+
+    assert deliver(app, event).status_code == 200
+    assert deliver(app, event).status_code == 200
+
+    with app.app_context():
+        assert models['StripeEvent'].query.count() == 1
+        assert models['StripeEvent'].query.one().status == 'processed'
+        invoice = models['Invoice'].query.one()
+        assert (invoice.status, float(invoice.amount_paid), invoice.currency) == ('paid', 10.0, 'USD')
+        assert models['Subscription'].query.one().payment_status == 'active'
+    totals = app.extensions['metrics'].totals()
+    assert totals['stripe_events_total{outcome="received"}'] == 1
+    assert totals['stripe_events_total{outcome="duplicate"}'] == 1
+
+
+def test_bad_signature_is_rejected(billing_app):
+    app, models = billing_app
+    response = app.test_client().post('/api/billing/webhooks/stripe', data='{}',
+                                      headers={'Stripe-Signature': 't=1,v1=bad'})
+
+    assert response.status_code == 400
+    with app.app_context():
+        assert models['StripeEvent'].query.count() == 0
+
+
+def test_events_are_processed_in_created_order_by_the_queue(billing_app):
+    fakeredis = pytest.importorskip('fakeredis')
+    app, models = billing_app
+    app.extensions['redis'] = fakeredis.FakeRedis()
+    app.config['QUEUE_PARTITIONS'] = {'default': 4}
+
+    # Delivered newest first
+    assert deliver(app, invoice_event('evt_2', 'invoice.payment_succeeded', 'paid', CREATED + 60)).status_code == 200
+    assert deliver(app, invoice_event('evt_1', 'invoice.finalized', 'open', CREATED)).status_code == 200
+
+    with app.app_context():
+        assert {event.status for event in models['StripeEvent'].query} == {'pending'}
+        from app.services.queue_service import get_task_queue
+        get_task_queue().process_queue('default')
+
+        assert {event.status for event in models['StripeEvent'].query} == {'processed'}
+        assert models['Invoice'].query.one().status == 'paid'
+        assert models['Subscription'].query.one().payment_status == 'active'
+
+
+def test_failing_event_holds_back_later_events_until_retried(billing_app, monkeypatch):
+    app, models = billing_app
+    handler = stripe_events.HANDLERS['invoice.finalized']
+
+    def broken(invoice, as_of):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setitem(stripe_events.HANDLERS, 'invoice.finalized', broken)
+    assert deliver(app, invoice_event('evt_1', 'invoice.finalized', 'open', CREATED)).status_code == 200
+    assert deliver(app, invoice_event('evt_2', 'invoice.payment_succeeded', 'paid', CREATED + 60)).status_code == 200
+
+    with app.app_context():
+        first = db.session.get(models['StripeEvent'], 'evt_1')
+        assert (first.status, first.attempts, first.last_error) == ('pending', 2, 'database unavailable')
+        assert db.session.get(models['StripeEvent'], 'evt_2').status == 'pending'
+        assert models['Invoice'].query.count() == 0
+
+        monkeypatch.setitem(stripe_events.HANDLERS, 'invoice.finalized', handler)
+        assert stripe_events.process_pending() == 1
+        assert {event.status for event in models['StripeEvent'].query} == {'processed'}
+        assert models['Invoice'].query.one().status == 'paid'
+
+
+def test_invoice_for_an_unknown_subscription_stays_pending(billing_app):
+    app, models = billing_app
+    event = invoice_event('evt_1', 'invoice.paid', 'paid', CREATED)
+    event['data']['object']['subscription'] = 'sub_2'
+
+    assert deliver(app, event).status_code == 200
+
+    with app.app_context():
+        stripe_event = db.session.get(models['StripeEvent'], 'evt_1')
+        assert (stripe_event.status, stripe_event.attempts) == ('pending', 1)
+        assert 'sub_2' in stripe_event.last_error
+        assert models['Invoice'].query.count() == 0
+
+        # Once the subscription is known the retry applies it
+        subscription = models['Subscription'].query.one()
+        subscription.stripe_subscription_id = 'sub_2'
+        db.session.commit()
+        assert stripe_events.process_pending() == 1
+        assert db.session.get(models['StripeEvent'], 'evt_1').status == 'processed'
+        assert models['Invoice'].query.one().status == 'paid'
+
+
+def test_backfill_is_idempotent_and_never_regresses_status(billing_app):
+    app, models = billing_app
+    invoices = [invoice_event(f"evt_{index}", 'invoice.paid', 'paid', CREATED, f"in_{index}")['data']['object']
+                for index in range(3)]
+    unknown = dict(invoices[0], id='in_other', number='INV-other', subscription='sub_missing')
+
+    with app.app_context():
+        summary = stripe_events.backfill_invoices(invoices + [unknown], app.config)
+        assert summary == {'upserted': 3, 'skipped': 1}
+
+        stale = [dict(invoice, status='open', amount_paid=0) for invoice in invoices]
+        stripe_events.backfill_invoices(stale, app.config)
+
+        rows = models['Invoice'].query.order_by(models['Invoice'].stripe_invoice_id).all()
+        assert [(row.stripe_invoice_id, row.status) for row in rows] == [('in_0', 'paid'), ('in_1', 'paid'),
+                                                                          ('in_2', 'paid')]
+        assert all(float(row.amount_paid) == 10.0 and row.paid_at is not None for row in rows)
@@ -0,0 +1,194 @@
+# tests/test_stripe_mirror.py
+import pytest
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from app.extensions import db, jwt
+from app.models import init_models
+from app.services.metrics import MetricsRegistry
+from app.services import stripe_mirror
+from app.services.stripe_events import replay_events
+
+stripe = pytest.importorskip('stripe')
+
+CREATED = 1704067200  # 2024-01-01
+
+
+@pytest.fixture
+def billing_app(tmp_path):
+    models = init_models()
+    from app.api.billing import billing_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}",
+        JWT_SECRET_KEY='test-secret-key-with-enough-length',
+        STRIPE_SECRET_KEY='sk_test',
+        STRIPE_BACKFILL_CHUNK_SIZE=2,
+        QUEUE_PARTITIONS={'default': 4},
+    )
+    app.extensions['redis'] = None
+    app.extensions['metrics'] = MetricsRegistry()
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(billing_bp, url_prefix='/api/billing')
+
+    with app.app_context():
+        db.create_all()
+        user = models['User'](username='owner', email='owner@example.com', password_hash='-',
+                              stripe_customer_id='cus_1')
+        basic = models['SubscriptionPlan'](name='Basic', price=10, stripe_price_id='price_basic')
+        pro = models['SubscriptionPlan'](name='Pro', price=30, stripe_price_id='price_pro')
+        db.session.add_all([user, basic, pro])
+        db.session.flush()
+        subscription = models['Subscription'](user_id=user.id, plan_id=basic.id, stripe_subscription_id='sub_1',
+                                              stripe_customer_id='cus_1')
+        db.session.add(subscription)
+        db.session.commit()
+        ids = {'user': user.id, 'basic': basic.id, 'pro': pro.id, 'subscription': subscription.id}
+        headers = {'Authorization': f"Bearer {create_access_token(identity=user.id)}"}
+
+    yield app, models, ids, headers
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def stripe_subscription(price='price_basic', status='active', cancel_at_period_end=False):
+    return {
+        'id': 'sub_1', 'object': 'subscription', 'customer': 'cus_1', 'status': status,
+        'cancel_at_period_end': cancel_at_period_end, 'current_period_end': CREATED + 30 * 86400,
+        'items': {'object': 'list', 'data': [
+            {'id': 'si_1', 'object': 'subscription_item', 'price': {'id': price, 'object': 'price'}},
+        ]},
+    }
+
+
+def subscription_event(event_id, created, **kwargs):
+    return {'id': event_id, 'object': 'event', 'type': 'customer.subscription.updated', 'created': created,
+            'data': {'object': stripe_subscription(**kwargs)}}
+
+
+@pytest.fixture
+def stripe_calls(monkeypatch):
+    """Record Subscription.modify calls; fail on Subscription.retrieve"""
+    calls = []
+
+    def modify(subscription_id, **params):
+        calls.append(params)
+        return stripe.util.convert_to_stripe_object(stripe_subscription(
+            price=params['items'][0]['price'] if 'items' in params else 'price_basic',
+            cancel_at_period_end=params.get('cancel_at_period_end', False),
+        ))
+
+    def retrieve(subscription_id, **params):
+        raise AssertionError('Subscription.retrieve should be served from the mirror')
+
+    monkeypatch.setattr(stripe.Subscription, 'modify', modify)
+    monkeypatch.setattr(stripe.Subscription, 'retrieve', retrieve)
+    return calls
+
+
+def test_subscription_events_update_the_mirror_and_local_subscription(billing_app):
+    app, models, ids, headers = billing_app
+
+    with app.app_context():
+        # Delivered newest first; applied in created order
+        replay_events([
+            subscription_event('evt_2', CREATED + 60, price='price_pro', status='past_due', cancel_at_period_end=True),
+            subscription_event('evt_1', CREATED, price='price_basic'),
+        ])
+
+        subscription = db.session.get(models['Subscription'], ids['subscription'])
+        assert (subscription.plan_id, subscription.payment_status, subscription.auto_renew) == (
+            ids['pro'], 'past_due', False)
+        assert subscription.is_active and subscription.end_date == subscription.renewal_date
+
+        # A stale state never replaces a newer one
+        stripe_mirror.mirror(stripe_subscription(status='canceled'), stripe_mirror._timestamp(CREATED))
+        db.session.commit()
+        assert stripe_mirror.get_mirrored('sub_1')['status'] == 'past_due'
+        assert subscription.is_active
+        assert stripe_mirror.subscription_item_id('sub_1') == 'si_1'
+
+
+def test_plan_changes_and_status_checks_read_the_mirror(billing_app, stripe_calls):
+    app, models, ids, headers = billing_app
+    with app.app_context():
+        stripe_mirror.mirror(stripe_subscription())
+        db.session.commit()
+
+    response = app.test_client().put('/api/billing/subscription', json={'plan_id': ids['pro']}, headers=headers)
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert stripe_calls[0]['items'] == [{'id': 'si_1', 'price': 'price_pro'}]
+    with app.app_context():
+        from app.services.billing_service import check_subscription_status
+        subscription = check_subscription_status(ids['subscription'])
+        assert (subscription.plan_id, subscription.payment_status) == (ids['pro'], 'active')
+        assert stripe_mirror.get_mirrored('sub_1')['items']['data'][0]['price']['id'] == 'price_pro'
+
+
+def test_subscription_changes_run_as_background_jobs(billing_app, stripe_calls):
+    fakeredis = pytest.importorskip('fakeredis')
+    app, models, ids, headers = billing_app
+    app.extensions['redis'] = fakeredis.FakeRedis()
+    with app.app_context():
+        stripe_mirror.mirror(stripe_subscription())
+        db.session.commit()
+    client = app.test_client()
+
+    response = client.delete('/api/billing/subscription', headers=headers)
+
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+    assert client.get(status_url, headers=headers).get_json()['state'] == 'queued'
+    assert stripe_calls == []
+
+    with app.app_context():
+        from app.services.queue_service import get_task_queue
+        get_task_queue().process_queue('default')
+
+    job = client.get(status_url, headers=headers).get_json()
+    assert job['state'] == 'completed'
+    assert job['result']['auto_renew'] is False
+    assert stripe_calls == [{'cancel_at_period_end': True}]
+
+    # A duplicate delivery of the task leaves the finished job alone
+    with app.app_context():
+        from app.services.billing_service import subscription_job
+        subscription_job(job['job_id'], 'cancel', {'subscription_id': ids['subscription']})
+    assert client.get(status_url, headers=headers).get_json()['state'] == 'completed'
+    assert len(stripe_calls) == 1
+
+    with app.app_context():
+        other = {'Authorization': f"Bearer {create_access_token(identity=ids['user'] + 1)}"}
+    assert client.get(status_url, headers=other).status_code == 404
+
+
+def test_reconcile_refreshes_the_mirror(billing_app, monkeypatch):
+    app, models, ids, headers = billing_app
+    listed = {
+        stripe.Price: [{'id': 'price_basic', 'object': 'price'}, {'id': 'price_pro', 'object': 'price'}],
+        stripe.Customer: [{'id': 'cus_1', 'object': 'customer'}],
+        stripe.Subscription: [stripe_subscription(price='price_pro', status='unpaid')],
+    }
+    for resource, objects in listed.items():
+        page = {'object': 'list', 'url': '/v1/list', 'has_more': False, 'data': objects}
+        monkeypatch.setattr(resource, 'list', lambda page=page, **params: stripe.util.convert_to_stripe_object(page))
+
+    with app.app_context():
+        stripe_mirror.mirror({'id': 'price_old', 'object': 'price'})
+        db.session.commit()
+
+        summary = stripe_mirror.reconcile(app.config)
+
+        assert summary == {
+            'price': {'listed': 2, 'deleted': 1},
+            'customer': {'listed': 1, 'deleted': 0},
+            'subscription': {'listed': 1, 'deleted': 0},
+        }
+        assert stripe_mirror.get_mirrored('price_old') is None
+        assert stripe_mirror.get_mirrored('cus_1') == {'id': 'cus_1', 'object': 'customer'}
+        subscription = db.session.get(models['Subscription'], ids['subscription'])
+        assert (subscription.plan_id, subscription.is_active) == (ids['pro'], False)
@@ -0,0 +1,114 @@
+# tests/test_text_example_ingest.py
+import io
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from app.extensions import db
+from app.services.background_jobs import JobStore
+from app.services.text_example_ingest import TextExampleIngester, content_hash
+
+
+@pytest.fixture
+def app_context():
+    from app.models import init_models
+    models = init_models()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[models['TextExample'].__table__])
+        yield models
+        db.session.remove()
+
+
+def test_ingest_dedupes_and_skips_oversized(app_context):
+    TextExample = app_context['TextExample']
+    db.session.add(TextExample(profile_id=1, content='already here', content_hash=content_hash('already here')))
+    db.session.commit()
+
+    summary = TextExampleIngester(1, chunk_size=2, max_length=20).run([
+        {'content': 'hey you'},
+        {'content': '  hey you  '},
+        'plain string',
+        {'content': 'already here', 'is_incoming': 'true'},
+        {'content': 'x' * 21},
+        {'nothing': 1},
+    ])
+
+    assert summary['received'] == 6
+    assert summary['inserted'] == 2
+    assert summary['duplicates'] == 2
+    assert summary['too_long'] == 1
+    assert summary['invalid'] == 1
+    assert len(summary['ids']) == 2
+    assert TextExample.query.filter_by(profile_id=1).count() == 3
+
+    # Same content is independent per profile
+    assert TextExampleIngester(2).run(['hey you'])['inserted'] == 1
+
+
+def test_ingest_caps_examples_per_profile_and_listed_ids(app_context):
+    summary = TextExampleIngester(1, chunk_size=3, max_per_profile=5, max_ids=2).run(
+        [f'example {i}' for i in range(8)]
+    )
+
+    assert summary['inserted'] == 5
+    assert summary['over_limit'] == 3
+    assert len(summary['ids']) == 2 and summary['ids_truncated']
+
+
+def test_job_store_tracks_state_and_staged_input():
+    fakeredis = pytest.importorskip('fakeredis')
+    store = JobStore(fakeredis.FakeStrictRedis(), ttl=60)
+
+    job_id = store.create('text_example_ingest', user_id=7)
+    store.push_input(job_id, [{'content': str(i)} for i in range(5)])
+    assert [item['content'] for item in store.iter_input(job_id, batch_size=2)] == ['0', '1', '2', '3', '4']
+
+    store.update(job_id, state='completed', result={'inserted': 5})
+    job = store.get(job_id)
+    assert (job['state'], job['user_id'], job['result']) == ('completed', 7, {'inserted': 5})
+    assert store.get('missing') is None
+
+
+@pytest.fixture
+def upload():
+    from app.models import init_models
+    from app.api.text_examples import text_examples_bp
+    models = init_models()
+
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', JWT_SECRET_KEY='test', TEXT_EXAMPLES_MAX_UPLOAD=3)
+    db.init_app(app)
+    JWTManager(app)
+    app.register_blueprint(text_examples_bp, url_prefix='/api/text_examples')
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[models['Profile'].__table__, models['TextExample'].__table__])
+        db.session.add(models['Profile'](id=1, user_id=7, name='Main', phone_number='+15550000000'))
+        db.session.commit()
+        headers = {'Authorization': f"Bearer {create_access_token(identity=7)}"}
+
+    client = app.test_client()
+
+    def post(body):
+        return client.post('/api/text_examples/bulk?profile_id=1&format=csv', data=body,
+                           content_type='text/csv', headers=headers)
+    yield post
+    with app.app_context():
+        db.session.remove()
+
+
+def test_upload_reports_rows_past_the_limit(upload):
+    response = upload(b"content\none\ntwo\nthree\nfour\nfive\n")
+
+    assert response.status_code == 201
+    assert (response.json['inserted'], response.json['dropped']) == (3, 2)
+    assert 'dropped' in response.json['message']
+
+
+def test_malformed_csv_is_a_bad_request(upload):
+    # A field past csv.field_size_limit() raises csv.Error, not ValueError
+    response = upload(b'content\n' + b'x' * 200000 + b'\n')
+
+    assert response.status_code == 400
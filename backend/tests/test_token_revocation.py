@@ -0,0 +1,43 @@
+# tests/test_token_revocation.py
+import time
+from app.services.token_revocation import RevocationFilter
+
+
+class CountingLookup:
+    def __init__(self, revoked=()):
+        self.revoked = set(revoked)
+        self.calls = 0
+
+    def __call__(self, jti):
+        self.calls += 1
+        return jti in self.revoked
+
+
+def test_healthy_filter_answers_locally():
+    lookup = CountingLookup(revoked={'remote-only'})
+    revocation_filter = RevocationFilter(lookup)
+    revocation_filter.healthy = True
+    revocation_filter.add('abc', time.time() + 60)
+
+    assert revocation_filter.is_revoked('abc') is True
+    assert revocation_filter.is_revoked('other') is False
+    assert lookup.calls == 0
+
+
+def test_unhealthy_filter_falls_back_to_the_store():
+    lookup = CountingLookup(revoked={'remote-only'})
+    revocation_filter = RevocationFilter(lookup)
+
+    assert revocation_filter.is_revoked('remote-only') is True
+    assert revocation_filter.is_revoked('other') is False
+    assert lookup.calls == 2
+
+
+def test_expired_entries_age_out():
+    revocation_filter = RevocationFilter(CountingLookup())
+    revocation_filter.healthy = True
+    revocation_filter.load([('old', time.time() - 1), ('new', time.time() + 60)])
+
+    assert revocation_filter.is_revoked('old') is False
+    revocation_filter.prune()
+    assert len(revocation_filter) == 1
@@ -0,0 +1,54 @@
+# worker.py
+"""
+Queue worker entry point.
+
+    python worker.py                                  # run workers on QUEUE_NAMES
+    python worker.py --queues outbound --concurrency 8
+    python worker.py --stats                          # print queue stats as JSON
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from app import create_app
+from app.services.queue_service import QueueWorker, get_task_queue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run task queue workers')
+    parser.add_argument('--queues', help='Comma-separated queue names (default: QUEUE_NAMES)')
+    parser.add_argument('--concurrency', type=int, help='Worker threads (default: QUEUE_WORKER_CONCURRENCY)')
+    parser.add_argument('--batch-size', type=int, help='Tasks taken per dequeue (default: QUEUE_BATCH_SIZE)')
+    parser.add_argument('--stats', action='store_true', help='Print queue depth, latency and throughput, then exit')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+
+    app = create_app(os.environ.get('FLASK_CONFIG', 'production'))
+    queues = args.queues.split(',') if args.queues else app.config.get('QUEUE_NAMES', ['default'])
+
+    with app.app_context():
+        task_queue = get_task_queue(app)
+
+    if task_queue is None:
+        print("REDIS_URL is not configured; nothing to do", file=sys.stderr)
+        return 1
+
+    if args.stats:
+        print(json.dumps([task_queue.stats(name) for name in queues], indent=2))
+        return 0
+
+    worker = QueueWorker(
+        app,
+        task_queue,
+        queues=queues,
+        concurrency=args.concurrency or app.config.get('QUEUE_WORKER_CONCURRENCY', 4),
+        batch_size=args.batch_size or app.config.get('QUEUE_BATCH_SIZE', 1)
+    )
+    worker.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
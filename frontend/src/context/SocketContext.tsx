@@ -1,6 +1,7 @@
 import { createContext, useEffect, useState, useContext } from 'react';
 import { io, Socket } from 'socket.io-client';
 import { AuthContext } from './AuthContext';
+import { attachResumableStream } from '../services/resumableSocket';
 
 interface SocketContextType {
   socket: Socket | null;
@@ -46,6 +47,9 @@ export const SocketProvider: React.FC<{ children: React.ReactNode }> = ({ childr
         setIsConnected(false);
       });
 
+      // Unpack batched events and, on reconnect, replay only the events missed while offline
+      attachResumableStream(socketInstance);
+
       socketInstance.on('connect_error', (error) => {
         console.error('Socket connection error:', error);
         setIsConnected(false);
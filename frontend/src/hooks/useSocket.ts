@@ -1,5 +1,6 @@
 import { useEffect, useRef, useCallback, useState } from 'react'
 import { io, Socket } from 'socket.io-client'
+import { attachResumableStream, EventSequence } from '../services/resumableSocket'
 
 // Define the message structure from backend
 export interface Message {
@@ -29,6 +30,7 @@ export interface SocketEmitEvents {
 // Define the events that can be received from the backend
 export interface SocketReceiveEvents {
   new_message: Message
+  resync: { seq: number }
   message_status_update: { message_id: number; status: string; error?: string }
   typing_indicator: { profile_id: number; sender_number: string; is_typing: boolean }
   profile_status_update: { profile_id: number; status: string }
@@ -85,7 +87,7 @@ interface UseSocketReturn {
 export function useSocket(options: UseSocketOptions = {}): UseSocketReturn {
   const {
     serverUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:5000',
-    authToken,
+    authToken = localStorage.getItem('token') || undefined,
     autoConnect = true,
     reconnectAttempts = 5,
     reconnectInterval = 2000
@@ -96,6 +98,8 @@ export function useSocket(options: UseSocketOptions = {}): UseSocketReturn {
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null)
   const reconnectCountRef = useRef(0)
   const isConnectingRef = useRef(false)
+  // Survives socket re-creation so a reconnect only fetches missed events
+  const sequenceRef = useRef(new EventSequence())
 
   // State variables
   const [connectionState, setConnectionState] = useState<SocketConnectionState>('disconnected')
@@ -184,6 +188,9 @@ export function useSocket(options: UseSocketOptions = {}): UseSocketReturn {
       }
     })
 
+    // Unpack batched events and resume from the last sequence number after reconnects
+    attachResumableStream(socket, sequenceRef.current)
+
     // Handle authentication errors
     socket.on('auth_error', (error) => {
       console.error('Socket authentication error:', error)
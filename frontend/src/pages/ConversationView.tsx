@@ -72,10 +72,17 @@ const ConversationView = () => {
       }
     };
     
+    // Missed events were trimmed from the server's replay buffer; reload the thread
+    const handleResync = () => {
+      getMessages(parseInt(profileId), clientPhone).then(setMessages).catch(console.error);
+    };
+    
     socket.on('new_message', handleNewMessage);
+    socket.on('resync', handleResync);
     
     return () => {
       socket.off('new_message', handleNewMessage);
+      socket.off('resync', handleResync);
     };
   }, [socket, profileId, clientPhone]);
   
@@ -0,0 +1,85 @@
+import { Socket } from 'socket.io-client'
+
+interface StreamEvent {
+  event: string
+  data: { seq?: number; [key: string]: unknown }
+}
+
+interface ResumeReply {
+  events?: StreamEvent[]
+  seq: number
+  reset?: boolean
+}
+
+/**
+ * Tracks the last contiguous event sequence number received, so a
+ * reconnecting socket can ask the server for only the events it missed.
+ */
+export class EventSequence {
+  private lastSeq: number | null = null
+  private ahead = new Set<number>()
+
+  get position(): number | null {
+    return this.lastSeq
+  }
+
+  reset(seq: number) {
+    this.lastSeq = seq
+    this.ahead.clear()
+  }
+
+  // Returns false for an event that was already received
+  accept(seq?: number): boolean {
+    if (seq === undefined || this.lastSeq === null) return true
+    if (seq <= this.lastSeq || this.ahead.has(seq)) return false
+
+    this.ahead.add(seq)
+    while (this.ahead.has(this.lastSeq + 1)) {
+      this.lastSeq += 1
+      this.ahead.delete(this.lastSeq)
+    }
+    return true
+  }
+}
+
+// Deliver an event to the socket's own listeners, as if the server had sent it
+const dispatchLocal = (socket: Socket, event: string, data: unknown) => {
+  socket.listeners(event).forEach(listener => listener(data))
+}
+
+/**
+ * Wire up batched and resumable delivery on a socket:
+ * - 'event_batch' payloads are unpacked into the regular per-event listeners
+ * - every (re)connect sends 'resume' with the last sequence number seen and
+ *   replays the missed events; if the server no longer has them a local
+ *   'resync' event is dispatched so views can reload from the API
+ */
+export function attachResumableStream(socket: Socket, sequence = new EventSequence()) {
+  socket.onAny((event: string, data?: { seq?: number }) => {
+    if (event !== 'event_batch') sequence.accept(data?.seq)
+  })
+
+  socket.on('event_batch', ({ events }: { events: StreamEvent[] }) => {
+    events.forEach(({ event, data }) => {
+      if (sequence.accept(data.seq)) dispatchLocal(socket, event, data)
+    })
+  })
+
+  socket.on('connect', () => {
+    const after = sequence.position
+    socket.emit('resume', { after }, (reply: ResumeReply) => {
+      if (after === null) {
+        sequence.reset(reply.seq)
+      } else if (reply.reset) {
+        sequence.reset(reply.seq)
+        dispatchLocal(socket, 'resync', { seq: reply.seq })
+      } else {
+        reply.events?.forEach(({ event, data }) => {
+          if (sequence.accept(data.seq)) dispatchLocal(socket, event, data)
+        })
+      }
+    })
+  })
+
+  return sequence
+}